@@ -1,66 +1,561 @@
-import json
-from functools import lru_cache
+from functools import cached_property
+import bisect
 import networkx as nx
+import numpy as np
+import pandas as pd
 import requests
 import os
 import streamlit as st
+from snapshot_store import DELTA_EXTENSION, apply_delta, read_delta, read_snapshot_file
+from mmap_store import META_NAME, LazyMapping, MmapSnapshot, SnapshotArrays, mmap_folder_for, write_mmap_snapshot
+from csr_graph import CSRGraph
+from temporal_cube import update_cubes
+from query_engine import QueryEngine
+from reachability import SupplierProductReachability
+from feasibility import FeasibilityEvaluator
+from allocation import AllocationLedger
+from bill_of_materials import BillOfMaterials
+from critical_path import LeadTimes
+from cost_rollup import CostRollup
+from route_optimizer import RouteOptimizer
+from snapshot_diff import SnapshotDiff
+from ego_graph import EgoGraphService
+from layout_engine import update_global_layout
+from path_engine import PathEngine
 
+BACKENDS = ("memory", "mmap")
+GRAPH_ENGINES = ("networkx", "csr")
 
-class TemporalGraphClass:
-    def __init__(self, files):
-        self.files = files  # List of JSON file paths
 
-    @st.cache_data
-    def load_json_at_timestamp(_self, timestamp):
+def json_to_graph(data):
+    graph = nx.DiGraph() if data["directed"] else nx.Graph()
+    for node_type, nodes in data["node_values"].items():
+        for node in nodes:
+            node_id = node[-1]
+            node_attributes = dict(zip(data["node_types"][node_type], node))
+            graph.add_node(node_id, **node_attributes)
+
+    all_edge_types = data["relationship_types"]
+    for link_type,link_values in data["link_values"].items():
+        for edge_data in link_values :
+            attributes = {}
+            for j in range(len(edge_data) - 2):
+                key = all_edge_types[link_type][j]
+                attributes[key] = edge_data[j]
+            graph.add_edge(edge_data[-2], edge_data[-1], **attributes)
+
+    return graph
+
+
+def patch_graph(graph, base, data, delta):
+    """
+    Graph of data from the graph of base, the snapshot the delta was applied
+    to: a copy with the removed edges taken out, the added rows put in and
+    only the columns the delta moved updated on the changed rows. An edge
+    whose (source, target) pair is linked under several link types is put
+    together again from all of its rows. Returns None when a node, a node
+    type or the columns of a type change, the graph is then rebuilt from the
+    rows.
+    """
+    if base["directed"] != data["directed"] or set(base["node_values"]) - set(data["node_values"]):
+        return None
+    if any("full" in table for kind in ("node_values", "link_values") for table in delta[kind].values()):
+        return None
+
+    removed_edges = [(row[-2], row[-1]) for link_type in set(base["link_values"]) - set(data["link_values"])
+                     for row in base["link_values"][link_type]]
+    changes = []
+    for kind in ("node_values", "link_values"):
+        for name, table in delta[kind].items():
+            rows, base_rows = data[kind][name], base[kind].get(name, [])
+            if rows is base_rows:
+                continue
+            if table["take"] is not None or len(rows) != len(base_rows):
+                key = (lambda row: row[-1]) if kind == "node_values" else (lambda row: (row[-2], row[-1]))
+                removed = {key(row) for row in base_rows} - {key(row) for row in rows}
+                if kind == "node_values" and removed:
+                    return None
+                removed_edges.extend(removed)
+            # rows the delta did not touch are the very same lists as in base
+            base_ids = {id(row) for row in base_rows}
+            changes.append((kind, name, [row for row in rows if id(row) not in base_ids], [int(j) for j in table["columns"]]))
+
+    # one (source, target) pair can be linked under several link types; an edge
+    # whose pair lost or changed a row is put together again from all its rows
+    def pair(source, target):
+        return (source, target) if data["directed"] else frozenset((source, target))
+
+    removed_pairs = {pair(*edge) for edge in removed_edges}
+    touched = removed_pairs | {pair(row[-2], row[-1]) for kind, _, rows, _ in changes if kind == "link_values" for row in rows}
+    linked = {}
+    if touched:
+        for name, rows in data["link_values"].items():
+            for row in rows:
+                key = pair(row[-2], row[-1])
+                if key in touched:
+                    linked.setdefault(key, []).append((name, row))
+    rebuilt = {key: rows for key, rows in linked.items() if len(rows) > 1 or key in removed_pairs}
+
+    graph = graph.copy()
+    graph.remove_edges_from(removed_edges)
+    for rows in rebuilt.values():
+        source, target = rows[0][1][-2], rows[0][1][-1]
+        if graph.has_edge(source, target):
+            graph.remove_edge(source, target)
+        # in file order, as json_to_graph adds them
+        for name, row in rows:
+            graph.add_edge(row[-2], row[-1], **dict(zip(data["relationship_types"][name], row[:-2])))
+    for kind, name, rows, moved in changes:
+        if kind == "node_values":
+            columns = data["node_types"][name]
+            nodes = graph.nodes
+            for row in rows:
+                if row[-1] in nodes:
+                    attributes = nodes[row[-1]]
+                    for j in moved:
+                        attributes[columns[j]] = row[j]
+                else:
+                    graph.add_node(row[-1], **dict(zip(columns, row)))
+        else:
+            columns = data["relationship_types"][name]
+            adjacency = graph.adj
+            for row in rows:
+                if pair(row[-2], row[-1]) in rebuilt:
+                    continue
+                attributes = adjacency[row[-2]].get(row[-1]) if row[-2] in adjacency else None
+                if attributes is None:
+                    graph.add_edge(row[-2], row[-1], **dict(zip(columns, row[:-2])))
+                else:
+                    for j in moved:
+                        attributes[columns[j]] = row[j]
+    return graph
+
+
+def build_node_type_index(data):
+    """Index every node row by node type and node id."""
+    node_type_index = {}
+    for node_type, nodes in data["node_values"].items():
+        node_type_index[node_type] = {}
+        for node in nodes:
+            node_id = node[-1]
+            node_type_index[node_type][node_id] = node
+
+    return node_type_index
+
+
+class TypedAdjacency:
+    """
+    Edges of one snapshot keyed by (relationship_type, source) and
+    (relationship_type, target).
+
+    Looking up the WAREHOUSEToPRODUCT_OFFERING edges into one offering only
+    touches those edges instead of scanning every edge of the graph. The
+    index holds references to the snapshot rows, edge dicts are built for the
+    edges a query returns.
+    """
+
+    def __init__(self, data):
+        self.attributes = {link_type: names[:-2] for link_type, names in data["relationship_types"].items()}
+        self.link_values = data["link_values"]
+        self._by_source = {}
+        self._by_target = {}
+        for link_type, rows in data["link_values"].items():
+            for row in rows:
+                self._by_source.setdefault((link_type, row[-2]), []).append(row)
+                self._by_target.setdefault((link_type, row[-1]), []).append(row)
+
+    def _edges(self, link_type, rows, data):
+        if not data:
+            return [(row[-2], row[-1]) for row in rows]
+        names = self.attributes[link_type]
+        return [(row[-2], row[-1], dict(zip(names, row))) for row in rows]
+
+    def out_edges(self, link_type, source, data=False):
+        return self._edges(link_type, self._by_source.get((link_type, source), []), data)
+
+    def in_edges(self, link_type, target, data=False):
+        return self._edges(link_type, self._by_target.get((link_type, target), []), data)
+
+    def edges(self, link_type, data=False):
+        return self._edges(link_type, self.link_values.get(link_type, []), data)
+
+    def successors(self, link_type, source):
+        return [row[-1] for row in self._by_source.get((link_type, source), [])]
+
+    def predecessors(self, link_type, target):
+        return [row[-2] for row in self._by_target.get((link_type, target), [])]
+
+
+class ArrayAdjacency:
+    """
+    TypedAdjacency over the CSR and CSC arrays of a snapshot, for the mmap
+    backend: the edges of a node are a slice of the mapped arrays, and rows
+    and edge dicts are only built for the edges a query returns.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+    def _edge_indices(self, link_type, node, outgoing):
+        if link_type not in self.arrays.meta["link_sizes"]:
+            return np.empty(0, dtype=np.int64)
+        position = self.arrays.node_position(node)
+        if position is None:
+            return np.empty(0, dtype=np.int64)
+        if outgoing:
+            edges = self.arrays.out_edge_range(link_type, position)
+            return np.arange(edges.start, edges.stop)
+        edges = self.arrays.in_edge_indices(link_type, position)
+        # in the row order of the payload, as TypedAdjacency returns them
+        return edges[np.argsort(self.arrays.link_row(link_type)[edges], kind="stable")]
+
+    def _edges(self, link_type, edges, data):
+        if not len(edges):
+            return []
+        src, dst = self.arrays.link_endpoints(link_type)
+        node_ids = self.arrays.node_ids
+        pairs = zip(node_ids[src[edges]].tolist(), node_ids[dst[edges]].tolist())
+        if not data:
+            return list(pairs)
+        names = self.arrays.meta["relationship_types"][link_type][:-2]
+        return [(source, target, {name: self.arrays.link_value(link_type, name, edge) for name in names})
+                for (source, target), edge in zip(pairs, edges.tolist())]
+
+    def out_edges(self, link_type, source, data=False):
+        return self._edges(link_type, self._edge_indices(link_type, source, True), data)
+
+    def in_edges(self, link_type, target, data=False):
+        return self._edges(link_type, self._edge_indices(link_type, target, False), data)
+
+    def edges(self, link_type, data=False):
+        if link_type not in self.arrays.meta["link_sizes"]:
+            return []
+        if not data:
+            return self._edges(link_type, self.arrays.link_file_order(link_type), False)
+        names = self.arrays.meta["relationship_types"][link_type][:-2]
+        return [(row[-2], row[-1], dict(zip(names, row))) for row in self.arrays.link_rows(link_type)]
+
+    def successors(self, link_type, source):
+        return [target for _, target in self.out_edges(link_type, source)]
+
+    def predecessors(self, link_type, target):
+        return [source for source, _ in self.in_edges(link_type, target)]
+
+
+class FacilityCostIndex:
+    """
+    FACILITYToPRODUCT_OFFERING edges joined with their facility and offering,
+    sorted by the facility's operating cost.
+
+    Facilities and offerings are looked up in the node-type index once per
+    snapshot. Offerings made in facilities whose operating cost is within a
+    threshold are then a bisect into the sorted costs and a slice of the
+    prebuilt table.
+    """
+
+    def __init__(self, data, node_type_index):
+        facilities = node_type_index.get("FACILITY", {})
+        offerings = node_type_index.get("PRODUCT_OFFERING", {})
+        facility_columns = {name: i for i, name in enumerate(data["node_types"].get("FACILITY", []))}
+        offering_columns = {name: i for i, name in enumerate(data["node_types"].get("PRODUCT_OFFERING", []))}
+
+        rows = []
+        self.highest_operating_cost = 0
+        self.highest_product_offering = None
+        for edge in data["link_values"].get("FACILITYToPRODUCT_OFFERING", []):
+            facility, product = facilities.get(edge[-2]), offerings.get(edge[-1])
+            if facility is None or product is None:
+                continue
+            operating_cost = facility[facility_columns["operating_cost"]]
+            rows.append((facility[facility_columns["name"]], facility[facility_columns["location"]],
+                         product[offering_columns["name"]], operating_cost))
+            if operating_cost > self.highest_operating_cost:
+                self.highest_operating_cost = operating_cost
+                self.highest_product_offering = product
+
+        rows.sort(key=lambda row: row[-1])
+        self.operating_costs = [row[-1] for row in rows]
+        # highest cost first, so every threshold selects a tail of the table
+        self.table = pd.DataFrame(
+            rows[::-1], columns=["Facility Name", "Facility Location", "Product Name", "Operating Cost"]
+        )
+
+    def __len__(self):
+        return len(self.operating_costs)
+
+    def under(self, threshold_operating_cost):
+        """Rows with operating cost <= threshold, highest cost first."""
+        count = bisect.bisect_right(self.operating_costs, threshold_operating_cost)
+        return self.table.iloc[len(self) - count:]
+
+
+class TemporalSnapshot:
+    """
+    Everything derived from one timestamp file, built from a single parse.
+
+    The parsed payload is kept as-is; the graph, the node-type index, the
+    typed adjacency index, the query engine, the supplier reachability, the
+    feasibility aggregates, the allocation ledger, the bill of materials and
+    the path engine are built from it the first time they are asked for.
+    Snapshots from the mmap backend carry the memory-mapped arrays: their
+    payload builds the rows of a node or relationship type the first time a
+    caller reads that type, and their node-type index and typed adjacency
+    are read from the arrays. A snapshot read from a delta file keeps the
+    snapshot it was applied to as base; its graph and node-type index are
+    patched from the ones of base when base has built them already.
+
+    load_snapshot and load_mmap_snapshot hand the same snapshot to every
+    session, so everything it holds is read-only: the graph is frozen and
+    raises on an added or removed node or edge, the column arrays are not
+    writeable, and a caller that wants to change rows, frames or attributes
+    works on a copy of them.
+    """
+
+    def __init__(self, data=None, arrays=None, base=None, delta=None):
+        self._data = data
+        self.arrays = arrays
+        self.base = base
+        self.delta = delta
+
+    @cached_property
+    def data(self):
+        if self._data is None:
+            # rows are built per node or relationship type, for the types a caller reads
+            self._data = self.arrays.lazy_data()
+        return self._data
+
+    @cached_property
+    def graph(self):
+        if self.base is not None and "graph" in self.base.__dict__:
+            graph = patch_graph(self.base.graph, self.base.data, self.data, self.delta)
+            if graph is not None:
+                return nx.freeze(graph)
+        # shared by every session, see the class docstring
+        return nx.freeze(json_to_graph(self.data))
+
+    @cached_property
+    def column_arrays(self):
+        # the mmap backend already has the arrays, the memory backend builds them once
+        return self.arrays if self.arrays is not None else SnapshotArrays.from_data(self.data)
+
+    @cached_property
+    def csr_graph(self):
+        return CSRGraph(self.column_arrays)
 
-        file_path = _self.files[timestamp]
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"The file {file_path} does not exist.")
+    @cached_property
+    def node_type_index(self):
+        if self.base is not None and "node_type_index" in self.base.__dict__:
+            # node types whose rows are shared with base share its index too
+            base_nodes = self.base.data["node_values"]
+            return {
+                node_type: self.base.node_type_index[node_type] if nodes is base_nodes.get(node_type)
+                else {node[-1]: node for node in nodes}
+                for node_type, nodes in self.data["node_values"].items()
+            }
+        if self.arrays is not None:
+            node_values = self.data["node_values"]
+            return LazyMapping(node_values, lambda node_type: {node[-1]: node for node in node_values[node_type]})
+        return build_node_type_index(self.data)
 
-        with open(file_path, "r") as f:
-            data = json.load(f)
+    @cached_property
+    def adjacency(self):
+        # the mmap backend slices the mapped adjacency arrays instead of indexing every row
+        if self.arrays is not None:
+            return ArrayAdjacency(self.arrays)
+        return TypedAdjacency(self.data)
 
-        return data
+    @cached_property
+    def facility_costs(self):
+        return FacilityCostIndex(self.data, self.node_type_index)
 
+    @cached_property
+    def query_engine(self):
+        # the mmap backend builds its frames from the column arrays, without the row payload
+        if self.arrays is not None:
+            return QueryEngine(arrays=self.arrays)
+        return QueryEngine(self.data)
 
-    # @lru_cache(maxsize=10)
-    @st.cache_data
-    def load_graph_at_timestamp(_self, timestamp):
-        with open(_self.files[timestamp]) as f:
-            data = json.load(f)
-        return _self._json_to_graph(data)
+    @cached_property
+    def reachability(self):
+        return SupplierProductReachability(self.column_arrays)
+
+    @cached_property
+    def feasibility(self):
+        return FeasibilityEvaluator(self.query_engine, self.bill_of_materials)
+
+    @cached_property
+    def allocation_ledger(self):
+        return AllocationLedger(self.query_engine)
+
+    @cached_property
+    def bill_of_materials(self):
+        return BillOfMaterials(self.query_engine)
+
+    @cached_property
+    def path_engine(self):
+        return PathEngine(self.column_arrays)
+
+
+# cache_resource hands every session the same snapshot instead of a pickled copy,
+# which is why a TemporalSnapshot is read-only
+@st.cache_resource(max_entries=64)
+def load_snapshot(file_path):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"The file {file_path} does not exist.")
+
+    # a delta is applied to the cached snapshot of its base, which is loaded the same way
+    if file_path.endswith(DELTA_EXTENSION):
+        base_path, delta = read_delta(file_path)
+        base = load_snapshot(base_path)
+        return TemporalSnapshot(apply_delta(base.data, delta), base=base, delta=delta)
+
+    # JSON and columnar snapshots are both accepted
+    data = read_snapshot_file(file_path)
+
+    return TemporalSnapshot(data)
+
+
+@st.cache_resource(max_entries=64)
+def load_mmap_snapshot(file_path):
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"The file {file_path} does not exist.")
+
+    # the array folder is written once next to the snapshot file, then only mapped
+    folder = mmap_folder_for(file_path)
+    if not os.path.exists(os.path.join(folder, META_NAME)):
+        write_mmap_snapshot(read_snapshot_file(file_path), folder)
+
+    return TemporalSnapshot(arrays=MmapSnapshot(folder))
+
+
+# keyed by the file list, a newly downloaded timestamp extends the persisted cubes
+@st.cache_resource(max_entries=8)
+def load_cubes(files):
+    return update_cubes(list(files))
+
+
+@st.cache_resource(max_entries=8)
+def load_lead_times(files):
+    return LeadTimes(load_cubes(files)[1])
+
+
+@st.cache_resource(max_entries=8)
+def load_cost_rollup(files):
+    return CostRollup(*load_cubes(files))
+
+
+@st.cache_resource(max_entries=8)
+def load_route_optimizer(files):
+    return RouteOptimizer(load_cubes(files)[1])
+
+
+@st.cache_resource(max_entries=8)
+def load_global_layout(files):
+    return update_global_layout(list(files), *load_cubes(files))
+
+
+# one LRU of ego graphs per file list, shared by every page and session
+@st.cache_resource(max_entries=8)
+def load_ego_graphs(files):
+    return EgoGraphService(load_global_layout(files))
+
+
+class TemporalGraphClass:
+    def __init__(self, files, backend="memory", graph_engine="networkx"):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown snapshot backend {backend}, expected one of {BACKENDS}.")
+        if graph_engine not in GRAPH_ENGINES:
+            raise ValueError(f"Unknown graph engine {graph_engine}, expected one of {GRAPH_ENGINES}.")
+        self.files = files  # List of snapshot file paths (JSON or columnar)
+        self.backend = backend
+        self.graph_engine = graph_engine
+
+    def load_snapshot_at_timestamp(self, timestamp):
+        if self.backend == "mmap":
+            return load_mmap_snapshot(self.files[timestamp])
+        return load_snapshot(self.files[timestamp])
+
+    def load_arrays_at_timestamp(self, timestamp):
+        """Memory-mapped arrays of a timestamp, whatever backend the pages use."""
+        return load_mmap_snapshot(self.files[timestamp]).arrays
+
+    def load_json_at_timestamp(self, timestamp):
+        return self.load_snapshot_at_timestamp(timestamp).data
+
+    def load_graph_at_timestamp(self, timestamp):
+        snapshot = self.load_snapshot_at_timestamp(timestamp)
+        return snapshot.csr_graph if self.graph_engine == "csr" else snapshot.graph
 
     def _json_to_graph(self, data):
-        graph = nx.DiGraph() if data["directed"] else nx.Graph()
-        for node_type, nodes in data["node_values"].items():
-            for node in nodes:
-                node_id = node[-1]
-                node_attributes = dict(zip(data["node_types"][node_type], node))
-                graph.add_node(node_id, **node_attributes)
-
-        all_edge_types = data["relationship_types"]
-        for link_type,link_values in data["link_values"].items():
-            for edge_data in link_values :
-                attributes = {}
-                for j in range(len(edge_data) - 2):
-                    key = all_edge_types[link_type][j]
-                    attributes[key] = edge_data[j]
-                graph.add_edge(edge_data[-2], edge_data[-1], **attributes)
-
-        return graph
-
-    @st.cache_data
-    def create_node_type_index(_self, timestamp):
-        """Create and cache an index for all node types."""
-        data = _self.load_json_at_timestamp(timestamp)
-        node_values = data["node_values"]
-
-        # Create an index for each node type
-        node_type_index = {}
-        for node_type, nodes in node_values.items():
-            node_type_index[node_type] = {}
-            for node in nodes:
-                node_id = node[-1] 
-                node_type_index[node_type][node_id] = node
-
-        return node_type_index
\ No newline at end of file
+        return json_to_graph(data)
+
+    def create_node_type_index(self, timestamp):
+        """Return the cached index of all node types for a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).node_type_index
+
+    def load_adjacency_at_timestamp(self, timestamp):
+        """Return the cached (relationship_type, node) edge index for a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).adjacency
+
+    def load_facility_costs_at_timestamp(self, timestamp):
+        """Return the cached facility operating-cost index for a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).facility_costs
+
+    def load_query_engine_at_timestamp(self, timestamp):
+        """Return the cached column query engine for a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).query_engine
+
+    def load_reachability_at_timestamp(self, timestamp):
+        """Return the cached supplier to product offering reachability for a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).reachability
+
+    def load_feasibility_at_timestamp(self, timestamp):
+        """Return the cached batch order feasibility evaluator for a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).feasibility
+
+    def load_allocation_ledger_at_timestamp(self, timestamp):
+        """Return the cached stock and capacity ledger for allocating orders at a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).allocation_ledger
+
+    def load_bill_of_materials_at_timestamp(self, timestamp):
+        """Return the cached multi-level bill of materials of every product for a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).bill_of_materials
+
+    def load_path_engine_at_timestamp(self, timestamp):
+        """Return the cached undirected shortest-path engine for a timestamp."""
+        return self.load_snapshot_at_timestamp(timestamp).path_engine
+
+    def diff_timestamps(self, before, after):
+        """Return the SnapshotDiff of the column arrays of two timestamps."""
+        return SnapshotDiff(
+            self.load_snapshot_at_timestamp(before).column_arrays,
+            self.load_snapshot_at_timestamp(after).column_arrays,
+        )
+
+    def load_ego_graph_at_timestamp(self, timestamp, node_id, radius):
+        """Return the cached, bounded ego graph of node_id and its layout for a timestamp."""
+        return load_ego_graphs(tuple(self.files)).ego_graph(timestamp, node_id, radius, self.load_graph_at_timestamp)
+
+    def load_global_layout(self):
+        """Return the persisted layout of every node of every timestamp, laid out together."""
+        return load_global_layout(tuple(self.files))
+
+    def load_node_cube(self):
+        """Return the (timestamp, node, attribute) cube of numeric node attributes of every timestamp."""
+        return load_cubes(tuple(self.files))[0]
+
+    def load_edge_cube(self):
+        """Return the (timestamp, edge, attribute) cube and validity masks of numeric edge attributes of every timestamp."""
+        return load_cubes(tuple(self.files))[1]
+
+    def load_lead_times(self):
+        """Return the critical-path lead times of every product offering at every timestamp."""
+        return load_lead_times(tuple(self.files))
+
+    def load_cost_rollup(self):
+        """Return the landed cost by component of every product offering at every timestamp."""
+        return load_cost_rollup(tuple(self.files))
+
+    def load_route_optimizer(self):
+        """Return the cheapest and fastest supplier to product offering routes of every timestamp."""
+        return load_route_optimizer(tuple(self.files))
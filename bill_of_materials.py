@@ -0,0 +1,247 @@
+"""
+Multi-level bill of materials of every product of one snapshot.
+
+find_raw_materials_to_make_product stopped at the parts feeding the
+facilities of a product. Some of those parts are subassemblies (the
+'subassembly' type of PART_TYPES in config.py) that a facility makes
+itself: FACILITYToPARTS links the maker to the subassembly, with the units
+one run of the maker yields, and the PARTSToFACILITY inputs of the maker are
+what that run takes. BillOfMaterials explodes every product through its
+subassemblies, once per snapshot:
+
+    bom = temporal_graph.load_bill_of_materials_at_timestamp(timestamp)
+    bom.flattened("PO_001")          # part -> units taken from stock per unit of PO_001
+    bom.built("PO_001")              # subassembly -> units made per unit of PO_001
+    bom.transport_costs("PO_001")    # part -> transport cost per unit of PO_001
+    bom.unit_bill("PO_001")          # the three of them as columns
+    bom.facilities("PO_001")         # the makers of PO_001 and of its subassemblies
+    bom.requirements("PO_001", 250)  # ceil(250 * flattened)
+    bom.shortfall("PO_001", 250)     # against the warehouse stock of the parts
+
+The recipe of a subassembly is the input quantities and transport costs of
+its makers divided by the yield of the run; a part used by two makers keeps
+the values of the last one, as product_bill does for the facilities of a
+product.
+
+Each subassembly is expanded once and its expansion reused by every product
+and subassembly that needs it: with X the (part, part) matrix whose row for
+a subassembly is its expansion and whose row for any other part is the part
+itself, X = L + K + B X, solved by iterating from X = L + K. B holds the
+recipe inputs that are built in turn and K those taken from stock. The
+flattened bills are the product bills times X, one sparse (product, part)
+matrix, and the built and transport matrices are found the same way.
+
+The makers of the generated snapshots use subassemblies made by the others,
+so the recipes form cycles. They are found as strongly connected components
+of the recipe graph and listed in cycles. A subassembly on a cycle is still
+built from its recipe, but the inputs on its own cycle are taken from stock:
+building them as well would need the subassembly again.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+from feasibility import link_columns
+
+# the PART_TYPES key of the parts facilities make (config.py)
+SUBASSEMBLY = "subassembly"
+BILL_COLUMNS = ["product", "part", "quantity", "built", "transport_cost"]
+
+
+def _index(*ids):
+    return pd.Index(pd.concat([pd.Series(list(i), dtype=object) for i in ids]).unique())
+
+
+def facility_bill(engine, link_type):
+    """
+    Parts the makers of every target of link_type (FACILITYToPRODUCT_OFFERING
+    or FACILITYToPARTS) use, one row per (facility, output, part) with
+    quantity, transport_cost and lead_time per unit of the output.
+    """
+    makers = link_columns(engine, link_type, ("source", "target"))
+    makers = makers.rename(columns={"source": "facility", "target": "output"})
+    makers["facility_rank"] = np.arange(len(makers))
+    parts = link_columns(engine, "PARTSToFACILITY", ("source", "target", "quantity", "transport_cost", "lead_time"))
+    parts = parts.rename(columns={"source": "part", "target": "facility"})
+    parts["part_rank"] = np.arange(len(parts))
+    return makers.merge(parts, on="facility").sort_values(["output", "facility_rank", "part_rank"], kind="stable")
+
+
+def product_bill(engine):
+    """
+    Parts the facilities of every product use, one row per (product, part)
+    with quantity, transport_cost and lead_time per unit of the product.
+    """
+    bill = facility_bill(engine, "FACILITYToPRODUCT_OFFERING").rename(columns={"output": "product"})
+    # a part used by two facilities of a product keeps the values of the last one, as in
+    # find_raw_materials_to_make_product
+    return bill.drop_duplicates(["product", "part"], keep="last")[
+        ["product", "part", "quantity", "transport_cost", "lead_time"]
+    ].reset_index(drop=True)
+
+
+def _matrix(rows, columns, values, row_ids, column_ids):
+    """Sparse (row_ids, column_ids) matrix of values at the ids in rows and columns."""
+    return sparse.csr_matrix(
+        (np.asarray(values, dtype=float), (row_ids.get_indexer(rows), column_ids.get_indexer(columns))),
+        shape=(len(row_ids), len(column_ids)),
+    )
+
+
+def _solve(step, start):
+    """X = start + step X for a step matrix whose nonzero rows and columns form a DAG."""
+    X = start.tocsr()
+    # one more level of the DAG settles per iteration
+    for _ in range(step.shape[0] + 1):
+        next_X = (start + step @ X).tocsr()
+        if (next_X != X).nnz == 0:
+            break
+        X = next_X
+    return X
+
+
+class BillOfMaterials:
+    """Flattened bill of materials of every product, as rows of sparse (product, part) matrices."""
+
+    def __init__(self, engine):
+        parts = engine.nodes("PARTS") if "PARTS" in engine.node_types else pd.DataFrame(columns=["type", "cost"])
+        subassemblies = set(parts.index[parts["type"] == SUBASSEMBLY]) if "type" in parts else set()
+
+        makers = link_columns(engine, "FACILITYToPARTS", ("source", "target", "quantity"))
+        makers = makers[makers["target"].isin(subassemblies)].drop_duplicates(["source", "target"], keep="last")
+        recipes = facility_bill(engine, "FACILITYToPARTS")
+        recipes = recipes[recipes["output"].isin(subassemblies)]
+        # the inputs of one run go into the units the run yields
+        run_yield = recipes[["facility", "output"]].merge(
+            makers.rename(columns={"source": "facility", "target": "output", "quantity": "yield"}), how="left"
+        )["yield"].to_numpy(dtype=float)
+        run_yield = np.where(np.isfinite(run_yield) & (run_yield > 0), run_yield, 1)
+        recipes = recipes.assign(quantity=recipes["quantity"].to_numpy(dtype=float) / run_yield,
+                                 transport_cost=recipes["transport_cost"].to_numpy(dtype=float) / run_yield)
+        recipes = recipes.drop_duplicates(["output", "part"], keep="last")
+        product_makers = link_columns(engine, "FACILITYToPRODUCT_OFFERING", ("source", "target")).drop_duplicates()
+        bill = product_bill(engine)
+        part_stock = link_columns(engine, "WAREHOUSEToPARTS", ("target", "inventory_level"))
+
+        self.part_ids = _index(parts.index, recipes["part"], recipes["output"], bill["part"])
+        self.product_ids = _index(bill["product"], product_makers["target"])
+        self.facility_ids = _index(product_makers["source"], makers["source"])
+        self.has_recipes = len(recipes) > 0
+        n = len(self.part_ids)
+
+        # A: recipe quantities per unit of each subassembly, and the transport costs of its inputs
+        inputs_of = _matrix(recipes["output"], recipes["part"], recipes["quantity"], self.part_ids, self.part_ids)
+        recipe_transport = _matrix(recipes["output"], recipes["part"], recipes["transport_cost"], self.part_ids, self.part_ids)
+
+        # parts on a cycle of the recipe graph, a self loop included
+        _, component = connected_components(inputs_of, directed=True, connection="strong")
+        on_cycle = (np.bincount(component)[component] > 1) | (inputs_of.diagonal() != 0)
+        self.on_cycle = on_cycle
+        self.cycles = [self.part_ids[np.flatnonzero(component == c)].tolist()
+                       for c in np.unique(component[on_cycle])]
+        self.expanded = inputs_of.getnnz(axis=1) > 0
+
+        # B: inputs built in turn, the subassemblies off the cycle of the one being built; K: the rest, from stock
+        coo = inputs_of.tocoo()
+        built_in_turn = self.expanded[coo.col] & (component[coo.row] != component[coo.col])
+        build_inputs = sparse.csr_matrix((coo.data * built_in_turn, (coo.row, coo.col)), shape=(n, n))
+        build_inputs.eliminate_zeros()
+        stock_inputs = (inputs_of - build_inputs).tocsr()
+        leaf = sparse.diags((~self.expanded).astype(float))
+        self.expansions = _solve(build_inputs, leaf + stock_inputs)
+        builds = _solve(build_inputs, build_inputs)
+
+        # a product bill builds the subassemblies it uses and takes every other part from stock
+        product_bills = _matrix(bill["product"], bill["part"], bill["quantity"], self.product_ids, self.part_ids)
+        built_parts = sparse.diags(self.expanded.astype(float))
+        direct_builds = (product_bills @ built_parts).tocsr()
+        self.matrix = (product_bills @ sparse.diags((~self.expanded).astype(float)) + direct_builds @ self.expansions).tocsr()
+        self.built_matrix = (direct_builds + direct_builds @ builds).tocsr()
+        self.transport_matrix = (
+            _matrix(bill["product"], bill["part"], bill["transport_cost"], self.product_ids, self.part_ids)
+            + self.built_matrix @ recipe_transport
+        ).tocsr()
+        for m in (self.matrix, self.built_matrix, self.transport_matrix):
+            m.eliminate_zeros()
+            m.sort_indices()
+
+        made_by = _matrix(makers["target"], makers["source"], np.ones(len(makers)), self.part_ids, self.facility_ids)
+        makes = _matrix(product_makers["target"], product_makers["source"], np.ones(len(product_makers)), self.product_ids, self.facility_ids)
+        self.facility_matrix = (makes + (self.built_matrix != 0).astype(float) @ made_by).tocsr()
+        self.facility_matrix.sort_indices()
+
+        cost = parts["cost"] if "cost" in parts else pd.Series(dtype=float)
+        self.part_costs = cost.reindex(self.part_ids).fillna(0).to_numpy(dtype=float)
+        self.unit_costs = pd.Series(self.matrix @ self.part_costs, index=self.product_ids)
+        self.part_stock = part_stock.groupby("target")["inventory_level"].sum().reindex(self.part_ids).fillna(0).to_numpy(dtype=float)
+
+    def _row(self, product_id, matrix=None):
+        matrix = self.matrix if matrix is None else matrix
+        position = self.product_ids.get_indexer([product_id])[0]
+        if position < 0:
+            return np.zeros(0, dtype=int), np.zeros(0)
+        start, stop = matrix.indptr[position], matrix.indptr[position + 1]
+        return matrix.indices[start:stop], matrix.data[start:stop]
+
+    def _series(self, product_id, matrix, name):
+        columns, values = self._row(product_id, matrix)
+        return pd.Series(values, index=self.part_ids[columns], name=name)
+
+    def flattened(self, product_id):
+        """Quantity of every part taken from stock for one unit of product_id, subassemblies expanded."""
+        return self._series(product_id, self.matrix, "Quantity")
+
+    def built(self, product_id):
+        """Units of every subassembly made for one unit of product_id."""
+        return self._series(product_id, self.built_matrix, "Built")
+
+    def transport_costs(self, product_id):
+        """Transport cost of every part moved to a facility for one unit of product_id."""
+        return self._series(product_id, self.transport_matrix, "Transport Cost")
+
+    def unit_bill(self, product_id):
+        """Quantity from stock, transport cost and units built of every part of one unit of product_id."""
+        return pd.concat([self.flattened(product_id), self.transport_costs(product_id), self.built(product_id)], axis=1).fillna(0)
+
+    def facilities(self, product_id):
+        """Facilities that make product_id or one of the subassemblies it is built from."""
+        columns, _ = self._row(product_id, self.facility_matrix)
+        return self.facility_ids[columns].tolist()
+
+    def bills(self):
+        """Flattened, built and transport rows of every product, one row per (product, part)."""
+        frames = []
+        for name, m in (("quantity", self.matrix), ("built", self.built_matrix), ("transport_cost", self.transport_matrix)):
+            coo = m.tocoo()
+            frames.append(pd.DataFrame({"product": coo.row, "part": coo.col, name: coo.data}))
+        rows = pd.concat(frames).groupby(["product", "part"]).sum().reset_index()
+        rows["product"] = self.product_ids[rows["product"].to_numpy()]
+        rows["part"] = self.part_ids[rows["part"].to_numpy()]
+        return rows[BILL_COLUMNS]
+
+    def product_facilities(self):
+        """(product, facility) rows of facilities."""
+        coo = self.facility_matrix.tocoo()
+        return pd.DataFrame({"product": self.product_ids[coo.row], "facility": self.facility_ids[coo.col]})
+
+    def requirements(self, product_id, units):
+        """Whole units of every part needed from stock for units of product_id."""
+        return np.ceil(self.flattened(product_id) * units)
+
+    def cost(self, product_id, units):
+        """Part cost of units of product_id, from the flattened bill."""
+        return float(self.unit_costs.get(product_id, 0.0) * units)
+
+    def shortfall(self, product_id, units, part_stock=None):
+        """Required, in stock and short units of every part of units of product_id."""
+        columns, quantity = self._row(product_id)
+        stock = (self.part_stock if part_stock is None else part_stock)[columns]
+        required = np.ceil(quantity * units)
+        return pd.DataFrame({
+            "Part": self.part_ids[columns],
+            "Required": required,
+            "In Stock": stock,
+            "Short": np.maximum(required - stock, 0),
+            "Subassembly on a cycle": self.on_cycle[columns],
+        })
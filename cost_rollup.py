@@ -0,0 +1,215 @@
+"""
+Landed cost of the product offerings of every timestamp.
+
+The cost of a product was put together by each query on its own:
+calulate_cost_and_time adds the transport cost of the raw materials and the
+operating cost of the facilities, the Product Offering page charts the
+product_cost of the facilities. CostRollup rolls every cost up the supply
+path once, over the node and edge cubes, for every timestamp at the same
+time:
+
+    WAREHOUSEToPARTS . PARTSToFACILITY . FACILITYToPRODUCT_OFFERING
+
+1. a unit of part costs its PARTS cost, and its storage_cost averaged over
+   the warehouses holding it,
+2. a unit of product made in a facility takes quantity units of every part
+   the facility uses, plus the transport_cost of each part, as in
+   find_total_cost,
+3. the FACILITYToPRODUCT_OFFERING edge adds the product_cost of the facility.
+
+These per-unit components add up to the landed cost of a unit, and each
+product is made in the facility with the lowest landed cost at each
+timestamp. The FACILITY operating_cost is reported next to them but is a
+fixed cost of the facility, not of a unit: it is neither in the landed cost
+nor in the choice of facility.
+
+    rollup = temporal_graph.load_cost_rollup()
+    rollup.breakdown(timestamp)              # one row per product, cost by component
+    rollup.routes(timestamp, "F_014")        # every facility and product it makes
+    rollup.series("PO_001")                  # cost by component at every timestamp
+    rollup.cost("PO_001", timestamp, 250)    # units per-unit costs plus the operating cost
+
+Edges missing at a timestamp do not count, a product no facility
+makes there has no cost (NaN). Time the rollup of every timestamp:
+
+    python cost_rollup.py data/<version>
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+UNIT_COMPONENTS = ["Part Cost", "Storage Cost", "Transport Cost", "Production Cost"]
+COMPONENTS = UNIT_COMPONENTS + ["Operating Cost"]
+LANDED_COST = "Landed Cost"
+
+
+def _segments(ids, keys):
+    """Order of keys grouped by their position in ids, the positions and the first row of each group."""
+    codes = ids.get_indexer(keys)
+    order = np.argsort(codes, kind="stable")
+    positions, first = np.unique(codes[order], return_index=True)
+    return order, positions, first
+
+
+class CostRollup:
+    """Per-unit cost components of every facility route and product, for every timestamp of the cubes."""
+
+    def __init__(self, node_cube, edge_cube):
+        self.timestamps = list(edge_cube.timestamps)
+        count = len(self.timestamps)
+
+        def edges(link_type):
+            return np.array(edge_cube.edges(link_type), dtype=object).reshape(-1, 2)
+
+        def values(link_type, attribute, order):
+            return np.nan_to_num(edge_cube.values(link_type, attribute)[:, order])
+
+        def node_values(node_type, attribute, ids):
+            position = {node_id: i for i, node_id in enumerate(node_cube.node_ids(node_type))}
+            columns = np.array([position.get(node_id, -1) for node_id in ids], dtype=np.int64)
+            if not len(columns) or attribute not in node_cube.attributes(node_type):
+                return np.zeros((count, len(columns)))
+            # ids the node cube has never seen cost nothing
+            return np.where(columns >= 0, np.nan_to_num(node_cube.values(node_type, attribute)[:, columns]), 0)
+
+        stored, inputs, routes = edges("WAREHOUSEToPARTS"), edges("PARTSToFACILITY"), edges("FACILITYToPRODUCT_OFFERING")
+        part_ids = pd.Index(pd.unique(np.concatenate([stored[:, 1], inputs[:, 0]])))
+        facility_ids = pd.Index(pd.unique(np.concatenate([inputs[:, 1], routes[:, 0]])))
+
+        # 1. parts: cost of the part and its storage cost averaged over the warehouses holding it
+        part_cost = node_values("PARTS", "cost", part_ids)
+        storage = np.zeros((count, len(part_ids)))
+        order, positions, first = _segments(part_ids, stored[:, 1])
+        if len(order):
+            valid = edge_cube.valid("WAREHOUSEToPARTS")[:, order]
+            total = np.add.reduceat(np.where(valid, values("WAREHOUSEToPARTS", "storage_cost", order), 0), first, axis=1)
+            held = np.add.reduceat(valid.astype(float), first, axis=1)
+            storage[:, positions] = np.divide(total, held, out=np.zeros_like(total), where=held > 0)
+
+        # 2. facilities: the parts of one unit of product and their transport
+        facility = {name: np.zeros((count, len(facility_ids))) for name in UNIT_COMPONENTS[:3]}
+        order, positions, first = _segments(facility_ids, inputs[:, 1])
+        if len(order):
+            valid = edge_cube.valid("PARTSToFACILITY")[:, order]
+            parts = part_ids.get_indexer(inputs[order, 0])
+            quantity = np.where(valid, values("PARTSToFACILITY", "quantity", order), 0)
+            per_edge = {
+                "Part Cost": quantity * part_cost[:, parts],
+                "Storage Cost": quantity * storage[:, parts],
+                "Transport Cost": np.where(valid, values("PARTSToFACILITY", "transport_cost", order), 0),
+            }
+            for name, cost in per_edge.items():
+                facility[name][:, positions] = np.add.reduceat(cost, first, axis=1)
+
+        # 3. routes: one per FACILITYToPRODUCT_OFFERING edge, grouped by product
+        self.product_ids = pd.Index(pd.unique(routes[:, 1]))
+        order, _, first = _segments(self.product_ids, routes[:, 1])
+        self.route_facilities = routes[order, 0]
+        self.route_products = routes[order, 1]
+        sources = facility_ids.get_indexer(self.route_facilities)
+        self.route_valid = edge_cube.valid("FACILITYToPRODUCT_OFFERING")[:, order]
+        self.route_costs = {name: cost[:, sources] for name, cost in facility.items()}
+        self.route_costs["Production Cost"] = values("FACILITYToPRODUCT_OFFERING", "product_cost", order)
+        self.route_costs["Operating Cost"] = node_values("FACILITY", "operating_cost", self.route_facilities)
+        # the operating cost does not scale with the units, a unit lands at the per-unit components only
+        landed = sum(self.route_costs[name] for name in UNIT_COMPONENTS)
+        self.route_costs[LANDED_COST] = landed
+
+        # cheapest route of every product: the first edge of its group at the lowest landed cost
+        self._cheapest = np.zeros((count, len(self.product_ids)), dtype=np.int64)
+        self._made = np.zeros((count, len(self.product_ids)), dtype=bool)
+        if len(order):
+            offered = np.where(self.route_valid, landed, np.inf)
+            lowest = np.minimum.reduceat(offered, first, axis=1)
+            edge_index = np.broadcast_to(np.arange(len(order)), offered.shape)
+            at_lowest = offered == np.repeat(lowest, np.diff(np.append(first, len(order))), axis=1)
+            self._cheapest = np.minimum.reduceat(np.where(at_lowest, edge_index, len(order)), first, axis=1)
+            self._made = np.isfinite(lowest)
+            self._cheapest = np.where(self._made, self._cheapest, 0)
+
+    def _product_costs(self, name):
+        """(timestamp, product) cost of one component over the cheapest route, NaN where nothing makes the product."""
+        cost = np.take_along_axis(self.route_costs[name], self._cheapest, axis=1)
+        return np.where(self._made, cost, np.nan)
+
+    def table(self, name=LANDED_COST):
+        """One component of every product at every timestamp."""
+        return pd.DataFrame(self._product_costs(name), index=pd.Index(self.timestamps, name="Timestamp"), columns=self.product_ids)
+
+    def breakdown(self, timestamp):
+        """Cost by component of every product at the timestamp position, with the facility that makes it cheapest."""
+        frame = pd.DataFrame({"Facility": self.route_facilities[self._cheapest[timestamp]]}, index=pd.Index(self.product_ids, name="Product"))
+        for name in COMPONENTS + [LANDED_COST]:
+            frame[name] = self._product_costs(name)[timestamp]
+        frame.loc[~self._made[timestamp], "Facility"] = None
+        return frame
+
+    def series(self, product_id):
+        """Cost by component of product_id at every timestamp, NaN where nothing makes it."""
+        position = self.product_ids.get_indexer([product_id])[0]
+        frame = pd.DataFrame(index=pd.Index(self.timestamps, name="Timestamp"), columns=COMPONENTS + [LANDED_COST], dtype=float)
+        if position >= 0:
+            for name in frame.columns:
+                frame[name] = self._product_costs(name)[:, position]
+        return frame
+
+    def routes(self, timestamp, facility_id=None):
+        """Cost by component of every facility and product it makes at the timestamp position."""
+        selected = self.route_valid[timestamp].copy()
+        if facility_id is not None:
+            selected &= self.route_facilities == facility_id
+        frame = pd.DataFrame({"Facility": self.route_facilities[selected], "Product": self.route_products[selected]})
+        for name in COMPONENTS + [LANDED_COST]:
+            frame[name] = self.route_costs[name][timestamp, selected]
+        positions = self.product_ids.get_indexer(frame["Product"])
+        frame["Cheapest"] = np.flatnonzero(selected) == self._cheapest[timestamp, positions]
+        return frame
+
+    def cost(self, product_id, timestamp, units):
+        """Cost of units of product_id at the timestamp position: per-unit components times units plus the operating cost."""
+        costs = self.series(product_id).iloc[timestamp]
+        return float(costs[UNIT_COMPONENTS].sum() * units + costs["Operating Cost"])
+
+
+if __name__ == "__main__":
+    import time
+
+    from snapshot_store import list_snapshot_files, read_snapshot_file
+    from temporal_cube import update_cubes
+
+    files = list_snapshot_files(sys.argv[1])
+    node_cube, edge_cube = update_cubes(files)
+    start = time.perf_counter()
+    rollup = CostRollup(node_cube, edge_cube)
+    landed = rollup.table()
+    seconds = time.perf_counter() - start
+    print(f"{landed.shape[1]} products x {landed.shape[0]} timestamps in {seconds:.3f} s")
+
+    # the same rollup from the rows of the last snapshot
+    data = read_snapshot_file(files[-1])
+
+    def rows(kind, group, name):
+        columns = data[kind][name]
+        return [dict(zip(columns, row)) for row in data[group].get(name, [])]
+
+    part_cost = {row["id"]: row["cost"] for row in rows("node_types", "node_values", "PARTS")}
+    operating_cost = {row["id"]: row["operating_cost"] for row in rows("node_types", "node_values", "FACILITY")}
+    storage = {}
+    for row in rows("relationship_types", "link_values", "WAREHOUSEToPARTS"):
+        storage.setdefault(row["target"], []).append(row["storage_cost"])
+    unit = {}
+    for row in rows("relationship_types", "link_values", "PARTSToFACILITY"):
+        part = row["source"]
+        unit[row["target"]] = unit.get(row["target"], 0) + row["transport_cost"] + row["quantity"] * (
+            part_cost.get(part, 0) + (np.mean(storage[part]) if part in storage else 0))
+    expected = {}
+    for row in rows("relationship_types", "link_values", "FACILITYToPRODUCT_OFFERING"):
+        cost = unit.get(row["source"], 0) + row["product_cost"]
+        expected[row["target"]] = min(cost, expected.get(row["target"], np.inf))
+    last = landed.iloc[-1].dropna()
+    assert set(last.index) == set(expected)
+    assert np.allclose(last.to_numpy(), [expected[product] for product in last.index])
+    breakdown = rollup.breakdown(len(files) - 1).dropna(subset=["Facility"])
+    assert np.allclose(breakdown["Operating Cost"], [operating_cost.get(facility, 0) for facility in breakdown["Facility"]])
+    print(breakdown.head().to_string())
@@ -0,0 +1,186 @@
+"""
+Critical-path lead times of the product offerings of every timestamp.
+
+calulate_cost_and_time added up the lead times of all the parts of a product,
+as if they arrived one after the other, and left out the lead time of the
+suppliers and of the facilities. A product is ready when its fastest
+facility is done, and a facility is done when the slowest of the parts it
+needs has arrived:
+
+    SUPPLIERSToWAREHOUSE . WAREHOUSEToPARTS . PARTSToFACILITY . FACILITYToPRODUCT_OFFERING
+
+Each relationship type only links one node type to the next, so the node
+types are already in topological order. LeadTimes walks the four layers once,
+over the EdgeCube, for every timestamp at the same time. The arrival over an
+edge is the completion of its source plus the lead time of the edge, and
+each layer combines the arrivals at a node as LEAD_TIME_PATH says: the
+earliest over alternatives (the suppliers of a warehouse, the warehouses
+stocking a part, the facilities making a product), the latest over the
+parts a facility needs. Edges missing at a timestamp do not count; nodes
+without any incoming edge are ready at 0.
+
+    lead_times = temporal_graph.load_lead_times()
+    lead_times.lead_time("PO_001", timestamp)                 # days until PO_001 can be delivered
+    lead_times.lead_time("PO_001", timestamp, ["F_003"])      # the same, made at F_003
+    lead_times.chain("PO_001", timestamp, ["F_003"])          # the edges of that critical path
+    lead_times.table                                          # (timestamp, product) completion days
+
+Lead times are in days. A product no facility makes at a timestamp has no
+lead time there (NaN). Time the pass over every timestamp:
+
+    python critical_path.py data/<version>
+"""
+import sys
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+LEAD_TIME_PATH = (
+    # (relationship type, lead time attribute, how the arrivals at a node combine)
+    ("SUPPLIERSToWAREHOUSE", "lead_time", "min"),  # any supplier of the warehouse
+    ("WAREHOUSEToPARTS", None, "min"),  # parts are in any warehouse once it is supplied
+    ("PARTSToFACILITY", "lead_time", "max"),  # a facility needs all of its parts
+    ("FACILITYToPRODUCT_OFFERING", "lead_time", "min"),  # any facility making the product
+)
+# combine -> (reduction over a node's edges, arrival of a missing edge, edge that sets the node)
+COMBINE = {"min": (np.minimum, np.inf, np.argmin), "max": (np.maximum, -np.inf, np.argmax)}
+CHAIN_COLUMNS = ["From", "To", "Relationship", "Lead Time", "Completes"]
+
+
+class LeadTimes:
+    """Earliest completion day of every node on the supply path, for every timestamp of an EdgeCube."""
+
+    def __init__(self, cube, path=LEAD_TIME_PATH):
+        self.timestamps = list(cube.timestamps)
+        self.path = path
+        edges = [np.array(cube.edges(link_type), dtype=object).reshape(-1, 2) for link_type, _, _ in path]
+        self.node_ids = pd.Index(pd.unique(np.concatenate([e.ravel() for e in edges])))
+        count = len(self.timestamps)
+        completion = np.zeros((count, len(self.node_ids)))
+
+        # per layer, the edges grouped by target: arrival of every edge and its target node,
+        # kept to walk the critical path back from any node
+        self._layers = []
+        for (link_type, attribute, combine), layer_edges in zip(path, edges):
+            sources = self.node_ids.get_indexer(layer_edges[:, 0])
+            targets = self.node_ids.get_indexer(layer_edges[:, 1])
+            order = np.argsort(targets, kind="stable")
+            sources, targets = sources[order], targets[order]
+            reduce, missing, _ = COMBINE[combine]
+
+            lead = np.zeros((count, len(order)))
+            if attribute is not None:
+                lead = np.nan_to_num(cube.values(link_type, attribute)[:, order])
+            valid = cube.valid(link_type)[:, order]
+            arrival = np.where(valid, completion[:, sources] + lead, missing)
+
+            nodes, first = np.unique(targets, return_index=True)
+            reached = np.zeros((count, len(nodes)), dtype=bool)
+            if len(order):
+                # a node none of whose edges exist at a timestamp is ready at 0, as one without edges
+                reached = np.logical_or.reduceat(valid, first, axis=1)
+                completion[:, nodes] = np.where(reached, reduce.reduceat(arrival, first, axis=1), 0)
+            self._layers.append((link_type, combine, sources, targets, lead, arrival, valid, nodes, first))
+
+        self.completion = completion
+        _, _, _, _, _, _, _, nodes, _ = self._layers[-1]
+        self.product_ids = self.node_ids[nodes]
+        # products no facility makes at a timestamp have no lead time there
+        self._products = np.where(reached, completion[:, nodes], np.nan)
+
+    @cached_property
+    def table(self):
+        """Completion day of every product offering, one row per timestamp."""
+        return pd.DataFrame(self._products, index=pd.Index(self.timestamps, name="Timestamp"), columns=self.product_ids)
+
+    def series(self, product_id):
+        """Completion day of product_id at every timestamp, NaN where nothing makes it."""
+        position = self.product_ids.get_indexer([product_id])[0]
+        if position < 0:
+            return np.full(len(self.timestamps), np.nan)
+        return self._products[:, position]
+
+    def _pick(self, layer, node, timestamp, sources=None):
+        """Edge of layer that sets the completion of node at the timestamp position, None when no edge reaches it."""
+        _, combine, layer_sources, _, _, arrival, valid, nodes, first = layer
+        group = np.searchsorted(nodes, node)
+        if node < 0 or group == len(nodes) or nodes[group] != node:
+            return None
+        stop = first[group + 1] if group + 1 < len(first) else arrival.shape[1]
+        edges = first[group] + np.flatnonzero(valid[timestamp, first[group]:stop])
+        if sources is not None:
+            edges = edges[self.node_ids[layer_sources[edges]].isin(list(sources))]
+        if not len(edges):
+            return None
+        _, _, pick = COMBINE[combine]
+        return edges[pick(arrival[timestamp, edges])]
+
+    def lead_time(self, product_id, timestamp, facilities=None):
+        """Days until product_id can be delivered at the timestamp position, made at the fastest of facilities (any by default); NaN where none makes it."""
+        if facilities is None:
+            return float(self.series(product_id)[timestamp])
+        layer = self._layers[-1]
+        edge = self._pick(layer, self.node_ids.get_indexer([product_id])[0], timestamp, facilities)
+        return np.nan if edge is None else float(layer[5][timestamp, edge])
+
+    def chain(self, product_id, timestamp, facilities=None):
+        """Edges of the critical path to product_id at the timestamp position through the fastest of facilities, supplier first."""
+        rows = []
+        node = self.node_ids.get_indexer([product_id])[0]
+        sources = facilities
+        for layer in reversed(self._layers):
+            edge = self._pick(layer, node, timestamp, sources)
+            if edge is None:
+                break
+            link_type, _, layer_sources, _, lead, arrival, _, _, _ = layer
+            rows.append({
+                "From": self.node_ids[layer_sources[edge]],
+                "To": self.node_ids[node],
+                "Relationship": link_type,
+                "Lead Time": lead[timestamp, edge],
+                "Completes": arrival[timestamp, edge],
+            })
+            node, sources = layer_sources[edge], None
+        return pd.DataFrame(rows[::-1], columns=CHAIN_COLUMNS)
+
+
+if __name__ == "__main__":
+    import time
+
+    import networkx as nx
+
+    from snapshot_store import list_snapshot_files, read_snapshot_file
+    from temporal_cube import update_edge_cube
+
+    files = list_snapshot_files(sys.argv[1])
+    cube = update_edge_cube(files)
+    start = time.perf_counter()
+    lead_times = LeadTimes(cube)
+    table = lead_times.table
+    seconds = time.perf_counter() - start
+    print(f"{table.shape[1]} products x {table.shape[0]} timestamps in {seconds:.3f} s")
+
+    # earliest over alternatives, latest over required parts, on the networkx DAG of the last timestamp
+    data = read_snapshot_file(files[-1])
+    graph = nx.DiGraph()
+    for link_type, attribute, combine in LEAD_TIME_PATH:
+        names = data["relationship_types"].get(link_type, [])
+        for row in data["link_values"].get(link_type, []):
+            weight = row[names.index(attribute)] if attribute else 0
+            graph.add_edge(row[-2], row[-1], weight=weight or 0, combine=min if combine == "min" else max)
+    finish = {}
+    for node in nx.topological_sort(graph):
+        arrivals = [(finish[p] + graph[p][node]["weight"], graph[p][node]["combine"]) for p in graph.predecessors(node)]
+        finish[node] = arrivals[0][1](a for a, _ in arrivals) if arrivals else 0
+    last = table.iloc[-1].dropna()
+    assert np.allclose(last.to_numpy(), [finish[product] for product in last.index])
+    product = last.idxmax()
+    chain = lead_times.chain(product, len(files) - 1)
+    assert np.isclose(chain["Lead Time"].sum(), last[product])
+    # made at the other facility, the product takes at least as long
+    for facility in graph.predecessors(product):
+        at_facility = lead_times.lead_time(product, len(files) - 1, [facility])
+        assert np.isclose(at_facility, finish[facility] + graph[facility][product]["weight"]) and at_facility >= last[product]
+        assert lead_times.chain(product, len(files) - 1, [facility])["From"].iloc[-1] == facility
+    print(chain.to_string(index=False))
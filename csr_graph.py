@@ -0,0 +1,286 @@
+"""
+Array-backed graph engine.
+
+CSRGraph answers the lookups the pages make on a NetworkX DiGraph (nodes[...],
+nodes(data=True), in_edges, out_edges, predecessors, successors, has_edge,
+degrees) straight from the arrays of mmap_store: integer node positions,
+per-type attribute columns and CSR/CSC adjacency split by relationship type.
+Attribute dicts are only built for the nodes and edges a query touches.
+
+Algorithms that need a real NetworkX graph (ego graphs, shortest paths,
+ancestors) go through as_networkx(), which builds the NetworkX view once per
+snapshot.
+
+Compare build time and memory with NetworkX:
+
+    python csr_graph.py data/<version>
+"""
+import bisect
+import sys
+from functools import cached_property
+
+import networkx as nx
+
+from mmap_store import UNKNOWN_NODE_TYPE, SnapshotArrays
+
+
+class NodeView:
+    """The parts of networkx's NodeView the pages rely on."""
+
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __call__(self, data=False):
+        return list(self._graph.iter_nodes(data=data))
+
+    def __getitem__(self, node):
+        attributes = self._graph.node_attributes(node)
+        if attributes is None:
+            raise KeyError(node)
+        return attributes
+
+    def __contains__(self, node):
+        return self._graph.has_node(node)
+
+    def __iter__(self):
+        return iter(self._graph.arrays.node_ids.tolist())
+
+    def __len__(self):
+        return self._graph.number_of_nodes()
+
+
+class CSRGraph:
+    def __init__(self, arrays):
+        self.arrays = arrays
+        ranges = sorted((start, stop, node_type) for node_type, (start, stop) in arrays.meta["node_type_ranges"].items())
+        self._range_starts = [start for start, _, _ in ranges]
+        self._ranges = ranges
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(SnapshotArrays.from_data(data))
+
+    def is_directed(self):
+        return self.arrays.directed
+
+    @cached_property
+    def nodes(self):
+        return NodeView(self)
+
+    def number_of_nodes(self):
+        return self.arrays.node_count
+
+    def number_of_edges(self):
+        return sum(self.arrays.meta["link_sizes"].values())
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __contains__(self, node):
+        return self.has_node(node)
+
+    def has_node(self, node):
+        return self.arrays.node_position(node) is not None
+
+    def _type_at(self, position):
+        i = bisect.bisect_right(self._range_starts, position) - 1
+        start, stop, node_type = self._ranges[i]
+        return node_type, position - start
+
+    def node_type(self, node):
+        position = self.arrays.node_position(node)
+        if position is None:
+            return None
+        node_type, _ = self._type_at(position)
+        return node_type if node_type != UNKNOWN_NODE_TYPE else None
+
+    def _attributes_at(self, position):
+        node_type, offset = self._type_at(position)
+        if node_type == UNKNOWN_NODE_TYPE:
+            return {}
+        return {
+            attribute: self.arrays.node_value(node_type, attribute, offset)
+            for attribute in self.arrays.meta["node_columns"][node_type]
+        }
+
+    def node_attributes(self, node):
+        """Attribute dict of node, None when the node does not exist."""
+        position = self.arrays.node_position(node)
+        if position is None:
+            return None
+        return self._attributes_at(position)
+
+    def node_type_rows(self, node_type):
+        """(node_id, attribute dict) of every node of one type, decoded column by column."""
+        start, stop = self.arrays.node_type_range(node_type)
+        node_ids = self.arrays.node_ids[start:stop].tolist()
+        names = list(self.arrays.meta["node_columns"].get(node_type, {}))
+        if not names:
+            return [(node_id, {}) for node_id in node_ids]
+        values = [self.arrays.node_column_values(node_type, name) for name in names]
+        return [(node_id, dict(zip(names, row))) for node_id, row in zip(node_ids, zip(*values))]
+
+    def iter_nodes(self, data=False):
+        if not data:
+            yield from self.arrays.node_ids.tolist()
+            return
+        for node_type in self.arrays.meta["node_type_ranges"]:
+            yield from self.node_type_rows(node_type)
+
+    def _edge_attributes(self, link_type, edge):
+        return {
+            attribute: self.arrays.link_value(link_type, attribute, edge)
+            for attribute in self.arrays.meta["link_columns"][link_type]
+        }
+
+    def _link_types(self, link_type):
+        return self.arrays.link_types if link_type is None else [link_type]
+
+    def _edges_of_type(self, link_type, data):
+        src, dst = self.arrays.link_endpoints(link_type)
+        node_ids = self.arrays.node_ids
+        sources = node_ids[src].tolist()
+        targets = node_ids[dst].tolist()
+        if not data:
+            return list(zip(sources, targets))
+        names = list(self.arrays.meta["link_columns"][link_type])
+        values = [self.arrays.link_column_values(link_type, name) for name in names]
+        rows = zip(*values) if names else [()] * len(sources)
+        return [(u, v, dict(zip(names, row))) for u, v, row in zip(sources, targets, rows)]
+
+    def out_edges(self, node=None, data=False, link_type=None):
+        """Edges leaving node (all edges when node is None), optionally of one relationship type."""
+        if node is None:
+            return [edge for kind in self._link_types(link_type) for edge in self._edges_of_type(kind, data)]
+
+        position = self.arrays.node_position(node)
+        if position is None:
+            return []
+        edges = []
+        for kind in self._link_types(link_type):
+            dst = self.arrays.link_endpoints(kind)[1]
+            for edge in self.arrays.out_edge_range(kind, position):
+                target = str(self.arrays.node_ids[dst[edge]])
+                edges.append((node, target, self._edge_attributes(kind, edge)) if data else (node, target))
+        return edges
+
+    def in_edges(self, node=None, data=False, link_type=None):
+        """Edges entering node (all edges when node is None), optionally of one relationship type."""
+        if node is None:
+            return self.out_edges(None, data=data, link_type=link_type)
+
+        position = self.arrays.node_position(node)
+        if position is None:
+            return []
+        edges = []
+        for kind in self._link_types(link_type):
+            src = self.arrays.link_endpoints(kind)[0]
+            for edge in self.arrays.in_edge_indices(kind, position).tolist():
+                source = str(self.arrays.node_ids[src[edge]])
+                edges.append((source, node, self._edge_attributes(kind, edge)) if data else (source, node))
+        return edges
+
+    def edges(self, data=False, link_type=None):
+        return self.out_edges(None, data=data, link_type=link_type)
+
+    def successors(self, node, link_type=None):
+        return [target for _, target in self.out_edges(node, link_type=link_type)]
+
+    def predecessors(self, node, link_type=None):
+        return [source for source, _ in self.in_edges(node, link_type=link_type)]
+
+    def neighbors(self, node):
+        if self.is_directed():
+            return self.successors(node)
+        return list(dict.fromkeys(self.successors(node) + self.predecessors(node)))
+
+    def get_edge_data(self, u, v, default=None):
+        # later rows update earlier ones, as repeated add_edge calls do in NetworkX
+        attributes = None
+        for _, target, edge_data in self.out_edges(u, data=True):
+            if target == v:
+                attributes = {**(attributes or {}), **edge_data}
+        if attributes is None and not self.is_directed():
+            for source, _, edge_data in self.in_edges(u, data=True):
+                if source == v:
+                    attributes = {**(attributes or {}), **edge_data}
+        return default if attributes is None else attributes
+
+    def has_edge(self, u, v):
+        return self.get_edge_data(u, v) is not None
+
+    def out_degree(self, node):
+        position = self.arrays.node_position(node)
+        if position is None:
+            return 0
+        return sum(len(self.arrays.out_edge_range(kind, position)) for kind in self.arrays.link_types)
+
+    def in_degree(self, node):
+        position = self.arrays.node_position(node)
+        if position is None:
+            return 0
+        return sum(len(self.arrays.in_edge_indices(kind, position)) for kind in self.arrays.link_types)
+
+    def degree(self, node):
+        return self.out_degree(node) + self.in_degree(node)
+
+    @cached_property
+    def networkx(self):
+        graph = nx.DiGraph() if self.is_directed() else nx.Graph()
+        graph.add_nodes_from(self.iter_nodes(data=True))
+        for link_type in self.arrays.link_types:
+            graph.add_edges_from(self._edges_of_type(link_type, data=True))
+        return graph
+
+    def to_networkx(self):
+        """NetworkX copy of the graph, built once and shared by later callers."""
+        return self.networkx
+
+    def to_undirected(self):
+        return self.networkx.to_undirected()
+
+
+def as_networkx(graph):
+    """NetworkX graph for algorithms that need one, whichever engine built graph."""
+    return graph.to_networkx() if isinstance(graph, CSRGraph) else graph
+
+
+if __name__ == "__main__":
+    import time
+    import tracemalloc
+
+    from mmap_store import MmapSnapshot, mmap_folder_for, write_mmap_snapshot
+    from snapshot_store import list_snapshot_files, read_snapshot_file
+    from TemporalGraphClass import json_to_graph
+
+    if len(sys.argv) < 2:
+        print("usage: python csr_graph.py <version folder>")
+        sys.exit(1)
+
+    file_path = list_snapshot_files(sys.argv[1])[0]
+    data = read_snapshot_file(file_path)
+    write_mmap_snapshot(data, mmap_folder_for(file_path))
+
+    builders = (
+        ("networkx", lambda: json_to_graph(data)),
+        ("csr", lambda: CSRGraph.from_data(data)),
+        # the mmap backend only opens files that were written once
+        ("csr mmap", lambda: CSRGraph(MmapSnapshot(mmap_folder_for(file_path)))),
+    )
+    for name, build in builders:
+        start = time.perf_counter()
+        graph = build()
+        seconds = time.perf_counter() - start
+        del graph
+
+        # memory is traced in a second build so tracing does not skew the timing
+        tracemalloc.start()
+        graph = build()
+        held, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:>8}: {graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges, "
+              f"build {seconds:.3f} s, held {held / 1e6:.1f} MB, peak {peak / 1e6:.1f} MB")
+        del graph
@@ -0,0 +1,142 @@
+"""
+Concurrent, resumable download of the timestamp snapshots of a version.
+
+Every snapshot is written to a temporary file and renamed into place, and the
+timestamps that finished are recorded in a manifest inside the version
+folder. A sync asks the server for its timestamps and only fetches the ones
+missing from the manifest or from the folder, so an interrupted download
+picks up where it stopped and a complete folder costs a single request.
+"""
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from snapshot_store import SNAPSHOT_EXTENSION, list_snapshot_files, read_snapshot_file, write_snapshot
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_WORKERS = 8
+REQUEST_TIMEOUT = 60  # seconds
+
+
+def create_session(max_workers=DEFAULT_WORKERS):
+    """Session whose connection pool is large enough for every worker."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=3)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _atomic_write_json(payload, file_path):
+    temp_path = f"{file_path}.part"
+    with open(temp_path, "w") as f:
+        json.dump(payload, f)
+    os.replace(temp_path, file_path)
+
+
+def read_manifest(target_path):
+    """Return the set of completed timestamps recorded for a version folder."""
+    manifest_path = os.path.join(target_path, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return set()
+
+    with open(manifest_path, "r") as f:
+        return set(json.load(f)["completed"])
+
+
+def write_manifest(target_path, completed):
+    _atomic_write_json({"completed": sorted(completed, key=int)}, os.path.join(target_path, MANIFEST_NAME))
+
+
+def _stored_timestamps(target_path):
+    return {os.path.splitext(os.path.basename(file_path))[0] for file_path in list_snapshot_files(target_path)}
+
+
+def _adopt_existing_files(target_path):
+    # folders downloaded before the manifest existed: keep every file that still parses
+    completed = set()
+    for file_path in list_snapshot_files(target_path):
+        try:
+            read_snapshot_file(file_path)
+        except Exception:
+            continue
+        completed.add(os.path.splitext(os.path.basename(file_path))[0])
+    return completed
+
+
+def fetch_timestamps(session, timestamps_url):
+    response = session.get(timestamps_url, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    return [str(timestamp) for timestamp in response.json()]
+
+
+def download_snapshot(session, data_url, timestamp, target_path):
+    """Fetch one timestamp and move it into place only once it is fully written."""
+    response = session.get(f"{data_url}/{timestamp}", timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+
+    file_path = os.path.join(target_path, f"{timestamp}{SNAPSHOT_EXTENSION}")
+    temp_path = f"{file_path}.part"
+    write_snapshot(response.json(), temp_path)
+    os.replace(temp_path, file_path)
+    return file_path
+
+
+def sync_version(timestamps_url, data_url, target_path, max_workers=DEFAULT_WORKERS, session=None, on_progress=None):
+    """
+    Bring target_path up to date with the server.
+
+    Only timestamps missing from the manifest, or whose file is gone from
+    target_path, are fetched, max_workers at a time over one pooled session.
+    A failed timestamp does not stop the others; it stays out of the manifest
+    and is retried by the next sync.
+    on_progress(done, total) is called from the calling thread.
+
+    Returns a dict with the server's timestamps, the downloaded ones and a
+    {timestamp: error} dict of failures. Errors fetching the timestamp list
+    itself are raised.
+    """
+    session = session or create_session(max_workers)
+    os.makedirs(target_path, exist_ok=True)
+
+    completed = read_manifest(target_path)
+    if completed:
+        # a snapshot deleted after it was recorded is fetched again
+        stored = completed & _stored_timestamps(target_path)
+        if stored != completed:
+            completed = stored
+            write_manifest(target_path, completed)
+    else:
+        completed = _adopt_existing_files(target_path)
+        if completed:
+            write_manifest(target_path, completed)
+
+    timestamps = fetch_timestamps(session, timestamps_url)
+    missing = [timestamp for timestamp in timestamps if timestamp not in completed]
+
+    downloaded = []
+    failed = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(download_snapshot, session, data_url, timestamp, target_path): timestamp
+            for timestamp in missing
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            timestamp = futures[future]
+            try:
+                future.result()
+            except (requests.RequestException, ValueError, OSError) as e:
+                failed[timestamp] = str(e)
+            else:
+                downloaded.append(timestamp)
+                completed.add(timestamp)
+                write_manifest(target_path, completed)
+
+            if on_progress is not None:
+                on_progress(done, len(missing))
+
+    return {"timestamps": timestamps, "downloaded": downloaded, "failed": failed}
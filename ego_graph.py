@@ -0,0 +1,189 @@
+"""
+Ego graphs for the node details of the pages, bounded and cached.
+
+nx.ego_graph collected the whole radius around a node, and every render laid
+it out again: utils.plotly_ego_graph with a fresh spring layout, the
+Structural page with a Kamada-Kawai layout, O(n²) memory that stalls at
+radius 3 to 5. EgoGraphService keeps the ego graph of every (timestamp, node,
+radius) in an LRU cache, together with its layout, a slice of the global
+layout of the version (see layout_engine):
+
+    ego = temporal_graph.load_ego_graph_at_timestamp(timestamp, "F_014", 2)
+    ego.graph        # the nodes within 2 hops of F_014, whatever the edge direction
+    ego.pos          # node -> (x, y)
+    ego.truncated    # the walk stopped at the node budget before radius 2
+    plotly_ego_graph(ego.graph, ego.pos)
+
+The breadth-first walk stops once node_budget nodes are collected, nearest
+first. Without a global layout, a new layout is seeded with the last layout
+of the same node and radius, the one of the previous timestamp when the
+slider moves: if the nodes and edges are the same its positions are reused as
+they are, otherwise force_layout refines them in a few iterations. Compare
+with nx.ego_graph and a fresh layout for every timestamp:
+
+    python ego_graph.py data/<version> F_014 3
+"""
+import sys
+import threading
+from collections import OrderedDict
+from itertools import chain
+
+import networkx as nx
+
+from layout_engine import layout_graph
+
+EGO_NODE_BUDGET = 500
+
+
+def bounded_ego_graph(graph, node_id, radius, node_budget=EGO_NODE_BUDGET):
+    """
+    Nodes within radius hops of node_id, edge direction ignored, and the edges
+    between them, stopping at node_budget nodes. Works on networkx and CSR
+    graphs; returns the networkx ego graph and whether the walk was cut short.
+    """
+    ego = nx.DiGraph() if graph.is_directed() else nx.Graph()
+    if node_id not in graph:
+        return ego, False
+
+    seen = {node_id}
+    frontier = [node_id]
+    truncated = False
+    for _ in range(radius):
+        next_frontier = []
+        for node in frontier:
+            neighbors = chain(graph.successors(node), graph.predecessors(node)) if graph.is_directed() else graph.neighbors(node)
+            for neighbor in neighbors:
+                if neighbor in seen:
+                    continue
+                if len(seen) >= node_budget:
+                    truncated = True
+                    break
+                seen.add(neighbor)
+                next_frontier.append(neighbor)
+            if truncated:
+                break
+        frontier = next_frontier
+        if truncated or not frontier:
+            break
+
+    # nx.Graph has no out_edges, its edges of a node are the same thing
+    out_edges = getattr(graph, "out_edges", graph.edges)
+    for node in seen:
+        ego.add_node(node, **graph.nodes[node])
+    for node in seen:
+        for _, target, attributes in out_edges(node, data=True):
+            if target in seen:
+                ego.add_edge(node, target, **attributes)
+    return ego, truncated
+
+
+class EgoGraph:
+    """Ego graph of one (timestamp, node, radius) and its layout."""
+
+    def __init__(self, graph, pos, truncated):
+        self.graph = graph
+        self.pos = pos
+        self.truncated = truncated
+
+
+class EgoGraphService:
+    """LRU cache of bounded ego graphs and their layouts, keyed by (timestamp, node, radius)."""
+
+    def __init__(self, layout=None, max_entries=64, node_budget=EGO_NODE_BUDGET):
+        # the GlobalLayout of the version, ego graphs are then drawn by slicing it
+        self.layout = layout
+        self.max_entries = max_entries
+        self.node_budget = node_budget
+        self._entries = OrderedDict()
+        # (node, radius) -> nodes, edges and positions of its last layout
+        self._layouts = OrderedDict()
+        # cache_resource shares the service between sessions
+        self._lock = threading.Lock()
+
+    def ego_graph(self, timestamp, node_id, radius, load_graph):
+        """EgoGraph of node_id at the timestamp position; load_graph(timestamp) is only called on a miss."""
+        key = (timestamp, node_id, radius)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        graph, truncated = bounded_ego_graph(load_graph(timestamp), node_id, radius, self.node_budget)
+        entry = EgoGraph(graph, self._layout(graph, (node_id, radius)), truncated)
+        with self._lock:
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _layout(self, graph, key):
+        if self.layout is not None:
+            pos = self.layout.positions(graph.nodes)
+            if len(pos) == len(graph):
+                return pos
+            # nodes the global layout has not seen yet are placed next to their neighbors
+            return layout_graph(graph, initial=pos)
+
+        nodes, edges = frozenset(graph.nodes), frozenset(graph.edges)
+        with self._lock:
+            last = self._layouts.get(key)
+
+        if last is not None and last[0] == nodes and last[1] == edges:
+            pos = last[2]
+        else:
+            seed = {node: xy for node, xy in last[2].items() if node in nodes} if last is not None else {}
+            pos = layout_graph(graph, initial=seed or None)
+
+        with self._lock:
+            self._layouts[key] = (nodes, edges, pos)
+            self._layouts.move_to_end(key)
+            while len(self._layouts) > self.max_entries:
+                self._layouts.popitem(last=False)
+        return pos
+
+
+if __name__ == "__main__":
+    import time
+
+    from snapshot_store import list_snapshot_files, read_snapshot_file
+    from TemporalGraphClass import json_to_graph
+
+    files = list_snapshot_files(sys.argv[1])
+    node_id = sys.argv[2]
+    radius = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    graphs = [json_to_graph(read_snapshot_file(path)) for path in files]
+
+    start = time.perf_counter()
+    for graph in graphs:
+        nx.spring_layout(nx.ego_graph(graph, node_id, radius=radius, undirected=True))
+    print(f"nx.ego_graph and a fresh layout, {len(graphs)} timestamps: {time.perf_counter() - start:.3f} s")
+
+    service = EgoGraphService()
+    start = time.perf_counter()
+    for timestamp in range(len(graphs)):
+        ego = service.ego_graph(timestamp, node_id, radius, graphs.__getitem__)
+    print(f"service, first pass: {time.perf_counter() - start:.3f} s, "
+          f"{ego.graph.number_of_nodes()} nodes, truncated: {ego.truncated}")
+    start = time.perf_counter()
+    for timestamp in range(len(graphs)):
+        service.ego_graph(timestamp, node_id, radius, graphs.__getitem__)
+    print(f"service, cached: {time.perf_counter() - start:.6f} s")
+
+    from layout_engine import update_global_layout
+    from temporal_cube import update_cubes
+
+    start = time.perf_counter()
+    layout = update_global_layout(files, *update_cubes(files))
+    print(f"global layout of the version: {time.perf_counter() - start:.3f} s")
+    sliced = EgoGraphService(layout)
+    start = time.perf_counter()
+    for timestamp in range(len(graphs)):
+        sliced.ego_graph(timestamp, node_id, radius, graphs.__getitem__)
+    print(f"service drawing slices of it, first pass: {time.perf_counter() - start:.3f} s")
+
+    # within the budget the walk finds what nx.ego_graph finds
+    unbounded = EgoGraphService(node_budget=float("inf")).ego_graph(0, node_id, radius, graphs.__getitem__)
+    expected = nx.ego_graph(graphs[0], node_id, radius=radius, undirected=True)
+    assert set(unbounded.graph.nodes) == set(expected.nodes)
+    assert set(unbounded.graph.edges) == set(expected.edges)
+    assert not unbounded.truncated
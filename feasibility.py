@@ -0,0 +1,201 @@
+"""
+Supply chain feasibility of a whole order book against one snapshot.
+
+supply_chain_query in main.py answers one (product, units) order: warehouse
+stock of the product, then the parts the remaining units need from stock,
+subassemblies expanded by the BillOfMaterials (bill_of_materials.py), the
+stock of those parts, and the suppliers of the parts that are short.
+FeasibilityEvaluator aggregates the stock of every product and part, and
+takes the flattened bills and facility cost of every product once per
+snapshot; a batch of orders is then a few merges and group-bys over all of
+them:
+
+    evaluator = temporal_graph.load_feasibility_at_timestamp(timestamp)
+    lead_times = temporal_graph.load_lead_times().table.iloc[timestamp]
+    evaluator.evaluate([("PO_001", 500), ("PO_002", 40)], catalog=load_supplier_catalog(), lead_times=lead_times)
+
+Every order is checked against the full stock of the snapshot, on its own,
+as supply_chain_query does. Compare with one supply_chain_query per order:
+
+    python feasibility.py data/<version> 500
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+ORDER_COLUMNS = ("product_id", "units")
+STATUS_LABELS = {
+    0: "Invalid order",
+    1: "Warehouse stock",
+    2: "Manufacture",
+    3: "Parts short",
+}
+RESULT_COLUMNS = [
+    "Product", "Units", "Warehouse Units", "Units to Manufacture", "Manufacturing Cost",
+    "Manufacturing Time", "Short Parts", "Shortfall Units", "Supplier Options", "Status",
+]
+
+
+def link_columns(engine, link_type, columns):
+    """Columns of one relationship type in file order, empty when the snapshot has no such links."""
+    if link_type not in engine.link_types:
+        return pd.DataFrame(columns=list(columns))
+    return engine.links(link_type)[list(columns)]
+
+
+def _joined(order, values, index):
+    """", ".join of the values of each order, "" for orders without any."""
+    grouped = {}
+    for key, value in zip(order.tolist(), values.tolist()):
+        grouped.setdefault(key, []).append(value)
+    return pd.Series([", ".join(grouped.get(key, ())) for key in index], index=index)
+
+
+def read_orders(orders):
+    """DataFrame of product_id and units from a DataFrame, a CSV file or (product, units) pairs."""
+    if isinstance(orders, pd.DataFrame):
+        frame = orders
+    elif hasattr(orders, "read") or isinstance(orders, str):
+        if hasattr(orders, "seek"):
+            # an upload is read again on every rerun of the page
+            orders.seek(0)
+        frame = pd.read_csv(orders)
+    else:
+        frame = pd.DataFrame(list(orders), columns=list(ORDER_COLUMNS))
+
+    frame = frame.rename(columns=lambda name: str(name).strip().lower())
+    missing = [name for name in ORDER_COLUMNS if name not in frame]
+    if missing:
+        raise ValueError(f"Orders are missing the columns {missing}, expected {list(ORDER_COLUMNS)}.")
+    frame = frame[list(ORDER_COLUMNS)].reset_index(drop=True)
+    frame["product_id"] = frame["product_id"].astype(str).str.strip()
+    frame["units"] = pd.to_numeric(frame["units"], errors="coerce")
+    return frame
+
+
+class FeasibilityEvaluator:
+    """Stock and bill of materials of one snapshot, aggregated for batches of orders."""
+
+    def __init__(self, engine, bill_of_materials):
+        self.products = set(engine.nodes("PRODUCT_OFFERING").index) if "PRODUCT_OFFERING" in engine.node_types else set()
+
+        product_links = link_columns(engine, "WAREHOUSEToPRODUCT_OFFERING", ("target", "inventory_level"))
+        self.product_stock = product_links.groupby("target")["inventory_level"].sum()
+        part_links = link_columns(engine, "WAREHOUSEToPARTS", ("target", "inventory_level"))
+        self.part_stock = part_links.groupby("target")["inventory_level"].sum()
+
+        # subassemblies expanded: parts from stock, subassemblies built and transport, per unit of each product
+        self.bill = bill_of_materials.bills()
+
+        # the fixed cost of every facility that makes the product or one of its subassemblies
+        facilities = bill_of_materials.product_facilities()
+        operating_cost = engine.nodes("FACILITY")["operating_cost"] if "FACILITY" in engine.node_types else pd.Series(dtype=float)
+        self.facility_cost = facilities["facility"].map(operating_cost).fillna(0).groupby(facilities["product"]).sum()
+
+    def evaluate(self, orders, catalog=None, lead_times=None):
+        """
+        One result row per order, in order.
+
+        Status 1: the warehouses hold enough units. 2: the rest can be made from
+        the parts in stock. 3: parts are short; Supplier Options lists the
+        catalog's suppliers of the short parts. 0: unknown product or units
+        that are not a positive number. Manufacturing Time is the critical-path
+        lead time of the product in lead_times (product -> days, a row of
+        LeadTimes.table), NaN without it.
+        """
+        orders = read_orders(orders)
+        valid = orders["product_id"].isin(self.products) & (orders["units"] > 0)
+
+        available = orders["product_id"].map(self.product_stock).fillna(0)
+        need = (orders["units"] - available).where(valid, 0).clip(lower=0)
+
+        made = pd.DataFrame({"order": orders.index, "product": orders["product_id"], "need": need})[need > 0]
+        rows = made.merge(self.bill, on="product")
+        rows["required"] = np.ceil(rows["quantity"] * rows["need"])
+        rows["cost"] = np.ceil(rows["transport_cost"] * rows["need"])
+        rows["shortfall"] = rows["required"] - rows["part"].map(self.part_stock).fillna(0)
+
+        by_order = rows.groupby("order")
+        cost = by_order["cost"].sum().reindex(orders.index, fill_value=0)
+        cost += orders["product_id"].map(self.facility_cost).fillna(0).where(need > 0, 0)
+        # the parts arrive in parallel, the lead time does not grow with the units
+        time = orders["product_id"].map(lead_times if lead_times is not None else {}).astype(float).where(need > 0, 0)
+
+        short = rows[rows["shortfall"] > 0]
+        short_parts = _joined(short["order"], short["part"], orders.index)
+        shortfall = short.groupby("order")["shortfall"].sum().reindex(orders.index, fill_value=0)
+
+        options = pd.Series("", index=orders.index)
+        if catalog is not None and len(short):
+            suppliers = short[["order", "part"]].assign(supplier=short["part"].map(catalog.suppliers_of)).explode("supplier")
+            suppliers = suppliers.dropna(subset=["supplier"]).drop_duplicates(["order", "supplier"])
+            options = _joined(suppliers["order"], suppliers["supplier"], orders.index)
+
+        status = np.select([~valid, available >= orders["units"], shortfall > 0], [0, 1, 3], default=2)
+        result = pd.DataFrame({
+            "Product": orders["product_id"],
+            "Units": orders["units"],
+            "Warehouse Units": available.where(valid, 0),
+            "Units to Manufacture": np.ceil(need),
+            "Manufacturing Cost": cost,
+            "Manufacturing Time": time,
+            "Short Parts": short_parts,
+            "Shortfall Units": shortfall,
+            "Supplier Options": options,
+            "Status": pd.Series(status, index=orders.index).map(STATUS_LABELS),
+        })
+        return result[RESULT_COLUMNS]
+
+
+if __name__ == "__main__":
+    import math
+    import time as timer
+
+    from bill_of_materials import BillOfMaterials
+    from critical_path import LeadTimes
+    from query_engine import QueryEngine
+    from snapshot_store import list_snapshot_files, read_snapshot_file
+    from temporal_cube import update_edge_cube
+    from TemporalGraphClass import TypedAdjacency
+
+    files = list_snapshot_files(sys.argv[1])
+    data = read_snapshot_file(files[0])
+    lead_times = LeadTimes(update_edge_cube(files)).table.iloc[0]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    rng = np.random.default_rng(0)
+    product_ids = [row[-1] for row in data["node_values"]["PRODUCT_OFFERING"]]
+    orders = list(zip(rng.choice(product_ids, count).tolist(), rng.integers(1, 2000, count).tolist()))
+    adjacency = TypedAdjacency(data)
+    operating_cost = {row[-1]: row[-2] for row in data["node_values"]["FACILITY"]}
+    engine = QueryEngine(data)
+    bom = BillOfMaterials(engine)
+
+    def single_order(product_id, units):
+        # the steps of main.supply_chain_query
+        available = sum(e["inventory_level"] for _, _, e in adjacency.in_edges("WAREHOUSEToPRODUCT_OFFERING", product_id, data=True))
+        if available >= units:
+            return 1, 0, 0
+        raw = {part: [math.ceil(v * (units - available)) for v in values] for part, values in bom.unit_bill(product_id).iterrows()}
+        short = any(values[0] - sum(e["inventory_level"] for _, _, e in adjacency.in_edges("WAREHOUSEToPARTS", part, data=True)) > 0
+                    for part, values in raw.items())
+        cost = sum(values[1] for values in raw.values()) + sum(operating_cost.get(f, 0) for f in bom.facilities(product_id))
+        return (3 if short else 2), cost, lead_times.get(product_id, np.nan)
+
+    start = timer.perf_counter()
+    expected = [single_order(product_id, units) for product_id, units in orders]
+    print(f"{count} orders, one query each: {timer.perf_counter() - start:.3f} s")
+
+    start = timer.perf_counter()
+    evaluator = FeasibilityEvaluator(engine, bom)
+    built = timer.perf_counter() - start
+    start = timer.perf_counter()
+    result = evaluator.evaluate(orders, lead_times=lead_times)
+    print(f"evaluator: aggregates {built:.3f} s, batch {timer.perf_counter() - start:.3f} s")
+
+    labels = [STATUS_LABELS[status] for status, _, _ in expected]
+    assert result["Status"].tolist() == labels
+    made = result["Status"] != STATUS_LABELS[1]
+    assert np.allclose(result.loc[made, "Manufacturing Cost"], [cost for (s, cost, _) in expected if s != 1])
+    assert np.allclose(result.loc[made, "Manufacturing Time"], [t for (s, _, t) in expected if s != 1], equal_nan=True)
+    print(result["Status"].value_counts().to_string())
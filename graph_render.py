@@ -0,0 +1,245 @@
+"""
+Plotly traces of large graphs: arrays built in bulk, WebGL and bundled edges.
+
+The ego graph figures appended every edge to Python lists with None
+separators and wrote one hover string per node, drawn with SVG go.Scatter:
+a few thousand elements made the page unusable. GraphArrays takes the node
+positions and the edges of a graph as NumPy arrays once; the traces are then
+slices of them:
+
+    arrays = GraphArrays(graph, pos)
+    traces = edge_traces(arrays, render="auto", edge_budget=2000, color="gray")
+    traces.append(node_trace(arrays, arrays.of_type("FACILITY"), render="auto", marker=dict(size=12)))
+
+- render "auto" switches from go.Scatter to go.Scattergl above WEBGL_THRESHOLD
+  nodes and edges, "svg" and "webgl" force one of them,
+- edge coordinates are one float array per relationship type, NaN between
+  segments, and hovers are a hovertemplate over customdata columns instead of
+  one string per element,
+- above edge_budget edges, the edges of one relationship type between the
+  same two cells of a grid over the layout are bundled into one segment
+  between their mean endpoints, drawn wider the more edges it carries. The
+  grid is coarsened until the bundles fit the budget, so the payload is
+  bounded whatever the number of edges.
+
+Compare the payload and build time with the per-edge lists:
+
+    python graph_render.py 20000
+"""
+import sys
+
+import numpy as np
+import plotly.graph_objects as go
+
+RENDER_MODES = ("auto", "svg", "webgl")
+WEBGL_THRESHOLD = 1000
+EDGE_BUDGET = 2000
+BUNDLE_GRID = 64
+
+
+class GraphArrays:
+    """Node ids, positions and types, and edge endpoints and relationship types of a graph as arrays."""
+
+    def __init__(self, graph, pos):
+        self.graph = graph
+        self.ids = np.array(list(graph.nodes), dtype=object)
+        index = {node: i for i, node in enumerate(self.ids)}
+        self.xy = np.array([pos[node] for node in self.ids], dtype=float).reshape(-1, 2)
+        self.node_types = np.array([graph.nodes[node].get("node_type", "") for node in self.ids], dtype=object)
+
+        edges = list(graph.edges(data="relationship_type", default=""))
+        self.src = np.array([index[u] for u, _, _ in edges], dtype=np.int64)
+        self.dst = np.array([index[v] for _, v, _ in edges], dtype=np.int64)
+        self.link_types = np.array([kind for _, _, kind in edges], dtype=object)
+        self.out_degree = np.bincount(self.src, minlength=len(self.ids))
+        self.in_degree = np.bincount(self.dst, minlength=len(self.ids))
+
+    def of_type(self, node_type):
+        """Rows of the nodes of node_type."""
+        return np.flatnonzero(self.node_types == node_type)
+
+    def size(self):
+        return len(self.ids) + len(self.src)
+
+
+def scatter_class(arrays, render="auto"):
+    """go.Scattergl or go.Scatter for the arrays under the render mode."""
+    if render not in RENDER_MODES:
+        raise ValueError(f"Unknown render mode {render}, expected one of {RENDER_MODES}.")
+    webgl = render == "webgl" or (render == "auto" and arrays.size() > WEBGL_THRESHOLD)
+    return go.Scattergl if webgl else go.Scatter
+
+
+def _segments(start, end):
+    """x and y of line segments start -> end, NaN between segments."""
+    x = np.full(3 * len(start), np.nan)
+    y = np.full(3 * len(start), np.nan)
+    x[0::3], x[1::3] = start[:, 0], end[:, 0]
+    y[0::3], y[1::3] = start[:, 1], end[:, 1]
+    return x, y
+
+
+def _hovertemplate(title, names, first=0):
+    lines = [f"{name}: %{{customdata[{first + i}]}}" for i, name in enumerate(names)]
+    return "<br>".join([title] + lines) + "<extra></extra>"
+
+
+def _attribute_table(rows, names):
+    """(row, attribute) object array of the attribute dicts rows, blank where one is missing."""
+    table = np.empty((len(rows), len(names)), dtype=object)
+    for i, attributes in enumerate(rows):
+        table[i] = [attributes.get(name, "") for name in names]
+    return table
+
+
+def _attribute_names(rows, skip):
+    return list(dict.fromkeys(name for attributes in rows for name in attributes if name not in skip))
+
+
+def bundle_edges(arrays, edge_budget=EDGE_BUDGET):
+    """
+    Start, end, relationship type and edge count of every segment to draw: the
+    edges themselves up to edge_budget, else bundles of the edges of one type
+    between the same two grid cells, on the finest grid that fits the budget.
+    """
+    start, end = arrays.xy[arrays.src], arrays.xy[arrays.dst]
+    if len(arrays.src) <= edge_budget:
+        return start, end, arrays.link_types, np.ones(len(arrays.src), dtype=np.int64)
+
+    kinds, kind = np.unique(arrays.link_types.astype(str), return_inverse=True)
+    low = arrays.xy.min(axis=0)
+    span = max(float((arrays.xy.max(axis=0) - low).max()), 1e-12)
+    cells = BUNDLE_GRID
+    while True:
+        cell_xy = np.minimum(((arrays.xy - low) / span * cells).astype(np.int64), cells - 1)
+        cell = cell_xy[:, 0] * cells + cell_xy[:, 1]
+        key = (kind * cells * cells + cell[arrays.src]) * cells * cells + cell[arrays.dst]
+        keys, bundle, count = np.unique(key, return_inverse=True, return_counts=True)
+        if len(keys) <= edge_budget or cells == 1:
+            break
+        cells = int(cells / np.sqrt(2))
+
+    def mean(points):
+        return np.stack([np.bincount(bundle, weights=points[:, axis]) / count for axis in (0, 1)], axis=1)
+
+    first = np.zeros(len(keys), dtype=np.int64)
+    first[bundle[::-1]] = np.arange(len(bundle))[::-1]
+    return mean(start), mean(end), kinds[kind[first]].astype(object), count
+
+
+def edge_traces(arrays, render="auto", edge_budget=EDGE_BUDGET, color="gray", width=0.5, opacity=1.0, hover=True):
+    """
+    Line traces of the edges, one per relationship type and bundle width, and
+    when hover is set an invisible marker at the middle of every segment
+    carrying the attributes of the edge, or the size of the bundle.
+    """
+    scatter = scatter_class(arrays, render)
+    start, end, kinds, count = bundle_edges(arrays, edge_budget)
+    bundled = len(count) < len(arrays.src) or (count > 1).any()
+    # bundles of 2, 4, 8 ... edges get one more pixel each
+    widths = np.floor(np.log2(count)).astype(np.int64)
+    colors = color if isinstance(color, dict) else {}
+
+    traces = []
+    for kind in dict.fromkeys(kinds.tolist()):
+        of_kind = kinds == kind
+        for extra in np.unique(widths[of_kind]):
+            selected = of_kind & (widths == extra)
+            x, y = _segments(start[selected], end[selected])
+            traces.append(scatter(
+                x=x, y=y, mode="lines", hoverinfo="none", showlegend=False, opacity=opacity,
+                line=dict(width=width + extra, color=colors.get(kind, color if not colors else "gray")),
+            ))
+        if not hover:
+            continue
+
+        middle = (start[of_kind] + end[of_kind]) / 2
+        if bundled:
+            customdata = count[of_kind, None]
+            template = f"<b>%{{customdata[0]}} x {kind}</b><extra></extra>"
+        else:
+            rows = np.flatnonzero(of_kind)
+            attributes = [arrays.graph.edges[u, v] for u, v in zip(arrays.ids[arrays.src[rows]], arrays.ids[arrays.dst[rows]])]
+            names = _attribute_names(attributes, ("relationship_type",))
+            customdata = np.concatenate([
+                np.stack([arrays.ids[arrays.src[rows]], arrays.ids[arrays.dst[rows]]], axis=1),
+                _attribute_table(attributes, names),
+            ], axis=1)
+            template = _hovertemplate(f"<b>{kind}</b><br>%{{customdata[0]}} → %{{customdata[1]}}", names, first=2)
+        traces.append(scatter(
+            x=middle[:, 0], y=middle[:, 1], mode="markers", marker=dict(size=6, opacity=0),
+            customdata=customdata, hovertemplate=template, showlegend=False,
+        ))
+    return traces
+
+
+def node_trace(arrays, rows, render="auto", title="", degrees=False, **trace):
+    """
+    Marker trace of the nodes at rows. The hover shows title, the id, the in
+    and out degree when degrees is set, and every attribute but node_type.
+    """
+    attributes = [arrays.graph.nodes[node] for node in arrays.ids[rows]]
+    names = _attribute_names(attributes, ("node_type",))
+    columns = [arrays.ids[rows, None]]
+    header = [f"<b>{title}</b>"] if title else []
+    header.append("ID: %{customdata[0]}")
+    if degrees:
+        columns.append(np.stack([arrays.in_degree[rows] + arrays.out_degree[rows], arrays.in_degree[rows], arrays.out_degree[rows]], axis=1))
+        header.append("Connections: %{customdata[1]}<br>Incoming: %{customdata[2]}<br>Outgoing: %{customdata[3]}")
+    columns.append(_attribute_table(attributes, names))
+    customdata = np.concatenate(columns, axis=1)
+
+    trace.setdefault("mode", "markers")
+    return scatter_class(arrays, render)(
+        x=arrays.xy[rows, 0], y=arrays.xy[rows, 1], customdata=customdata,
+        hovertemplate=_hovertemplate("<br>".join(header), names, first=4 if degrees else 1),
+        **trace,
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    import networkx as nx
+
+    from layout_engine import layout_graph
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    rng = np.random.default_rng(0)
+    nodes = count // 4
+    graph = nx.DiGraph()
+    kinds = ["PARTSToFACILITY", "WAREHOUSEToPARTS", "SUPPLIERSToWAREHOUSE"]
+    for i in range(nodes):
+        graph.add_node(f"N_{i}", node_type=["PARTS", "FACILITY", "WAREHOUSE"][i % 3], cost=float(i))
+    for u, v in rng.integers(0, nodes, (count, 2)).tolist():
+        if u != v:
+            graph.add_edge(f"N_{u}", f"N_{v}", relationship_type=kinds[(u + v) % 3], lead_time=u % 7)
+    pos = layout_graph(graph)
+
+    # the per-edge lists of plotly_ego_graph before
+    start = time.perf_counter()
+    edge_x, edge_y, edge_text = [], [], []
+    for u, v, attributes in graph.edges(data=True):
+        edge_x += [pos[u][0], pos[v][0], None]
+        edge_y += [pos[u][1], pos[v][1], None]
+        edge_text.append("<br>".join(f"{key}: {value}" for key, value in attributes.items()))
+    node_text = ["<br>".join(f"{key}: {value}" for key, value in attributes.items()) for _, attributes in graph.nodes(data=True)]
+    before = go.Figure([
+        go.Scatter(x=edge_x, y=edge_y, mode="lines", hovertext=edge_text),
+        go.Scatter(x=[pos[n][0] for n in graph], y=[pos[n][1] for n in graph], mode="markers", hovertext=node_text),
+    ])
+    payload = len(before.to_json())
+    print(f"per-edge lists, {graph.number_of_edges()} edges: {time.perf_counter() - start:.2f} s, {payload / 1e6:.2f} MB")
+
+    for budget in (EDGE_BUDGET, count * 2):
+        start = time.perf_counter()
+        arrays = GraphArrays(graph, pos)
+        traces = edge_traces(arrays, edge_budget=budget)
+        traces += [node_trace(arrays, arrays.of_type(node_type), title=node_type) for node_type in ("PARTS", "FACILITY", "WAREHOUSE")]
+        after = go.Figure(traces)
+        payload = len(after.to_json())
+        segments = sum(np.isnan(trace.x).sum() for trace in traces if trace.mode == "lines")
+        print(f"arrays, edge budget {budget}: {time.perf_counter() - start:.2f} s, {payload / 1e6:.2f} MB, "
+              f"{segments} segments, {type(traces[0]).__name__}")
+        assert budget < graph.number_of_edges() or segments == graph.number_of_edges()
+        assert budget >= graph.number_of_edges() or segments <= budget
@@ -0,0 +1,423 @@
+"""
+Multilevel force-directed layout over NumPy arrays, and one global layout per version.
+
+nx.spring_layout computes every pair of repulsions, nx.kamada_kawai_layout
+every pair of shortest paths: both are quadratic, and a radius-3 ego graph of
+a 10,000 node version took tens of seconds. force_layout is the multilevel
+Fruchterman-Reingold of Walshaw:
+
+1. coarsen: nodes that are local maxima of a random priority become suns, their
+   neighbors join them, and the graph of the clusters is coarsened again,
+   until it is small or stops shrinking,
+2. lay out the coarsest graph with every pair of repulsions,
+3. refine: each level starts from the position of its cluster and runs a few
+   Fruchterman-Reingold iterations with Barnes-Hut repulsion: a quadtree
+   over the Morton codes of the nodes, where a cell seen under a small enough
+   angle pushes as one node from its center of mass.
+
+Each iteration costs O(n log n). Positions come rescaled to [-1, 1] like the
+networkx layouts:
+
+    pos = force_layout(n, sources, targets)          # (n, 2) array, nodes 0..n-1
+    pos = force_layout(n, sources, targets, initial)  # refine from positions, NaN rows are placed
+
+GlobalLayout lays out every node and edge of the cubes of a version once,
+persisted next to them, so any ego graph is drawn by slicing coordinates:
+
+    layout = temporal_graph.load_global_layout()
+    layout.positions(ego_graph.nodes)                 # node -> (x, y)
+
+New timestamps only refine the stored layout. Time it against node count,
+and the networkx layouts where they finish:
+
+    python layout_engine.py --benchmark
+    python layout_engine.py data/<version>
+"""
+import os
+import sys
+
+import numpy as np
+
+from temporal_cube import _load_array, _load_meta, _save_arrays, published_folder, timestamp_of
+
+LAYOUT_FOLDER = os.path.join("cube", "layout")
+COARSEST_SIZE = 50
+EXACT_REPULSION_SIZE = 500
+TREE_DEPTH = 16
+LEAF_SIZE = 8
+THETA = 1.2
+COARSEST_ITERATIONS = 100
+LEVEL_ITERATIONS = 30
+REFINE_ITERATIONS = 10
+
+
+def _edge_array(n, sources, targets):
+    """(edge, 2) array of distinct undirected edges without self loops."""
+    sources, targets = np.asarray(sources, dtype=np.int64), np.asarray(targets, dtype=np.int64)
+    edges = np.sort(np.stack([sources, targets], axis=1), axis=1)
+    edges = edges[edges[:, 0] != edges[:, 1]]
+    return np.unique(edges, axis=0) if len(edges) else edges.reshape(0, 2)
+
+
+def _coarsen(n, edges, rng):
+    """Cluster of every node and the number of clusters, suns and their neighbors grouped."""
+    priority = rng.random(n)
+    sun = np.zeros(n, dtype=bool)
+    covered = np.zeros(n, dtype=bool)
+    u, v = edges[:, 0], edges[:, 1]
+    while not covered.all():
+        # uncovered nodes above every uncovered neighbor become suns, their neighbors are covered
+        open_priority = np.where(covered, -1.0, priority)
+        highest = np.full(n, -1.0)
+        np.maximum.at(highest, u, open_priority[v])
+        np.maximum.at(highest, v, open_priority[u])
+        new = ~covered & (open_priority > highest)
+        if not new.any():
+            break
+        sun |= new
+        covered |= new
+        covered[v[new[u]]] = True
+        covered[u[new[v]]] = True
+
+    cluster = np.full(n, -1, dtype=np.int64)
+    suns = np.flatnonzero(sun)
+    cluster[suns] = np.arange(len(suns))
+    node, neighbor = np.concatenate([u, v]), np.concatenate([v, u])
+    # every other node joins its sun neighbor of highest priority
+    _join(cluster, node, neighbor, sun[neighbor] & ~sun[node], priority)
+    # a sun of a later round can find all its neighbors taken, it joins one of them as a moon
+    lonely = sun & (np.bincount(cluster, minlength=len(suns))[np.maximum(cluster, 0)] == 1)
+    lonely_cluster = cluster.copy()
+    _join(cluster, node, neighbor, lonely[node] & ~lonely[neighbor] & (lonely_cluster[neighbor] >= 0), priority, lonely_cluster)
+    # nodes out of reach of every sun stay alone
+    alone = np.flatnonzero(cluster < 0)
+    cluster[alone] = len(suns) + np.arange(len(alone))
+    _, cluster = np.unique(cluster, return_inverse=True)
+    return cluster, int(cluster.max()) + 1
+
+
+def _join(cluster, node, neighbor, joins, priority, source=None):
+    """cluster[node] = cluster of its neighbor of highest priority, over the (node, neighbor) pairs in joins."""
+    source = cluster if source is None else source
+    node, neighbor = node[joins], neighbor[joins]
+    order = np.lexsort((-priority[neighbor], node))
+    node, neighbor = node[order], neighbor[order]
+    first = np.ones(len(node), dtype=bool)
+    first[1:] = node[1:] != node[:-1]
+    cluster[node[first]] = source[neighbor[first]]
+
+
+def _spread_bits(x):
+    """Bits of 16 bit integers moved to the even positions, for Morton codes."""
+    x = x & 0xFFFF
+    x = (x | (x << 8)) & 0x00FF00FF
+    x = (x | (x << 4)) & 0x0F0F0F0F
+    x = (x | (x << 2)) & 0x33333333
+    return (x | (x << 1)) & 0x55555555
+
+
+def _quadtree(pos):
+    """Nodes sorted by Morton code and, per level, the start, size, key, center of mass and children of every cell."""
+    n = len(pos)
+    low = pos.min(axis=0)
+    span = max(float((pos.max(axis=0) - low).max()), 1e-12)
+    cells = np.minimum(((pos - low) / span * (1 << TREE_DEPTH)).astype(np.int64), (1 << TREE_DEPTH) - 1)
+    codes = _spread_bits(cells[:, 0]) << 1 | _spread_bits(cells[:, 1])
+    order = np.argsort(codes, kind="stable")
+    codes = codes[order]
+    prefix = np.concatenate([np.zeros((1, 2)), np.cumsum(pos[order], axis=0)])
+
+    levels = []
+    for level in range(TREE_DEPTH + 1):
+        keys = codes >> 2 * (TREE_DEPTH - level)
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        stops = np.append(starts[1:], n)
+        count = stops - starts
+        levels.append({
+            "keys": keys[starts], "start": starts, "count": count,
+            "center": (prefix[stops] - prefix[starts]) / count[:, None], "size": span / (1 << level),
+        })
+    for level, child in zip(levels, levels[1:]):
+        level["children"] = np.searchsorted(child["keys"], level["keys"] << 2)
+        level["children_stop"] = np.searchsorted(child["keys"], (level["keys"] + 1) << 2)
+    return order, codes, levels
+
+
+def _expand(items, first, count):
+    """items repeated count times, and first + 0..count-1 alongside."""
+    total = int(count.sum())
+    offset = np.arange(total) - np.repeat(np.cumsum(count) - count, count)
+    return np.repeat(items, count), np.repeat(first, count) + offset
+
+
+def _repulsion(pos, k):
+    """
+    Barnes-Hut Fruchterman-Reingold repulsion k²/d: a cell of the quadtree seen
+    under an angle below THETA pushes as one node of its weight from its center
+    of mass, cells of LEAF_SIZE nodes or fewer push node by node.
+    """
+    n = len(pos)
+    order, codes, levels = _quadtree(pos)
+    sorted_pos = pos[order]
+    displacement = np.zeros((n, 2))
+
+    def push(nodes, sources, weight):
+        delta = sorted_pos[nodes] - sources
+        distance2 = np.maximum(np.einsum("ij,ij->i", delta, delta), 1e-9 * k * k)
+        force = delta * (weight * k * k / distance2)[:, None]
+        displacement[:, 0] += np.bincount(nodes, weights=force[:, 0], minlength=n)
+        displacement[:, 1] += np.bincount(nodes, weights=force[:, 1], minlength=n)
+
+    # every node against every cell of the first level, then down the tree
+    nodes, cells = _expand(np.arange(n), np.zeros(n, dtype=np.int64), np.full(n, len(levels[1]["keys"])))
+    for depth in range(1, TREE_DEPTH + 1):
+        level = levels[depth]
+        delta = sorted_pos[nodes] - level["center"][cells]
+        distance2 = np.einsum("ij,ij->i", delta, delta)
+        own = (codes[nodes] >> 2 * (TREE_DEPTH - depth)) == level["keys"][cells]
+        far = ~own & (level["size"] ** 2 < THETA ** 2 * distance2)
+        push(nodes[far], level["center"][cells[far]], level["count"][cells[far]])
+
+        near = ~far
+        leaf = near & ((level["count"][cells] <= LEAF_SIZE) | (depth == TREE_DEPTH))
+        leaf_nodes, members = _expand(nodes[leaf], level["start"][cells[leaf]], level["count"][cells[leaf]])
+        other = leaf_nodes != members
+        push(leaf_nodes[other], sorted_pos[members[other]], 1.0)
+
+        split = near & ~leaf
+        if depth == TREE_DEPTH or not split.any():
+            break
+        nodes, cells = _expand(nodes[split], level["children"][cells[split]],
+                               level["children_stop"][cells[split]] - level["children"][cells[split]])
+
+    result = np.empty_like(displacement)
+    result[order] = displacement
+    return result
+
+
+def _exact_repulsion(pos, k):
+    delta = pos[:, None, :] - pos[None, :, :]
+    distance2 = np.maximum(np.einsum("ijk,ijk->ij", delta, delta), 1e-9 * k * k)
+    np.fill_diagonal(distance2, np.inf)
+    return np.einsum("ijk,ij->ik", delta, k * k / distance2)
+
+
+def _fruchterman_reingold(pos, edges, k, iterations, temperature, exact=False):
+    n = len(pos)
+    u, v = edges[:, 0], edges[:, 1]
+    for _ in range(iterations):
+        displacement = _exact_repulsion(pos, k) if exact else _repulsion(pos, k)
+        delta = pos[u] - pos[v]
+        # attraction d²/k along every edge
+        pull = delta * (np.sqrt(np.einsum("ij,ij->i", delta, delta)) / k)[:, None]
+        for axis in (0, 1):
+            displacement[:, axis] -= np.bincount(u, weights=pull[:, axis], minlength=n)
+            displacement[:, axis] += np.bincount(v, weights=pull[:, axis], minlength=n)
+        length = np.maximum(np.sqrt(np.einsum("ij,ij->i", displacement, displacement)), 1e-12)
+        pos += displacement * (np.minimum(length, temperature) / length)[:, None]
+        temperature *= 0.92
+    return pos
+
+
+def _rescale(pos):
+    if not len(pos):
+        return pos
+    pos = pos - pos.mean(axis=0)
+    extent = np.abs(pos).max()
+    return pos / extent if extent > 0 else pos
+
+
+def _place(pos, edges, rng, k):
+    """Rows of pos that are NaN go to the mean of their placed neighbors, or anywhere when none is placed."""
+    missing = np.isnan(pos[:, 0])
+    for _ in range(len(pos)):
+        if not missing.any():
+            break
+        u, v = edges[:, 0], edges[:, 1]
+        total = np.zeros_like(pos)
+        count = np.zeros(len(pos))
+        for a, b in ((u, v), (v, u)):
+            known = missing[a] & ~missing[b]
+            np.add.at(total, a[known], pos[b[known]])
+            count += np.bincount(a[known], minlength=len(pos))
+        reached = missing & (count > 0)
+        if not reached.any():
+            spread = np.nanmax(np.abs(pos)) if (~missing).any() else 1.0
+            pos[missing] = rng.uniform(-spread, spread, (int(missing.sum()), 2))
+            break
+        pos[reached] = total[reached] / count[reached, None] + rng.normal(0, k / 4, (int(reached.sum()), 2))
+        missing &= ~reached
+    return pos
+
+
+def force_layout(n, sources, targets, initial=None, seed=0):
+    """
+    (n, 2) positions of nodes 0..n-1 linked by sources[i] - targets[i], in [-1, 1].
+    With initial positions (NaN for nodes to place) a few iterations refine them instead.
+    """
+    rng = np.random.default_rng(seed)
+    if n == 0:
+        return np.zeros((0, 2))
+    edges = _edge_array(n, sources, targets)
+
+    if initial is not None:
+        k = 1.0
+        pos = np.array(initial, dtype=float) * np.sqrt(n)
+        pos = _place(pos, edges, rng, k)
+        return _rescale(_fruchterman_reingold(pos, edges, k, REFINE_ITERATIONS, k, exact=n <= EXACT_REPULSION_SIZE))
+
+    # coarsen while the graph shrinks by a quarter at least
+    levels = [(n, edges)]
+    clusters = []
+    while levels[-1][0] > COARSEST_SIZE:
+        size, level_edges = levels[-1]
+        cluster, coarse_size = _coarsen(size, level_edges, rng)
+        if coarse_size > 0.75 * size:
+            break
+        clusters.append(cluster)
+        levels.append((coarse_size, _edge_array(coarse_size, cluster[level_edges[:, 0]], cluster[level_edges[:, 1]])))
+
+    size, level_edges = levels[-1]
+    k = 1.0
+    pos = rng.uniform(0, np.sqrt(size), (size, 2))
+    exact = size <= EXACT_REPULSION_SIZE
+    pos = _fruchterman_reingold(pos, level_edges, k, COARSEST_ITERATIONS, np.sqrt(size) / 4, exact=exact)
+
+    for cluster, (size, level_edges) in zip(reversed(clusters), reversed(levels[:-1])):
+        # the natural length shrinks so that the area per node stays the same
+        coarse_k = k
+        k = k * np.sqrt(len(pos) / size)
+        pos = pos[cluster] + rng.normal(0, coarse_k / 4, (size, 2))
+        pos = _fruchterman_reingold(pos, level_edges, k, LEVEL_ITERATIONS, coarse_k, exact=size <= EXACT_REPULSION_SIZE)
+    return _rescale(pos)
+
+
+def layout_graph(graph, initial=None):
+    """force_layout of a networkx graph, node -> (x, y) like nx.spring_layout."""
+    nodes = list(graph.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    edges = np.array([(position[a], position[b]) for a, b in graph.edges], dtype=np.int64).reshape(-1, 2)
+    start = None
+    if initial is not None:
+        start = np.array([initial.get(node, (np.nan, np.nan)) for node in nodes], dtype=float).reshape(-1, 2)
+    pos = force_layout(len(nodes), edges[:, 0], edges[:, 1], start)
+    return dict(zip(nodes, pos))
+
+
+class GlobalLayout:
+    """Positions of every node seen in the cubes of a version, laid out together."""
+
+    def __init__(self, timestamps, node_ids, pos):
+        self.timestamps = list(timestamps)
+        self.node_ids = list(node_ids)
+        self.pos = pos
+        self._position = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+    @classmethod
+    def from_cubes(cls, node_cube, edge_cube, previous=None):
+        """Lay out the nodes and edges of the cubes, starting from previous where it has the node."""
+        node_ids = list(dict.fromkeys(node_id for node_type in node_cube.node_types for node_id in node_cube.node_ids(node_type)))
+        position = {node_id: i for i, node_id in enumerate(node_ids)}
+        pairs = [edge for link_type in edge_cube.link_types for edge in edge_cube.edges(link_type)]
+        for source, target in pairs:
+            for node_id in (source, target):
+                if node_id not in position:
+                    position[node_id] = len(node_ids)
+                    node_ids.append(node_id)
+        edges = np.array([(position[source], position[target]) for source, target in pairs], dtype=np.int64).reshape(-1, 2)
+
+        initial = None
+        if previous is not None:
+            initial = np.full((len(node_ids), 2), np.nan)
+            known = [(i, previous._position[node_id]) for i, node_id in enumerate(node_ids) if node_id in previous._position]
+            if known:
+                rows, stored = np.array(known).T
+                initial[rows] = previous.pos[stored]
+        pos = force_layout(len(node_ids), edges[:, 0], edges[:, 1], initial)
+        return cls(edge_cube.timestamps, node_ids, pos)
+
+    @classmethod
+    def load(cls, folder):
+        folder = published_folder(folder)
+        meta = _load_meta(folder)
+        return cls(meta["timestamps"], meta["node_ids"], np.asarray(_load_array(folder, "positions")))
+
+    def save(self, folder):
+        return _save_arrays(folder, {"timestamps": self.timestamps, "node_ids": self.node_ids}, {"positions": self.pos})
+
+    def __contains__(self, node_id):
+        return node_id in self._position
+
+    def positions(self, nodes):
+        """node -> (x, y) of the nodes in the layout."""
+        return {node: self.pos[self._position[node]] for node in nodes if node in self._position}
+
+
+def update_global_layout(files, node_cube, edge_cube):
+    """The persisted layout of the version of files, refined first when the cubes have newer timestamps."""
+    if not files:
+        return GlobalLayout([], [], np.zeros((0, 2)))
+    folder = os.path.join(os.path.dirname(files[0]), LAYOUT_FOLDER)
+    timestamps = [timestamp_of(file_path) for file_path in files]
+    previous = None
+    if published_folder(folder) is not None:
+        previous = GlobalLayout.load(folder)
+        if previous.timestamps == timestamps:
+            return previous
+        if previous.timestamps != timestamps[:len(previous.timestamps)]:
+            previous = None
+    layout = GlobalLayout.from_cubes(node_cube, edge_cube, previous)
+    layout.save(folder)
+    return layout
+
+
+def _supply_chain_graph(n, rng):
+    """Random graph shaped like a version: a few hubs, most nodes a few edges from one."""
+    hubs = max(n // 50, 1)
+    nodes = np.arange(hubs, n)
+    sources = np.concatenate([rng.integers(0, hubs, len(nodes)), rng.integers(0, n, n)])
+    targets = np.concatenate([nodes, rng.integers(0, n, n)])
+    return sources, targets
+
+
+if __name__ == "__main__":
+    import time
+
+    import networkx as nx
+
+    if sys.argv[1:] == ["--benchmark"]:
+        rng = np.random.default_rng(0)
+        print(f"{'nodes':>8} {'force_layout':>13} {'spring_layout':>14} {'kamada_kawai':>13}", flush=True)
+        for n in (500, 1000, 2000, 5000, 10000, 20000, 50000, 100000):
+            sources, targets = _supply_chain_graph(n, rng)
+            start = time.perf_counter()
+            force_layout(n, sources, targets)
+            ours = f"{time.perf_counter() - start:.2f} s"
+            graph = nx.Graph()
+            graph.add_nodes_from(range(n))
+            graph.add_edges_from(zip(sources.tolist(), targets.tolist()))
+            spring = kamada = "-"
+            if n <= 5000:
+                start = time.perf_counter()
+                nx.spring_layout(graph, seed=0)
+                spring = f"{time.perf_counter() - start:.2f} s"
+            if n <= 1000:
+                start = time.perf_counter()
+                nx.kamada_kawai_layout(graph)
+                kamada = f"{time.perf_counter() - start:.2f} s"
+            print(f"{n:>8} {ours:>13} {spring:>14} {kamada:>13}", flush=True)
+        sys.exit(0)
+
+    from snapshot_store import list_snapshot_files
+    from temporal_cube import update_cubes
+
+    files = list_snapshot_files(sys.argv[1])
+    node_cube, edge_cube = update_cubes(files)
+    start = time.perf_counter()
+    layout = GlobalLayout.from_cubes(node_cube, edge_cube)
+    print(f"global layout of {len(layout.node_ids)} nodes: {time.perf_counter() - start:.2f} s")
+
+    start = time.perf_counter()
+    refined = GlobalLayout.from_cubes(node_cube, edge_cube, previous=layout)
+    print(f"refined from the stored layout: {time.perf_counter() - start:.2f} s")
+    assert np.isfinite(layout.pos).all() and np.abs(layout.pos).max() <= 1 + 1e-9
@@ -3,12 +3,14 @@ from TemporalGraphClass import TemporalGraphClass
 import requests
 from dotenv import load_dotenv
 import os
-import json
 import glob
+import numpy as np
 import pandas as pd
 import base64
-import networkx as nx
 import math
+from snapshot_store import list_snapshot_files
+from downloader import sync_version
+from supplier_catalog import load_supplier_catalog
 
 
 st.set_page_config(
@@ -31,6 +33,8 @@ base_url = "http://172.17.149.238/api"
 # version = "simulation_check"z
 version = "lam_1000_12_v1"
 end_point_for_supplier = base_url
+# supplier -> parts mapping, read from suppliers_parts_data_unused.json unless an endpoint is set
+supplier_catalog_url = os.environ.get("SUPPLIER_CATALOG_URL")
 
 getVersions = f"{base_url}/versions"
 getTimestamp = f"{base_url}/archive/schema/{version}"
@@ -41,35 +45,22 @@ get_live_data = f"{base_url}/live/schema/{version}"
 data_folder = "data"
 
 
-def find_alternate_suppliers(graph, facility_id, primary_suppliers=None):
-    path = "suppliers_parts_data_unused.json"
-    with open(path,'r') as f : 
-        supplier_data = json.load(f)
+def find_alternate_suppliers(adjacency, facility_id, primary_suppliers=None):
+    catalog = load_supplier_catalog(url=supplier_catalog_url)
 
-    if primary_suppliers is None:
-        primary_suppliers = []
+    primary_suppliers = set(primary_suppliers or [])
 
     # Find parts used by the facility
-    parts_used = [
-        source for source, target, edge_data in graph.in_edges(facility_id, data=True)
-        if edge_data.get("relationship_type") == "PARTSToFACILITY"
-    ]
+    parts_used = adjacency.predecessors("PARTSToFACILITY", facility_id)
     # st.write(parts_used)
 
     # Find all suppliers for these parts
-    partsToSupplier = {}
-    for supplier_id,parts in supplier_data.items():
-        for part in parts:
-            if part in parts_used:
-                if part in partsToSupplier:
-                    partsToSupplier[part].append(supplier_id)
-                else:
-                    partsToSupplier[part] = [supplier_id]
+    partsToSupplier = catalog.suppliers_for(parts_used)
 
-    # Find Suppliers lead time and cost
+    # Find Suppliers lead time and cost, only for the suppliers of these parts
     supplierCost = {}
-    for source, target, edge_data in graph.edges(data=True):
-        if edge_data.get("relationship_type") == "SUPPLIERSToWAREHOUSE":
+    for supplier in {supplier for suppliers in partsToSupplier.values() for supplier in suppliers}:
+        for source, target, edge_data in adjacency.out_edges("SUPPLIERSToWAREHOUSE", supplier, data=True):
             supplierCost[source] = [edge_data.get("transportation_cost"), edge_data.get("lead_time")]
 
     # Find alternate suppliers for these parts
@@ -94,17 +85,16 @@ def find_alternate_suppliers(graph, facility_id, primary_suppliers=None):
     return partsToAlternateSupplier
 
 
-def check_units_available_in_warehouse(data,graph,product_id,product_id_node) :
+def check_units_available_in_warehouse(data,adjacency,product_id) :
 
-    in_edges = graph.in_edges(product_id_node[0],data=True)
+    in_edges = adjacency.in_edges("WAREHOUSEToPRODUCT_OFFERING",product_id,data=True)
     available = {}
 
     for source,target,edge_data in in_edges :
-        if edge_data["relationship_type"] == "WAREHOUSEToPRODUCT_OFFERING" and target == product_id :
-            if source not in available :
-                available[source] = 0
+        if source not in available :
+            available[source] = 0
 
-            available[source] += edge_data["inventory_level"]
+        available[source] += edge_data["inventory_level"]
 
     all_warehouses = data["node_values"]["WAREHOUSE"]
     warehouses = {}
@@ -123,24 +113,16 @@ def check_units_available_in_warehouse(data,graph,product_id,product_id_node) :
     return [available,warehouses]
 
 
-def find_facilty_making_product(graph,product_id,product_id_node) :
-    in_edges = graph.in_edges(product_id_node[0],data=True)
-    facility = []
-
-    for source,target,edge_data in in_edges :
-        if edge_data["relationship_type"] == "FACILITYToPRODUCT_OFFERING" and target == product_id :
-            facility.append(source)
+def find_facilty_making_product(adjacency,product_id) :
+    return adjacency.predecessors("FACILITYToPRODUCT_OFFERING",product_id)
 
-    return facility
 
-
-def find_raw_materials_to_make_product(data,facility) :
+def find_raw_materials_to_make_product(bom,product_id) :
+    # every part one unit takes, subassemblies replaced by the parts their makers use:
+    # [units from stock, transport cost, subassembly units built]
     raw_materials = {}
-    facility_to_parts = data["link_values"]["PARTSToFACILITY"]
-    for edge_data in facility_to_parts :
-        # st.write(edge_data[-1],facility)
-        if edge_data[-1] in facility :      # quantity , cost , lead time
-            raw_materials[edge_data[-2]] = [edge_data[1],edge_data[3],edge_data[-3]] 
+    for part, values in bom.unit_bill(product_id).iterrows() :
+        raw_materials[part] = values.tolist()
 
     return raw_materials
 
@@ -153,12 +135,15 @@ def find_total_cost(raw_materials,needed_units) :
     return raw_materials
 
 
-def calulate_cost_and_time(data,total,facility) :
+def calulate_cost_and_time(data,total,facility,lead_time=None) :
     cost = 0
-    time = 0
     for key, values in total.items():
         cost += values[1]
-        time += values[2]
+
+    # the parts arrive in parallel, the critical path sets the time; None without one
+    time = None
+    if lead_time is not None and not math.isnan(lead_time) :
+        time = lead_time
 
     all_facility = data["node_values"]["FACILITY"]
 
@@ -169,16 +154,15 @@ def calulate_cost_and_time(data,total,facility) :
     return cost,time
 
 
-def check_warehouse_have_enough_raw_material(data,raw_materials) :
-    warehouse = data["link_values"]["WAREHOUSEToPARTS"]
+def check_warehouse_have_enough_raw_material(adjacency,raw_materials) :
     all_raw_materials = {}
     for k,v in raw_materials.items() :
         all_raw_materials[k] = v[0]
 
 
-    for edge_data in warehouse :
-        if edge_data[-1] in all_raw_materials :
-            all_raw_materials[edge_data[-1]] -= edge_data[1]
+    for part in all_raw_materials :
+        for source,target,edge_data in adjacency.in_edges("WAREHOUSEToPARTS",part,data=True) :
+            all_raw_materials[part] -= edge_data["inventory_level"]
 
     for k,v in all_raw_materials.items() :
         if v > 0 :
@@ -189,25 +173,10 @@ def check_warehouse_have_enough_raw_material(data,raw_materials) :
 # need to change
 
 def get_supplier_for_raw_material(data,raw_materials) :
-    path = "suppliers_parts_data_unused.json"
-    with open(path,'r') as f : 
-        supplier_data = json.load(f)
-    
-    
-    # supplier_data = requests.get(end_point_for_supplier).json()
-
-    parts_supplier = {}
-    all_needed_supplier = set()
-    for supp,parts in supplier_data.items() :
-        
-        for part in parts :
-            if part in raw_materials :
-
-                if part not in parts_supplier :
-                    parts_supplier[part] = []
+    catalog = load_supplier_catalog(url=supplier_catalog_url)
 
-                parts_supplier[part].append(supp)
-                all_needed_supplier.add(supp)
+    parts_supplier = catalog.suppliers_for(raw_materials)
+    all_needed_supplier = {supp for suppliers in parts_supplier.values() for supp in suppliers}
 
     all_suppliers = data["node_values"]["SUPPLIERS"]
     supplier_details = {}
@@ -239,9 +208,9 @@ def get_supplier_for_raw_material(data,raw_materials) :
 
 
 
-def supply_chain_query(data,graph,product_id,units,product_id_node) :
+def supply_chain_query(data,adjacency,bom,product_id,units,lead_times=None,timestamp=None) :
 
-    warehouse_containing_product_id,warehouse_data = check_units_available_in_warehouse(data,graph,product_id,product_id_node)
+    warehouse_containing_product_id,warehouse_data = check_units_available_in_warehouse(data,adjacency,product_id)
     
     if sum(warehouse_containing_product_id.values()) >= units :
         return [1,[warehouse_containing_product_id,warehouse_data]] # 1 - Demand can be satisfied by warehouse
@@ -253,18 +222,21 @@ def supply_chain_query(data,graph,product_id,units,product_id_node) :
         # st.write(warehouse_containing_product_id)
 
         available_units = sum(warehouse_containing_product_id.values())
-        facility = find_facilty_making_product(graph,product_id,product_id_node)
+        facility = find_facilty_making_product(adjacency,product_id)
         # st.write("facility",facility)
 
-        raw_materials = find_raw_materials_to_make_product(data,facility)
+        raw_materials = find_raw_materials_to_make_product(bom,product_id)
         # st.write("raw_materials",raw_materials)
 
         total_raw_materials = find_total_cost(raw_materials,units - available_units)
 
-        check,needed_raw_material = check_warehouse_have_enough_raw_material(data,total_raw_materials)
+        check,needed_raw_material = check_warehouse_have_enough_raw_material(adjacency,total_raw_materials)
 
         if check :
-            cost,time = calulate_cost_and_time(data,total_raw_materials,facility)
+            # critical path through the fastest of the facilities the parts are taken for
+            lead_time = lead_times.lead_time(product_id,timestamp,facility) if lead_times is not None else None
+            # the makers of the subassemblies run as well
+            cost,time = calulate_cost_and_time(data,total_raw_materials,bom.facilities(product_id),lead_time)
             return [2,[total_raw_materials,cost,time,units - available_units]] # 2 - Demand can be satisfied by making new products
         
         else :
@@ -273,47 +245,21 @@ def supply_chain_query(data,graph,product_id,units,product_id_node) :
 
 
 
-def count_connections_and_find_max_nodes(data):
-   connection_counts = {}
-  
-   # Iterate over all edges in the relationship values
-   for type in data["link_values"]:
-       for edge in data["link_values"][type]:
-           # Determine the relationship type
-           relationship_type = edge[0]
-           relationship_structure = data["relationship_types"].get(relationship_type, [])
-           # st.write(relationship_structure)
-       
-           # Find the indices for source and target based on the relationship structure
-           try:
-               source_index = relationship_structure.index("source")
-               target_index = relationship_structure.index("target")
-           except ValueError:
-               continue
-           
-           # Extract source and target nodes
-           source = edge[source_index] if len(edge) > source_index else None
-           target = edge[target_index] if len(edge) > target_index else None
-       
-           # Update connection counts
-           if source is not None:
-               if source not in connection_counts:
-                   connection_counts[source] = {"outgoing": 0, "incoming": 0}
-               connection_counts[source]["outgoing"] += 1
-           if target is not None:
-               if target not in connection_counts:
-                   connection_counts[target] = {"outgoing": 0, "incoming": 0}
-               connection_counts[target]["incoming"] += 1
-    
-#    # Calculate degree centrality
-#    graph = st.session_state.temporal_graph.load_graph_at_timestamp(0)
-#    n = len(graph.nodes())
-#    # Calculate degree centrality
-#    degree_centrality = {node:round((counts["outgoing"] + counts["incoming"]) / (n-1),3)
-#                        for node, counts in connection_counts.items()}
-
-   degree_centrality = {node:(counts["outgoing"] + counts["incoming"])
-                       for node, counts in connection_counts.items()}
+def count_connections_and_find_max_nodes(arrays):
+   # Degree of every node from the source and target columns of each relationship type,
+   # in the order the nodes first appear in the link rows
+   endpoints = []
+   for link_type in arrays.link_types:
+       if "source" not in arrays.meta["relationship_types"].get(link_type, []):
+           continue
+       sources, targets = arrays.link_endpoints(link_type)
+       order = arrays.link_file_order(link_type)
+       endpoints.append(np.column_stack([sources[order], targets[order]]).ravel())
+   endpoints = np.concatenate(endpoints) if endpoints else np.zeros(0, dtype=np.int64)
+   degrees = np.bincount(endpoints, minlength=len(arrays.node_ids))
+   positions = pd.unique(endpoints)
+   node_ids = arrays.node_ids[positions]
+   degree_centrality = {str(node): int(degree) for node, degree in zip(node_ids, degrees[positions])}
   
    # Group nodes by type
    grouped_nodes = {
@@ -441,27 +387,6 @@ def display_node_boxes(df):
         """, unsafe_allow_html=True)
   
 
-def convert_json_to_graph(data):
-    graph = nx.DiGraph()
-
-    for node_type, nodes in data["node_values"].items():
-        for node in nodes:
-            node_id = node[-1]
-            node_attributes = dict(zip(data["node_types"][node_type], node))
-            graph.add_node(node_id, **node_attributes)
-
-    all_edge_types = data["relationship_types"]
-    for link_type,link_values in data["link_values"].items():
-        for edge_data in link_values :
-            attributes = {}
-            for j in range(len(edge_data) - 2):
-                key = all_edge_types[link_type][j]
-                attributes[key] = edge_data[j]
-            graph.add_edge(edge_data[-2], edge_data[-1], **attributes)
-    
-    return graph
-
-
 def main():
     st.markdown("""
     <style>
@@ -495,60 +420,52 @@ def main():
 
     # st.write(base_url)
 
-    if not os.path.exists(data_folder):
-        os.makedirs(data_folder)
-
     target_path = os.path.join(data_folder, version)
-    if os.path.exists(target_path) and os.path.isdir(target_path):
-        
-        st.info("Version exists!")
-        st.write(getVersions)
-        # all_files = [f for f in os.listdir(target_path) if os.path.isfile(os.path.join(target_path, f))]
-        
-        # # check if version exists in the server
-        # all_versions = requests.get(getVersions).json()
-        
-        # if version not in all_versions:
-        #     st.write("Version doesnt exist in the server")
-
-        # else:
-        #     st.write("Version exists in the server")
-
-        #     all_timestamps = requests.get(getTimestamp).json()
-
-        #     for timestamp in all_timestamps:
-        #         if f"{timestamp}.json" not in all_files:
-        #             timestamp_data = requests.get(f"{getdata}/{timestamp}").json()
-        #             with open(os.path.join(target_path, f"{timestamp}.json"), "w") as f:
-        #                 json.dump(timestamp_data, f, indent=4)
-
-    else:
-        st.info("Version doesnt exist, downloading...")
-        os.makedirs(target_path)
-        all_timestamps = requests.get(getTimestamp).json()
-
-        for timestamp in all_timestamps:
-            data = requests.get(f"{getdata}/{timestamp}")
-            if data.status_code == 200 :
-                timestamp_data = data.json()
-                with open(os.path.join(target_path, f"{timestamp}.json"), "w") as f:
-                    json.dump(timestamp_data, f, indent=4)
-            else:
-                st.write("Error in downloading the data")
-                break
 
-    all_files = [os.path.join(target_path, f) for f in os.listdir(
-        target_path) if os.path.isfile(os.path.join(target_path, f))]
-    
+    # check the server for missing timestamps once per session
+    if st.session_state.get("synced_version") != version:
+        progress = st.progress(0.0, text="Checking server for new timestamps...")
+        try:
+            result = sync_version(
+                getTimestamp, getdata, target_path,
+                on_progress=lambda done, total: progress.progress(done / total, text=f"Downloaded {done}/{total} timestamps"),
+            )
+        except requests.RequestException as e:
+            progress.empty()
+            if not list_snapshot_files(target_path):
+                st.error(f"Could not reach the server and no local copy of {version} exists: {e}")
+                return
+            st.warning("Could not reach the server, using the local copy of the version.")
+        else:
+            progress.empty()
+            if result["failed"]:
+                # the version stays unsynced, so the next rerun of the session retries the failed timestamps
+                st.warning(f"{len(result['failed'])} timestamps failed to download and will be retried on the next run.")
+            else:
+                if result["downloaded"]:
+                    st.info(f"Downloaded {len(result['downloaded'])} new timestamps.")
+                else:
+                    st.info("Version exists!")
+                st.session_state.synced_version = version
 
-    all_files.sort(key=lambda x: int(x.split("\\")[-1].split(".")[0]))
-    #all_files.sort(key=lambda x: int(x.split("/")[-1].split(".")[0])) # for linux
+    # ordered by timestamp, columnar files preferred over JSON
+    all_files = list_snapshot_files(target_path)
 
     # Initialize TemporalGraph
-    temporal_graph = TemporalGraphClass(all_files)
+    # SNAPSHOT_BACKEND=mmap shares one memory-mapped copy of each timestamp between processes,
+    # GRAPH_ENGINE=csr answers page queries from arrays instead of a NetworkX graph
+    temporal_graph = TemporalGraphClass(
+        all_files,
+        backend=os.environ.get("SNAPSHOT_BACKEND", "memory"),
+        graph_engine=os.environ.get("GRAPH_ENGINE", "networkx"),
+    )
     if temporal_graph not in st.session_state:
         st.session_state.temporal_graph = temporal_graph
 
+    # the time series cubes only read the timestamps they have not seen yet
+    with st.spinner("Updating time series..."):
+        temporal_graph.load_node_cube()
+
     # Success message
     st.success("Files processed successfully!")
 
@@ -583,8 +500,8 @@ def main():
         st.write(" ")
         st.write(" ")
         timestamp = 2
-        data = st.session_state.temporal_graph.load_json_at_timestamp(timestamp)
-        grouped_nodes, max_connections_nodes, max_connections = count_connections_and_find_max_nodes(data)
+        arrays = st.session_state.temporal_graph.load_snapshot_at_timestamp(timestamp).column_arrays
+        grouped_nodes, max_connections_nodes, max_connections = count_connections_and_find_max_nodes(arrays)
     
         # Create DataFrame
         df_data = []
@@ -676,7 +593,7 @@ def main():
         # data = requests.get(get_live_data).json()
         data = st.session_state.temporal_graph.load_json_at_timestamp(timestamp)
 
-        graph = convert_json_to_graph(data)
+        adjacency = st.session_state.temporal_graph.load_adjacency_at_timestamp(timestamp)
         all_products = []
         for po in data["node_values"]["PRODUCT_OFFERING"] :
             all_products.append(po[-1])
@@ -684,14 +601,11 @@ def main():
         product_id = st.selectbox("Select Product Offering",all_products)
         units = st.number_input("Enter number of units",min_value=1,max_value=1000000)
 
-        for node in graph.nodes(data=True):
-            if node[0] == product_id :
-                product_id_node = node
-                break
-        
         choice = 0
         if st.button("Check Supply Chain"):
-            choice, supply_chain_data = supply_chain_query(data,graph, product_id, units, product_id_node)
+            lead_times = st.session_state.temporal_graph.load_lead_times()
+            bom = st.session_state.temporal_graph.load_bill_of_materials_at_timestamp(timestamp)
+            choice, supply_chain_data = supply_chain_query(data,adjacency,bom, product_id, units, lead_times, timestamp)
 
     with col2:
 
@@ -740,6 +654,8 @@ def main():
                 raw_materials = supply_chain_data[0]
                 total_cost = supply_chain_data[1]
                 estimated_time = supply_chain_data[2]
+                # no critical path reaches the product at this timestamp
+                estimated_time = "no estimate" if estimated_time is None else f"{estimated_time:g} days"
 
                 # Displaying information in a structured format
                 # st.write(f"### Manufacturing Summary")
@@ -760,15 +676,16 @@ def main():
 
 
                 st.write(f"### Raw Materials Breakdown")
-                st.write(f"To manufacture **{units_to_be_made} units**, the following raw materials are required:")
+                st.write(f"To manufacture **{units_to_be_made} units**, the following raw materials are required. Subassemblies are built from the parts their facilities use; Built is the units of each one made:")
                 # for material, values in raw_materials.items():
                 #     st.write(f"- **{material}**: Quantity: {values[0]}, Cost: {values[1]}, Time: {values[2]} hours")
                 # st.write("")
 
+                # the parts arrive in parallel, the time is the critical path below rather than a column per part
                 raw_materials_df = pd.DataFrame.from_dict(
                     raw_materials, 
                     orient="index", 
-                    columns=["Quantity", "Cost", "Time (hours)"]
+                    columns=["Quantity", "Cost", "Built"]
                 ).reset_index().rename(columns={"index": "Material"})
 
                 st.dataframe(raw_materials_df)
@@ -778,10 +695,14 @@ def main():
                 st.markdown(f"""
                 <div style="background-color: #f0f8ff; padding: 10px; border-radius: 5px;">
                     <h3 style="color: #ff4500; margin: 0;"> 💰 Total Cost to Manufacture: ${total_cost:,.2f}</h3>
-                    <p style="font-size: 18px; color: #4682b4; margin: 0;"> ⏳ Estimated Manufacturing Time:  {estimated_time} hours</p>
+                    <p style="font-size: 18px; color: #4682b4; margin: 0;"> ⏳ Estimated Manufacturing Time:  {estimated_time}</p>
                 </div>
                 """, unsafe_allow_html=True)
 
+                with st.expander("Critical Path"):
+                    st.write("The chain that sets the estimated time: the fastest facility making the product, the last of its parts to arrive, and the quickest warehouse and supplier of that part:")
+                    st.dataframe(lead_times.chain(product_id, timestamp, find_facilty_making_product(adjacency, product_id)))
+
 
                 # st.write(f"- **Total Cost to Manufacture:** ${total_cost:,.2f}")
                 # st.write(f"- **Estimated Manufacturing Time:** {estimated_time} hours")
@@ -841,6 +762,37 @@ def main():
 
     st.divider()  
 
+    st.write("## Batch Supply Chain Query")
+    st.write("Upload a CSV of orders with a `product_id` and a `units` column to check the whole order book at once.")
+
+    orders_file = st.file_uploader("Upload Orders", type="csv")
+    batch_mode = st.radio(
+        "Inventory",
+        ["Check every order against the full stock", "Allocate the orders in sequence from shared stock"],
+        horizontal=True,
+    )
+    if orders_file is not None:
+        try:
+            if batch_mode == "Check every order against the full stock":
+                evaluator = st.session_state.temporal_graph.load_feasibility_at_timestamp(timestamp)
+                lead_times = st.session_state.temporal_graph.load_lead_times().table.iloc[timestamp]
+                order_results = evaluator.evaluate(orders_file, catalog=load_supplier_catalog(url=supplier_catalog_url), lead_times=lead_times)
+            else:
+                # every run starts from the full stock of the timestamp
+                ledger = st.session_state.temporal_graph.load_allocation_ledger_at_timestamp(timestamp)
+                order_results = ledger.allocate(orders_file)
+        except ValueError as error:
+            st.error(f"Could not read the orders: {error}")
+        else:
+            st.write(order_results["Status"].value_counts().to_frame("Orders").T)
+            st.dataframe(order_results)
+            st.download_button("Download Results", order_results.to_csv(index=False), file_name="order_feasibility.csv", mime="text/csv")
+
+    st.text(" ")
+    st.text(" ")
+
+    st.divider()
+
     st.write("## Alternate Suppliers Query")
     all_facility_id = []
     for facility in data["node_values"]["FACILITY"] :
@@ -858,7 +810,7 @@ def main():
         primary_suppliers = st.multiselect("Select Primary Suppliers", all_supplier_id)
 
         if st.button("Find Alternate Suppliers"):
-            partsToAlternateSupplier = find_alternate_suppliers(graph, facility_id, primary_suppliers)
+            partsToAlternateSupplier = find_alternate_suppliers(adjacency, facility_id, primary_suppliers)
             clicked = True
 
     with col2:
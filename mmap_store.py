@@ -0,0 +1,542 @@
+"""
+Read-only, memory-mapped snapshot backend.
+
+A snapshot is written once into a folder of .npy files: one file per node
+attribute column, one per link attribute column, and a CSR (out) / CSC (in)
+adjacency per relationship type over integer node positions. Readers open the
+files with numpy's mmap_mode="r", so every session and every worker process
+reading the same timestamp shares the pages of the OS file cache instead of
+holding its own parsed dicts and graphs.
+
+Layout of data/<version>/mmap/v<MMAP_FORMAT>/<timestamp>/:
+
+    meta.json                       schema, node type ranges, column kinds and encodings
+    node_ids.npy                    node id per position, grouped by node type
+    sorted_ids.npy, sorted_pos.npy  id lookup by binary search
+    nodes/<NODE_TYPE>/<attr>.npy    node attribute columns (codes for category columns,
+                                    next to <attr>.categories.npy)
+    links/<LINK_TYPE>/<attr>.npy    link attribute columns, edges sorted by source
+    links/<LINK_TYPE>/src.npy, dst.npy              edge endpoints (node positions)
+    links/<LINK_TYPE>/row.npy                       original row of each edge
+    links/<LINK_TYPE>/out_indptr.npy                CSR row pointers over src
+    links/<LINK_TYPE>/in_indptr.npy, in_order.npy   CSC row pointers and edge order over dst
+
+Measure memory across concurrent readers:
+
+    python mmap_store.py data/<version> 1 10 50
+"""
+import json
+import os
+import shutil
+import sys
+from collections.abc import Mapping
+
+import numpy as np
+
+META_NAME = "meta.json"
+# bumped when the encoding changes; folders of an older format are left alone and rebuilt next to them
+MMAP_FORMAT = 2
+UNKNOWN_NODE_TYPE = ""  # edge endpoints that have no row in node_values
+
+
+def _column_kind(values):
+    if values and all(type(v) is float for v in values):
+        return "float"
+    if values and all(type(v) is int for v in values):
+        return "int"
+    if values and all(type(v) is bool for v in values):
+        return "bool"
+    if values and all(type(v) is str for v in values):
+        return "str"
+    return "json"
+
+
+def _column_array(values, kind):
+    if kind == "float":
+        return np.asarray(values, dtype=np.float64)
+    if kind == "int":
+        return np.asarray(values, dtype=np.int64)
+    if kind == "bool":
+        return np.asarray(values, dtype=np.bool_)
+    if kind == "str":
+        return np.asarray(values, dtype=np.str_)
+    # lists, None and mixed columns are kept as JSON text
+    return np.asarray([json.dumps(v) for v in values], dtype=np.str_)
+
+
+def _code_dtype(size):
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if size <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.int64
+
+
+def _store_column(arrays, meta_columns, parts, values, ids=None):
+    """
+    Pick the cheapest encoding for one column and record it.
+
+    const:    one scalar value on every row (node_type, relationship_type), kept in meta;
+              list and mixed (json) columns are never const, their values are not scalars
+    id:       the column repeats the node ids, read from node_ids instead
+    category: few distinct strings, stored as small integer codes plus the distinct values
+    plain:    everything else, one array
+    """
+    kind = _column_kind(values)
+    column = {"kind": kind, "encoding": "plain"}
+    if kind != "json" and values and all(v == values[0] for v in values):
+        column.update(encoding="const", value=values[0])
+    elif ids is not None and values == ids:
+        column["encoding"] = "id"
+    else:
+        array = _column_array(values, kind)
+        if kind in ("str", "json"):
+            categories, codes = np.unique(array, return_inverse=True)
+            if len(categories) * 4 <= len(values):
+                column["encoding"] = "category"
+                arrays[parts[:-1] + (f"{parts[-1]}.categories",)] = categories
+                array = codes.astype(_code_dtype(len(categories)))
+        arrays[parts] = array
+    meta_columns[parts[-1]] = column
+
+
+# node positions and edge indices; a snapshot stays far below 2**31 of either
+INDEX_DTYPE = np.int32
+
+
+def _indptr(keys, size):
+    return np.concatenate(([0], np.cumsum(np.bincount(keys, minlength=size)))).astype(INDEX_DTYPE)
+
+
+def build_snapshot_arrays(data):
+    """
+    Split a snapshot dictionary into column and adjacency arrays.
+
+    Returns (meta, arrays); arrays maps a path tuple such as
+    ("links", "WAREHOUSEToPARTS", "src") to a numpy array.
+    """
+    arrays = {}
+    node_ids = []
+    node_type_ranges = {}
+    node_columns = {}
+    for node_type, rows in data["node_values"].items():
+        start = len(node_ids)
+        node_ids.extend(row[-1] for row in rows)
+        node_type_ranges[node_type] = [start, len(node_ids)]
+
+        node_columns[node_type] = {}
+        type_ids = node_ids[start:]
+        for j, attribute in enumerate(data["node_types"][node_type]):
+            values = [row[j] for row in rows]
+            _store_column(arrays, node_columns[node_type], ("nodes", node_type, attribute), values, ids=type_ids)
+
+    position = {node_id: i for i, node_id in enumerate(node_ids)}
+    known_nodes = len(node_ids)
+
+    for rows in data["link_values"].values():
+        for row in rows:
+            for node_id in (row[-2], row[-1]):
+                if node_id not in position:
+                    position[node_id] = len(node_ids)
+                    node_ids.append(node_id)
+
+    node_count = len(node_ids)
+    if node_count > known_nodes:
+        node_type_ranges[UNKNOWN_NODE_TYPE] = [known_nodes, node_count]
+
+    link_columns = {}
+    link_sizes = {}
+    for link_type, rows in data["link_values"].items():
+        src = np.asarray([position[row[-2]] for row in rows], dtype=INDEX_DTYPE)
+        dst = np.asarray([position[row[-1]] for row in rows], dtype=INDEX_DTYPE)
+        order = np.argsort(src, kind="stable")
+        src, dst = src[order], dst[order]
+
+        arrays[("links", link_type, "row")] = order.astype(INDEX_DTYPE)
+        arrays[("links", link_type, "src")] = src
+        arrays[("links", link_type, "dst")] = dst
+        arrays[("links", link_type, "out_indptr")] = _indptr(src, node_count)
+        arrays[("links", link_type, "in_order")] = np.argsort(dst, kind="stable").astype(INDEX_DTYPE)
+        arrays[("links", link_type, "in_indptr")] = _indptr(dst, node_count)
+
+        link_columns[link_type] = {}
+        link_sizes[link_type] = len(rows)
+        attributes = data["relationship_types"][link_type][:-2]
+        for j, attribute in enumerate(attributes):
+            values = [rows[i][j] for i in order.tolist()]
+            _store_column(arrays, link_columns[link_type], ("links", link_type, attribute), values)
+
+    ids = np.asarray(node_ids, dtype=np.str_)
+    sorted_pos = np.argsort(ids, kind="stable").astype(INDEX_DTYPE)
+    arrays[("node_ids",)] = ids
+    arrays[("sorted_ids",)] = ids[sorted_pos]
+    arrays[("sorted_pos",)] = sorted_pos
+
+    meta = {
+        "directed": data["directed"],
+        "extra": {key: value for key, value in data.items()
+                  if key not in ("directed", "node_types", "relationship_types", "node_values", "link_values")},
+        "node_types": data["node_types"],
+        "relationship_types": data["relationship_types"],
+        "node_count": node_count,
+        "node_type_ranges": node_type_ranges,
+        "node_columns": node_columns,
+        "link_columns": link_columns,
+        "link_sizes": link_sizes,
+    }
+    return meta, arrays
+
+
+def _array_path(folder, parts):
+    return os.path.join(folder, *parts[:-1], f"{parts[-1]}.npy")
+
+
+def write_mmap_snapshot(data, folder):
+    """Write a snapshot dictionary as a folder of memory-mappable arrays."""
+    meta, arrays = build_snapshot_arrays(data)
+
+    # one temporary folder per process, several sessions may build the same timestamp
+    temp_folder = f"{folder}.{os.getpid()}.part"
+    shutil.rmtree(temp_folder, ignore_errors=True)
+    for parts, array in arrays.items():
+        path = _array_path(temp_folder, parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, array, allow_pickle=False)
+    with open(os.path.join(temp_folder, META_NAME), "w") as f:
+        json.dump(meta, f)
+
+    # published with one rename, readers only ever see a complete folder; a folder of a
+    # snapshot file never changes once written, so a published one is kept as it is
+    try:
+        os.rename(temp_folder, folder)
+    except OSError:
+        # another process published its copy first
+        shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+class SnapshotArrays:
+    """Read-only column and adjacency view of a snapshot, as built by build_snapshot_arrays."""
+
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.directed = meta["directed"]
+        self.node_count = meta["node_count"]
+        self._arrays = arrays
+
+    @classmethod
+    def from_data(cls, data):
+        meta, arrays = build_snapshot_arrays(data)
+        # as read-only as the memory-mapped arrays
+        for array in arrays.values():
+            array.flags.writeable = False
+        return cls(meta, arrays)
+
+    def _array(self, *parts):
+        return self._arrays[parts]
+
+    @property
+    def node_ids(self):
+        return self._array("node_ids")
+
+    @property
+    def node_types(self):
+        return [node_type for node_type in self.meta["node_type_ranges"] if node_type != UNKNOWN_NODE_TYPE]
+
+    @property
+    def link_types(self):
+        return list(self.meta["link_sizes"])
+
+    def node_type_range(self, node_type):
+        start, stop = self.meta["node_type_ranges"].get(node_type, (0, 0))
+        return start, stop
+
+    def node_type_of(self, position):
+        for node_type, (start, stop) in self.meta["node_type_ranges"].items():
+            if start <= position < stop:
+                return node_type
+        return None
+
+    def node_positions(self, node_ids):
+        """Positions of node_ids, -1 where an id is unknown."""
+        sorted_ids = self._array("sorted_ids")
+        # keys keep their own width so a longer id is never truncated into a match
+        keys = np.asarray(node_ids, dtype=np.str_)
+        found = np.searchsorted(sorted_ids, keys)
+        found = np.minimum(found, len(sorted_ids) - 1)
+        hit = sorted_ids[found] == keys
+        return np.where(hit, self._array("sorted_pos")[found], -1)
+
+    def node_position(self, node_id):
+        if self.node_count == 0:
+            return None
+        position = int(self.node_positions([node_id])[0])
+        return None if position < 0 else position
+
+    def _column(self, parts, column, start, length):
+        if column["encoding"] == "const":
+            # a read-only view of one value, no per-row storage
+            return np.broadcast_to(np.asarray(column["value"]), (length,))
+        if column["encoding"] == "id":
+            return self.node_ids[start:start + length]
+        if column["encoding"] == "category":
+            return self._array(*parts[:-1], f"{parts[-1]}.categories")[self._array(*parts)]
+        return self._array(*parts)
+
+    def _value(self, parts, column, start, i):
+        if column["encoding"] == "const":
+            return column["value"]
+        if column["encoding"] == "id":
+            value = self.node_ids[start + i].item()
+        elif column["encoding"] == "category":
+            value = self._array(*parts[:-1], f"{parts[-1]}.categories")[self._array(*parts)[i]].item()
+        else:
+            value = self._array(*parts)[i].item()
+        return json.loads(value) if column["kind"] == "json" else value
+
+    def node_column(self, node_type, attribute):
+        """Column array of one node attribute; list and mixed columns come back as JSON text."""
+        start, stop = self.node_type_range(node_type)
+        return self._column(("nodes", node_type, attribute), self.meta["node_columns"][node_type][attribute], start, stop - start)
+
+    def node_column_kind(self, node_type, attribute):
+        return self.meta["node_columns"][node_type][attribute]["kind"]
+
+    def node_value(self, node_type, attribute, offset):
+        """Decoded value of one node attribute, offset counted within the node type."""
+        start, _ = self.node_type_range(node_type)
+        return self._value(("nodes", node_type, attribute), self.meta["node_columns"][node_type][attribute], start, offset)
+
+    def link_column(self, link_type, attribute):
+        """Link attribute column, in the edge order of link_endpoints."""
+        return self._column(("links", link_type, attribute), self.meta["link_columns"][link_type][attribute], 0, self.meta["link_sizes"][link_type])
+
+    def link_column_kind(self, link_type, attribute):
+        return self.meta["link_columns"][link_type][attribute]["kind"]
+
+    def link_value(self, link_type, attribute, edge):
+        """Decoded value of one link attribute."""
+        return self._value(("links", link_type, attribute), self.meta["link_columns"][link_type][attribute], 0, edge)
+
+    def link_endpoints(self, link_type):
+        return self._array("links", link_type, "src"), self._array("links", link_type, "dst")
+
+    def link_row(self, link_type):
+        """Row of every edge in the link_values of the snapshot payload."""
+        return self._array("links", link_type, "row")
+
+    def link_file_order(self, link_type):
+        """Edge indices in the row order of the snapshot payload."""
+        return np.argsort(self.link_row(link_type), kind="stable")
+
+    def out_edge_range(self, link_type, position):
+        """Edges of link_type leaving position, as a range of edge indices."""
+        indptr = self._array("links", link_type, "out_indptr")
+        return range(int(indptr[position]), int(indptr[position + 1]))
+
+    def in_edge_indices(self, link_type, position):
+        """Edges of link_type entering position, as edge indices."""
+        indptr = self._array("links", link_type, "in_indptr")
+        return self._array("links", link_type, "in_order")[indptr[position]:indptr[position + 1]]
+
+    def _decoded_column(self, values, kind):
+        if kind == "json":
+            return [json.loads(v) for v in values.tolist()]
+        return values.tolist()
+
+    def node_column_values(self, node_type, attribute):
+        """Decoded Python values of one node attribute."""
+        return self._decoded_column(self.node_column(node_type, attribute), self.node_column_kind(node_type, attribute))
+
+    def link_column_values(self, link_type, attribute):
+        """Decoded Python values of one link attribute."""
+        return self._decoded_column(self.link_column(link_type, attribute), self.link_column_kind(link_type, attribute))
+
+    def node_rows(self, node_type):
+        """Rows of one node type in the layout of node_values."""
+        columns = [self.node_column_values(node_type, attribute) for attribute in self.meta["node_types"][node_type]]
+        start, stop = self.node_type_range(node_type)
+        return [list(row) for row in zip(*columns)] if columns else [[] for _ in range(stop - start)]
+
+    def link_rows(self, link_type):
+        """Rows of one relationship type in the layout and order of link_values."""
+        node_ids = self.node_ids
+        attributes = self.meta["relationship_types"][link_type][:-2]
+        columns = [self.link_column_values(link_type, attribute) for attribute in attributes]
+        src, dst = self.link_endpoints(link_type)
+        columns.append(node_ids[src].tolist())
+        columns.append(node_ids[dst].tolist())
+        rows = [list(row) for row in zip(*columns)]
+        # back to the order of the original payload
+        return [rows[i] for i in self.link_file_order(link_type).tolist()]
+
+    def _payload(self, node_values, link_values):
+        data = dict(self.meta["extra"])
+        data.update({
+            "directed": self.directed,
+            "node_types": self.meta["node_types"],
+            "relationship_types": self.meta["relationship_types"],
+            "node_values": node_values,
+            "link_values": link_values,
+        })
+        return data
+
+    def to_data(self):
+        """Materialize the snapshot dictionary, for callers that need the row layout."""
+        return self._payload(
+            {node_type: self.node_rows(node_type) for node_type in self.node_types},
+            {link_type: self.link_rows(link_type) for link_type in self.link_types},
+        )
+
+    def lazy_data(self):
+        """
+        The snapshot dictionary with node_values and link_values built one type
+        at a time, the first time a type is read. A page that only reads the
+        FACILITY rows never builds the rows of the other types.
+        """
+        return self._payload(LazyMapping(self.node_types, self.node_rows), LazyMapping(self.link_types, self.link_rows))
+
+
+class LazyMapping(Mapping):
+    """Read-only mapping over fixed keys whose values are built by build(key) on first access, then kept."""
+
+    def __init__(self, keys, build):
+        self._keys = list(keys)
+        self._known = set(self._keys)
+        self._build = build
+        self._values = {}
+
+    def __getitem__(self, key):
+        if key not in self._values:
+            if key not in self._known:
+                raise KeyError(key)
+            # two sessions may build the same key at once, the second result simply wins
+            self._values[key] = self._build(key)
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._known
+
+
+class MmapSnapshot(SnapshotArrays):
+    """Zero-copy view of a snapshot written by write_mmap_snapshot; files are mapped on first use."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        with open(os.path.join(folder, META_NAME), "r") as f:
+            meta = json.load(f)
+        super().__init__(meta, {})
+
+    def _array(self, *parts):
+        if parts not in self._arrays:
+            self._arrays[parts] = np.load(_array_path(self.folder, parts), mmap_mode="r", allow_pickle=False)
+        return self._arrays[parts]
+
+
+def mmap_folder_for(file_path):
+    """data/<version>/<timestamp>.<ext> -> data/<version>/mmap/v<MMAP_FORMAT>/<timestamp>"""
+    folder, name = os.path.split(file_path)
+    return os.path.join(folder, "mmap", f"v{MMAP_FORMAT}", os.path.splitext(name)[0])
+
+
+def _touch(snapshot):
+    # read every stored column once so its pages are resident
+    columns = []
+    for node_type in snapshot.node_types:
+        columns.extend(snapshot.node_column(node_type, attribute) for attribute in snapshot.meta["node_columns"][node_type])
+    for link_type in snapshot.link_types:
+        columns.extend(snapshot.link_endpoints(link_type))
+        columns.extend(snapshot.link_column(link_type, attribute) for attribute in snapshot.meta["link_columns"][link_type])
+    return sum(float(column.view(np.uint8).sum()) for column in columns if column.flags.c_contiguous)
+
+
+def _read_like_pages(snapshot):
+    # what the facility and product pages read of a timestamp on this backend
+    facilities = snapshot.node_type_index.get("FACILITY", {})
+    for facility_id in facilities:
+        snapshot.adjacency.out_edges("FACILITYToPRODUCT_OFFERING", facility_id, data=True)
+    snapshot.data["node_values"].get("PRODUCT_OFFERING", [])
+    return snapshot.facility_costs.table
+
+
+def _session_worker(file_paths, backend, ready, release):
+    # every worker imports what a dashboard process imports, whatever it loads
+    from snapshot_store import read_snapshot_file
+    from TemporalGraphClass import TemporalSnapshot, json_to_graph
+
+    keep = []
+    if backend == "mmap":
+        for file_path in file_paths:
+            snapshot = MmapSnapshot(mmap_folder_for(file_path))
+            _touch(snapshot)
+            keep.append(snapshot)
+    elif backend in ("pages", "rows"):
+        for file_path in file_paths:
+            snapshot = TemporalSnapshot(arrays=MmapSnapshot(mmap_folder_for(file_path)))
+            if backend == "rows":
+                # every row of every type, as TemporalSnapshot.data was before it built them per type
+                snapshot.__dict__["data"] = snapshot.arrays.to_data()
+            _read_like_pages(snapshot)
+            keep.append(snapshot)
+    elif backend == "dicts":
+        for file_path in file_paths:
+            data = read_snapshot_file(file_path)
+            keep.append((data, json_to_graph(data)))
+    ready.set()
+    release.wait()
+
+
+def measure_sessions(file_paths, sessions, backend):
+    """Start `sessions` processes that all load file_paths with backend ("dicts", "mmap", "pages", "rows" or "none"); return their summed RSS, PSS and USS in MB."""
+    import multiprocessing
+    import psutil
+
+    context = multiprocessing.get_context("spawn")
+    release = context.Event()
+    workers = []
+    for _ in range(sessions):
+        ready = context.Event()
+        process = context.Process(target=_session_worker, args=(file_paths, backend, ready, release))
+        process.start()
+        workers.append((process, ready))
+
+    totals = {"rss": 0, "pss": 0, "uss": 0}
+    for process, ready in workers:
+        ready.wait()
+    for process, _ in workers:
+        info = psutil.Process(process.pid).memory_full_info()
+        for key in totals:
+            totals[key] += getattr(info, key, 0)
+
+    release.set()
+    for process, _ in workers:
+        process.join()
+
+    return {key: value / 1e6 for key, value in totals.items()}
+
+
+if __name__ == "__main__":
+    from snapshot_store import list_snapshot_files, read_snapshot_file
+
+    if len(sys.argv) < 2:
+        print("usage: python mmap_store.py <version folder> [sessions ...]")
+        sys.exit(1)
+
+    files = list_snapshot_files(sys.argv[1])
+    for file_path in files:
+        data = read_snapshot_file(file_path)
+        if not os.path.exists(os.path.join(mmap_folder_for(file_path), META_NAME)):
+            write_mmap_snapshot(data, mmap_folder_for(file_path))
+        # the arrays give back the payload they were built from, row for row
+        assert MmapSnapshot(mmap_folder_for(file_path)).to_data() == data, file_path
+
+    for sessions in [int(n) for n in sys.argv[2:]] or [1, 10, 50]:
+        # "none" is the cost of idle dashboard processes that loaded no snapshot
+        # "pages" reads a TemporalSnapshot over the arrays the way the pages do, "rows" also rebuilds all of its rows
+        for backend in ("none", "dicts", "mmap", "pages", "rows"):
+            usage = measure_sessions(files, sessions, backend)
+            print(f"{sessions:>3} sessions, {backend:>5}: RSS {usage['rss']:.0f} MB, PSS {usage['pss']:.0f} MB, USS {usage['uss']:.0f} MB")
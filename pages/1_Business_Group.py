@@ -1,13 +1,13 @@
 import streamlit as st
 import requests
 from constants import getTimestamp, getdata
-import heapq
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.patches import Circle
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import networkx as nx
-from utils import time_and_memory_streamlit, plotly_ego_graph, ego_graph_query
+from utils import time_and_memory_streamlit, plotly_ego_graph
 # st.set_page_config(
 #     layout="wide",
 #     initial_sidebar_state="expanded",
@@ -30,25 +30,23 @@ def static_part():
     # Validate session state
     
 
-    highest_business_group = []  # Heap to store the highest business groups
+    # one slice of the revenue cube instead of a pass over every timestamp file
+    cube = st.session_state.temporal_graph.load_node_cube()
+    business_ids = cube.node_ids("BUSINESS_GROUP")
+    revenues = cube.values("BUSINESS_GROUP", "revenue")[start_range:end_range]
+
     revenue_of_business_group_across_time = {}
-    # totalTimeStamps = len(st.session_state.temporal_graph.files)
-    
-    for time in range(start_range, end_range):
-        data = st.session_state.temporal_graph.load_json_at_timestamp(time)
-        business_nodes = data["node_values"]["BUSINESS_GROUP"]
-        # st.write(business_nodes[0])
-        
-        for i in range(len(business_nodes)):
-            heapq.heappush(highest_business_group, (business_nodes[i][-2], business_nodes[i][-1], time))
-            if len(highest_business_group) > 3:
-                heapq.heappop(highest_business_group)
+    for i, business_id in enumerate(business_ids):
+        times = np.flatnonzero(~np.isnan(revenues[:, i]))
+        if len(times):
+            revenue_of_business_group_across_time[business_id] = [(start_range + int(t), float(revenues[t, i])) for t in times]
 
-            if business_nodes[i][-1] not in revenue_of_business_group_across_time :
-                revenue_of_business_group_across_time[business_nodes[i][-1]] = []
+    # top 3 (revenue, id, timestamp) over the selected range
+    highest_business_group = sorted(
+        (float(revenues[t, i]), business_ids[i], start_range + int(t))
+        for t, i in zip(*np.nonzero(~np.isnan(revenues)))
+    )[-3:]
 
-            revenue_of_business_group_across_time[business_nodes[i][-1]].append((time,business_nodes[i][-2]))
-    
     # Display the top 3 business groups in columns
     cols = st.columns(len(highest_business_group)+1)
     with cols[0]:
@@ -154,16 +152,18 @@ def node_details(node_index, business_group_id,timestamp):
 
     with col2:
         # if found:
-        graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-        ego_graph = ego_graph_query(graph, business_group_id, 1)
+        ego = st.session_state.temporal_graph.load_ego_graph_at_timestamp(timestamp, business_group_id, 1)
+        ego_graph = ego.graph
         if ego_graph:
             st.write(f"### Neighbors for {business_group_id}")
             # st.write(f"Ego Graph for Node: {supplier_id}")
             # st.write(f"Nodes: {ego_graph.number_of_nodes()}, Edges: {ego_graph.number_of_edges()}")
 
             # Visualize and render the ego graph with Plotly
-            fig = plotly_ego_graph(ego_graph)
+            fig = plotly_ego_graph(ego_graph, ego.pos)
             st.plotly_chart(fig)  # Display the figure in Streamlit
+            if ego.truncated:
+                st.caption(f"Showing the nearest {len(ego_graph)} nodes.")
 
 
 def create_graph():
@@ -2,12 +2,13 @@ import streamlit as st
 import requests
 import matplotlib.pyplot as plt
 from matplotlib.patches import Circle
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 import networkx as nx
 
-from utils import time_and_memory_streamlit, plotly_ego_graph, ego_graph_query
+from utils import time_and_memory_streamlit, plotly_ego_graph
 
 # st.set_page_config(
 #     layout="wide",
@@ -25,41 +26,23 @@ def static_part():
     revenue_of_product_offering_across_time = {}
     pf_data={"PF_001":"Kyo","PF_002":"Coronus","PF_003":"Flex","PF_004":"Versys Metal"}
     
-    for time in range(totalTimeStamps) :
-        
-        data = st.session_state.temporal_graph.load_json_at_timestamp(time)
-        
-
-        PRODUCT_FAMILY = data["node_values"]["PRODUCT_FAMILY"]
-
-        for i in range(len(PRODUCT_FAMILY)) :
-            if PRODUCT_FAMILY[i][1] not in revenue_of_product_offering_across_time :
-                revenue_of_product_offering_across_time[PRODUCT_FAMILY[i][1]] = []
-
-            revenue_of_product_offering_across_time[PRODUCT_FAMILY[i][1]].append(PRODUCT_FAMILY[i][-2])
-
-        product_index=st.session_state.temporal_graph.create_node_type_index(time)["PRODUCT_FAMILY"]
-        
-        for key,value in product_index.items():
-            if time % 12 in [0,1,2]:
-                if pf_data[key] not in q1:
-                    q1[pf_data[key]] = 0
-                q1[pf_data[key]]+=value[-2]
-
-            elif time % 12 in [3,4,5]:
-                if pf_data[key] not in q2:
-                    q2[pf_data[key]] = 0
-                q2[pf_data[key]]+=value[-2]
-            
-            elif time % 12 in [6,7,8]:
-                if pf_data[key] not in q3:
-                    q3[pf_data[key]] = 0
-                q3[pf_data[key]]+=value[-2]
-            
-            else:
-                if pf_data[key] not in q4:
-                    q4[pf_data[key]] = 0
-                q4[pf_data[key]]+=value[-2]
+    # revenue of every product family at every timestamp, one slice of the cube
+    cube = st.session_state.temporal_graph.load_node_cube()
+    family_ids = cube.node_ids("PRODUCT_FAMILY")
+    family_names = cube.names("PRODUCT_FAMILY")
+    revenues = cube.values("PRODUCT_FAMILY", "revenue")[:totalTimeStamps]
+    present = ~np.isnan(revenues)
+
+    for i, name in enumerate(family_names):
+        if present[:, i].any():
+            revenue_of_product_offering_across_time[name] = revenues[present[:, i], i].tolist()
+
+    quarter_of_time = np.arange(len(revenues)) % 12 // 3
+    for quarter, totals in enumerate((q1, q2, q3, q4)):
+        in_quarter = quarter_of_time == quarter
+        for i, key in enumerate(family_ids):
+            if present[in_quarter, i].any():
+                totals[pf_data[key]] = float(np.nansum(revenues[in_quarter, i]))
     
     highest_quarterly_revenue_product_group[0]=max(q1, key=lambda x:q1[x])
     highest_quarterly_revenue[0] = round(q1[highest_quarterly_revenue_product_group[0]], 3)
@@ -325,16 +308,18 @@ def node_details(node_index, product_family_id,timestamp):
 
     with col2:
         # if found:
-        graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-        ego_graph = ego_graph_query(graph, product_family_id, 1)
+        ego = st.session_state.temporal_graph.load_ego_graph_at_timestamp(timestamp, product_family_id, 1)
+        ego_graph = ego.graph
         if ego_graph:
             st.write(f"### Neighbors for {product_family_id}")
             # st.write(f"Ego Graph for Node: {supplier_id}")
             # st.write(f"Nodes: {ego_graph.number_of_nodes()}, Edges: {ego_graph.number_of_edges()}")
 
             # Visualize and render the ego graph with Plotly
-            fig = plotly_ego_graph(ego_graph)
+            fig = plotly_ego_graph(ego_graph, ego.pos)
             st.plotly_chart(fig)  # Display the figure in Streamlit
+            if ego.truncated:
+                st.caption(f"Showing the nearest {len(ego_graph)} nodes.")
 
 
 # @st.fragment
@@ -6,11 +6,14 @@ import plotly.express as px
 import matplotlib.pyplot as plt
 from matplotlib.patches import Circle
 import networkx as nx
+import numpy as np
 import pandas as pd
 
 
+from cost_rollup import UNIT_COMPONENTS
+from route_optimizer import OBJECTIVES
+from query_engine import col
 from utils import (
-    ego_graph_query,
     plotly_ego_graph,
     time_and_memory_streamlit,
 )
@@ -67,49 +70,29 @@ def static_part():
     all_avg_costs = {}
     all_avg_demands = {}
 
-    # Iterate through all timestamps
-    for timestamp in range(len(temporal_graph.files)):
-        # url_data = requests.get(temporal_graph.files[timestamp])
-        # if url_data.status_code != 200:
-        #     st.error(f"Failed to load data for timestamp {timestamp}. Skipping...")
-        #     continue
+    # family -> offering edges valid at each timestamp, joined with the offering cost and demand cubes
+    node_cube = temporal_graph.load_node_cube()
+    edge_cube = temporal_graph.load_edge_cube()
+    family_edges = edge_cube.edges("PRODUCT_FAMILYToPRODUCT_OFFERING")
+    offering_positions = np.array([node_cube.node_position("PRODUCT_OFFERING", target) for _, target in family_edges], dtype=float)
+    known = ~np.isnan(offering_positions)
+    offering_positions = offering_positions[known].astype(int)
+    families = np.array([source for source, _ in family_edges], dtype=object)[known]
+
+    edge_costs = node_cube.values("PRODUCT_OFFERING", "cost")[:num_timestamps, offering_positions]
+    edge_demands = node_cube.values("PRODUCT_OFFERING", "demand")[:num_timestamps, offering_positions]
+    # an edge only counts at timestamps where both it and its offering exist
+    valid = edge_cube.valid("PRODUCT_FAMILYToPRODUCT_OFFERING")[:num_timestamps, known]
+    valid = valid & ~(np.isnan(edge_costs) & np.isnan(edge_demands))
+    edge_costs, edge_demands = np.nan_to_num(edge_costs), np.nan_to_num(edge_demands)
 
-        # # Parse data
-        # data = url_data.json()
-        data = st.session_state.temporal_graph.load_json_at_timestamp(timestamp)
-
-        # Retrieve PRODUCT_FAMILY to PRODUCT_OFFERING relationships
-        family_to_offering_relationships = get_product_family_to_offering_relationships(data)
-
-        # Retrieve PRODUCT_OFFERING nodes
-        product_offerings = get_product_offerings(data)
-
-        # Create a lookup dictionary for PRODUCT_OFFERING nodes by ID
-        offering_lookup = {po["id"]: po for po in product_offerings}
-
-        # Calculate average cost and demand for each product family
-        family_avg_cost = {}
-        family_avg_demand = {}
-
-        for relationship in family_to_offering_relationships:
-            source = relationship["source"]  # PRODUCT_FAMILY ID
-            target = relationship["target"]  # PRODUCT_OFFERING ID
-
-            if target in offering_lookup:
-                offering = offering_lookup[target]
-                cost = offering.get("cost", 0)
-                demand = offering.get("demand", 0)
-
-                if source not in family_avg_cost:
-                    family_avg_cost[source] = []
-                    family_avg_demand[source] = []
-
-                family_avg_cost[source].append(cost)
-                family_avg_demand[source].append(demand)
-
-        # Store average values for the timestamp
-        all_avg_costs[timestamp] = {family: sum(costs) / len(costs) for family, costs in family_avg_cost.items()}
-        all_avg_demands[timestamp] = {family: sum(demands) / len(demands) for family, demands in family_avg_demand.items()}
+    for timestamp in range(num_timestamps):
+        all_avg_costs[timestamp] = {}
+        all_avg_demands[timestamp] = {}
+        for family in dict.fromkeys(families[valid[timestamp]]):
+            in_family = valid[timestamp] & (families == family)
+            all_avg_costs[timestamp][family] = float(edge_costs[timestamp, in_family].mean())
+            all_avg_demands[timestamp][family] = float(edge_demands[timestamp, in_family].mean())
 
     # Convert data into time-series format for plotting
     time_series_cost = pd.DataFrame(all_avg_costs).T.fillna(0)
@@ -249,16 +232,18 @@ def node_details(node_index, po_id_input,timestamp):
 
     with col2:
         # if found:
-        graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-        ego_graph = ego_graph_query(graph, po_id_input, 1)
+        ego = st.session_state.temporal_graph.load_ego_graph_at_timestamp(timestamp, po_id_input, 1)
+        ego_graph = ego.graph
         if ego_graph:
             st.write(f"### Neighbors for {po_id_input}")
             # st.write(f"Ego Graph for Node: {supplier_id}")
             # st.write(f"Nodes: {ego_graph.number_of_nodes()}, Edges: {ego_graph.number_of_edges()}")
 
             # Visualize and render the ego graph with Plotly
-            fig = plotly_ego_graph(ego_graph)
+            fig = plotly_ego_graph(ego_graph, ego.pos)
             st.plotly_chart(fig) 
+            if ego.truncated:
+                st.caption(f"Showing the nearest {len(ego_graph)} nodes.")
 
 @st.fragment
 def queries():
@@ -267,7 +252,7 @@ def queries():
     cols1,cols2=st.columns([2,1],gap="medium")
     with cols1:
 
-        query_options = ["Select","Profitable Products", "Cost and Demand Across Timestamps", "Storage Cost Analysis"]
+        query_options = ["Select","Profitable Products", "Cost and Demand Across Timestamps", "Storage Cost Analysis", "Lead Time Trend", "Landed Cost Breakdown", "Best Supply Route"]
         selected_query = st.selectbox("Select a Query", query_options)
         num_timestamps = len(st.session_state.temporal_graph.files)
         temporal_graph = st.session_state.temporal_graph
@@ -371,6 +356,96 @@ def queries():
                 query_and_plot_costs_plotly(temporal_graph, product_offering_id, timestamp)
 
 
+        elif selected_query == "Lead Time Trend":
+            st.subheader("Critical-Path Lead Time Across Timestamps")
+
+            product_offering_ids=st.session_state.temporal_graph.create_node_type_index(0)["PRODUCT_OFFERING"]
+            selected_products = st.multiselect(
+                "Select PRODUCT_OFFERING IDs (none for every product)",
+                options=list(product_offering_ids.keys()),
+            )
+
+            if st.button("Query Lead Times"):
+                lead_time_df = query_lead_time_trend(temporal_graph, selected_products)
+                if lead_time_df.empty:
+                    st.warning("No lead times found for the selected products.")
+                    return
+
+                fig = px.line(lead_time_df, x="Timestamp", y="Lead Time (days)", color="Product", title="Lead Time Across Timestamps")
+                st.plotly_chart(fig)
+
+                # the slowest product at the latest timestamp and the chain that holds it up
+                lead_times = temporal_graph.load_lead_times()
+                latest = lead_time_df[lead_time_df["Timestamp"] == lead_times.timestamps[-1]]
+                if not latest.empty:
+                    product_offering_id = latest.loc[latest["Lead Time (days)"].idxmax(), "Product"]
+                    st.write(f"Critical path of **{product_offering_id}**, the slowest product at timestamp {lead_times.timestamps[-1]}:")
+                    st.dataframe(lead_times.chain(product_offering_id, len(lead_times.timestamps) - 1))
+
+
+        elif selected_query == "Landed Cost Breakdown":
+            st.subheader("Landed Cost Across Timestamps")
+
+            with cols2:
+                timestamp = st.slider("Select Timestamp", 0, num_timestamps - 1, 0)
+
+            product_offering_ids=st.session_state.temporal_graph.create_node_type_index(0)["PRODUCT_OFFERING"]
+            if product_offering_ids:
+                product_offering_id = st.selectbox(
+                    "Select PRODUCT_OFFERING ID",
+                    options=product_offering_ids.keys(),
+                    format_func=lambda x: f"{x}",
+                )
+            else:
+                st.warning("No PRODUCT_OFFERING IDs available for the selected timestamp.")
+                return
+
+            if st.button("Query Landed Cost"):
+                cost_df, routes_df = query_landed_cost(temporal_graph, product_offering_id, timestamp)
+                if cost_df.empty:
+                    st.warning(f"No facility makes Product Offering ID {product_offering_id}.")
+                    return
+
+                fig = px.bar(cost_df, x="Timestamp", y="Cost", color="Component", title="Unit Cost by Component Across Timestamps")
+                st.plotly_chart(fig)
+                st.write(f"Facilities making **{product_offering_id}** at timestamp {timestamp}, the cheapest one sets the landed cost:")
+                st.dataframe(routes_df)
+
+
+        elif selected_query == "Best Supply Route":
+            st.subheader("Best Supplier to Product Route")
+
+            with cols2:
+                timestamp = st.slider("Select Timestamp", 0, num_timestamps - 1, 0)
+
+            product_offering_ids=st.session_state.temporal_graph.create_node_type_index(0)["PRODUCT_OFFERING"]
+            if product_offering_ids:
+                product_offering_id = st.selectbox(
+                    "Select PRODUCT_OFFERING ID",
+                    options=product_offering_ids.keys(),
+                    format_func=lambda x: f"{x}",
+                )
+            else:
+                st.warning("No PRODUCT_OFFERING IDs available for the selected timestamp.")
+                return
+            objective = st.selectbox("Optimize", list(OBJECTIVES), format_func=lambda x: x.replace("_", " ").capitalize())
+
+            if st.button("Find Best Route"):
+                route_df, series_df = query_best_route(temporal_graph, product_offering_id, timestamp, objective)
+                if route_df.empty:
+                    st.warning(f"No supplier reaches Product Offering ID {product_offering_id} at timestamp {timestamp}.")
+                    return
+
+                st.write(f"Best route to **{product_offering_id}** at timestamp {timestamp}: "
+                         f"cost {route_df['Cost'].sum():.2f}, lead time {route_df['Lead Time'].sum():g} days")
+                st.dataframe(route_df, hide_index=True)
+                l,r=st.columns(2)
+                with l:
+                    st.plotly_chart(px.line(series_df, x="Timestamp", y="Cost", title="Best Route Cost Across Timestamps"))
+                with r:
+                    st.plotly_chart(px.line(series_df, x="Timestamp", y="Lead Time", title="Best Route Lead Time Across Timestamps"))
+
+
 
 def create_graph():
     # Define node attributes
@@ -501,70 +576,83 @@ def query_profitable_products(temporal_graph, timestamp, cost_threshold, demand_
     """
     Query 1: Find profitable products based on cost and demand thresholds.
     """
-    profitable_products = []
-    G = temporal_graph.load_graph_at_timestamp(timestamp)
-    for node, attrs in G.nodes(data=True):
-        if attrs.get("node_type") == "PRODUCT_OFFERING":
-            making_cost = attrs.get("cost", float("inf"))
-            demand = attrs.get("demand", 0)
-
-            if making_cost <= cost_threshold and demand >= demand_threshold:
-                profitable_products.append((node, making_cost, demand))
-    return profitable_products
+    engine = temporal_graph.load_query_engine_at_timestamp(timestamp)
+    matches = engine.select("PRODUCT_OFFERING", (col("cost") <= cost_threshold) & (col("demand") >= demand_threshold))
+    return list(zip(matches.index.tolist(), matches["cost"].tolist(), matches["demand"].tolist()))
 
 @time_and_memory_streamlit
 def query_product_cost_demand_across_timestamps(temporal_graph, product_offering_id):
     """
     Query 2: Retrieve the cost and demand of a product offering across timestamps.
     """
-    costs = []
-    demands = []
-
-    for timestamp, file_url in enumerate(temporal_graph.files):
-        # url_data = requests.get(file_url)
-        # if url_data.status_code != 200:
-        #     continue
-
-        # data = url_data.json()
-        data = st.session_state.temporal_graph.load_json_at_timestamp(timestamp)
-        product_offerings = get_product_offerings(data)
-        for offering in product_offerings:
-            if offering.get("id") == product_offering_id:
-                costs.append((timestamp, offering.get("cost", 0)))
-                demands.append((timestamp, offering.get("demand", 0)))
-                break
+    cube = temporal_graph.load_node_cube()
+    cost = cube.series("PRODUCT_OFFERING", product_offering_id, "cost")
+    demand = cube.series("PRODUCT_OFFERING", product_offering_id, "demand")
+
+    # timestamps where the offering exists
+    present = np.flatnonzero(~np.isnan(cost) | ~np.isnan(demand))
+    costs = [(int(timestamp), float(np.nan_to_num(cost[timestamp]))) for timestamp in present]
+    demands = [(int(timestamp), float(np.nan_to_num(demand[timestamp]))) for timestamp in present]
 
     return costs, demands
 
 
+@time_and_memory_streamlit
+def query_lead_time_trend(temporal_graph, product_offering_ids):
+    """
+    Query 4: Critical-path lead time of product offerings at every timestamp, long format for plotting.
+    """
+    table = temporal_graph.load_lead_times().table
+    if product_offering_ids:
+        table = table.reindex(columns=product_offering_ids)
+    lead_times = table.reset_index().melt(id_vars="Timestamp", var_name="Product", value_name="Lead Time (days)")
+    return lead_times.dropna(subset=["Lead Time (days)"])
+
+
+@time_and_memory_streamlit
+def query_landed_cost(temporal_graph, product_offering_id, timestamp):
+    """
+    Query 5: Landed cost of a product offering by component at every timestamp, and its facilities at one timestamp.
+    """
+    rollup = temporal_graph.load_cost_rollup()
+    # the unit cost stacks the per-unit components, the fixed operating cost of the facility stays in the table
+    costs = rollup.series(product_offering_id)[UNIT_COMPONENTS]
+    costs = costs.reset_index().melt(id_vars="Timestamp", var_name="Component", value_name="Cost").dropna(subset=["Cost"])
+    routes = rollup.routes(timestamp)
+    return costs, routes[routes["Product"] == product_offering_id].reset_index(drop=True)
+
+
+@time_and_memory_streamlit
+def query_best_route(temporal_graph, product_offering_id, timestamp, objective):
+    """
+    Query 6: Edges of the best supplier to product offering route at one timestamp, and its cost and lead time at every timestamp.
+    """
+    routes = temporal_graph.load_route_optimizer()
+    series = routes.series(product_offering_id, objective).reset_index().dropna()
+    return routes.route(product_offering_id, timestamp, objective), series
+
+
 @time_and_memory_streamlit
 def query_and_plot_costs_plotly(temporal_graph, product_offering_id, timestamp):
     """
     Query and visualize product costs and storage costs for a given PRODUCT_OFFERING using Plotly.
     """
     G = temporal_graph.load_graph_at_timestamp(timestamp)
+    adjacency = temporal_graph.load_adjacency_at_timestamp(timestamp)
 
     # Retrieve product cost from facilities
     facility_costs = {}
-    for u, v, attrs in G.edges(data=True):
-        if (
-            attrs.get("relationship_type") == "FACILITYToPRODUCT_OFFERING"
-            and v == product_offering_id
-        ):
-            facility_name = G.nodes[u].get("name", u)  
-            product_cost = attrs.get("product_cost", 0)
-            facility_costs[facility_name] = product_cost
+    for u, v, attrs in adjacency.in_edges("FACILITYToPRODUCT_OFFERING", product_offering_id, data=True):
+        facility_name = G.nodes[u].get("name", u)  
+        product_cost = attrs.get("product_cost", 0)
+        facility_costs[facility_name] = product_cost
 
     # Retrieve storage cost from warehouses
     warehouse_costs = {}
-    for u, v, attrs in G.edges(data=True):
-        if (
-            attrs.get("relationship_type") == "WAREHOUSEToPRODUCT_OFFERING"
-            and v == product_offering_id
-        ):
-            warehouse_name = G.nodes[u].get("name", u) 
-            storage_cost = attrs.get("storage_cost", 0)
-            warehouse_costs[warehouse_name] = storage_cost
+    for u, v, attrs in adjacency.in_edges("WAREHOUSEToPRODUCT_OFFERING", product_offering_id, data=True):
+        warehouse_name = G.nodes[u].get("name", u) 
+        storage_cost = attrs.get("storage_cost", 0)
+        warehouse_costs[warehouse_name] = storage_cost
 
     l,r=st.columns(2)
     with l:
@@ -602,25 +690,21 @@ def get_top_demand_products(temporal_graph, num_timestamps, top_n=3):
     Find the top N product offerings with the highest demand across timestamps.
     """
     
-    demand_records = []
-
-    for timestamp in range(num_timestamps):
-        # url_data = requests.get(temporal_graph.files[timestamp])
-        # if url_data.status_code != 200:
-        #     continue
-
-        # data = url_data.json()
-        data = st.session_state.temporal_graph.load_json_at_timestamp(timestamp)
-        product_offerings = get_product_offerings(data)
-
-        for offering in product_offerings:
-            product_name = offering.get("name", "Unknown Product")
-            demand = offering.get("demand", 0)
-            demand_records.append((timestamp, product_name, demand))
-
-    # Sort by demand in descending order and take the top N
-    sorted_records = sorted(demand_records, key=lambda x: x[2], reverse=True)
-    return sorted_records[:top_n]
+    cube = temporal_graph.load_node_cube()
+    names = cube.names("PRODUCT_OFFERING")
+    demand = cube.values("PRODUCT_OFFERING", "demand")[:num_timestamps]
+    demand = np.where(np.isnan(demand), -np.inf, demand)
+
+    # top_n (timestamp, offering) cells of the demand slice, highest first
+    flat = demand.ravel()
+    top = np.argpartition(flat, -top_n)[-top_n:] if flat.size > top_n else np.arange(flat.size)
+    top = top[np.argsort(flat[top])[::-1]]
+    timestamps, offerings = np.unravel_index(top, demand.shape)
+    return [
+        (int(timestamp), names[offering], float(demand[timestamp, offering]))
+        for timestamp, offering in zip(timestamps, offerings)
+        if np.isfinite(demand[timestamp, offering])
+    ]
 
 
 
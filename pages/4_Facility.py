@@ -9,7 +9,8 @@ import functools
 import matplotlib.pyplot as plt
 from matplotlib.patches import Circle
 import networkx as nx
-from utils import time_and_memory_streamlit,ego_graph_query,plotly_ego_graph
+from utils import time_and_memory_streamlit,plotly_ego_graph
+from cost_rollup import UNIT_COMPONENTS
 
 # st.set_page_config(
 #     layout="wide",
@@ -364,16 +365,18 @@ def node_details(node_index, facility_id,timestamp):
 
     with col2:
         # if found:
-        graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-        ego_graph = ego_graph_query(graph, facility_id, 1)
+        ego = st.session_state.temporal_graph.load_ego_graph_at_timestamp(timestamp, facility_id, 1)
+        ego_graph = ego.graph
         if ego_graph:
             st.write(f"### Neighbors for {facility_id}")
             # st.write(f"Ego Graph for Node: {supplier_id}")
             # st.write(f"Nodes: {ego_graph.number_of_nodes()}, Edges: {ego_graph.number_of_edges()}")
 
             # Visualize and render the ego graph with Plotly
-            fig = plotly_ego_graph(ego_graph)
+            fig = plotly_ego_graph(ego_graph, ego.pos)
             st.plotly_chart(fig)  # Display the figure in Streamlit
+            if ego.truncated:
+                st.caption(f"Showing the nearest {len(ego_graph)} nodes.")
 
 
 
@@ -415,42 +418,12 @@ def plot_average_operating_cost(operating_cost1, identifier1, operating_cost2, i
     return fig
 
 @time_and_memory_streamlit
-@st.cache_data
-def find_product_offerings_under_threshold(data, threshold_operating_cost):
-    product_offerings = []
-    highest_operating_cost = 0
-    highest_product_offering = None
-
-    for edge in data["link_values"].get("FACILITYToPRODUCT_OFFERING", []):
-        source_id = edge[4]  # Facility ID
-        target_id = edge[5]  # Product Offering ID
-
-        # Find the corresponding facility and product offering
-        facility = next((f for f in data["node_values"]["FACILITY"] if f[6] == source_id), None)
-        product = next((p for p in data["node_values"]["PRODUCT_OFFERING"] if p[4] == target_id), None)
-
-        if facility and product:
-            operating_cost = facility[5]
-
-            # Add to list if operating cost is below the threshold
-            if operating_cost <= threshold_operating_cost:
-                product_offerings.append({
-                    "Facility Name": facility[1],  # Assuming index 1 is name
-                    "Facility Location": facility[3],  # Assuming index 3 is location
-                    "Product Name": product[1],  # Assuming index 1 is name
-                    "Operating Cost": operating_cost
-                })
+def find_product_offerings_under_threshold(facility_costs, threshold_operating_cost):
+    # edges were joined with the id index and sorted by operating cost once per timestamp,
+    # any threshold is a bisect into the sorted costs
+    offerings_df = facility_costs.under(threshold_operating_cost)
 
-            # Update the highest operating cost and product offering
-            if operating_cost > highest_operating_cost:
-                highest_operating_cost = operating_cost
-                highest_product_offering = product
-
-    # Convert to Pandas DataFrame for tabular output
-    offerings_df = pd.DataFrame(product_offerings)
-    offerings_df = offerings_df.sort_values(by='Operating Cost', ascending=False)
-
-    return offerings_df, highest_operating_cost, highest_product_offering
+    return offerings_df, facility_costs.highest_operating_cost, facility_costs.highest_product_offering
 
 
 @time_and_memory_streamlit
@@ -481,28 +454,23 @@ def find_all_parts_required_in_facility(data):
 
 
 @time_and_memory_streamlit
-def find_facilty_making_product(graph, product_id):
-    for node in graph.nodes(data=True):
-        if node[0] == product_id:
-            product_id_node = node
-            break
-    in_edges = graph.in_edges(product_id_node[0], data=True)
-    facility = {}
-
-    for source, target, edge_data in in_edges:
-        if edge_data["relationship_type"] == "FACILITYToPRODUCT_OFFERING" and target == product_id:
-            if target not in facility:
-                facility[target] = []
+def find_facilty_making_product(adjacency, product_id):
+    facilities = adjacency.predecessors("FACILITYToPRODUCT_OFFERING", product_id)
 
-            facility[target].append(source)
-
-    if facility:
-        facility_list = ", ".join(facility[product_id])
+    if facilities:
+        facility_list = ", ".join(facilities)
         return f"The facilities making the product with ID '{product_id}' are: {facility_list}."
     else:
         return f"No facilities found making the product with ID '{product_id}'."
 
 
+@time_and_memory_streamlit
+def find_landed_cost_of_facility_products(temporal_graph, facility_id, timestamp):
+    # rolled up once for every timestamp, the facility's routes are a slice of it
+    rollup = temporal_graph.load_cost_rollup()
+    return rollup.routes(timestamp, facility_id)
+
+
 @st.fragment
 def queries():
     num_timestamps = len(st.session_state.temporal_graph.files)
@@ -515,25 +483,26 @@ def queries():
         query_option = st.selectbox("Choose Query", ["Select", 
                                                      "Facility with operting cost within a threshold",
                                                     "Parts Present in a facility"
-                                                    ,"Facility manufacturing a specfic product"])
+                                                    ,"Facility manufacturing a specfic product"
+                                                    ,"Landed cost of the products of a facility"])
 
         if query_option=="Facility with operting cost within a threshold":
 
             
-            data = st.session_state.temporal_graph.load_json_at_timestamp(timestamp)
+            facility_costs = st.session_state.temporal_graph.load_facility_costs_at_timestamp(timestamp)
             cost_threshold = st.slider("Cost Threshold", min_value=0, max_value=300, value=150)
-            if st.button("Find Product Offerings"):
-                offerings_df, highest_cost, highest_product = find_product_offerings_under_threshold(data, cost_threshold)
+            # answered by a bisect, so the table follows the slider
+            offerings_df, highest_cost, highest_product = find_product_offerings_under_threshold(facility_costs, cost_threshold)
 
-                if not offerings_df.empty:
-                    st.write("**Product Offerings Under Threshold**")
-                    st.dataframe(offerings_df)
+            if not offerings_df.empty:
+                st.write("**Product Offerings Under Threshold**")
+                st.dataframe(offerings_df)
 
-                    st.write("**Highest Operating Cost and Associated Product Offering:**")
-                    st.write(f"Operating Cost: {highest_cost}")
-                    st.write(f"Product Name: {highest_product[1]}")  # Assuming index 1 is name
-                else:
-                    st.write("No product offerings found under the given threshold.")
+                st.write("**Highest Operating Cost and Associated Product Offering:**")
+                st.write(f"Operating Cost: {highest_cost}")
+                st.write(f"Product Name: {highest_product[1]}")  # Assuming index 1 is name
+            else:
+                st.write("No product offerings found under the given threshold.")
 
         elif query_option=="Parts Present in a facility":
             
@@ -559,10 +528,26 @@ def queries():
                 st.warning("No Product Offering IDs available for the selected timestamp.")
                 return
             if st.button("Find Facilities"):
-                graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-                facility_for_prod= find_facilty_making_product(graph,po_ids)
+                adjacency=st.session_state.temporal_graph.load_adjacency_at_timestamp(timestamp)
+                facility_for_prod= find_facilty_making_product(adjacency,po_ids)
                 st.success(facility_for_prod)
 
+        elif query_option=="Landed cost of the products of a facility":
+            facility_ids = st.session_state.temporal_graph.create_node_type_index(timestamp)["FACILITY"]
+            facility_id = st.selectbox("Choose Facility Id", options=facility_ids.keys())
+            if st.button("Find Landed Cost"):
+                routes_df = find_landed_cost_of_facility_products(st.session_state.temporal_graph, facility_id, timestamp)
+                if routes_df.empty:
+                    st.warning(f"Facility {facility_id} makes no product offering at timestamp {timestamp}.")
+                else:
+                    fig = px.bar(
+                        routes_df.melt(id_vars="Product", value_vars=UNIT_COMPONENTS, var_name="Component", value_name="Cost"),
+                        x="Product", y="Cost", color="Component", title=f"Unit Cost by Component in {facility_id}",
+                    )
+                    st.plotly_chart(fig)
+                    st.write("The operating cost is a fixed cost of the facility, it is listed in the table but not in the unit cost. Cheapest is True where no other facility makes a unit of the product for less.")
+                    st.dataframe(routes_df)
+
     
 
 
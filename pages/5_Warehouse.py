@@ -12,7 +12,8 @@ import functools
 #     layout="wide",
 #     initial_sidebar_state="expanded",
 #     )
-from utils import time_and_memory_streamlit,plotly_ego_graph,ego_graph_query
+from utils import time_and_memory_streamlit,plotly_ego_graph
+from query_engine import Predicate, col
 def get_product_offering_ids(graph):
 
         return [
@@ -70,12 +71,11 @@ def static_part():
     with col3:
         fig = donut_chart(warehouse_size)
         st.plotly_chart(fig, use_container_width=True)  # Display the figure within the column
-def query_transportation_cost_for_supplier_and_warehouse(G, supplier_id, warehouse_id):
+def query_transportation_cost_for_supplier_and_warehouse(adjacency, supplier_id, warehouse_id):
 
-    if G.has_edge(supplier_id, warehouse_id):
-        edge_data = G[supplier_id][warehouse_id]
-        st.write(edge_data)
-        if edge_data.get("relationship_type") == "SUPPLIERSToWAREHOUSE":
+    for source, target, edge_data in adjacency.out_edges("SUPPLIERSToWAREHOUSE", supplier_id, data=True):
+        if target == warehouse_id:
+            st.write(edge_data)
             return edge_data.get("transportation_cost")
     return None
 
@@ -281,16 +281,18 @@ def node_details(node_index, war_id,timestamp):
 
     with col2:
         # if found:
-        graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-        ego_graph = ego_graph_query(graph, war_id, 1)
+        ego = st.session_state.temporal_graph.load_ego_graph_at_timestamp(timestamp, war_id, 1)
+        ego_graph = ego.graph
         if ego_graph:
             st.write(f"### Neighbors for {war_id}")
             # st.write(f"Ego Graph for Node: {supplier_id}")
             # st.write(f"Nodes: {ego_graph.number_of_nodes()}, Edges: {ego_graph.number_of_edges()}")
 
             # Visualize and render the ego graph with Plotly
-            fig = plotly_ego_graph(ego_graph)
+            fig = plotly_ego_graph(ego_graph, ego.pos)
             st.plotly_chart(fig)  # Display the figure in Streamlit
+            if ego.truncated:
+                st.caption(f"Showing the nearest {len(ego_graph)} nodes.")
 
 
 
@@ -455,21 +457,15 @@ def create_warehouse_map(warehouse_data):
     return fig
 
 @time_and_memory_streamlit
-def check_units_available_in_warehouse(graph, product_id):
-    for node in graph.nodes(data=True):
-        if node[0] == product_id:
-            product_id_node = node
-            break
-
-    in_edges = graph.in_edges(product_id_node[0], data=True)
+def check_units_available_in_warehouse(adjacency, product_id):
+    in_edges = adjacency.in_edges("WAREHOUSEToPRODUCT_OFFERING", product_id, data=True)
     available = {}
 
     for source, target, edge_data in in_edges:
-        if edge_data["relationship_type"] == "WAREHOUSEToPRODUCT_OFFERING" and target == product_id:
-            if source not in available:
-                available[source] = 0
+        if source not in available:
+            available[source] = 0
 
-            available[source] += edge_data["inventory_level"]
+        available[source] += edge_data["inventory_level"]
 
     # Prepare the output as a sentence
     if available:
@@ -484,23 +480,20 @@ def check_units_available_in_warehouse(graph, product_id):
         st.write(f"No warehouses found with the product with ID '{product_id}'.")
         return
 @time_and_memory_streamlit
-def find_suppliers_to_warehouse_table(graph, warehouse_id):
+def find_suppliers_to_warehouse_table(graph, adjacency, warehouse_id):
     supplier_data = []
 
-    in_edges = graph.in_edges(warehouse_id, data=True)
-
-    for source, target, edge_data in in_edges:
-        if edge_data["relationship_type"] == "SUPPLIERSToWAREHOUSE" and target == warehouse_id:
-            supplier_name = graph.nodes[source].get("name", source)  # Supplier node's name
-            part_types = graph.nodes[source].get("supplied_part_types", [])  # Extract supplied part types
-            
-            # Ensure part_types is a valid list
-            if isinstance(part_types, list) and part_types:
-                part_list = ", ".join(part_types)  # Convert list to comma-separated string
-            else:
-                part_list = "Unknown"
-            
-            supplier_data.append({"Supplier": supplier_name, "Supplied Parts": part_list})
+    for source in adjacency.predecessors("SUPPLIERSToWAREHOUSE", warehouse_id):
+        supplier_name = graph.nodes[source].get("name", source)  # Supplier node's name
+        part_types = graph.nodes[source].get("supplied_part_types", [])  # Extract supplied part types
+        
+        # Ensure part_types is a valid list
+        if isinstance(part_types, list) and part_types:
+            part_list = ", ".join(part_types)  # Convert list to comma-separated string
+        else:
+            part_list = "Unknown"
+        
+        supplier_data.append({"Supplier": supplier_name, "Supplied Parts": part_list})
 
     # Convert the data into a Pandas DataFrame
     suppliers_df = pd.DataFrame(supplier_data)
@@ -508,27 +501,26 @@ def find_suppliers_to_warehouse_table(graph, warehouse_id):
     return suppliers_df
 
 @time_and_memory_streamlit
-def find_parts_for_warehouse(graph, warehouse_id):
+def find_parts_for_warehouse(graph, adjacency, warehouse_id):
     # Data storage for parts
     parts_data = []
 
-    # Iterate through out-edges of the warehouse node
-    out_edges = graph.out_edges(warehouse_id, data=True)
+    # Only the WAREHOUSEToPARTS out-edges of the warehouse node
+    out_edges = adjacency.out_edges("WAREHOUSEToPARTS", warehouse_id, data=True)
     
     for source, target, edge_data in out_edges:
-        if edge_data.get("relationship_type") == "WAREHOUSEToPARTS":
-            part_name = graph.nodes[target].get("name", target)  # Get part name
-            part_type = graph.nodes[target].get("type", "Unknown")  # Get part type
-            inventory_level = edge_data.get("inventory_level", "Unknown")  # Inventory level from edge data
-            storage_cost = edge_data.get("storage_cost", "Unknown")  # Storage cost from edge data
-            
-            # Append part details
-            parts_data.append({
-                "Part Name": part_name,
-                "Part Type": part_type,
-                "Inventory Level": inventory_level,
-                "Storage Cost": storage_cost
-            })
+        part_name = graph.nodes[target].get("name", target)  # Get part name
+        part_type = graph.nodes[target].get("type", "Unknown")  # Get part type
+        inventory_level = edge_data.get("inventory_level", "Unknown")  # Inventory level from edge data
+        storage_cost = edge_data.get("storage_cost", "Unknown")  # Storage cost from edge data
+        
+        # Append part details
+        parts_data.append({
+            "Part Name": part_name,
+            "Part Type": part_type,
+            "Inventory Level": inventory_level,
+            "Storage Cost": storage_cost
+        })
 
     # Convert to DataFrame for structured output
     parts_df = pd.DataFrame(parts_data)
@@ -536,36 +528,27 @@ def find_parts_for_warehouse(graph, warehouse_id):
 
 #max-capacity-current capacity should be greater than 15 percent of max-capacity
 @time_and_memory_streamlit
-def find_warehouses_below_safety_stock(graph):
-    under_threshold_warehouses = []
-
-    for node, data in graph.nodes(data=True):
-        if data.get("node_type") == "WAREHOUSE":
-            max_capacity = data.get("max_capacity", 0)
-            current_capacity = data.get("current_capacity", 0)
-            # Check if max_capacity - current_capacity is less than or equal to 15% of max_capacity
-            if max_capacity > 0 and (max_capacity - current_capacity) <= 0.15 * max_capacity:
-                under_threshold_warehouses.append({
-                    "Warehouse Name": data.get("name", node),
-                    "Max Capacity": max_capacity,
-                    "Current Capacity": current_capacity,
-                    "Location": data.get("location", "Unknown"),
-                })
-
-    warehouse_df = pd.DataFrame(under_threshold_warehouses)
-    return warehouse_df
+def find_warehouses_below_safety_stock(engine):
+    # max_capacity - current_capacity within 15% of max_capacity
+    near_capacity = Predicate(lambda frame: frame["max_capacity"] - frame["current_capacity"] <= 0.15 * frame["max_capacity"])
+    warehouses = engine.select("WAREHOUSE", (col("max_capacity") > 0) & near_capacity)
+
+    return pd.DataFrame({
+        "Warehouse Name": warehouses["name"].tolist(),
+        "Max Capacity": warehouses["max_capacity"].tolist(),
+        "Current Capacity": warehouses["current_capacity"].tolist(),
+        "Location": warehouses["location"].tolist(),
+    })
 
 @time_and_memory_streamlit
-def find_warehouses_by_storage_cost(graph):
+def find_warehouses_by_storage_cost(graph, adjacency):
     warehouse_cost_data = []
 
     for node, data in graph.nodes(data=True):
         if data.get("node_type") == "WAREHOUSE":
             total_storage_cost = 0
-            out_edges = graph.out_edges(node, data=True)
-            for source, target, edge_data in out_edges:
-                if edge_data.get("relationship_type") == "WAREHOUSEToPARTS":
-                    total_storage_cost += edge_data.get("storage_cost", 0)
+            for source, target, edge_data in adjacency.out_edges("WAREHOUSEToPARTS", node, data=True):
+                total_storage_cost += edge_data.get("storage_cost", 0)
 
             warehouse_cost_data.append({
                 "Warehouse Name": data.get("name", node),
@@ -576,6 +559,17 @@ def find_warehouses_by_storage_cost(graph):
     warehouse_df = pd.DataFrame(warehouse_cost_data).sort_values(by="Total Storage Cost", ascending=False)
     return warehouse_df
 
+@time_and_memory_streamlit
+def query_inventory_history(edge_cube, warehouse_id, relationship_type="WAREHOUSEToPARTS"):
+    """Inventory level of every part (or offering) of a warehouse at each timestamp, from the edge cube."""
+    positions = edge_cube.edge_positions(relationship_type, source=warehouse_id)
+    inventory = edge_cube.values(relationship_type, "inventory_level")[:, positions]
+    edges = edge_cube.edges(relationship_type)
+    targets = [edges[position][1] for position in positions]
+
+    # NaN where the warehouse did not stock the item at that timestamp
+    return pd.DataFrame(inventory, columns=targets).rename_axis("Timestamp")
+
 @st.fragment
 def queries():
     num_timestamps = len(st.session_state.temporal_graph.files)
@@ -588,7 +582,8 @@ def queries():
                                                     "Find Suppliers Supplying to a Warehouse",
                                                     "Find Parts in Warehouse", 
                                                     # "Find Warehouses Below Safety Stock",
-                                                    "Sort Warehouses by Storage Cost"])
+                                                    "Sort Warehouses by Storage Cost",
+                                                    "Inventory Level Over Time"])
         if query_option=="Check available units":
         
             po_ids = st.session_state.temporal_graph.create_node_type_index(0)["PRODUCT_OFFERING"]
@@ -602,8 +597,8 @@ def queries():
                 st.warning("No Product Offering IDs available for the selected timestamp.")
                 return
             if st.button("Check Availability"):
-                graph = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-                avail=check_units_available_in_warehouse(graph, po_ids)
+                adjacency = st.session_state.temporal_graph.load_adjacency_at_timestamp(timestamp)
+                avail=check_units_available_in_warehouse(adjacency, po_ids)
                 # st.success(avail)
         
         elif query_option == "Find Suppliers Supplying to a Warehouse":
@@ -612,7 +607,8 @@ def queries():
 
             if st.button("Find suppliers"):
                 graph = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-                result = find_suppliers_to_warehouse_table(graph, selected_warehouse)
+                adjacency = st.session_state.temporal_graph.load_adjacency_at_timestamp(timestamp)
+                result = find_suppliers_to_warehouse_table(graph, adjacency, selected_warehouse)
                 
                 # Display the result as a table
                 if not result.empty:
@@ -628,7 +624,8 @@ def queries():
 
                 if st.button("Find Parts"):
                     graph = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-                    result = find_parts_for_warehouse(graph, selected_warehouse)
+                    adjacency = st.session_state.temporal_graph.load_adjacency_at_timestamp(timestamp)
+                    result = find_parts_for_warehouse(graph, adjacency, selected_warehouse)
                     
                     if result.empty:
                         st.warning(f"No parts found for the warehouse '{selected_warehouse}'.")
@@ -639,8 +636,8 @@ def queries():
 
         elif query_option == "Find Warehouses Below Safety Stock":
             if st.button("Find Warehouses"):
-                graph = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp) 
-                result = find_warehouses_below_safety_stock(graph)
+                engine = st.session_state.temporal_graph.load_query_engine_at_timestamp(timestamp)
+                result = find_warehouses_below_safety_stock(engine)
                 if not result.empty:
                     st.dataframe(result)
                 else:
@@ -649,9 +646,30 @@ def queries():
         elif query_option == "Sort Warehouses by Storage Cost":
             if st.button("Find Warehouses"):
                 graph = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-                result = find_warehouses_by_storage_cost(graph)
+                adjacency = st.session_state.temporal_graph.load_adjacency_at_timestamp(timestamp)
+                result = find_warehouses_by_storage_cost(graph, adjacency)
                 st.dataframe(result)
 
+        elif query_option == "Inventory Level Over Time":
+            warehouse_ids = st.session_state.temporal_graph.create_node_type_index(0)["WAREHOUSE"]
+            selected_warehouse = st.selectbox("Select a Warehouse ID:", warehouse_ids.keys())
+            relationship_type = st.radio("Stock of", ["WAREHOUSEToPARTS", "WAREHOUSEToPRODUCT_OFFERING"],
+                                         format_func=lambda x: "Parts" if x == "WAREHOUSEToPARTS" else "Product Offerings",
+                                         horizontal=True)
+
+            if st.button("Show History"):
+                edge_cube = st.session_state.temporal_graph.load_edge_cube()
+                result = query_inventory_history(edge_cube, selected_warehouse, relationship_type)
+                if result.empty:
+                    st.warning(f"No stock recorded for the warehouse '{selected_warehouse}'.")
+                else:
+                    fig = go.Figure()
+                    for item in result.columns:
+                        fig.add_trace(go.Scatter(x=result.index, y=result[item], mode="lines", name=item))
+                    fig.update_layout(title=f"Inventory Level in {selected_warehouse}",
+                                      xaxis_title="Timestamp", yaxis_title="Inventory Level", height=400)
+                    st.plotly_chart(fig, use_container_width=True)
+
 
 def main():
     # Adjust global Streamlit styling
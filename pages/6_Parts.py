@@ -10,7 +10,8 @@ import networkx as nx
 import pandas as pd
 import plotly.express as px
 
-from utils import time_and_memory_streamlit, plotly_ego_graph, ego_graph_query
+from query_engine import col
+from utils import time_and_memory_streamlit, plotly_ego_graph
 
 # st.set_page_config(
 #     layout="wide",
@@ -232,16 +233,18 @@ def node_details(node_index, part_id,timestamp):
 
     with col2:
         # if found:
-        graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-        ego_graph = ego_graph_query(graph, part_id, 1)
+        ego = st.session_state.temporal_graph.load_ego_graph_at_timestamp(timestamp, part_id, 1)
+        ego_graph = ego.graph
         if ego_graph:
             st.write(f"### Neighbors for {part_id}")
             # st.write(f"Ego Graph for Node: {supplier_id}")
             # st.write(f"Nodes: {ego_graph.number_of_nodes()}, Edges: {ego_graph.number_of_edges()}")
 
             # Visualize and render the ego graph with Plotly
-            fig = plotly_ego_graph(ego_graph)
+            fig = plotly_ego_graph(ego_graph, ego.pos)
             st.plotly_chart(fig)  # Display the figure in Streamlit
+            if ego.truncated:
+                st.caption(f"Showing the nearest {len(ego_graph)} nodes.")
 
 def donut_chart(data, title="Raw Material Distribution"):
     labels = list(data.keys())
@@ -310,33 +313,21 @@ def query_valid_parts_nx(timestamp, start_date: str, end_date: str):
         st.error(f"Error parsing dates: {e}")
         return []
 
-    # Load the graph at the given timestamp
-    graph = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-    
-    # List to store valid parts (node IDs) and their valid_till dates
-    valid_parts_details = []
-    
-    # Iterate through the nodes in the graph
-    for node, attributes in graph.nodes(data=True):
-        # Extract valid_from and valid_till, with default empty string if not present
-        valid_from_str = attributes.get('valid_from', '')
-        valid_till_str = attributes.get('valid_till', '')
-        
-        # Only process valid nodes with valid dates
-        if valid_from_str and valid_till_str:
-            try:
-                valid_from = datetime.strptime(valid_from_str, "%Y-%m-%d")
-                valid_till = datetime.strptime(valid_till_str, "%Y-%m-%d")
-                
-                if valid_from <= end_date and valid_till >= start_date:
-                    valid_parts_details.append({
-                        'part_id': node,
-                        'valid_till': valid_till.strftime("%Y-%m-%d")
-                    })
-            except ValueError:
-                # Handle any invalid date format gracefully
-                st.warning(f"Skipping node {node} due to invalid date format.")
-                continue
+    # valid_from / valid_till were parsed once when the PARTS frame was built
+    engine = st.session_state.temporal_graph.load_query_engine_at_timestamp(timestamp)
+    parts = engine.nodes("PARTS")
+    validity = engine.interval_index("PARTS", "valid_from", "valid_till")
+
+    if len(validity.unknown):
+        # Handle any missing or invalid date format gracefully
+        st.warning(f"Skipping {len(validity.unknown)} parts due to invalid date format.")
+
+    # Binary search over the sorted validity intervals
+    valid = validity.overlapping(start_date, end_date)
+    valid_parts_details = [
+        {'part_id': part_id, 'valid_till': valid_till}
+        for part_id, valid_till in zip(parts.index[valid], parts["valid_till"].iloc[valid].dt.strftime("%Y-%m-%d"))
+    ]
     
     # Display the results in a container in Streamlit
     if valid_parts_details:
@@ -381,36 +372,21 @@ def query_most_common_subtypes_nx(timestamp: int, n: int)->str:
 @time_and_memory_streamlit
 def bottleneck_parts_temporal(timestamp, importance_threshold, expected_life_threshold):
     
-    # Load the graph for the specified timestamp
-    graph = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-    
-    bottlenecks = []
-    
-    # Iterate through nodes to find parts
-    for node, data in graph.nodes(data=True):
-        if data.get("node_type") == "PARTS":
-            importance = data.get("importance_factor", 0)
-            valid_from = data.get("valid_from", "1970-01-01")
-            valid_till = data.get("valid_till", "9999-12-31")
-
-            # Parse valid_from and valid_till as datetime objects
-            try:
-                valid_from_date = datetime.strptime(valid_from, "%Y-%m-%d")
-                valid_till_date = datetime.strptime(valid_till, "%Y-%m-%d")
-                expected_life = (valid_till_date - valid_from_date).days
-            except ValueError:
-                expected_life = float('inf')  # Handle invalid dates gracefully
-
-            # Check if part qualifies as a bottleneck
-            if importance >= importance_threshold and expected_life <= expected_life_threshold:
-                bottlenecks.append({
-                    "Node ID": node,
-                    "Importance Factor": importance,
-                    "Expected Life (days)": expected_life
-                })
-    
-    # Convert the results to a DataFrame
-    return pd.DataFrame(bottlenecks)
+    # Column queries over the PARTS frame of the timestamp
+    engine = st.session_state.temporal_graph.load_query_engine_at_timestamp(timestamp)
+    parts = engine.nodes("PARTS")
+
+    # Parts with a short enough life by binary search over the sorted lives, parts with invalid dates never qualify
+    lives = engine.interval_index("PARTS", "valid_from", "valid_till")
+    short_lived = lives.at_most(expected_life_threshold)
+
+    # Check which of them are important enough to be bottlenecks
+    bottleneck = short_lived[parts["importance_factor"].to_numpy()[short_lived] >= importance_threshold]
+    return pd.DataFrame({
+        "Node ID": parts.index[bottleneck].tolist(),
+        "Importance Factor": parts["importance_factor"].iloc[bottleneck].tolist(),
+        "Expected Life (days)": lives.lengths[bottleneck].tolist(),
+    })
 
 # # Query suppliers for part via warehouse
 # @time_and_memory
@@ -418,28 +394,25 @@ def bottleneck_parts_temporal(timestamp, importance_threshold, expected_life_thr
 def query_suppliers_for_part_via_warehouse(timestamp, part_id):
     
     G = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
+    adjacency = st.session_state.temporal_graph.load_adjacency_at_timestamp(timestamp)
 
     if part_id not in G:
         return f"Part with ID '{part_id}' not found in the graph."
     suppliers = []
 
-    # Traverse edges originating from the given part to find facilities
-    for facility_node in G.predecessors(part_id):
-        facility_data = G.nodes[facility_node]
-        if facility_data.get("node_type") == "WAREHOUSE":
-            # Traverse edges originating from the facility to find suppliers
-            for supplier_node in G.predecessors(facility_node):
-                supplier_data = G.nodes[supplier_node]
-                if supplier_data.get("node_type") == "SUPPLIERS":
-                    suppliers.append({
-                        "Supplier ID": supplier_node,
-                        # "Name": supplier_data.get("name"),
-                        "Location": supplier_data.get("location"),
-                        # "Reliability": supplier_data.get("reliability"),
-                        # "Size": supplier_data.get("size"),
-                        # "Size Category": supplier_data.get("size_category"),
-                        # "Supplied Part Types": supplier_data.get("supplied_part_types")
-                    })
+    # Warehouses stocking the part, then the suppliers of those warehouses
+    for facility_node in adjacency.predecessors("WAREHOUSEToPARTS", part_id):
+        for supplier_node in adjacency.predecessors("SUPPLIERSToWAREHOUSE", facility_node):
+            supplier_data = G.nodes[supplier_node]
+            suppliers.append({
+                "Supplier ID": supplier_node,
+                # "Name": supplier_data.get("name"),
+                "Location": supplier_data.get("location"),
+                # "Reliability": supplier_data.get("reliability"),
+                # "Size": supplier_data.get("size"),
+                # "Size Category": supplier_data.get("size_category"),
+                # "Supplied Part Types": supplier_data.get("supplied_part_types")
+            })
 
     if not suppliers:
         return f"No suppliers found for part with ID '{part_id}'."
@@ -457,37 +430,20 @@ def query_suppliers_for_part_via_warehouse(timestamp, part_id):
 @time_and_memory_streamlit
 def parts_with_larger_distances_and_lower_costs(timestamp, min_distance, max_transport_cost):
     
-    # Load graph at the given timestamp
-    G = st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-    
-    results = []
-
-    # Iterate over all PARTS nodes
-    for node, data in G.nodes(data=True):
-        if data.get("node_type") == "PARTS":
-            part_id = node  # Get the Part ID
-            # Traverse all neighbors connected by PARTSToFACILITY relationship
-            for neighbor, edge_data in G[node].items():
-                if edge_data.get("relationship_type") == "PARTSToFACILITY":
-                    facility_id = neighbor  # The connected facility ID
-                    distance = edge_data.get("distance", 0)
-                    transport_cost = edge_data.get("transport_cost", 0)
-
-                    # Check if the edge meets the criteria
-                    if distance >= min_distance and transport_cost <= max_transport_cost:
-                        results.append({
-                            "Part ID": part_id,
-                            "Facility ID": facility_id,
-                            "Distance": distance,
-                            "Transport Cost": transport_cost
-                        })
-
-    # Convert results to a DataFrame and sort by distance in descending order
-    results_df = pd.DataFrame(results)
-    if not results_df.empty:
-        results_df = results_df.sort_values(by="Distance", ascending=False)
-
-    return results_df
+    # Column query over the PARTSToFACILITY edges of the timestamp
+    engine = st.session_state.temporal_graph.load_query_engine_at_timestamp(timestamp)
+    edges = engine.select_links(
+        "PARTSToFACILITY",
+        (col("distance") >= min_distance) & (col("transport_cost") <= max_transport_cost),
+        sort_by="distance", ascending=False,
+    )
+
+    return pd.DataFrame({
+        "Part ID": edges["source"].tolist(),
+        "Facility ID": edges["target"].tolist(),
+        "Distance": edges["distance"].tolist(),
+        "Transport Cost": edges["transport_cost"].tolist(),
+    })
 
 
 def create_bar(mydict,title):
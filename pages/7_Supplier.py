@@ -6,7 +6,8 @@ import plotly.graph_objects as go
 import requests
 import networkx as nx
 
-from utils import time_and_memory_streamlit, plotly_ego_graph, ego_graph_query
+from query_engine import col
+from utils import time_and_memory_streamlit, plotly_ego_graph
 
 # st.set_page_config(
 #     layout="wide",
@@ -39,33 +40,30 @@ def static_part():
     with col3:
         st.plotly_chart(fig2, use_container_width=True)  # Display figure 2
 @time_and_memory_streamlit
-def query_lead_time_supplier_to_warehouse(G, timestamp, supplier_id, warehouse_id):
-    if G.has_edge(supplier_id, warehouse_id):
-        edge_data = G[supplier_id][warehouse_id]
-        if edge_data.get("relationship_type") == "SUPPLIERSToWAREHOUSE":
+def query_lead_time_supplier_to_warehouse(adjacency, timestamp, supplier_id, warehouse_id):
+    for _, target, edge_data in adjacency.out_edges("SUPPLIERSToWAREHOUSE", supplier_id, data=True):
+        if target == warehouse_id:
             lead_time = edge_data.get("lead_time")
             return lead_time
-        else:
-            return None
-    else:
-        return None
+    return None
 
 @time_and_memory_streamlit
-def supplier_reliability_costing_temporal(graph, timestamp, reliability_threshold, max_transportation_cost):
-    suppliers = []
+def query_lead_time_history(edge_cube, supplier_id, warehouse_id):
+    """Lead time and transportation cost of one supplier -> warehouse edge at each timestamp, from the edge cube."""
+    return pd.DataFrame({
+        "Lead Time": edge_cube.series("SUPPLIERSToWAREHOUSE", supplier_id, warehouse_id, "lead_time"),
+        "Transportation Cost": edge_cube.series("SUPPLIERSToWAREHOUSE", supplier_id, warehouse_id, "transportation_cost"),
+    }).rename_axis("Timestamp")
 
-    for u, v, data in graph.edges(data=True):
-        if data.get("relationship_type") == "SUPPLIERSToWAREHOUSE":
-            transportation_cost = data.get("transportation_cost", 0)
-            
-            # Check if the transportation cost is within the acceptable range
-            if transportation_cost <= max_transportation_cost:
-                # Extract and check the reliability of the supplier node
-                reliability = graph.nodes[u].get("reliability", 0)
-                if reliability >= reliability_threshold:
-                    suppliers.append((u, reliability, transportation_cost))
-
-    return suppliers
+@time_and_memory_streamlit
+def supplier_reliability_costing_temporal(engine, timestamp, reliability_threshold, max_transportation_cost):
+    # the supplier's reliability joined onto its SUPPLIERSToWAREHOUSE edges, both filters in one mask
+    edges = engine.select_links(
+        "SUPPLIERSToWAREHOUSE",
+        (col("transportation_cost") <= max_transportation_cost) & (col("source_reliability") >= reliability_threshold),
+        source_columns=("reliability",),
+    )
+    return list(zip(edges["source"].tolist(), edges["source_reliability"].tolist(), edges["transportation_cost"].tolist()))
 
 # given a part type return the suppliers who can supply that part type
 @time_and_memory_streamlit
@@ -111,46 +109,19 @@ def find_unused_suppliers(graph):
         return unused_suppliers_df
 
 @time_and_memory_streamlit
-def find_supplier_product_association(graph):
-    supplier_product_mapping = []
+def find_supplier_product_association(reachability):
+    # supplier -> warehouse -> part -> facility -> offering, multiplied out once per timestamp
+    return reachability.table
 
-    for node, data in graph.nodes(data=True):
-        if data.get("node_type") == "SUPPLIERS":
-            supplier_name = data.get("name", node)
-            supplied_parts = set()
-
-            # Traverse outgoing edges to identify supplied parts
-            for _, target, edge_data in graph.out_edges(node, data=True):
-                if edge_data["relationship_type"] == "SUPPLIERSToWAREHOUSE":
-                    warehouse_id = target
-                    
-                    # Traverse warehouse's outgoing edges to find parts
-                    for _, part_target, wh_edge_data in graph.out_edges(warehouse_id, data=True):
-                        if wh_edge_data["relationship_type"] == "WAREHOUSEToPARTS":
-                            supplied_parts.add(part_target)
-
-            # For each supplied part, find associated product offerings
-            associated_products = set()
-            for part_id in supplied_parts:
-                for _, product_target, edge_data in graph.out_edges(part_id, data=True):
-                    if edge_data["relationship_type"] == "PARTSToFACILITY":
-                        facility_id = product_target
-
-                        # Traverse facility's outgoing edges to product offerings
-                        for _, offering_target, fac_edge_data in graph.out_edges(facility_id, data=True):
-                            if fac_edge_data["relationship_type"] == "FACILITYToPRODUCT_OFFERING":
-                                associated_products.add(offering_target)
-
-            # Prepare the result
-            supplier_product_mapping.append({
-                "Supplier Name": supplier_name,
-                "Associated Products": ", ".join(associated_products) if associated_products else "None"
-            })
 
-    # Convert to a DataFrame for better readability
-    supplier_product_df = pd.DataFrame(supplier_product_mapping)
+@time_and_memory_streamlit
+def find_products_of_supplier(reachability, supplier_id):
+    return pd.DataFrame({"Product Offering ID": reachability.products_of(supplier_id)})
 
-    return supplier_product_df
+
+@time_and_memory_streamlit
+def find_suppliers_of_product(reachability, product_id):
+    return pd.DataFrame({"Supplier ID": reachability.suppliers_of(product_id)})
 
 
 # @st.fragment
@@ -265,16 +236,18 @@ def node_details(node_index, sup_id,timestamp):
 
     with col2:
         # if found:
-        graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-        ego_graph = ego_graph_query(graph, sup_id, 1)
+        ego = st.session_state.temporal_graph.load_ego_graph_at_timestamp(timestamp, sup_id, 1)
+        ego_graph = ego.graph
         if ego_graph:
             st.write(f"### Neighbors for {sup_id}")
             # st.write(f"Ego Graph for Node: {supplier_id}")
             # st.write(f"Nodes: {ego_graph.number_of_nodes()}, Edges: {ego_graph.number_of_edges()}")
 
             # Visualize and render the ego graph with Plotly
-            fig = plotly_ego_graph(ego_graph)
+            fig = plotly_ego_graph(ego_graph, ego.pos)
             st.plotly_chart(fig)  # Display the figure in Streamlit
+            if ego.truncated:
+                st.caption(f"Showing the nearest {len(ego_graph)} nodes.")
 
 
 
@@ -298,8 +271,8 @@ def queries():
                 
             if st.button("Get Suppliers"):
                 # st.info("Suppliers with high reliability and low transportation cost")
-                graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-                results = supplier_reliability_costing_temporal(graph, timestamp, reliability_threshold, max_transportation_cost)
+                engine=st.session_state.temporal_graph.load_query_engine_at_timestamp(timestamp)
+                results = supplier_reliability_costing_temporal(engine, timestamp, reliability_threshold, max_transportation_cost)
                 
                 with st.container(height=300):
             
@@ -317,14 +290,20 @@ def queries():
             war_index = st.session_state.temporal_graph.create_node_type_index(0)["WAREHOUSE"].keys()
             warehouse_id = st.selectbox("Choose Warehouse ID", war_index)
             if st.button("Find Lead Time"):
-                graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-                lead_time = query_lead_time_supplier_to_warehouse(graph, timestamp, supplier_id, warehouse_id)
+                adjacency=st.session_state.temporal_graph.load_adjacency_at_timestamp(timestamp)
+                lead_time = query_lead_time_supplier_to_warehouse(adjacency, timestamp, supplier_id, warehouse_id)
 
                 if lead_time is not None:
                     st.success(f"Lead time between Supplier {supplier_id} and Warehouse {warehouse_id}: {lead_time}")
                 else:
                     st.error(f"No relationship or lead time data found between Supplier {supplier_id} and Warehouse {warehouse_id}.")
 
+                # the edge may exist at other timestamps even when it is missing at this one
+                history = query_lead_time_history(st.session_state.temporal_graph.load_edge_cube(), supplier_id, warehouse_id)
+                if history["Lead Time"].notna().any():
+                    fig = px.line(history, y="Lead Time", markers=True, title=f"Lead Time from {supplier_id} to {warehouse_id} Across Timestamps")
+                    st.plotly_chart(fig, use_container_width=True)
+
         elif query_type == "Find Suppliers by Part Type":
             graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
             part_types = list({ptype for node, data in graph.nodes(data=True) 
@@ -348,13 +327,25 @@ def queries():
                     st.write(result)
 
         elif query_type == "Supplier-Product Offering Association":
+            direction = st.radio("Look up", ["All suppliers", "Products fed by a supplier", "Suppliers feeding a product"], horizontal=True)
+            node_index = st.session_state.temporal_graph.create_node_type_index(timestamp)
+            if direction == "Products fed by a supplier":
+                supplier_id = st.selectbox("Choose Supplier ID", node_index["SUPPLIERS"].keys())
+            elif direction == "Suppliers feeding a product":
+                product_id = st.selectbox("Choose Product Offering ID", node_index["PRODUCT_OFFERING"].keys())
+
             if st.button("Associated products"):
-                graph=st.session_state.temporal_graph.load_graph_at_timestamp(timestamp)
-                result = find_supplier_product_association(graph)
-                if isinstance(result, pd.DataFrame):
-                    st.dataframe(result)
+                reachability=st.session_state.temporal_graph.load_reachability_at_timestamp(timestamp)
+                if direction == "Products fed by a supplier":
+                    result = find_products_of_supplier(reachability, supplier_id)
+                elif direction == "Suppliers feeding a product":
+                    result = find_suppliers_of_product(reachability, product_id)
                 else:
-                    st.write(result)
+                    result = find_supplier_product_association(reachability)
+                if result.empty:
+                    st.write("No associations found.")
+                else:
+                    st.dataframe(result)
 
 
 def get_visualization(data):
@@ -4,9 +4,14 @@ import streamlit as st
 import numpy as np
 import pandas as pd
 from utils import time_and_memory_streamlit
+from csr_graph import as_networkx
+from graph_render import EDGE_BUDGET, RENDER_MODES, GraphArrays, edge_traces, node_trace
+from layout_engine import layout_graph
+from path_engine import WEIGHTS as PATH_WEIGHTS
+from route_optimizer import OBJECTIVES
 
 # final function to visualize the graph
-def plotly_ego_graph(G):
+def plotly_ego_graph(G, pos, render="auto", edge_budget=EDGE_BUDGET):
     show_edges = True
     EDGE_COLOR = "#B0B0B0"  # Light gray for edges
     NODE_CONFIG = {
@@ -53,92 +58,38 @@ def plotly_ego_graph(G):
     for node_type, config in NODE_CONFIG.items():
         selected_node_types[node_type] = True
 
-    pos = nx.kamada_kawai_layout(G)
+    # pos comes laid out and cached by the ego graph service
 
-    # Create edge trace if edges are enabled
+    # Coordinates and hovers come as arrays; large graphs switch to WebGL and bundle their edges
+    arrays = GraphArrays(G, pos)
+
+    # Create edge traces if edges are enabled
     traces = []
     if show_edges:
-        edge_x = []
-        edge_y = []
-        for edge in G.edges():
-            x0, y0 = pos[edge[0]]
-            x1, y1 = pos[edge[1]]
-            edge_x.extend([x0, x1, None])
-            edge_y.extend([y0, y1, None])
-
-        edge_trace = go.Scatter(
-            x=edge_x,
-            y=edge_y,
-            line=dict(width=0.5, color=EDGE_COLOR),
-            hoverinfo="none",
-            mode="lines",
-            name="Connections",
-            opacity=0.7,  
-        )
-        traces.append(edge_trace)
-
-    # print(G.nodes(data=True))
+        traces += edge_traces(arrays, render, edge_budget, color=EDGE_COLOR, width=0.5, opacity=0.7)
 
     # Create node traces with improved hover information
     for node_type, config in NODE_CONFIG.items():
-        if selected_node_types[node_type]:
-            node_x = []
-            node_y = []
-            node_text = []
-            node_size = []
-
-            for node in G.nodes():
-                if G.nodes[node]["node_type"] == node_type:
-                    x, y = pos[node]
-                    node_x.append(x)
-                    node_y.append(y)
-
-                    # Enhanced hover information
-                    degree = G.degree(node)
-                    in_degree = G.in_degree(node)
-                    out_degree = G.out_degree(node)
-
-                    # Initialize hover text
-                    hover_text = f"<b>{config['display_name']}</b><br>"
-                    hover_text += f"ID: {node}<br>"
-                    hover_text += f"Connections: {degree}<br>"
-                    hover_text += f"Incoming: {in_degree}<br>"
-                    hover_text += f"Outgoing: {out_degree}"
-
-                    
-                    for key, value in G.nodes[node].items():
-                        if (
-                            key != "node_type"
-                        ):  # Skip node_type as it's already shown
-                            hover_text += f"<br>{key}: {value}"
-
-                    node_text.append(hover_text)
-
-                    # Calculate node size based on degree and configuration
-                    base_size = np.sqrt(degree + 1) * config["size_multiplier"]
-                    # scaled_size = base_size * size_scale
-                    # node_size.append(
-                    #     np.clip(scaled_size, MIN_NODE_SIZE, MAX_NODE_SIZE)
-                    # )
-
-            if node_x:  # Only create trace if nodes exist for this type
-                node_trace = go.Scatter(
-                    x=node_x,
-                    y=node_y,
-                    mode="markers",
-                    name=f"<b>{config['display_name']}</b>",  # Bold text in legend
-                    marker=dict(
-                        size=40,
-                        color=config["color"],
-                        line=dict(width=1, color="white"),
-                        opacity=0.9,  # Increased opacity
-                    ),
-                    text=node_text,
-                    hoverinfo="text",
-                    legendgroup=node_type,
-                    showlegend=True,
-                )
-                traces.append(node_trace)
+        rows = arrays.of_type(node_type)
+        if selected_node_types[node_type] and len(rows):  # Only create trace if nodes exist for this type
+            trace = node_trace(
+                arrays,
+                rows,
+                render,
+                title=config["display_name"],
+                degrees=True,
+                mode="markers",
+                name=f"<b>{config['display_name']}</b>",  # Bold text in legend
+                marker=dict(
+                    size=40,
+                    color=config["color"],
+                    line=dict(width=1, color="white"),
+                    opacity=0.9,  # Increased opacity
+                ),
+                legendgroup=node_type,
+                showlegend=True,
+            )
+            traces.append(trace)
 
     # Create figure with improved layout and darker legend
     fig = go.Figure(
@@ -228,12 +179,11 @@ def plotly_ego_graph(G):
 
 
 @time_and_memory_streamlit
-def ego_graph_query(graph, node_id, radius):
+def ego_graph_query(temporal_graph, timestamp, node_id, radius):
     """
-    Returns the ego graph for a specific node within a given radius.
+    Returns the cached ego graph for a specific node within a given radius, with its layout.
     """
-    ego_graph = nx.ego_graph(graph, node_id, radius=radius,undirected=True)
-    return ego_graph
+    return temporal_graph.load_ego_graph_at_timestamp(timestamp, node_id, radius)
 
 @time_and_memory_streamlit
 def node_details_query(graph, node_id):
@@ -265,109 +215,107 @@ def retrieve_edge_attributes(graph, node_id):
     return pd.DataFrame(edges)
 
 @time_and_memory_streamlit
-def find_shortest_path(directed_graph, source, destination):
+def find_shortest_path(temporal_graph, timestamp, source, destination, k=1, weight=None):
     """
-    Finds the shortest path between source and destination nodes and visualizes the path.
+    Finds up to k shortest paths between source and destination nodes, by hops or by
+    the total weight of an edge attribute, and visualizes them.
 
     Parameters:
-        graph (nx.Graph): The graph object.
+        temporal_graph (TemporalGraphClass): The temporal graph of the session.
+        timestamp (int): Timestamp position.
         source (str/int): Source node ID.
         destination (str/int): Destination node ID.
+        k (int): Number of paths to find.
+        weight (str): Edge attribute to add up along the paths, None for hops.
 
     Returns:
-        tuple: Shortest path, length, and Plotly figure.
+        tuple: Paths as (node ids, total) and Plotly figure.
     """
-    graph = directed_graph.to_undirected()
-    try:
-        # Find the shortest path and its length
-        path = nx.shortest_path(graph, source=source, target=destination)
-        
-        length = nx.shortest_path_length(graph, source=source, target=destination)
-
-        # Create a subgraph containing only the shortest path
-        path_edges = [(path[i], path[i + 1]) for i in range(len(path) - 1)]
-        subgraph = nx.Graph()
-        subgraph.add_edges_from(path_edges)
-
-        # Use spring layout for the subgraph
-        pos = nx.spring_layout(subgraph)
-
-        # Extract edge data for visualization
-        edge_x = []
-        edge_y = []
-        for edge in subgraph.edges():
-            x0, y0 = pos[edge[0]]
-            x1, y1 = pos[edge[1]]
-            edge_x.append(x0)
-            edge_y.append(y0)
-            edge_x.append(x1)
-            edge_y.append(y1)
-            edge_x.append(None)  # Separate edges
-            edge_y.append(None)
-
-        edge_trace = go.Scatter(
-            x=edge_x, y=edge_y,
-            line=dict(width=2, color='red'),
+    # the cached engine of the timestamp: no copy of the graph, one search per path
+    engine = temporal_graph.load_path_engine_at_timestamp(timestamp)
+    if k == 1 and weight is None:
+        path = engine.shortest_path(source, destination)
+        paths = [] if path is None else [(path, len(path) - 1)]
+    else:
+        paths = engine.k_shortest_paths(source, destination, k, weight)
+    if not paths:
+        return paths, None
+
+    # Create a subgraph containing only the paths
+    subgraph = nx.Graph()
+    for path, _ in paths:
+        subgraph.add_nodes_from(path)
+        subgraph.add_edges_from(zip(path[:-1], path[1:]))
+
+    # the nodes stay where the global layout of the version puts them
+    pos = temporal_graph.load_global_layout().positions(subgraph.nodes)
+    if len(pos) < len(subgraph):
+        pos = layout_graph(subgraph, initial=pos)
+
+    colors = ["red", "purple", "teal", "brown", "olive"]
+    traces = []
+    for i, (path, _) in enumerate(reversed(paths)):
+        rank = len(paths) - 1 - i
+        xy = np.array([pos[node] for node in path])
+        traces.append(go.Scatter(
+            x=xy[:, 0], y=xy[:, 1],
+            line=dict(width=3 if rank == 0 else 2, color=colors[rank % len(colors)], dash="solid" if rank == 0 else "dash"),
             hoverinfo='none',
             mode='lines'
-        )
-
-        # Extract node data for visualization
-        node_x = []
-        node_y = []
-        node_color = []
-        hover_text = []
-        for node in subgraph.nodes():
-            x, y = pos[node]
-            node_x.append(x)
-            node_y.append(y)
-
-            # Highlight nodes based on their role in the path
-            if node == source:
-                node_color.append('green')  # Source
-                hover_text.append(f"Source Node: {node}")
-            elif node == destination:
-                node_color.append('blue')  # Destination
-                hover_text.append(f"Destination Node: {node}")
-            else:
-                node_color.append('orange')  # Intermediate
-                hover_text.append(f"Intermediate Node: {node}")
-
-        node_trace = go.Scatter(
-            x=node_x, y=node_y,
-            mode='markers+text',
-            hoverinfo='text',
-            marker=dict(
-                size=20,
-                color=node_color,
-                line=dict(width=2, color='black')
-            ),
-            text=[f"{node}" for node in subgraph.nodes()],  # Display node IDs
-            textposition="top center"
-        )
-
-        # Create the figure
-        fig = go.Figure(data=[edge_trace, node_trace])
-        fig.update_layout(
-            title="Shortest Path Visualization",
-            titlefont_size=16,
-            showlegend=False,
-            hovermode='closest',
-            xaxis=dict(showgrid=False, zeroline=False),
-            yaxis=dict(showgrid=False, zeroline=False),
-            height=500,
-            width=900
-        )
-
-        return path, length, fig
-
-    except nx.NetworkXNoPath:
-        return None, None, None
-    except nx.NodeNotFound as e:
-        return str(e), None, None
+        ))
+
+    # Extract node data for visualization
+    node_x = []
+    node_y = []
+    node_color = []
+    hover_text = []
+    for node in subgraph.nodes():
+        x, y = pos[node]
+        node_x.append(x)
+        node_y.append(y)
+
+        # Highlight nodes based on their role in the path
+        if node == source:
+            node_color.append('green')  # Source
+            hover_text.append(f"Source Node: {node}")
+        elif node == destination:
+            node_color.append('blue')  # Destination
+            hover_text.append(f"Destination Node: {node}")
+        else:
+            node_color.append('orange')  # Intermediate
+            hover_text.append(f"Intermediate Node: {node}")
+
+    node_trace = go.Scatter(
+        x=node_x, y=node_y,
+        mode='markers+text',
+        hoverinfo='text',
+        hovertext=hover_text,
+        marker=dict(
+            size=20,
+            color=node_color,
+            line=dict(width=2, color='black')
+        ),
+        text=[f"{node}" for node in subgraph.nodes()],  # Display node IDs
+        textposition="top center"
+    )
+
+    # Create the figure
+    fig = go.Figure(data=traces + [node_trace])
+    fig.update_layout(
+        title=dict(text="Shortest Path Visualization", font=dict(size=16)),
+        showlegend=False,
+        hovermode='closest',
+        xaxis=dict(showgrid=False, zeroline=False),
+        yaxis=dict(showgrid=False, zeroline=False),
+        height=500,
+        width=900
+    )
+
+    return paths, fig
 
 @time_and_memory_streamlit
 def get_ancestors_descendants(graph, node_id):
+    graph = as_networkx(graph)
     if not isinstance(graph, nx.DiGraph):
         raise TypeError("The graph must be a directed graph (nx.DiGraph).")
 
@@ -383,6 +331,18 @@ def get_ancestors_descendants(graph, node_id):
     return pd.DataFrame(ancestors,columns=["Ancestors"]), pd.DataFrame(descendants,columns=["Descendants"])
 
 
+@time_and_memory_streamlit
+def what_changed(temporal_graph, before, after):
+    # matched on the column arrays of both timestamps, no graph is walked
+    return temporal_graph.diff_timestamps(before, after)
+
+
+@time_and_memory_streamlit
+def best_supply_routes(temporal_graph, timestamp, objective):
+    # one pass over the typed layers solves every product at every timestamp, then it is kept
+    return temporal_graph.load_route_optimizer().best_routes(timestamp, objective)
+
+
 def main():
     st.markdown("""
     <style>
@@ -428,22 +388,28 @@ def main():
 
     with cols1:
         # Dropdown to select query
-        query_type = st.selectbox("Choose Query", ["Select","Ego Graph", "Node Details", "Edge Attributes","Shortest Path", "Ancestors and Descendants"])
+        query_type = st.selectbox("Choose Query", ["Select","Ego Graph", "Node Details", "Edge Attributes","Shortest Path", "Ancestors and Descendants", "What changed", "Best Supply Route"])
 
     # Execute the chosen query
     if query_type == "Ego Graph":
         with cols1:
             node_id = st.selectbox("Select Node ID for Ego Graph", all_nodes)
         radius = st.slider("Select Radius for Ego Graph", 1, 5, 2)  # Slider for radius
+        render_col, budget_col = st.columns(2)
+        render = render_col.selectbox("Rendering", RENDER_MODES, help="auto switches to WebGL above 1,000 nodes and edges")
+        edge_budget = budget_col.number_input("Edges drawn before bundling", min_value=100, value=EDGE_BUDGET, step=500)
 
         # Generate the ego graph using the selected node and radius
-        ego_graph = ego_graph_query(graph, node_id, radius)
+        ego = ego_graph_query(st.session_state.temporal_graph, timestamp, node_id, radius)
+        ego_graph = ego.graph
         if ego_graph:
             st.write(f"Ego Graph for Node: {node_id}")
             st.write(f"Nodes: {ego_graph.number_of_nodes()}, Edges: {ego_graph.number_of_edges()}")
+            if ego.truncated:
+                st.warning(f"Stopped at {ego_graph.number_of_nodes()} nodes before reaching radius {radius}; the nearest nodes are shown.")
 
             # Visualize and render the ego graph with Plotly
-            fig = plotly_ego_graph(ego_graph)
+            fig = plotly_ego_graph(ego_graph, ego.pos, render, int(edge_budget))
             st.plotly_chart(fig)  # Display the figure in Streamlit
 
     elif query_type == "Node Details":
@@ -469,21 +435,35 @@ def main():
             destination_node = st.selectbox("Enter Destination Node ID", all_nodes)
 
 
+            k_col, weight_col = st.columns(2)
+            k = k_col.number_input("Number of Paths", min_value=1, max_value=10, value=1)
+            weight = weight_col.selectbox("Path Length", ["Hops"] + list(PATH_WEIGHTS), help="Hops, or the total of an edge attribute along the path")
+
         if st.button("Find Shortest Path"):
-            # source_node = st.selectbox("Select Node ID to Retrieve Edge Attributes", all_nodes)
-            # destination_node = st.selectbox("Select Node ID to Retrieve Edge Attributes", all_nodes)
             if source_node and destination_node:
-                path, length, fig = find_shortest_path(graph, source_node, destination_node)
-                if path and length:
-                    st.write(f"Shortest Path from {source_node} to {destination_node}: {path}")
-                    st.write(f"Path Length: {length}")
-
-            # Display the visualization
-                    st.plotly_chart(fig)
-                elif path is None:
-                    st.warning(f"No path exists between {source_node} and {destination_node}.")
+                try:
+                    paths, fig = find_shortest_path(
+                        st.session_state.temporal_graph, timestamp, source_node, destination_node,
+                        int(k), None if weight == "Hops" else weight,
+                    )
+                except ValueError as e:
+                    st.error(f"Error: {e}")
                 else:
-                    st.error(f"Error: {path}")
+                    if paths:
+                        path, length = paths[0]
+                        st.write(f"Shortest Path from {source_node} to {destination_node}: {path}")
+                        st.write(f"Path Length: {length:g}" + ("" if weight == "Hops" else f" ({weight})"))
+                        if len(paths) > 1:
+                            st.dataframe(pd.DataFrame({
+                                "Path": [" → ".join(p) for p, _ in paths],
+                                "Hops": [len(p) - 1 for p, _ in paths],
+                                "Length": [total for _, total in paths],
+                            }), hide_index=True)
+
+                        # Display the visualization
+                        st.plotly_chart(fig)
+                    else:
+                        st.warning(f"No path exists between {source_node} and {destination_node}.")
             else:
                 st.error("Please enter valid source and destination nodes.")
     
@@ -514,6 +494,51 @@ def main():
                 except Exception as e:
                     st.error(f"An unexpected error occurred: {str(e)}")
 
+    elif query_type == "What changed":
+        num_timestamps = len(st.session_state.temporal_graph.files)
+        with cols1:
+            before, after = st.select_slider(
+                "Compare Timestamps", options=range(num_timestamps), value=(0, num_timestamps - 1)
+            )
+            threshold = st.number_input("Report attributes that moved by more than (%)", min_value=0.0, value=10.0, step=1.0)
+
+        if st.button("Compare"):
+            diff = what_changed(st.session_state.temporal_graph, before, after)
+            st.write(f"Changes from timestamp {before} to timestamp {after}:")
+            st.dataframe(diff.summary(threshold / 100), hide_index=True)
+
+            nodes_tab, edges_tab, node_changes_tab, edge_changes_tab = st.tabs(
+                ["Nodes Added and Removed", "Edges Added and Removed", "Node Attribute Changes", "Edge Attribute Changes"]
+            )
+            with nodes_tab:
+                l, r = st.columns(2)
+                l.write("**Added**")
+                l.dataframe(diff.nodes_added(), hide_index=True)
+                r.write("**Removed**")
+                r.dataframe(diff.nodes_removed(), hide_index=True)
+            with edges_tab:
+                l, r = st.columns(2)
+                l.write("**Added**")
+                l.dataframe(diff.edges_added(), hide_index=True)
+                r.write("**Removed**")
+                r.dataframe(diff.edges_removed(), hide_index=True)
+            with node_changes_tab:
+                st.dataframe(diff.node_changes(threshold / 100), hide_index=True)
+            with edge_changes_tab:
+                st.dataframe(diff.edge_changes(threshold / 100), hide_index=True)
+
+    elif query_type == "Best Supply Route":
+        with cols1:
+            objective = st.selectbox("Optimize", list(OBJECTIVES), format_func=lambda x: x.replace("_", " ").capitalize())
+
+        if st.button("Find Best Routes"):
+            routes = best_supply_routes(st.session_state.temporal_graph, timestamp, objective)
+            unreached = routes["Cost"].isna()
+            st.write(f"Best supplier to product route of {len(routes) - unreached.sum()} product offerings at timestamp {timestamp}:")
+            st.dataframe(routes[~unreached])
+            if unreached.any():
+                st.info(f"No supplier reaches {unreached.sum()} product offerings: {', '.join(routes.index[unreached])}")
+
     st.text(" ")  
     st.text(" ")  
 
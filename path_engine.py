@@ -0,0 +1,372 @@
+"""
+Shortest paths between any two nodes of one snapshot.
+
+find_shortest_path copied the whole graph with to_undirected() on every
+click, then ran nx.shortest_path and nx.shortest_path_length, two
+breadth-first searches for the same answer. PathEngine builds the undirected
+adjacency of the snapshot once, as CSR arrays over the node positions of
+mmap_store, and answers from it:
+
+    paths = temporal_graph.load_path_engine_at_timestamp(timestamp)
+    paths.distance("S_014", "PO_007")                      # hops, None without a path
+    paths.shortest_path("S_014", "PO_007")                 # ids, one bidirectional BFS
+    paths.weighted_path("S_014", "PO_007", "lead_time")    # (ids, total lead time)
+    paths.k_shortest_paths("S_014", "PO_007", 3, "transport_cost")
+
+- shortest_path grows a frontier from both ends, one whole level at a time
+  with NumPy, always the smaller frontier, and stops where they meet,
+- distance first looks at the hop distances of every node to LANDMARKS
+  high-degree nodes, computed the first time they are needed: two nodes
+  whose lower and upper bounds agree need no search at all, the others get
+  the BFS. Hop distances are kept in an LRU, a repeated pair is a dict
+  lookup,
+- every query first asks the LRU and the landmarks whether the two nodes are
+  connected at all; a landmark that reaches one of them and not the other
+  puts them in different components, and the query returns without a
+  search,
+- weighted paths run scipy's Dijkstra over WEIGHTS, the lead time or the
+  transport cost of each edge; edges without the attribute cost nothing, and
+  every edge costs HOP_EPSILON more so that ties go to the path with fewer
+  hops,
+- k_shortest_paths is Yen's algorithm over the same weights, or over hops.
+
+Edge direction is ignored, as in the Structural page. Compare with
+to_undirected and networkx on a snapshot:
+
+    python path_engine.py data/<version>/<timestamp file>
+"""
+import heapq
+import sys
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+LANDMARKS = 16
+WEIGHTS = {"lead_time": ("lead_time",), "transport_cost": ("transport_cost", "transportation_cost")}
+HOP_EPSILON = 1e-6
+NUMERIC_KINDS = ("float", "int")
+UNREACHED = np.iinfo(np.uint16).max
+
+
+def _neighbors(indptr, indices, frontier):
+    """Neighbors of every node of frontier, and the frontier node each one was reached from."""
+    starts, counts = indptr[frontier], indptr[frontier + 1] - indptr[frontier]
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    return indices[offsets], np.repeat(frontier, counts)
+
+
+class PathEngine:
+    """Undirected CSR adjacency of one snapshot, its landmark distances and path queries over it."""
+
+    def __init__(self, arrays, landmarks=LANDMARKS, max_entries=4096):
+        self.arrays = arrays
+        n = arrays.node_count
+        sources, targets, weights = [], [], {name: [] for name in WEIGHTS}
+        for link_type in arrays.link_types:
+            src, dst = arrays.link_endpoints(link_type)
+            sources.append(src)
+            targets.append(dst)
+            columns = arrays.meta["link_columns"][link_type]
+            for name, attributes in WEIGHTS.items():
+                found = [a for a in attributes if columns.get(a, {}).get("kind") in NUMERIC_KINDS]
+                values = np.asarray(arrays.link_column(link_type, found[0]), dtype=float) if found else np.zeros(len(src))
+                weights[name].append(np.maximum(np.nan_to_num(values), 0))
+
+        src = np.concatenate(sources).astype(np.int64) if sources else np.zeros(0, dtype=np.int64)
+        dst = np.concatenate(targets).astype(np.int64) if targets else np.zeros(0, dtype=np.int64)
+        both = np.concatenate([src, dst]), np.concatenate([dst, src])
+        key = both[0] * max(n, 1) + both[1]
+
+        # one entry per node pair, the lowest weight of its parallel edges
+        self._matrices = {}
+        for name in WEIGHTS:
+            weight = np.tile(np.concatenate(weights[name]) if weights[name] else np.zeros(0), 2) + HOP_EPSILON
+            order = np.lexsort((weight, key))
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = key[order][1:] != key[order][:-1]
+            keep = order[first]
+            self._matrices[name] = sparse.csr_matrix((weight[keep], (both[0][keep], both[1][keep])), shape=(n, n))
+            self._matrices[name].sort_indices()
+        hops = next(iter(self._matrices.values())).copy() if self._matrices else sparse.csr_matrix((n, n))
+        hops.data[:] = 1
+        self._matrices[None] = hops
+        self.indptr, self.indices = hops.indptr.astype(np.int64), hops.indices.astype(np.int64)
+
+        degree = np.diff(self.indptr)
+        self.landmarks = np.argsort(-degree, kind="stable")[:min(landmarks, n)]
+
+        self.max_entries = max_entries
+        self._distances = OrderedDict()
+        # cache_resource shares the snapshot, and so the engine, between sessions
+        self._lock = threading.Lock()
+
+    @cached_property
+    def _landmark_distances(self):
+        """(landmark, node) hop distances, UNREACHED between components; built on the first query that needs them."""
+        hops = self._matrices[None]
+        if not len(self.landmarks):
+            return np.zeros((0, hops.shape[0]), dtype=np.uint16)
+        distances = csgraph.shortest_path(hops, directed=False, unweighted=True, indices=self.landmarks)
+        return np.where(np.isfinite(distances), distances, UNREACHED).astype(np.uint16)
+
+    def _position(self, node_id):
+        position = self.arrays.node_position(node_id)
+        if position is None:
+            raise ValueError(f"Node {node_id} is not in the graph.")
+        return position
+
+    def _ids(self, positions):
+        return self.arrays.node_ids[positions].tolist()
+
+    def bounds(self, source, target):
+        """Lower and upper bound of the hop distance between two positions from the landmarks; None, None when they are not connected."""
+        ds = self._landmark_distances[:, source].astype(np.int64)
+        dt = self._landmark_distances[:, target].astype(np.int64)
+        reached = (ds != UNREACHED) & (dt != UNREACHED)
+        if ((ds != UNREACHED) != (dt != UNREACHED)).any():
+            # a landmark reaches one end and not the other: different components
+            return None, None
+        if not reached.any():
+            return 0, np.inf
+        return int(np.abs(ds - dt)[reached].max()), int((ds + dt)[reached].min())
+
+    def _bidirectional_bfs(self, source, target):
+        """Positions along one shortest unweighted path, None when there is none."""
+        if source == target:
+            return [source]
+        n = len(self.indptr) - 1
+        parents = [np.full(n, -1, dtype=np.int64), np.full(n, -1, dtype=np.int64)]
+        depth = [np.full(n, -1, dtype=np.int64), np.full(n, -1, dtype=np.int64)]
+        frontiers = [np.array([source]), np.array([target])]
+        for side, node in enumerate((source, target)):
+            depth[side][node] = 0
+            parents[side][node] = node
+
+        while len(frontiers[0]) and len(frontiers[1]):
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            reached, owners = _neighbors(self.indptr, self.indices, frontiers[side])
+            new = depth[side][reached] < 0
+            reached, first = np.unique(reached[new], return_index=True)
+            depth[side][reached] = depth[side][owners[new][first]] + 1
+            parents[side][reached] = owners[new][first]
+            frontiers[side] = reached
+
+            met = reached[depth[1 - side][reached] >= 0]
+            if len(met):
+                middle = met[np.argmin(depth[1 - side][met])]
+                halves = []
+                for walk in parents:
+                    half, node = [middle], middle
+                    while walk[node] != node:
+                        node = walk[node]
+                        half.append(node)
+                    halves.append(half)
+                return halves[0][::-1] + halves[1][1:]
+        return None
+
+    def _cached(self, source, target):
+        """(True, hop distance) of a pair in the LRU, (False, None) for a pair it does not hold."""
+        key = (min(source, target), max(source, target))
+        with self._lock:
+            if key in self._distances:
+                self._distances.move_to_end(key)
+                return True, self._distances[key]
+        return False, None
+
+    def _remember(self, source, target, distance):
+        with self._lock:
+            self._distances[(min(source, target), max(source, target))] = distance
+            while len(self._distances) > self.max_entries:
+                self._distances.popitem(last=False)
+
+    def _unreachable(self, source, target):
+        """True when the LRU or the landmarks show there is no path between two positions."""
+        known, distance = self._cached(source, target)
+        if known:
+            return distance is None
+        if self.bounds(source, target)[0] is None:
+            self._remember(source, target, None)
+            return True
+        return False
+
+    def distance(self, source_id, target_id):
+        """Hop distance between two nodes whatever the edge direction, None without a path."""
+        source, target = self._position(source_id), self._position(target_id)
+        known, distance = self._cached(source, target)
+        if known:
+            return distance
+
+        low, high = self.bounds(source, target)
+        if low is not None and low == high:
+            distance = low
+        elif low is None:
+            distance = None
+        else:
+            path = self._bidirectional_bfs(source, target)
+            distance = None if path is None else len(path) - 1
+        self._remember(source, target, distance)
+        return distance
+
+    def shortest_path(self, source_id, target_id):
+        """Ids along a path with the fewest hops, None without a path."""
+        source, target = self._position(source_id), self._position(target_id)
+        if self._unreachable(source, target):
+            return None
+        path = self._bidirectional_bfs(source, target)
+        self._remember(source, target, None if path is None else len(path) - 1)
+        return None if path is None else self._ids(path)
+
+    def _weight(self, weight):
+        if weight is not None and weight not in WEIGHTS:
+            raise ValueError(f"Unknown path weight {weight}, expected one of {list(WEIGHTS)}.")
+        return self._matrices[weight]
+
+    def _total(self, matrix, path):
+        """Sum of the weights along path, without the hop epsilon."""
+        total = sum(matrix[a, b] for a, b in zip(path[:-1], path[1:]))
+        if matrix is self._matrices[None]:
+            return float(total)
+        # rounded so the epsilons leave no residue of their own
+        return round(max(float(total - HOP_EPSILON * (len(path) - 1)), 0.0), 6)
+
+    @staticmethod
+    def _dijkstra(matrix, source, target):
+        distances, predecessors = csgraph.dijkstra(matrix, directed=True, indices=source, return_predecessors=True)
+        if not np.isfinite(distances[target]):
+            return None
+        path = [target]
+        while path[-1] != source:
+            path.append(predecessors[path[-1]])
+        return [int(node) for node in path[::-1]]
+
+    def weighted_path(self, source_id, target_id, weight="lead_time"):
+        """Ids along the path of lowest total weight and that total, (None, None) without a path."""
+        matrix = self._weight(weight)
+        source, target = self._position(source_id), self._position(target_id)
+        path = None if self._unreachable(source, target) else self._dijkstra(matrix, source, target)
+        if path is None:
+            return None, None
+        return self._ids(path), self._total(matrix, path)
+
+    def k_shortest_paths(self, source_id, target_id, k=3, weight=None):
+        """Up to k loopless paths in order of total weight, or of hops when weight is None, as (ids, total)."""
+        matrix = self._weight(weight)
+        source, target = self._position(source_id), self._position(target_id)
+        first = None if self._unreachable(source, target) else self._dijkstra(matrix, source, target)
+        if first is None:
+            return []
+
+        found = [first]
+        candidates, queued = [], {tuple(first)}
+        while len(found) < k:
+            last = found[-1]
+            for i in range(len(last) - 1):
+                spur, root = last[i], last[:i + 1]
+                # Yen: leave out the next edge of every path sharing the root, and the root itself
+                data = matrix.data.copy()
+                for path in found:
+                    if path[:i + 1] == root:
+                        for a, b in ((path[i], path[i + 1]), (path[i + 1], path[i])):
+                            row = slice(matrix.indptr[a], matrix.indptr[a + 1])
+                            data[row][matrix.indices[row] == b] = 0
+                for node in root[:-1]:
+                    data[matrix.indptr[node]:matrix.indptr[node + 1]] = 0
+                data[np.isin(matrix.indices, root[:-1])] = 0
+                pruned = sparse.csr_matrix((data, matrix.indices.copy(), matrix.indptr.copy()), shape=matrix.shape)
+                pruned.eliminate_zeros()
+
+                tail = self._dijkstra(pruned, spur, target)
+                if tail is None:
+                    continue
+                path = root[:-1] + tail
+                if tuple(path) not in queued:
+                    queued.add(tuple(path))
+                    heapq.heappush(candidates, (self._total(matrix, path), len(path), path))
+            if not candidates:
+                break
+            found.append(heapq.heappop(candidates)[2])
+        return [(self._ids(path), self._total(matrix, path)) for path in found]
+
+
+if __name__ == "__main__":
+    import time
+
+    import networkx as nx
+
+    from mmap_store import SnapshotArrays
+    from snapshot_store import read_snapshot_file
+    from TemporalGraphClass import json_to_graph
+
+    data = read_snapshot_file(sys.argv[1])
+    graph = json_to_graph(data)
+    arrays = SnapshotArrays.from_data(data)
+    rng = np.random.default_rng(0)
+    pairs = [tuple(pair) for pair in rng.choice(list(graph.nodes), (200, 2)).tolist()]
+
+    start = time.perf_counter()
+    for source, target in pairs[:20]:
+        undirected = graph.to_undirected()
+        try:
+            nx.shortest_path(undirected, source, target)
+            nx.shortest_path_length(undirected, source, target)
+        except nx.NetworkXNoPath:
+            pass
+    print(f"to_undirected and networkx: {(time.perf_counter() - start) / 20 * 1e3:.1f} ms a pair")
+
+    start = time.perf_counter()
+    engine = PathEngine(arrays)
+    print(f"engine of {arrays.node_count} nodes: {time.perf_counter() - start:.3f} s")
+    start = time.perf_counter()
+    engine.bounds(0, 0)
+    print(f"landmarks, on the first query that needs them: {time.perf_counter() - start:.3f} s")
+    start = time.perf_counter()
+    for source, target in pairs:
+        engine.shortest_path(source, target)
+    print(f"bidirectional BFS: {(time.perf_counter() - start) / len(pairs) * 1e3:.2f} ms a pair")
+    # the paths above filled the LRU
+    engine._distances.clear()
+    start = time.perf_counter()
+    for source, target in pairs:
+        engine.distance(source, target)
+    exact = sum(low == high for low, high in (engine.bounds(arrays.node_position(s), arrays.node_position(t)) for s, t in pairs))
+    print(f"distance, first time: {(time.perf_counter() - start) / len(pairs) * 1e3:.2f} ms a pair, "
+          f"{exact} of {len(pairs)} answered by the landmarks")
+    start = time.perf_counter()
+    for source, target in pairs:
+        engine.distance(source, target)
+    print(f"distance, repeated: {(time.perf_counter() - start) / len(pairs) * 1e6:.1f} us a pair")
+    start = time.perf_counter()
+    for source, target in pairs[:20]:
+        engine.weighted_path(source, target, "lead_time")
+    print(f"weighted path: {(time.perf_counter() - start) / 20 * 1e3:.2f} ms a pair")
+    start = time.perf_counter()
+    for source, target in pairs[:5]:
+        engine.k_shortest_paths(source, target, 3, "transport_cost")
+    print(f"3 shortest paths: {(time.perf_counter() - start) / 5 * 1e3:.1f} ms a pair")
+
+    undirected = graph.to_undirected()
+    for source, target in pairs:
+        try:
+            expected = nx.shortest_path_length(undirected, source, target)
+        except nx.NetworkXNoPath:
+            expected = None
+        assert engine.distance(source, target) == expected
+        path = engine.shortest_path(source, target)
+        assert (path is None) == (expected is None)
+        assert path is None or (len(path) - 1 == expected and nx.is_path(undirected, path))
+
+    def lead_time(a, b, _):
+        # the engine keeps the cheaper of two edges between the same nodes, to_undirected the last one
+        return min(graph.edges[e].get("lead_time", 0) for e in ((a, b), (b, a)) if graph.has_edge(*e)) + HOP_EPSILON
+    for source, target in pairs[:20]:
+        path, total = engine.weighted_path(source, target, "lead_time")
+        if path is None:
+            assert engine.k_shortest_paths(source, target, 3) == []
+            continue
+        assert np.isclose(total + HOP_EPSILON * (len(path) - 1), nx.dijkstra_path_length(undirected, source, target, lead_time))
+        hops = [len(p) - 1 for p, _ in engine.k_shortest_paths(source, target, 3)]
+        assert hops == [len(p) - 1 for _, p in zip(range(3), nx.shortest_simple_paths(undirected, source, target))]
@@ -0,0 +1,390 @@
+"""
+Predicate queries over the attribute columns of one snapshot.
+
+The threshold filters of the pages (cost <= X and demand >= Y, reliability
+above a floor, distance above and transport cost below a limit) used to walk
+graph.nodes(data=True) with a dict .get per node. QueryEngine keeps one
+pandas DataFrame per node type and per relationship type, and runs the same
+filters as boolean masks over whole columns:
+
+    engine = temporal_graph.load_query_engine_at_timestamp(timestamp)
+    engine.select(
+        "PRODUCT_OFFERING",
+        (col("cost") <= cost_threshold) & (col("demand") >= demand_threshold),
+        sort_by="demand", ascending=False,
+    )
+
+Predicates combine with &, | and ~. select_links can bring columns of the
+source or target nodes into an edge query, so a filter on edges and on their
+endpoints is one mask.
+
+Frames are built from the row payload, or straight from the column arrays of
+the mmap backend. Compare with the loop versions of the page queries:
+
+    python query_engine.py 100000
+"""
+import json
+import sys
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+# date columns parsed to datetime64 when a frame is built, unparseable dates become NaT
+DATE_COLUMNS = ("valid_from", "valid_till")
+DATE_FORMAT = "%Y-%m-%d"
+
+
+class Predicate:
+    """Boolean mask over a frame, combined with &, | and ~."""
+
+    def __init__(self, evaluate):
+        self._evaluate = evaluate
+
+    def mask(self, frame):
+        return np.asarray(self._evaluate(frame), dtype=bool)
+
+    def __and__(self, other):
+        return Predicate(lambda frame: self.mask(frame) & other.mask(frame))
+
+    def __or__(self, other):
+        return Predicate(lambda frame: self.mask(frame) | other.mask(frame))
+
+    def __invert__(self):
+        return Predicate(lambda frame: ~self.mask(frame))
+
+
+class col:
+    """A column in a predicate; comparisons with a missing column are all False."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def _compare(self, compare):
+        def evaluate(frame):
+            if self.name not in frame:
+                # not even != holds for a column the frame does not have
+                return np.zeros(len(frame), dtype=bool)
+            return compare(frame[self.name]).fillna(False)
+        return Predicate(evaluate)
+
+    def __lt__(self, value):
+        return self._compare(lambda values: values < value)
+
+    def __le__(self, value):
+        return self._compare(lambda values: values <= value)
+
+    def __gt__(self, value):
+        return self._compare(lambda values: values > value)
+
+    def __ge__(self, value):
+        return self._compare(lambda values: values >= value)
+
+    def __eq__(self, value):
+        return self._compare(lambda values: values == value)
+
+    def __ne__(self, value):
+        return self._compare(lambda values: values != value)
+
+    __hash__ = None
+
+    def between(self, low, high):
+        return self._compare(lambda values: values.between(low, high))
+
+    def isin(self, options):
+        return self._compare(lambda values: values.isin(list(options)))
+
+    def contains(self, value):
+        """For list columns such as supplied_part_types."""
+        return self._compare(lambda values: values.map(lambda items: isinstance(items, list) and value in items))
+
+
+class IntervalIndex:
+    """
+    [start, end] date intervals of one node type, sorted by start, by end and
+    by length in days.
+
+    "Intervals overlapping [start, end]" and "intervals at most N days long"
+    are answered by binary search; only the matching positions are touched.
+    Positions are rows of the frame the index was built from. Rows with a
+    missing start or end are left out and listed in unknown.
+    """
+
+    def __init__(self, ids, starts, ends):
+        self.ids = np.asarray(ids, dtype=object)
+        self.starts = np.asarray(starts, dtype="datetime64[D]")
+        self.ends = np.asarray(ends, dtype="datetime64[D]")
+        known = ~(np.isnat(self.starts) | np.isnat(self.ends))
+        self.unknown = np.flatnonzero(~known)
+        positions = np.flatnonzero(known)
+        self.lengths = np.where(known, (self.ends - self.starts).astype(np.int64), 0)
+
+        self._by_start = positions[np.argsort(self.starts[positions], kind="stable")]
+        self._sorted_starts = self.starts[self._by_start]
+        self._by_end = positions[np.argsort(self.ends[positions], kind="stable")]
+        self._sorted_ends = self.ends[self._by_end]
+        self._by_length = positions[np.argsort(self.lengths[positions], kind="stable")]
+        self._sorted_lengths = self.lengths[self._by_length]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def overlapping(self, start, end):
+        """Positions of the intervals with interval start <= end and interval end >= start, in row order."""
+        start, end = np.datetime64(start, "D"), np.datetime64(end, "D")
+        started = self._by_start[:np.searchsorted(self._sorted_starts, end, side="right")]
+        not_ended = self._by_end[np.searchsorted(self._sorted_ends, start, side="left"):]
+        # check the other bound on the smaller side only
+        if len(started) <= len(not_ended):
+            hits = started[self.ends[started] >= start]
+        else:
+            hits = not_ended[self.starts[not_ended] <= end]
+        return np.sort(hits)
+
+    def at_most(self, days):
+        """Positions of the intervals lasting at most days, in row order."""
+        return np.sort(self._by_length[:np.searchsorted(self._sorted_lengths, days, side="right")])
+
+
+def _select(frame, where, sort_by, ascending, columns, limit):
+    if where is not None:
+        frame = frame[where.mask(frame)]
+    if sort_by is not None:
+        frame = frame.sort_values(sort_by, ascending=ascending, kind="stable")
+    if columns is not None:
+        frame = frame[list(columns)]
+    if limit is not None:
+        frame = frame.head(limit)
+    return frame
+
+
+class QueryEngine:
+    def __init__(self, data=None, arrays=None):
+        self._data = data
+        self._arrays = arrays
+        self._node_frames = {}
+        self._link_frames = {}
+        self._interval_indexes = {}
+
+    @cached_property
+    def node_types(self):
+        if self._arrays is not None:
+            return self._arrays.node_types
+        return list(self._data["node_values"])
+
+    @cached_property
+    def link_types(self):
+        if self._arrays is not None:
+            return self._arrays.link_types
+        return list(self._data["link_values"])
+
+    def _array_column(self, column, kind):
+        if kind == "json":
+            return [json.loads(value) for value in column.tolist()]
+        return np.asarray(column)
+
+    def _build_node_frame(self, node_type):
+        if self._arrays is not None:
+            arrays = self._arrays
+            names = [name for name in arrays.meta["node_types"].get(node_type, []) if name != "id"]
+            start, stop = arrays.node_type_range(node_type)
+            frame = pd.DataFrame(
+                {name: self._array_column(arrays.node_column(node_type, name), arrays.node_column_kind(node_type, name)) for name in names},
+                index=pd.Index(arrays.node_ids[start:stop].tolist(), name="id"),
+            )
+        else:
+            names = self._data["node_types"].get(node_type, [])
+            frame = pd.DataFrame(self._data["node_values"].get(node_type, []), columns=names).set_index("id")
+
+        if frame.index.has_duplicates:
+            # a repeated id keeps its last row, as in the graph, whichever backend built the frame
+            frame = frame[~frame.index.duplicated(keep="last")].copy()
+        for name in DATE_COLUMNS:
+            if name in frame:
+                frame[name] = pd.to_datetime(frame[name], format=DATE_FORMAT, errors="coerce")
+        return frame
+
+    def _build_link_frame(self, link_type):
+        if self._arrays is not None:
+            arrays = self._arrays
+            src, dst = arrays.link_endpoints(link_type)
+            order = arrays.link_file_order(link_type)
+            columns = {}
+            for name in arrays.meta["link_columns"].get(link_type, {}):
+                values = self._array_column(arrays.link_column(link_type, name), arrays.link_column_kind(link_type, name))
+                columns[name] = [values[i] for i in order] if isinstance(values, list) else values[order]
+            columns["source"] = arrays.node_ids[np.asarray(src)[order]].tolist()
+            columns["target"] = arrays.node_ids[np.asarray(dst)[order]].tolist()
+            return pd.DataFrame(columns)
+
+        names = self._data["relationship_types"].get(link_type, [])
+        return pd.DataFrame(self._data["link_values"].get(link_type, []), columns=names)
+
+    def nodes(self, node_type):
+        """DataFrame of one node type indexed by node id, built on first use."""
+        if node_type not in self._node_frames:
+            self._node_frames[node_type] = self._build_node_frame(node_type)
+        return self._node_frames[node_type]
+
+    def links(self, link_type):
+        """DataFrame of one relationship type with source and target columns, in file order."""
+        if link_type not in self._link_frames:
+            self._link_frames[link_type] = self._build_link_frame(link_type)
+        return self._link_frames[link_type]
+
+    def interval_index(self, node_type, start_column, end_column):
+        """IntervalIndex over two date columns of node_type, built on first use."""
+        key = (node_type, start_column, end_column)
+        if key not in self._interval_indexes:
+            frame = self.nodes(node_type)
+            self._interval_indexes[key] = IntervalIndex(frame.index, frame[start_column].to_numpy(), frame[end_column].to_numpy())
+        return self._interval_indexes[key]
+
+    def select(self, node_type, where=None, sort_by=None, ascending=True, columns=None, limit=None):
+        """Nodes of node_type matching where, optionally sorted, projected and limited."""
+        return _select(self.nodes(node_type), where, sort_by, ascending, columns, limit)
+
+    def select_links(self, link_type, where=None, sort_by=None, ascending=True, columns=None, limit=None,
+                     source_columns=(), target_columns=()):
+        """
+        Edges of link_type matching where.
+
+        source_columns and target_columns add attributes of the endpoint nodes
+        as source_<name> and target_<name>, so where can filter on them too.
+        """
+        frame = self.links(link_type)
+        if source_columns or target_columns:
+            frame = frame.copy()
+            for end, names in (("source", source_columns), ("target", target_columns)):
+                for name in names:
+                    frame[f"{end}_{name}"] = frame[end].map(self._endpoint_column(name))
+        return _select(frame, where, sort_by, ascending, columns, limit)
+
+    def _endpoint_column(self, name):
+        # endpoint attributes by id, over every node type that has the attribute
+        series = [self.nodes(node_type)[name] for node_type in self.node_types if name in self.nodes(node_type)]
+        if not series:
+            return pd.Series(dtype=float)
+        return pd.concat(series) if len(series) > 1 else series[0]
+
+
+if __name__ == "__main__":
+    import time
+    from datetime import datetime
+
+    from mmap_store import SnapshotArrays
+
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    rng = np.random.default_rng(0)
+    ids = lambda prefix, n: [f"{prefix}_{i:06d}" for i in range(n)]
+    offerings, suppliers, warehouses = ids("PO", size), ids("S", size // 10), ids("W", size // 100)
+    parts, facilities = ids("P", size), ids("F", size // 100)
+    valid_from = [f"2024-{m:02d}-{d:02d}" for m, d in zip(rng.integers(1, 13, size), rng.integers(1, 29, size))]
+    valid_till = [f"{y}-{m:02d}-15" for y, m in zip(rng.integers(2025, 2030, size), rng.integers(1, 13, size))]
+    data = {
+        "directed": True,
+        "node_types": {
+            "PRODUCT_OFFERING": ["node_type", "name", "cost", "demand", "id"],
+            "SUPPLIERS": ["node_type", "name", "reliability", "id"],
+            "WAREHOUSE": ["node_type", "name", "max_capacity", "current_capacity", "location", "id"],
+            "PARTS": ["node_type", "name", "importance_factor", "valid_from", "valid_till", "id"],
+            "FACILITY": ["node_type", "name", "id"],
+        },
+        "relationship_types": {
+            "SUPPLIERSToWAREHOUSE": ["relationship_type", "transportation_cost", "lead_time", "source", "target"],
+            "PARTSToFACILITY": ["relationship_type", "quantity", "distance", "transport_cost", "lead_time", "source", "target"],
+        },
+        "node_values": {
+            "PRODUCT_OFFERING": [["PRODUCT_OFFERING", i, c, d, i] for i, c, d in zip(offerings, rng.uniform(100, 10000, size).tolist(), rng.uniform(0, 300, size).tolist())],
+            "SUPPLIERS": [["SUPPLIERS", i, r, i] for i, r in zip(suppliers, rng.uniform(0.5, 1, len(suppliers)).tolist())],
+            "WAREHOUSE": [["WAREHOUSE", i, m, int(m * f), "Texas", i] for i, m, f in zip(warehouses, rng.integers(1000, 5000, len(warehouses)).tolist(), rng.uniform(0, 1, len(warehouses)).tolist())],
+            "PARTS": [["PARTS", i, f, a, b, i] for i, f, a, b in zip(parts, rng.uniform(0, 1, size).tolist(), valid_from, valid_till)],
+            "FACILITY": [["FACILITY", i, i] for i in facilities],
+        },
+        "link_values": {
+            "SUPPLIERSToWAREHOUSE": [["SUPPLIERSToWAREHOUSE", c, 5, s, warehouses[i % len(warehouses)]] for i, (s, c) in enumerate(zip(suppliers * 2, rng.uniform(1, 100, 2 * len(suppliers)).tolist()))],
+            "PARTSToFACILITY": [["PARTSToFACILITY", 3, d, c, 5, p, facilities[i % len(facilities)]] for i, (p, d, c) in enumerate(zip(parts, rng.uniform(0, 1000, size).tolist(), rng.uniform(1, 100, size).tolist()))],
+        },
+    }
+    node_rows = {
+        node_type: [dict(zip(data["node_types"][node_type], row)) for row in rows]
+        for node_type, rows in data["node_values"].items()
+    }
+    all_nodes = [(row["id"], row) for rows in node_rows.values() for row in rows]
+    nodes_by_id = dict(all_nodes)
+    edges = {
+        link_type: [(row[-2], row[-1], dict(zip(data["relationship_types"][link_type], row))) for row in rows]
+        for link_type, rows in data["link_values"].items()
+    }
+
+    def loop_profitable():
+        return [(n, a["cost"], a["demand"]) for n, a in all_nodes if a.get("node_type") == "PRODUCT_OFFERING" and a.get("cost", float("inf")) <= 5000 and a.get("demand", 0) >= 150]
+
+    def loop_safety_stock():
+        return [n for n, a in all_nodes if a.get("node_type") == "WAREHOUSE" and a["max_capacity"] > 0 and a["max_capacity"] - a["current_capacity"] <= 0.15 * a["max_capacity"]]
+
+    def loop_bottleneck():
+        result = []
+        for n, a in all_nodes:
+            if a.get("node_type") == "PARTS":
+                life = (datetime.strptime(a["valid_till"], "%Y-%m-%d") - datetime.strptime(a["valid_from"], "%Y-%m-%d")).days
+                if a["importance_factor"] >= 0.5 and life <= 700:
+                    result.append(n)
+        return result
+
+    def loop_reliability():
+        return [(u, nodes_by_id[u]["reliability"], e["transportation_cost"]) for u, v, e in edges["SUPPLIERSToWAREHOUSE"] if e["transportation_cost"] <= 50 and nodes_by_id[u]["reliability"] >= 0.9]
+
+    def loop_distance():
+        return [(u, v) for u, v, e in edges["PARTSToFACILITY"] if e["distance"] >= 500 and e["transport_cost"] <= 50]
+
+    def engine_queries(engine):
+        short_lived = engine.interval_index("PARTS", "valid_from", "valid_till").at_most(700)
+        return (
+            engine.select("PRODUCT_OFFERING", (col("cost") <= 5000) & (col("demand") >= 150)),
+            engine.select("WAREHOUSE", Predicate(lambda f: (f["max_capacity"] > 0) & (f["max_capacity"] - f["current_capacity"] <= 0.15 * f["max_capacity"]))),
+            short_lived[engine.nodes("PARTS")["importance_factor"].to_numpy()[short_lived] >= 0.5],
+            engine.select_links("SUPPLIERSToWAREHOUSE", (col("transportation_cost") <= 50) & (col("source_reliability") >= 0.9), source_columns=("reliability",)),
+            engine.select_links("PARTSToFACILITY", (col("distance") >= 500) & (col("transport_cost") <= 50), sort_by="distance", ascending=False),
+        )
+
+    loops = (loop_profitable, loop_safety_stock, loop_bottleneck, loop_reliability, loop_distance)
+    start = time.perf_counter()
+    loop_results = [query() for query in loops]
+    print(f"{size} nodes, loop queries: {time.perf_counter() - start:.3f} s")
+
+    for name, engine in (("engine rows", QueryEngine(data)), ("engine arrays", QueryEngine(arrays=SnapshotArrays.from_data(data)))):
+        start = time.perf_counter()
+        for node_type in data["node_types"]:
+            engine.nodes(node_type)
+        for link_type in data["relationship_types"]:
+            engine.links(link_type)
+        engine.interval_index("PARTS", "valid_from", "valid_till")
+        built = time.perf_counter() - start
+        start = time.perf_counter()
+        results = engine_queries(engine)
+        print(f"{name}: frames {built:.3f} s, queries {time.perf_counter() - start:.3f} s")
+        assert [len(result) for result in results] == [len(result) for result in loop_results]
+
+    # interval index latency against the strptime loop as the parts count grows
+    for count in (1000, 10000, 100000):
+        starts = np.datetime64("2024-01-01") + rng.integers(0, 730, count)
+        ends = starts + rng.integers(30, 1500, count)
+        rows = [(str(a), str(b)) for a, b in zip(starts, ends)]
+
+        start = time.perf_counter()
+        loop_hits = 0
+        for valid_from, valid_till in rows:
+            valid_from, valid_till = datetime.strptime(valid_from, "%Y-%m-%d"), datetime.strptime(valid_till, "%Y-%m-%d")
+            loop_hits += valid_from <= datetime(2024, 3, 1) and valid_till >= datetime(2024, 2, 1)
+        loop_seconds = time.perf_counter() - start
+
+        index = IntervalIndex(range(count), starts, ends)
+        start = time.perf_counter()
+        for _ in range(100):
+            hits = index.overlapping("2024-02-01", "2024-03-01")
+            short = index.at_most(45)
+        index_seconds = (time.perf_counter() - start) / 100
+        assert len(hits) == loop_hits
+        print(f"{count:>6} parts: loop {loop_seconds * 1e3:.1f} ms, index {index_seconds * 1e6:.0f} us "
+              f"({len(hits)} valid in window, {len(short)} lasting <= 45 days)")
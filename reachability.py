@@ -0,0 +1,157 @@
+"""
+Supplier to product offering reachability of one snapshot.
+
+find_supplier_product_association walked supplier -> warehouse -> part ->
+facility -> offering for every supplier, re-walking the same parts and
+facilities each time. SupplierProductReachability builds one sparse boolean
+matrix per relationship type over the node positions of mmap_store and
+multiplies them once per snapshot:
+
+    SUPPLIERSToWAREHOUSE . WAREHOUSEToPARTS . PARTSToFACILITY . FACILITYToPRODUCT_OFFERING
+
+Row s of the product holds the offerings supplier s feeds; its transpose
+answers the other direction:
+
+    reachability = temporal_graph.load_reachability_at_timestamp(timestamp)
+    reachability.products_of("S_014")
+    reachability.suppliers_of("PO_007")
+
+Compare with the nested walk:
+
+    python reachability.py 10000
+"""
+import sys
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+SUPPLIER_PRODUCT_PATH = ("SUPPLIERSToWAREHOUSE", "WAREHOUSEToPARTS", "PARTSToFACILITY", "FACILITYToPRODUCT_OFFERING")
+
+
+def link_matrix(arrays, link_type):
+    """Boolean (node, node) matrix of the edges of one relationship type."""
+    shape = (arrays.node_count, arrays.node_count)
+    if link_type not in arrays.link_types:
+        return sparse.csr_matrix(shape, dtype=np.int32)
+    src, dst = arrays.link_endpoints(link_type)
+    matrix = sparse.csr_matrix((np.ones(len(src), dtype=np.int32), (src, dst)), shape=shape)
+    matrix.data[:] = 1  # parallel edges are summed by the constructor
+    return matrix
+
+
+class SupplierProductReachability:
+    """
+    Which product offerings each supplier feeds, as a sparse (supplier, node)
+    matrix and its transpose.
+    """
+
+    def __init__(self, arrays, path=SUPPLIER_PRODUCT_PATH, source_type="SUPPLIERS"):
+        self.arrays = arrays
+        self.source_type = source_type
+        self._start, stop = arrays.node_type_range(source_type)
+
+        reach = link_matrix(arrays, path[0])[self._start:stop]
+        for link_type in path[1:]:
+            reach = reach @ link_matrix(arrays, link_type)
+            # only whether a walk exists matters, not how many there are
+            reach.data[:] = 1
+        reach.sort_indices()
+        self.matrix = reach
+        self._by_product = reach.T.tocsr()
+        self._by_product.sort_indices()
+
+    def __len__(self):
+        return self.matrix.nnz
+
+    @property
+    def supplier_ids(self):
+        return self.arrays.node_ids[self._start:self._start + self.matrix.shape[0]]
+
+    def products_of(self, supplier_id):
+        """Ids of the product offerings supplier_id feeds."""
+        position = self.arrays.node_position(supplier_id)
+        if position is None or not 0 <= position - self._start < self.matrix.shape[0]:
+            return []
+        row = position - self._start
+        columns = self.matrix.indices[self.matrix.indptr[row]:self.matrix.indptr[row + 1]]
+        return self.arrays.node_ids[columns].tolist()
+
+    def suppliers_of(self, product_id):
+        """Ids of the suppliers that feed product_id."""
+        position = self.arrays.node_position(product_id)
+        if position is None:
+            return []
+        rows = self._by_product.indices[self._by_product.indptr[position]:self._by_product.indptr[position + 1]]
+        return self.supplier_ids[rows].tolist()
+
+    @cached_property
+    def table(self):
+        """One row per supplier with its name and the offerings it feeds."""
+        if "name" in self.arrays.meta["node_columns"].get(self.source_type, {}):
+            names = self.arrays.node_column(self.source_type, "name").tolist()
+        else:
+            names = self.supplier_ids.tolist()
+        products = self.arrays.node_ids[self.matrix.indices].tolist()
+        indptr = self.matrix.indptr.tolist()
+        associated = [", ".join(products[a:b]) or "None" for a, b in zip(indptr[:-1], indptr[1:])]
+        return pd.DataFrame({"Supplier Name": names, "Associated Products": associated})
+
+
+if __name__ == "__main__":
+    import time
+
+    from mmap_store import SnapshotArrays
+
+    suppliers = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rng = np.random.default_rng(0)
+    ids = lambda prefix, n: [f"{prefix}_{i:06d}" for i in range(n)]
+    # node and edge ratios of the generated snapshots
+    counts = {"SUPPLIERS": suppliers, "WAREHOUSE": suppliers // 4, "PARTS": suppliers * 5 // 2,
+              "FACILITY": suppliers // 10, "PRODUCT_OFFERING": suppliers // 8}
+    nodes = {node_type: ids(node_type[:2], count) for node_type, count in counts.items()}
+
+    def links(link_type, sources, targets, fan_out):
+        return [[link_type, s, t] for s in sources for t in rng.choice(targets, fan_out, replace=False).tolist()]
+
+    data = {
+        "directed": True,
+        "node_types": {node_type: ["node_type", "name", "id"] for node_type in nodes},
+        "relationship_types": {link_type: ["relationship_type", "source", "target"] for link_type in SUPPLIER_PRODUCT_PATH},
+        "node_values": {node_type: [[node_type, f"{i} name", i] for i in values] for node_type, values in nodes.items()},
+        "link_values": {
+            "SUPPLIERSToWAREHOUSE": links("SUPPLIERSToWAREHOUSE", nodes["SUPPLIERS"], nodes["WAREHOUSE"], 2),
+            "WAREHOUSEToPARTS": links("WAREHOUSEToPARTS", nodes["WAREHOUSE"], nodes["PARTS"], 20),
+            "PARTSToFACILITY": links("PARTSToFACILITY", nodes["PARTS"], nodes["FACILITY"], 2),
+            "FACILITYToPRODUCT_OFFERING": links("FACILITYToPRODUCT_OFFERING", nodes["FACILITY"], nodes["PRODUCT_OFFERING"], 3),
+        },
+    }
+    successors = {}
+    for link_type, rows in data["link_values"].items():
+        for _, source, target in rows:
+            successors.setdefault((link_type, source), []).append(target)
+
+    start = time.perf_counter()
+    walked = {}
+    for supplier in nodes["SUPPLIERS"]:
+        parts = {p for w in successors.get(("SUPPLIERSToWAREHOUSE", supplier), []) for p in successors.get(("WAREHOUSEToPARTS", w), [])}
+        walked[supplier] = {o for p in parts for f in successors.get(("PARTSToFACILITY", p), []) for o in successors.get(("FACILITYToPRODUCT_OFFERING", f), [])}
+    print(f"{suppliers} suppliers, nested walk: {time.perf_counter() - start:.3f} s")
+
+    arrays = SnapshotArrays.from_data(data)
+    start = time.perf_counter()
+    reachability = SupplierProductReachability(arrays)
+    built = time.perf_counter() - start
+    start = time.perf_counter()
+    table = reachability.table
+    print(f"matrix product {built:.3f} s, table {time.perf_counter() - start:.3f} s, {len(reachability)} pairs")
+
+    assert all(set(reachability.products_of(s)) == walked[s] for s in nodes["SUPPLIERS"])
+    product = nodes["PRODUCT_OFFERING"][0]
+    assert set(reachability.suppliers_of(product)) == {s for s, products in walked.items() if product in products}
+    start = time.perf_counter()
+    for supplier, product in zip(nodes["SUPPLIERS"][:1000], nodes["PRODUCT_OFFERING"] * 5):
+        reachability.products_of(supplier)
+        reachability.suppliers_of(product)
+    print(f"lookups both ways: {(time.perf_counter() - start) / 1000 * 1e6:.0f} us")
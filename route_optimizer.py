@@ -0,0 +1,240 @@
+"""
+Cheapest and fastest supplier to product offering route of every timestamp.
+
+No query answered "which supplier, warehouse, part and facility make the
+cheapest or the fastest route to PO_007", although every edge of the way
+carries a cost and most a lead time:
+
+    SUPPLIERSToWAREHOUSE . WAREHOUSEToPARTS . PARTSToFACILITY . FACILITYToPRODUCT_OFFERING
+
+As in critical_path, each relationship type only links one node type to the
+next, so the node types are in topological order and a shortest path is one
+dynamic-programming pass over the four layers: every supplier starts at 0,
+and each node keeps its best incoming edge. RouteOptimizer runs the pass over
+the EdgeCube, for every product and every timestamp at the same time:
+
+    routes = temporal_graph.load_route_optimizer()
+    routes.best_routes(timestamp, "cost")                   # one row per product: its route, cost and lead time
+    routes.route("PO_007", timestamp, "lead_time")          # the edges of the fastest route to PO_007
+    routes.series("PO_007", "cost_then_lead_time")          # cost and lead time of its best route at every timestamp
+    routes.table("cost")                                    # (timestamp, product) cost of the cheapest routes
+
+An objective is a metric or a lexicographic combination of both, the way
+find_alternate_suppliers ranks suppliers by cost, then lead time: a route
+with the lowest cost wins, and among equally cheap routes the fastest. The
+cost of a route is the sum of the cost attributes of its edges (ROUTE_PATH),
+its lead time the sum of their lead times; this is one chain of edges, not
+the landed cost of CostRollup, which adds up every part a product takes.
+Edges missing at a timestamp do not count, and a product no route reaches
+there has none (NaN). Each objective is solved for every timestamp the first
+time it is asked for, then kept. Time it against Dijkstra on each snapshot:
+
+    python route_optimizer.py data/<version>
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+ROUTE_PATH = (
+    # (relationship type, cost attribute, lead time attribute)
+    ("SUPPLIERSToWAREHOUSE", "transportation_cost", "lead_time"),
+    ("WAREHOUSEToPARTS", "storage_cost", None),  # parts are in the warehouse once it is supplied
+    ("PARTSToFACILITY", "transport_cost", "lead_time"),
+    ("FACILITYToPRODUCT_OFFERING", "product_cost", "lead_time"),
+)
+METRICS = ("cost", "lead_time")
+OBJECTIVES = {
+    "cost": ("cost",),
+    "lead_time": ("lead_time",),
+    "cost_then_lead_time": ("cost", "lead_time"),
+    "lead_time_then_cost": ("lead_time", "cost"),
+}
+ROUTE_NODES = ["Supplier", "Warehouse", "Part", "Facility"]
+ROUTE_COLUMNS = ["From", "To", "Relationship", "Cost", "Lead Time"]
+
+
+def _lexicographic_min(keys, first, sizes):
+    """Per group of edges, the first edge with the lowest keys compared in order; keys are (timestamp, edge) arrays."""
+    candidate = np.ones(keys[0].shape, dtype=bool)
+    for key in keys:
+        masked = np.where(candidate, key, np.inf)
+        lowest = np.minimum.reduceat(masked, first, axis=1)
+        candidate &= masked == np.repeat(lowest, sizes, axis=1)
+    edge_index = np.broadcast_to(np.arange(keys[0].shape[1]), keys[0].shape)
+    return np.minimum.reduceat(np.where(candidate, edge_index, keys[0].shape[1]), first, axis=1)
+
+
+class RouteOptimizer:
+    """Best supplier to product offering route under each objective, for every timestamp of an EdgeCube."""
+
+    def __init__(self, cube, path=ROUTE_PATH):
+        self.timestamps = list(cube.timestamps)
+        self.path = path
+        edges = [np.array(cube.edges(link_type), dtype=object).reshape(-1, 2) for link_type, _, _ in path]
+        self.node_ids = pd.Index(pd.unique(np.concatenate([e.ravel() for e in edges])))
+        count = len(self.timestamps)
+
+        # per layer, the edges grouped by target with the cost and lead time of each, inf where it is missing
+        self._layers = []
+        for (link_type, *attributes), layer_edges in zip(path, edges):
+            sources = self.node_ids.get_indexer(layer_edges[:, 0])
+            targets = self.node_ids.get_indexer(layer_edges[:, 1])
+            order = np.argsort(targets, kind="stable")
+            valid = cube.valid(link_type)[:, order]
+            weights = {}
+            for metric, attribute in zip(METRICS, attributes):
+                weight = np.zeros((count, len(order)))
+                if attribute is not None:
+                    weight = np.nan_to_num(cube.values(link_type, attribute)[:, order])
+                weights[metric] = np.where(valid, weight, np.inf)
+            nodes, first, sizes = np.unique(targets[order], return_index=True, return_counts=True)
+            self._layers.append((link_type, sources[order], targets[order], weights, nodes, first, sizes))
+
+        _, _, _, _, products, _, _ = self._layers[-1]
+        self.product_ids = self.node_ids[products]
+        self._solutions = {}
+
+    def _solve(self, objective):
+        """(timestamp, node) cost and lead time of the best route to every node, and the edge chosen per layer."""
+        if objective not in OBJECTIVES:
+            raise ValueError(f"Unknown route objective {objective}, expected one of {list(OBJECTIVES)}.")
+        if objective in self._solutions:
+            return self._solutions[objective]
+
+        count = len(self.timestamps)
+        best = {metric: np.full((count, len(self.node_ids)), np.inf) for metric in METRICS}
+        _, suppliers, _, _, _, _, _ = self._layers[0]
+        for metric in METRICS:
+            # every supplier is a source
+            best[metric][:, suppliers] = 0
+
+        chosen = []
+        for _, sources, _, weights, nodes, first, sizes in self._layers:
+            if not len(sources):
+                chosen.append(np.zeros((count, 0), dtype=np.int64))
+                continue
+            arrival = {metric: best[metric][:, sources] + weights[metric] for metric in METRICS}
+            edge = _lexicographic_min([arrival[metric] for metric in OBJECTIVES[objective]], first, sizes)
+            for metric in METRICS:
+                best[metric][:, nodes] = np.take_along_axis(arrival[metric], edge, axis=1)
+            chosen.append(edge)
+
+        self._solutions[objective] = best, chosen
+        return best, chosen
+
+    def table(self, objective="cost", metric=None):
+        """(timestamp, product) value of metric, the first of objective by default, over the best routes; NaN where none."""
+        best, _ = self._solve(objective)
+        _, _, _, _, products, _, _ = self._layers[-1]
+        values = best[metric or OBJECTIVES[objective][0]][:, products]
+        return pd.DataFrame(np.where(np.isinf(values), np.nan, values),
+                            index=pd.Index(self.timestamps, name="Timestamp"), columns=self.product_ids)
+
+    def series(self, product_id, objective="cost"):
+        """Cost and lead time of the best route to product_id at every timestamp, NaN where there is none."""
+        frame = pd.DataFrame(index=pd.Index(self.timestamps, name="Timestamp"), columns=["Cost", "Lead Time"], dtype=float)
+        if product_id in self.product_ids:
+            for column, metric in zip(frame.columns, METRICS):
+                frame[column] = self.table(objective, metric)[product_id]
+        return frame
+
+    def _walk(self, timestamp, objective, nodes):
+        """Edge index into every layer of the best routes to nodes, last layer first."""
+        _, chosen = self._solve(objective)
+        edges = []
+        for (_, sources, _, _, targets, _, _), edge in zip(reversed(self._layers), reversed(chosen)):
+            group = np.minimum(np.searchsorted(targets, nodes), max(len(targets) - 1, 0))
+            edges.append(edge[timestamp, group] if len(targets) else np.zeros(len(nodes), dtype=np.int64))
+            nodes = sources[edges[-1]] if len(sources) else nodes
+        return edges
+
+    def best_routes(self, timestamp, objective="cost"):
+        """One row per product at the timestamp position: the nodes of its best route, its cost and lead time."""
+        best, _ = self._solve(objective)
+        _, _, _, _, products, _, _ = self._layers[-1]
+        frame = pd.DataFrame(index=pd.Index(self.product_ids, name="Product"))
+        reached = np.isfinite(best["cost"][timestamp, products])
+        if len(products) and len(self._layers) == len(ROUTE_NODES):
+            edges = self._walk(timestamp, objective, products)
+            for name, (_, sources, _, _, _, _, _), edge in zip(ROUTE_NODES[::-1], reversed(self._layers), edges):
+                frame[name] = np.where(reached, self.node_ids[sources[edge]], None)
+            frame = frame[ROUTE_NODES]
+        frame["Cost"] = np.where(reached, best["cost"][timestamp, products], np.nan)
+        frame["Lead Time"] = np.where(reached, best["lead_time"][timestamp, products], np.nan)
+        return frame
+
+    def route(self, product_id, timestamp, objective="cost"):
+        """Edges of the best route to product_id at the timestamp position, supplier first."""
+        best, _ = self._solve(objective)
+        node = self.node_ids.get_indexer([product_id])[0]
+        if node < 0 or not np.isfinite(best["cost"][timestamp, node]):
+            return pd.DataFrame(columns=ROUTE_COLUMNS)
+        rows = []
+        for (link_type, sources, _, weights, _, _, _), edge in zip(reversed(self._layers), self._walk(timestamp, objective, np.array([node]))):
+            edge = edge[0]
+            rows.append({
+                "From": self.node_ids[sources[edge]],
+                "To": self.node_ids[node],
+                "Relationship": link_type,
+                "Cost": weights["cost"][timestamp, edge],
+                "Lead Time": weights["lead_time"][timestamp, edge],
+            })
+            node = sources[edge]
+        return pd.DataFrame(rows[::-1], columns=ROUTE_COLUMNS)
+
+
+if __name__ == "__main__":
+    import time
+
+    import networkx as nx
+
+    from snapshot_store import list_snapshot_files, read_snapshot_file
+    from temporal_cube import update_edge_cube
+
+    files = list_snapshot_files(sys.argv[1])
+    cube = update_edge_cube(files)
+    start = time.perf_counter()
+    routes = RouteOptimizer(cube)
+    for objective in OBJECTIVES:
+        routes.table(objective)
+    seconds = time.perf_counter() - start
+    print(f"{len(routes.product_ids)} products x {len(routes.timestamps)} timestamps x {len(OBJECTIVES)} objectives in {seconds:.3f} s")
+
+    # Dijkstra from a super source on the networkx graph of every snapshot
+    start = time.perf_counter()
+    graphs = []
+    for timestamp, file_path in enumerate(files):
+        data = read_snapshot_file(file_path)
+        graph = nx.DiGraph()
+        for link_type, cost, lead_time in ROUTE_PATH:
+            names = data["relationship_types"].get(link_type, [])
+            for row in data["link_values"].get(link_type, []):
+                values = dict(zip(names, row))
+                graph.add_edge(row[-2], row[-1], cost=values.get(cost) or 0, lead_time=values.get(lead_time) or 0 if lead_time else 0)
+        suppliers = {row[-2] for row in data["link_values"].get("SUPPLIERSToWAREHOUSE", [])}
+        graph.add_edges_from(("source", supplier, {"cost": 0, "lead_time": 0}) for supplier in suppliers)
+        graphs.append((graph, nx.single_source_dijkstra_path_length(graph, "source", weight="cost")))
+    print(f"networkx Dijkstra, cheapest routes only: {time.perf_counter() - start:.3f} s")
+
+    cheapest = routes.table("cost")
+    for timestamp, (graph, expected) in enumerate(graphs):
+        row = cheapest.iloc[timestamp].dropna()
+        assert set(row.index) == {product for product in routes.product_ids if product in expected}
+        assert np.allclose(row.to_numpy(), [expected[product] for product in row.index])
+
+    # cost, then lead time: the best (cost, lead time) pair by a walk over the last graph in topological order
+    graph, _ = graphs[-1]
+    pair = {"source": (0.0, 0.0)}
+    for node in nx.topological_sort(graph):
+        for source in graph.predecessors(node):
+            edge = graph.edges[source, node]
+            candidate = (pair[source][0] + edge["cost"], pair[source][1] + edge["lead_time"])
+            pair[node] = min(pair.get(node, candidate), candidate)
+    frame = routes.best_routes(len(files) - 1, "cost_then_lead_time").dropna()
+    assert np.allclose(frame[["Cost", "Lead Time"]].to_numpy(), [pair[product] for product in frame.index])
+    product = frame["Cost"].idxmin()
+    route = routes.route(product, len(files) - 1, "cost_then_lead_time")
+    assert np.isclose(route["Cost"].sum(), frame.loc[product, "Cost"])
+    assert list(route["From"]) == list(frame.loc[product, ROUTE_NODES])
+    print(route.to_string(index=False))
@@ -0,0 +1,195 @@
+"""
+What changed between two timestamps.
+
+SnapshotDiff compares the column arrays of two snapshots (see mmap_store):
+node ids are matched per node type, edges per relationship type by
+(source, target), with sorted-array set operations instead of loading both
+graphs and walking them. The numeric attributes of the nodes and edges
+present at both timestamps are compared column by column:
+
+    diff = temporal_graph.diff_timestamps(3, 9)
+    diff.summary(threshold=0.1)       # per type: counts, added, removed, moved by more than 10%
+    diff.nodes_added()                # node type and id of every new node
+    diff.edges_removed()              # relationship, source and target of every edge that went away
+    diff.node_changes(0.1, ["cost", "demand"])
+    diff.edge_changes(0.2)
+
+A change is (after - before) / |before|; an attribute that leaves zero counts
+as an infinite change. Compare with walking the two graphs:
+
+    python snapshot_diff.py data/<version> 3 9
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+NUMERIC_KINDS = ("float", "int")
+CHANGE_COLUMNS = ["Attribute", "Before", "After", "Change (%)"]
+
+
+def _match(before_keys, after_keys):
+    """Positions of the keys only in before, only in after, and of the keys in both, in before and in after."""
+    removed = np.flatnonzero(~np.isin(before_keys, after_keys))
+    added = np.flatnonzero(~np.isin(after_keys, before_keys))
+    _, in_before, in_after = np.intersect1d(before_keys, after_keys, return_indices=True)
+    order = np.argsort(in_after, kind="stable")
+    return removed, added, in_before[order], in_after[order]
+
+
+def _numeric(names, before_kinds, after_kinds, attributes):
+    """Attributes numeric at both timestamps, among the selected ones."""
+    return [name for name in names
+            if before_kinds.get(name, {}).get("kind") in NUMERIC_KINDS and after_kinds.get(name, {}).get("kind") in NUMERIC_KINDS
+            and (attributes is None or name in attributes)]
+
+
+class SnapshotDiff:
+    """Added and removed nodes and edges, and the attribute changes, between two snapshots."""
+
+    def __init__(self, before, after):
+        self.before = before
+        self.after = after
+
+        self._nodes = {}
+        for node_type in dict.fromkeys(before.node_types + after.node_types):
+            self._nodes[node_type] = _match(self._type_ids(before, node_type), self._type_ids(after, node_type))
+
+        # edges are keyed by the positions of their endpoints in the ids of both snapshots
+        self._vocabulary = np.union1d(before.node_ids, after.node_ids)
+        self._links = {}
+        for link_type in dict.fromkeys(before.link_types + after.link_types):
+            self._links[link_type] = _match(self._edge_keys(before, link_type), self._edge_keys(after, link_type))
+
+    @staticmethod
+    def _type_ids(arrays, node_type):
+        start, stop = arrays.node_type_range(node_type)
+        return arrays.node_ids[start:stop]
+
+    def _edge_keys(self, arrays, link_type):
+        if link_type not in arrays.link_types:
+            return np.empty(0, dtype=np.int64)
+        codes = np.searchsorted(self._vocabulary, arrays.node_ids).astype(np.int64)
+        src, dst = arrays.link_endpoints(link_type)
+        return codes[src] * len(self._vocabulary) + codes[dst]
+
+    def _endpoints(self, arrays, link_type, edges):
+        src, dst = arrays.link_endpoints(link_type)
+        return arrays.node_ids[src[edges]], arrays.node_ids[dst[edges]]
+
+    def nodes_added(self):
+        frames = [pd.DataFrame({"Node Type": node_type, "Id": self._type_ids(self.after, node_type)[added]})
+                  for node_type, (_, added, _, _) in self._nodes.items()]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Node Type", "Id"])
+
+    def nodes_removed(self):
+        frames = [pd.DataFrame({"Node Type": node_type, "Id": self._type_ids(self.before, node_type)[removed]})
+                  for node_type, (removed, _, _, _) in self._nodes.items()]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Node Type", "Id"])
+
+    def edges_added(self):
+        return self._edge_frame(self.after, 1)
+
+    def edges_removed(self):
+        return self._edge_frame(self.before, 0)
+
+    def _edge_frame(self, arrays, side):
+        frames = []
+        for link_type, matched in self._links.items():
+            source, target = self._endpoints(arrays, link_type, matched[side])
+            frames.append(pd.DataFrame({"Relationship": link_type, "Source": source, "Target": target}))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Relationship", "Source", "Target"])
+
+    def _changes(self, before_column, after_column, threshold):
+        """Rows whose change is larger than threshold, their before and after values and the change."""
+        before_values = np.asarray(before_column, dtype=float)
+        after_values = np.asarray(after_column, dtype=float)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (after_values - before_values) / np.abs(before_values)
+        change[before_values == after_values] = 0
+        moved = np.flatnonzero(np.abs(change) > threshold)
+        return moved, before_values[moved], after_values[moved], change[moved] * 100
+
+    def node_changes(self, threshold=0.0, attributes=None):
+        """Numeric node attributes that moved by more than threshold (0.1 is 10%)."""
+        frames = []
+        for node_type, (_, _, in_before, in_after) in self._nodes.items():
+            if node_type not in self.before.node_types or node_type not in self.after.node_types:
+                continue
+            names = _numeric(self.after.meta["node_types"][node_type], self.before.meta["node_columns"][node_type],
+                             self.after.meta["node_columns"][node_type], attributes)
+            ids = self._type_ids(self.after, node_type)
+            for name in names:
+                moved, before_values, after_values, change = self._changes(
+                    self.before.node_column(node_type, name)[in_before], self.after.node_column(node_type, name)[in_after], threshold)
+                frames.append(pd.DataFrame({"Node Type": node_type, "Id": ids[in_after[moved]], "Attribute": name,
+                                            "Before": before_values, "After": after_values, "Change (%)": change}))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Node Type", "Id"] + CHANGE_COLUMNS)
+
+    def edge_changes(self, threshold=0.0, attributes=None):
+        """Numeric edge attributes that moved by more than threshold (0.1 is 10%)."""
+        frames = []
+        for link_type, (_, _, in_before, in_after) in self._links.items():
+            if link_type not in self.before.link_types or link_type not in self.after.link_types:
+                continue
+            names = _numeric(self.after.meta["relationship_types"][link_type][:-2], self.before.meta["link_columns"][link_type],
+                             self.after.meta["link_columns"][link_type], attributes)
+            for name in names:
+                moved, before_values, after_values, change = self._changes(
+                    self.before.link_column(link_type, name)[in_before], self.after.link_column(link_type, name)[in_after], threshold)
+                source, target = self._endpoints(self.after, link_type, in_after[moved])
+                frames.append(pd.DataFrame({"Relationship": link_type, "Source": source, "Target": target, "Attribute": name,
+                                            "Before": before_values, "After": after_values, "Change (%)": change}))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["Relationship", "Source", "Target"] + CHANGE_COLUMNS)
+
+    def summary(self, threshold=0.0):
+        """One row per node and relationship type: counts at both timestamps, added, removed and moved."""
+        node_changes = self.node_changes(threshold)
+        edge_changes = self.edge_changes(threshold)
+        moved_nodes = node_changes.groupby("Node Type")["Id"].nunique()
+        moved_edges = edge_changes.groupby("Relationship")[["Source", "Target"]].apply(lambda rows: len(rows.drop_duplicates()))
+        rows = []
+        for kind, matches, moved in (("Node", self._nodes, moved_nodes), ("Edge", self._links, moved_edges)):
+            for name, (removed, added, in_before, _) in matches.items():
+                rows.append({"Kind": kind, "Type": name, "Before": len(in_before) + len(removed), "After": len(in_before) + len(added),
+                             "Added": len(added), "Removed": len(removed), "Changed": int(moved.get(name, 0))})
+        return pd.DataFrame(rows, columns=["Kind", "Type", "Before", "After", "Added", "Removed", "Changed"])
+
+
+if __name__ == "__main__":
+    import time
+
+    from mmap_store import SnapshotArrays
+    from snapshot_store import list_snapshot_files, read_snapshot_file
+    from TemporalGraphClass import json_to_graph
+
+    files = list_snapshot_files(sys.argv[1])
+    first = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    last = int(sys.argv[3]) if len(sys.argv) > 3 else len(files) - 1
+    before_data, after_data = read_snapshot_file(files[first]), read_snapshot_file(files[last])
+    before, after = SnapshotArrays.from_data(before_data), SnapshotArrays.from_data(after_data)
+
+    start = time.perf_counter()
+    diff = SnapshotDiff(before, after)
+    summary = diff.summary(0.1)
+    print(f"diff of timestamps {first} and {last}: {time.perf_counter() - start:.3f} s")
+    print(summary.to_string(index=False))
+
+    # the same by hand on the two graphs
+    start = time.perf_counter()
+    before_graph, after_graph = json_to_graph(before_data), json_to_graph(after_data)
+    added_edges = set(after_graph.edges) - set(before_graph.edges)
+    removed_edges = set(before_graph.edges) - set(after_graph.edges)
+    moved = set()
+    for node, attributes in after_graph.nodes(data=True):
+        old = before_graph.nodes[node] if node in before_graph else {}
+        for name, value in attributes.items():
+            if type(value) in (int, float) and type(old.get(name)) in (int, float) and value != old[name] and (
+                    old[name] == 0 or abs((value - old[name]) / abs(old[name])) > 0.1):
+                moved.add((node, name))
+    print(f"walking the two graphs: {time.perf_counter() - start:.3f} s")
+
+    assert set(zip(diff.edges_added()["Source"], diff.edges_added()["Target"])) == added_edges
+    assert set(zip(diff.edges_removed()["Source"], diff.edges_removed()["Target"])) == removed_edges
+    changes = diff.node_changes(0.1)
+    assert set(zip(changes["Id"], changes["Attribute"])) == moved
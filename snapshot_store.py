@@ -0,0 +1,391 @@
+"""
+Columnar binary storage for timestamp snapshots.
+
+Each snapshot is one msgpack file. Node and link values are stored per type as
+columns; columns that hold only floats or only ints are packed as raw
+little-endian numpy buffers, everything else (names, dates, lists) stays a
+msgpack list. Reading a file gives back exactly the dictionary the server
+returns, so the rest of the dashboard does not care which format is on disk.
+
+One-time conversion of a downloaded version folder:
+
+    python snapshot_store.py data/<version> [--keep-json]
+
+Successive timestamps share almost every row; only the numeric attributes
+drift. A delta file stores one timestamp as the changes to the timestamp
+before it: rows added and removed, and the columns whose values moved, either
+whole or as (row, value) pairs when few rows moved. Names, ids, locations and
+every other column that stays the same are not stored again. Every
+KEYFRAME_INTERVAL-th timestamp stays a full snapshot so no chain of deltas
+gets long. read_snapshot_file applies the chain, read_snapshot_files reads a
+run of timestamps applying each delta to the snapshot just read. Turn the
+full snapshots of a version into deltas:
+
+    python snapshot_store.py data/<version> --deltas [--keep-full]
+"""
+import json
+import os
+import sys
+import time
+
+import msgpack
+import numpy as np
+
+SNAPSHOT_EXTENSION = ".msgpack"
+DELTA_EXTENSION = ".delta"
+JSON_EXTENSION = ".json"
+FORMAT_VERSION = 1
+KEYFRAME_INTERVAL = 12  # one full snapshot every year of monthly timestamps
+# when a timestamp exists in several formats the first one wins
+EXTENSION_PREFERENCE = (SNAPSHOT_EXTENSION, DELTA_EXTENSION, JSON_EXTENSION)
+
+INT64_MIN, INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+
+def _encode_column(values):
+    # type() instead of isinstance() so bools never end up in an int column
+    if values and all(type(v) is float for v in values):
+        return {"dtype": "<f8", "data": np.asarray(values, dtype="<f8").tobytes()}
+    if values and all(type(v) is int and INT64_MIN <= v <= INT64_MAX for v in values):
+        return {"dtype": "<i8", "data": np.asarray(values, dtype="<i8").tobytes()}
+    return {"dtype": None, "data": values}
+
+
+def _decode_column(column):
+    if column["dtype"] is None:
+        return column["data"]
+    return np.frombuffer(column["data"], dtype=column["dtype"])
+
+
+def _encode_table(rows):
+    width = len(rows[0]) if rows else 0
+    if any(len(row) != width for row in rows):
+        # ragged rows cannot be split into columns, keep them as they are
+        return {"rows": rows}
+    return {"length": len(rows), "columns": [_encode_column([row[j] for row in rows]) for j in range(width)]}
+
+
+def _decode_table(table):
+    if "rows" in table:
+        return table["rows"]
+    columns = [_decode_column(column) for column in table["columns"]]
+    columns = [column.tolist() if isinstance(column, np.ndarray) else column for column in columns]
+    if not columns:
+        return [[] for _ in range(table["length"])]
+    return [list(row) for row in zip(*columns)]
+
+
+def write_snapshot(data, file_path):
+    """Write a snapshot dictionary to file_path in the columnar format."""
+    payload = {
+        "format_version": FORMAT_VERSION,
+        "meta": {key: value for key, value in data.items() if key not in ("node_values", "link_values")},
+        "node_values": {node_type: _encode_table(rows) for node_type, rows in data["node_values"].items()},
+        "link_values": {link_type: _encode_table(rows) for link_type, rows in data["link_values"].items()},
+    }
+    with open(file_path, "wb") as f:
+        f.write(msgpack.packb(payload, use_bin_type=True))
+
+
+def read_snapshot(file_path):
+    """Read a columnar snapshot back into the server's dictionary layout."""
+    with open(file_path, "rb") as f:
+        payload = msgpack.unpackb(f.read(), raw=False)
+
+    if payload.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format in {file_path}: {payload.get('format_version')}")
+
+    data = dict(payload["meta"])
+    data["node_values"] = {node_type: _decode_table(table) for node_type, table in payload["node_values"].items()}
+    data["link_values"] = {link_type: _decode_table(table) for link_type, table in payload["link_values"].items()}
+    return data
+
+
+def _row_key(kind):
+    # nodes are matched by id, links by (source, target)
+    if kind == "node_values":
+        return lambda row: row[-1]
+    return lambda row: (row[-2], row[-1])
+
+
+def _same(a, b):
+    # 1 == 1.0, but an int that turns into a float is a change
+    return a is b or (type(a) is type(b) and a == b)
+
+
+def _diff_table(base_rows, rows, key):
+    """Rows as changes to base_rows: base position of each row, added rows and moved columns."""
+    base_positions = {key(row): i for i, row in enumerate(base_rows)}
+    take = [base_positions.get(key(row), -1) for row in rows]
+    added = [row for row, i in zip(rows, take) if i < 0]
+
+    changed = {}
+    for position, (row, i) in enumerate(zip(rows, take)):
+        if i < 0:
+            continue
+        base_row = base_rows[i]
+        for j, (a, b) in enumerate(zip(base_row, row)):
+            if not _same(a, b):
+                changed.setdefault(j, []).append(position)
+
+    columns = {}
+    for j, positions in changed.items():
+        if 2 * len(positions) > len(rows):
+            # most rows moved, the whole column is smaller than the pairs
+            columns[str(j)] = {"rows": None, "data": _encode_column([row[j] for row in rows])}
+        else:
+            columns[str(j)] = {"rows": _encode_column(positions), "data": _encode_column([rows[p][j] for p in positions])}
+
+    return {
+        "length": len(rows),
+        "take": None if take == list(range(len(base_rows))) else _encode_column(take),
+        "added": _encode_table(added),
+        "columns": columns,
+    }
+
+
+def diff_snapshots(base, data):
+    """The changes that turn snapshot base into snapshot data, see apply_delta."""
+    delta = {"meta": {key: value for key, value in data.items() if key not in ("node_values", "link_values")}}
+    for kind, schema in (("node_values", "node_types"), ("link_values", "relationship_types")):
+        delta[kind] = {}
+        for name, rows in data[kind].items():
+            width = len(data[schema][name])
+            if base[schema].get(name) != data[schema][name] or any(len(row) != width for row in rows):
+                # a type whose columns changed is stored whole
+                delta[kind][name] = {"full": _encode_table(rows)}
+            else:
+                delta[kind][name] = _diff_table(base[kind].get(name, []), rows, _row_key(kind))
+    return delta
+
+
+def _column(column):
+    values = _decode_column(column)
+    return values.tolist() if isinstance(values, np.ndarray) else values
+
+
+def _apply_table(base_rows, table):
+    if "full" in table:
+        return _decode_table(table["full"])
+    if table["take"] is None and not table["columns"] and len(base_rows) == table["length"]:
+        # nothing moved, the rows are shared with the base snapshot
+        return base_rows
+
+    take = range(len(base_rows)) if table["take"] is None else _column(table["take"])
+    added = iter(_decode_table(table["added"]))
+    rows = [base_rows[i] if i >= 0 else next(added) for i in take]
+
+    # rows are copied on their first change, the others stay shared with the base snapshot
+    copied = set()
+    for j, column in table["columns"].items():
+        j = int(j)
+        values = _column(column["data"])
+        positions = range(len(rows)) if column["rows"] is None else _column(column["rows"])
+        for position, value in zip(positions, values):
+            row = rows[position]
+            if _same(row[j], value):
+                continue
+            if position not in copied:
+                row = rows[position] = list(row)
+                copied.add(position)
+            row[j] = value
+    return rows
+
+
+def apply_delta(base, delta):
+    """Snapshot dictionary of a delta applied to its base snapshot. Unchanged types share the base rows."""
+    data = dict(delta["meta"])
+    for kind in ("node_values", "link_values"):
+        data[kind] = {name: _apply_table(base[kind].get(name, []), table) for name, table in delta[kind].items()}
+    return data
+
+
+def write_delta(base, data, file_path, base_path):
+    """Write data to file_path as the changes to base, the snapshot stored in base_path."""
+    payload = {"format_version": FORMAT_VERSION, "base": os.path.basename(base_path)}
+    payload.update(diff_snapshots(base, data))
+    with open(file_path, "wb") as f:
+        f.write(msgpack.packb(payload, use_bin_type=True))
+
+
+def read_delta(file_path):
+    """Path of the base snapshot of a delta file and the delta itself."""
+    with open(file_path, "rb") as f:
+        payload = msgpack.unpackb(f.read(), raw=False)
+
+    if payload.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format in {file_path}: {payload.get('format_version')}")
+    return os.path.join(os.path.dirname(file_path), payload["base"]), payload
+
+
+def read_snapshot_file(file_path):
+    """Load a snapshot from a JSON, a columnar or a delta file."""
+    if file_path.endswith(SNAPSHOT_EXTENSION):
+        return read_snapshot(file_path)
+    if file_path.endswith(DELTA_EXTENSION):
+        base_path, delta = read_delta(file_path)
+        return apply_delta(read_snapshot_file(base_path), delta)
+
+    with open(file_path, "r") as f:
+        return json.load(f)
+
+
+def read_snapshot_files(files):
+    """
+    Yield the snapshot of every file in order. A delta on the file just read
+    is applied to that snapshot instead of reading its chain again.
+    """
+    previous_path, previous = None, None
+    for file_path in files:
+        if file_path.endswith(DELTA_EXTENSION):
+            base_path, delta = read_delta(file_path)
+            base = previous if base_path == previous_path else read_snapshot_file(base_path)
+            data = apply_delta(base, delta)
+        else:
+            data = read_snapshot_file(file_path)
+        previous_path, previous = file_path, data
+        yield data
+
+
+def list_snapshot_files(folder):
+    """
+    Return the snapshot files of a version folder ordered by timestamp.
+
+    When a timestamp exists in several formats the columnar file wins, then
+    the delta file.
+    """
+    by_timestamp = {}
+    for name in os.listdir(folder):
+        stem, extension = os.path.splitext(name)
+        if extension not in EXTENSION_PREFERENCE or not stem.isdigit():
+            continue
+        timestamp = int(stem)
+        current = by_timestamp.get(timestamp)
+        if current is None or EXTENSION_PREFERENCE.index(extension) < EXTENSION_PREFERENCE.index(os.path.splitext(current)[1]):
+            by_timestamp[timestamp] = os.path.join(folder, name)
+
+    return [by_timestamp[timestamp] for timestamp in sorted(by_timestamp)]
+
+
+def convert_version_folder(folder, keep_json=False):
+    """
+    Convert every JSON snapshot in folder to the columnar format.
+
+    Each converted file is read back and compared with the JSON before the
+    JSON is removed. Returns one row of size and load-time figures per file.
+    """
+    report = []
+    for name in sorted(os.listdir(folder)):
+        stem, extension = os.path.splitext(name)
+        if extension != JSON_EXTENSION or not stem.isdigit():
+            continue
+
+        json_path = os.path.join(folder, name)
+        snapshot_path = os.path.join(folder, stem + SNAPSHOT_EXTENSION)
+
+        start = time.perf_counter()
+        with open(json_path, "r") as f:
+            data = json.load(f)
+        json_seconds = time.perf_counter() - start
+
+        write_snapshot(data, snapshot_path)
+
+        start = time.perf_counter()
+        converted = read_snapshot(snapshot_path)
+        snapshot_seconds = time.perf_counter() - start
+
+        if converted != data:
+            os.remove(snapshot_path)
+            raise ValueError(f"Round trip of {json_path} does not match, JSON file kept.")
+
+        report.append({
+            "timestamp": int(stem),
+            "json_bytes": os.path.getsize(json_path),
+            "snapshot_bytes": os.path.getsize(snapshot_path),
+            "json_load_seconds": json_seconds,
+            "snapshot_load_seconds": snapshot_seconds,
+        })
+
+        if not keep_json:
+            os.remove(json_path)
+
+    return report
+
+
+def delta_version_folder(folder, keyframe_interval=KEYFRAME_INTERVAL, keep_full=False):
+    """
+    Store every timestamp of folder as a delta on the one before it, except
+    every keyframe_interval-th, which stays a full snapshot.
+
+    Each delta is read back and compared with the snapshot before the full
+    file is removed. Returns one row of size and load-time figures per file.
+    """
+    files = list_snapshot_files(folder)
+    report = []
+    previous_path, previous = None, None
+    for position, (file_path, data) in enumerate(zip(files, read_snapshot_files(files))):
+        stem, extension = os.path.splitext(os.path.basename(file_path))
+        delta_path = os.path.join(folder, stem + DELTA_EXTENSION)
+        if position % keyframe_interval == 0 or extension == DELTA_EXTENSION:
+            if extension == JSON_EXTENSION:
+                # keyframes are kept in the columnar format
+                write_snapshot(data, os.path.join(folder, stem + SNAPSHOT_EXTENSION))
+                if not keep_full:
+                    os.remove(file_path)
+                file_path = os.path.join(folder, stem + SNAPSHOT_EXTENSION)
+            previous_path, previous = file_path, data
+            continue
+
+        write_delta(previous, data, delta_path, previous_path)
+        start = time.perf_counter()
+        converted = apply_delta(previous, read_delta(delta_path)[1])
+        delta_seconds = time.perf_counter() - start
+        if converted != data:
+            os.remove(delta_path)
+            raise ValueError(f"Delta of {file_path} does not match, full file kept.")
+
+        report.append({
+            "timestamp": int(stem),
+            "full_bytes": os.path.getsize(file_path),
+            "delta_bytes": os.path.getsize(delta_path),
+            "delta_apply_seconds": delta_seconds,
+        })
+        if not keep_full:
+            os.remove(file_path)
+        previous_path, previous = (file_path if keep_full else delta_path), data
+
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python snapshot_store.py <version folder> [--keep-json] [--deltas [--keep-full]]")
+        sys.exit(1)
+
+    if "--deltas" in sys.argv[2:]:
+        start = time.perf_counter()
+        rows = delta_version_folder(sys.argv[1], keep_full="--keep-full" in sys.argv[2:])
+        print(f"Stored {len(rows)} timestamps as deltas in {time.perf_counter() - start:.2f} s")
+        if rows:
+            full_bytes = sum(row["full_bytes"] for row in rows)
+            delta_bytes = sum(row["delta_bytes"] for row in rows)
+            print(f"Size: {full_bytes / 1e6:.1f} MB -> {delta_bytes / 1e6:.1f} MB ({full_bytes / delta_bytes:.1f}x smaller)")
+        files = list_snapshot_files(sys.argv[1])
+        start = time.perf_counter()
+        for _ in read_snapshot_files(files):
+            pass
+        print(f"Reading all {len(files)} timestamps in order: {time.perf_counter() - start:.2f} s")
+        sys.exit(0)
+
+    rows = convert_version_folder(sys.argv[1], keep_json="--keep-json" in sys.argv[2:])
+    if not rows:
+        print("No JSON snapshots found.")
+        sys.exit(0)
+
+    json_bytes = sum(row["json_bytes"] for row in rows)
+    snapshot_bytes = sum(row["snapshot_bytes"] for row in rows)
+    json_seconds = sum(row["json_load_seconds"] for row in rows)
+    snapshot_seconds = sum(row["snapshot_load_seconds"] for row in rows)
+    print(f"Converted {len(rows)} snapshots")
+    print(f"Size: {json_bytes / 1e6:.1f} MB -> {snapshot_bytes / 1e6:.1f} MB ({json_bytes / snapshot_bytes:.1f}x smaller)")
+    print(f"Load: {json_seconds:.2f} s -> {snapshot_seconds:.2f} s ({json_seconds / snapshot_seconds:.1f}x faster)")
@@ -0,0 +1,125 @@
+"""
+Which suppliers can supply which parts.
+
+The alternate-supplier and shortfall queries of the dashboard used to re-open
+suppliers_parts_data_unused.json on every click and test every part of every
+supplier against the parts they needed. SupplierCatalog parses the mapping
+once, keeps a set of parts per supplier and an inverted part -> suppliers
+index, so both queries are dictionary lookups:
+
+    catalog = load_supplier_catalog()
+    catalog.suppliers_for(["P_200", "P_161"])  # {"P_200": ["S_001", ...], ...}
+
+The catalog is cached per process and reloaded when the file changes. With
+url set (the SUPPLIER_CATALOG_URL environment variable on the dashboard) it
+is fetched from the supplier-data endpoint instead, and refreshed when the
+endpoint reports a new version.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+import requests
+import streamlit as st
+
+SUPPLIER_PARTS_PATH = "suppliers_parts_data_unused.json"
+CHECK_INTERVAL = 60  # seconds between two checks of the supplier-data endpoint
+REQUEST_TIMEOUT = 60  # seconds
+
+
+class SupplierCatalog:
+    """Supplier -> parts sets and the inverted part -> suppliers index."""
+
+    def __init__(self, supplier_parts):
+        self.parts_by_supplier = {}
+        self.suppliers_by_part = {}
+        for supplier_id, parts in supplier_parts.items():
+            self.parts_by_supplier[supplier_id] = set(parts)
+            for part in parts:
+                self.suppliers_by_part.setdefault(part, []).append(supplier_id)
+        # first position of each part in the file, results keep the order of the old scan
+        self._part_rank = {part: rank for rank, part in enumerate(self.suppliers_by_part)}
+
+    def __len__(self):
+        return len(self.parts_by_supplier)
+
+    def parts_of(self, supplier_id):
+        return self.parts_by_supplier.get(supplier_id, set())
+
+    def suppliers_of(self, part_id):
+        return self.suppliers_by_part.get(part_id, [])
+
+    def suppliers_for(self, parts):
+        """part -> suppliers for the parts any supplier carries, in file order."""
+        found = sorted({part for part in parts if part in self._part_rank}, key=self._part_rank.get)
+        return {part: list(self.suppliers_by_part[part]) for part in found}
+
+
+# keyed by the file's modification time and size, an edited file is parsed again
+@st.cache_resource(max_entries=1)
+def _catalog_from_file(path, modified):
+    with open(path, "r") as f:
+        return SupplierCatalog(json.load(f))
+
+
+class RemoteSupplierCatalog:
+    """
+    Catalog of the supplier-data endpoint, checked at most every CHECK_INTERVAL
+    seconds with a conditional request. The index is only rebuilt when the
+    payload differs from the one it was built from.
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.catalog = None
+        self._validators = {}
+        self._digest = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self.catalog is None or time.monotonic() - self._checked_at >= CHECK_INTERVAL:
+                self._refresh()
+            return self.catalog
+
+    def _refresh(self):
+        headers = {}
+        if "ETag" in self._validators:
+            headers["If-None-Match"] = self._validators["ETag"]
+        if "Last-Modified" in self._validators:
+            headers["If-Modified-Since"] = self._validators["Last-Modified"]
+        try:
+            response = requests.get(self.url, headers=headers, timeout=REQUEST_TIMEOUT)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except requests.RequestException:
+            # keep answering from the last catalog while the endpoint is unreachable
+            if self.catalog is None:
+                raise
+            return
+        finally:
+            self._checked_at = time.monotonic()
+
+        if response.status_code == 304:
+            return
+        self._validators = {key: response.headers[key] for key in ("ETag", "Last-Modified") if key in response.headers}
+        digest = hashlib.sha1(response.content).hexdigest()
+        if digest != self._digest:
+            self.catalog = SupplierCatalog(response.json())
+            self._digest = digest
+
+
+@st.cache_resource
+def _remote_catalog(url):
+    return RemoteSupplierCatalog(url)
+
+
+def load_supplier_catalog(path=SUPPLIER_PARTS_PATH, url=None):
+    """Return the cached catalog of the file, or of the endpoint when url is set."""
+    if url:
+        return _remote_catalog(url).get()
+    stat = os.stat(path)
+    return _catalog_from_file(path, (stat.st_mtime_ns, stat.st_size))
@@ -0,0 +1,462 @@
+"""
+Time series of the numeric node and edge attributes of a version.
+
+NodeCube holds one float64 array per node type with shape
+(timestamp, node, attribute): revenue of business groups and product
+families, cost and demand of offerings, capacities of warehouses and
+facilities, reliability and size of suppliers, cost of parts. A node missing
+at a timestamp is NaN.
+
+EdgeCube does the same per relationship type with shape
+(timestamp, edge, attribute), an edge being one (source, target) pair:
+inventory_level and storage_cost of warehouses, lead_time and
+transportation_cost of suppliers, transport_cost of parts. Edges come and go
+between snapshots, a boolean (timestamp, edge) mask tells which edges exist
+at each timestamp. Relationship types without attributes only have the mask.
+
+Charts and queries across timestamps become slices of these arrays instead
+of loops that load every snapshot. The cubes are written next to the
+snapshots:
+
+    data/<version>/cube/nodes/CURRENT                           name of the published generation
+    data/<version>/cube/nodes/<generation>/meta.json            timestamps, node ids, names and attributes per node type
+    data/<version>/cube/nodes/<generation>/<NODE_TYPE>.npy      values of one node type
+    data/<version>/cube/edges/CURRENT                           name of the published generation
+    data/<version>/cube/edges/<generation>/meta.json            timestamps, (source, target) pairs and attributes per relationship type
+    data/<version>/cube/edges/<generation>/<LINK_TYPE>.npy      values of one relationship type
+    data/<version>/cube/edges/<generation>/<LINK_TYPE>.valid.npy    validity mask of one relationship type
+
+Every save writes a new generation and then replaces CURRENT, so sessions
+that mapped an older generation keep reading complete arrays. The save then
+deletes the complete generations older than the one it replaced; that one is
+kept for the sessions that may still be reading it.
+
+When new timestamps are downloaded only their snapshot files are read and
+appended; the arrays of the earlier timestamps are reused.
+
+Build or extend the cubes of a version and time them against the snapshot loop:
+
+    python temporal_cube.py data/<version>
+"""
+import json
+import os
+import shutil
+import sys
+import time
+from functools import cached_property
+
+import numpy as np
+
+from snapshot_store import read_snapshot_files
+
+NODE_CUBE_FOLDER = os.path.join("cube", "nodes")
+EDGE_CUBE_FOLDER = os.path.join("cube", "edges")
+CUBE_META_NAME = "meta.json"
+CUBE_POINTER_NAME = "CURRENT"
+
+
+def timestamp_of(file_path):
+    """data/<version>/<timestamp>.<ext> -> <timestamp>"""
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def _is_number(value):
+    # type() instead of isinstance() so bools are not counted as numbers
+    return type(value) in (int, float)
+
+
+def _numeric_columns(names, rows):
+    return [
+        (j, name) for j, name in enumerate(names)
+        if name not in ("id", "source", "target") and rows and all(_is_number(row[j]) for row in rows)
+    ]
+
+
+def published_folder(folder):
+    """Generation folder the pointer of folder names, folder itself for a cube saved before pointers, None before the first save."""
+    try:
+        with open(os.path.join(folder, CUBE_POINTER_NAME), "r") as f:
+            return os.path.join(folder, f.read().strip())
+    except FileNotFoundError:
+        return folder if os.path.exists(os.path.join(folder, CUBE_META_NAME)) else None
+
+
+def _generation_time(name):
+    """Save time of a generation folder name, None for any other entry of a cube folder."""
+    saved, _, pid = name.partition(".")
+    return int(saved) if saved.isdigit() and pid.isdigit() else None
+
+
+def _remove_old_generations(folder, previous):
+    """Delete the complete generations of folder saved before previous, the generation just replaced."""
+    cutoff = _generation_time(os.path.basename(previous)) if previous is not None else None
+    if cutoff is None:
+        return
+    for name in os.listdir(folder):
+        saved = _generation_time(name)
+        generation_folder = os.path.join(folder, name)
+        # a generation without meta.json may still be written by another process
+        if saved is not None and saved < cutoff and os.path.exists(os.path.join(generation_folder, CUBE_META_NAME)):
+            shutil.rmtree(generation_folder, ignore_errors=True)
+
+
+def _save_arrays(folder, meta, arrays):
+    # every save writes a new generation folder, then points folder at it with one rename;
+    # processes that mapped the replaced generation keep reading it, older ones are deleted
+    generation = f"{time.time_ns()}.{os.getpid()}"
+    generation_folder = os.path.join(folder, generation)
+    os.makedirs(generation_folder)
+    for name, array in arrays.items():
+        np.save(os.path.join(generation_folder, f"{name}.npy"), array, allow_pickle=False)
+    with open(os.path.join(generation_folder, CUBE_META_NAME), "w") as f:
+        json.dump(meta, f)
+
+    previous = published_folder(folder)
+    temp_path = os.path.join(folder, f"{CUBE_POINTER_NAME}.{os.getpid()}.part")
+    with open(temp_path, "w") as f:
+        f.write(generation)
+    os.replace(temp_path, os.path.join(folder, CUBE_POINTER_NAME))
+    _remove_old_generations(folder, previous)
+    return generation_folder
+
+
+def _load_meta(folder):
+    with open(os.path.join(folder, CUBE_META_NAME), "r") as f:
+        return json.load(f)
+
+
+def _load_array(folder, name):
+    return np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="r")
+
+
+def _grow(old, shape, fill):
+    """Array of shape with old copied into its leading corner and fill everywhere else."""
+    values = np.full(shape, fill)
+    if old is not None:
+        values[tuple(slice(0, size) for size in old.shape)] = old
+    return values
+
+
+class NodeCube:
+    folder_name = NODE_CUBE_FOLDER
+
+    def __init__(self, timestamps=None, node_types=None, values=None):
+        self.timestamps = timestamps or []
+        # node_type -> {"ids": [...], "names": [...], "attributes": [...]}
+        self.node_types = node_types or {}
+        self._values = values or {}
+        self._pending = []
+
+    @classmethod
+    def load(cls, folder):
+        """Open the published generation of a persisted cube, the arrays are memory-mapped read-only."""
+        folder = published_folder(folder)
+        meta = _load_meta(folder)
+        values = {node_type: _load_array(folder, node_type) for node_type in meta["node_types"]}
+        return cls(meta["timestamps"], meta["node_types"], values)
+
+    def save(self, folder):
+        """Publish the cube as a new generation of folder and return the generation folder."""
+        return _save_arrays(folder, {"timestamps": self.timestamps, "node_types": self.node_types}, self._values)
+
+    def add_snapshot(self, timestamp, data):
+        """Stage one snapshot after the timestamps in the cube, finish_update() writes the arrays."""
+        blocks = {}
+        for node_type, rows in data["node_values"].items():
+            info = self.node_types.setdefault(node_type, {"ids": [], "names": [], "attributes": []})
+            index = self._node_positions.setdefault(node_type, {})
+            names = data["node_types"][node_type]
+            columns = _numeric_columns(names, rows)
+
+            for name in (name for _, name in columns if name not in info["attributes"]):
+                info["attributes"].append(name)
+            name_column = names.index("name") if "name" in names else None
+            for row in rows:
+                if row[-1] not in index:
+                    index[row[-1]] = len(info["ids"])
+                    info["ids"].append(row[-1])
+                    info["names"].append(row[-1])
+                if name_column is not None:
+                    info["names"][index[row[-1]]] = row[name_column]
+
+            block = np.full((len(rows), len(info["attributes"])), np.nan)
+            for j, name in columns:
+                block[:, info["attributes"].index(name)] = [row[j] for row in rows]
+            node_positions = np.fromiter((index[row[-1]] for row in rows), dtype=np.int64, count=len(rows))
+            blocks[node_type] = (node_positions, block)
+        self._pending.append((timestamp, blocks))
+
+    def finish_update(self):
+        # nodes and attributes seen for the first time widen the arrays, earlier timestamps stay NaN
+        start = len(self.timestamps)
+        for node_type, info in self.node_types.items():
+            shape = (start + len(self._pending), len(info["ids"]), len(info["attributes"]))
+            values = _grow(self._values.get(node_type), shape, np.nan)
+            for t, (_, blocks) in enumerate(self._pending, start=start):
+                if node_type in blocks:
+                    node_positions, block = blocks[node_type]
+                    values[t, node_positions, :block.shape[1]] = block
+            self._values[node_type] = values
+        self.timestamps = self.timestamps + [timestamp for timestamp, _ in self._pending]
+        self._pending = []
+
+    def extend(self, snapshots):
+        """Append (timestamp, data) pairs after the timestamps already in the cube."""
+        for timestamp, data in snapshots:
+            self.add_snapshot(timestamp, data)
+        self.finish_update()
+
+    @cached_property
+    def _node_positions(self):
+        return {node_type: {node_id: i for i, node_id in enumerate(info["ids"])} for node_type, info in self.node_types.items()}
+
+    def node_ids(self, node_type):
+        return self.node_types.get(node_type, {}).get("ids", [])
+
+    def names(self, node_type):
+        """Latest name of every node of node_type, in cube order."""
+        return self.node_types.get(node_type, {}).get("names", [])
+
+    def attributes(self, node_type):
+        return self.node_types.get(node_type, {}).get("attributes", [])
+
+    def node_position(self, node_type, node_id):
+        return self._node_positions.get(node_type, {}).get(node_id)
+
+    def values(self, node_type, attribute=None):
+        """(timestamp, node, attribute) array of node_type, or (timestamp, node) for one attribute."""
+        values = self._values.get(node_type)
+        if values is None:
+            return np.empty((len(self.timestamps), 0) if attribute else (len(self.timestamps), 0, 0))
+        if attribute is None:
+            return values
+        if attribute not in self.attributes(node_type):
+            return np.full(values.shape[:2], np.nan)
+        return values[:, :, self.attributes(node_type).index(attribute)]
+
+    def series(self, node_type, node_id, attribute):
+        """Values of one attribute of one node over every timestamp, NaN where it is missing."""
+        position = self.node_position(node_type, node_id)
+        if position is None:
+            return np.full(len(self.timestamps), np.nan)
+        return self.values(node_type, attribute)[:, position]
+
+
+class EdgeCube:
+    folder_name = EDGE_CUBE_FOLDER
+
+    def __init__(self, timestamps=None, link_types=None, values=None, valid=None):
+        self.timestamps = timestamps or []
+        # link_type -> {"edges": [[source, target], ...], "attributes": [...]}
+        self.link_types = link_types or {}
+        self._values = values or {}
+        self._valid = valid or {}
+        self._pending = []
+
+    @classmethod
+    def load(cls, folder):
+        """Open the published generation of a persisted cube, the arrays are memory-mapped read-only."""
+        folder = published_folder(folder)
+        meta = _load_meta(folder)
+        values = {link_type: _load_array(folder, link_type) for link_type in meta["link_types"]}
+        valid = {link_type: _load_array(folder, f"{link_type}.valid") for link_type in meta["link_types"]}
+        return cls(meta["timestamps"], meta["link_types"], values, valid)
+
+    def save(self, folder):
+        arrays = dict(self._values)
+        arrays.update({f"{link_type}.valid": valid for link_type, valid in self._valid.items()})
+        return _save_arrays(folder, {"timestamps": self.timestamps, "link_types": self.link_types}, arrays)
+
+    def add_snapshot(self, timestamp, data):
+        """Stage one snapshot after the timestamps in the cube, finish_update() writes the arrays."""
+        blocks = {}
+        for link_type, rows in data["link_values"].items():
+            info = self.link_types.setdefault(link_type, {"edges": [], "attributes": []})
+            index = self._edge_positions.setdefault(link_type, {})
+            columns = _numeric_columns(data["relationship_types"][link_type], rows)
+
+            for name in (name for _, name in columns if name not in info["attributes"]):
+                info["attributes"].append(name)
+            for row in rows:
+                if (row[-2], row[-1]) not in index:
+                    index[(row[-2], row[-1])] = len(info["edges"])
+                    info["edges"].append([row[-2], row[-1]])
+
+            # a repeated (source, target) row overwrites the earlier one, as in the graph
+            block = np.full((len(rows), len(info["attributes"])), np.nan)
+            for j, name in columns:
+                block[:, info["attributes"].index(name)] = [row[j] for row in rows]
+            edge_positions = np.fromiter((index[(row[-2], row[-1])] for row in rows), dtype=np.int64, count=len(rows))
+            blocks[link_type] = (edge_positions, block)
+        self._pending.append((timestamp, blocks))
+
+    def finish_update(self):
+        start = len(self.timestamps)
+        for link_type, info in self.link_types.items():
+            size = (start + len(self._pending), len(info["edges"]))
+            values = _grow(self._values.get(link_type), size + (len(info["attributes"]),), np.nan)
+            valid = _grow(self._valid.get(link_type), size, False)
+            for t, (_, blocks) in enumerate(self._pending, start=start):
+                if link_type in blocks:
+                    edge_positions, block = blocks[link_type]
+                    values[t, edge_positions, :block.shape[1]] = block
+                    valid[t, edge_positions] = True
+            self._values[link_type] = values
+            self._valid[link_type] = valid
+        self.timestamps = self.timestamps + [timestamp for timestamp, _ in self._pending]
+        self._pending = []
+
+    def extend(self, snapshots):
+        """Append (timestamp, data) pairs after the timestamps already in the cube."""
+        for timestamp, data in snapshots:
+            self.add_snapshot(timestamp, data)
+        self.finish_update()
+
+    @cached_property
+    def _edge_positions(self):
+        return {
+            link_type: {(source, target): i for i, (source, target) in enumerate(info["edges"])}
+            for link_type, info in self.link_types.items()
+        }
+
+    @cached_property
+    def _endpoints(self):
+        # link_type -> (sources, targets) as arrays, for selecting edges by endpoint
+        return {
+            link_type: (
+                np.array([source for source, _ in info["edges"]], dtype=object),
+                np.array([target for _, target in info["edges"]], dtype=object),
+            )
+            for link_type, info in self.link_types.items()
+        }
+
+    def edges(self, link_type):
+        """(source, target) of every edge of link_type seen at any timestamp, in cube order."""
+        return [tuple(edge) for edge in self.link_types.get(link_type, {}).get("edges", [])]
+
+    def attributes(self, link_type):
+        return self.link_types.get(link_type, {}).get("attributes", [])
+
+    def edge_position(self, link_type, source, target):
+        return self._edge_positions.get(link_type, {}).get((source, target))
+
+    def edge_positions(self, link_type, source=None, target=None):
+        """Positions of the edges of link_type leaving source and/or entering target."""
+        if link_type not in self._endpoints:
+            return np.empty(0, dtype=np.int64)
+        sources, targets = self._endpoints[link_type]
+        selected = np.ones(len(sources), dtype=bool)
+        if source is not None:
+            selected &= sources == source
+        if target is not None:
+            selected &= targets == target
+        return np.flatnonzero(selected)
+
+    def valid(self, link_type):
+        """(timestamp, edge) mask, True where the edge exists in the snapshot."""
+        valid = self._valid.get(link_type)
+        return valid if valid is not None else np.zeros((len(self.timestamps), 0), dtype=bool)
+
+    def values(self, link_type, attribute=None):
+        """(timestamp, edge, attribute) array of link_type, or (timestamp, edge) for one attribute; NaN where the edge is missing."""
+        values = self._values.get(link_type)
+        if values is None:
+            return np.empty((len(self.timestamps), 0) if attribute else (len(self.timestamps), 0, 0))
+        if attribute is None:
+            return values
+        if attribute not in self.attributes(link_type):
+            return np.full(values.shape[:2], np.nan)
+        return values[:, :, self.attributes(link_type).index(attribute)]
+
+    def series(self, link_type, source, target, attribute):
+        """Values of one attribute of one edge over every timestamp, NaN where it is missing."""
+        position = self.edge_position(link_type, source, target)
+        if position is None:
+            return np.full(len(self.timestamps), np.nan)
+        return self.values(link_type, attribute)[:, position]
+
+
+def update_cubes(files, cube_classes=(NodeCube, EdgeCube)):
+    """
+    Cubes of the snapshot files of one version, read from disk when possible.
+
+    A persisted cube whose timestamps start the list of files is extended with
+    the missing timestamps only; any other cube is rebuilt from scratch. Each
+    missing snapshot file is read once for all cubes.
+    """
+    if not files:
+        return tuple(cube_class() for cube_class in cube_classes)
+
+    version_folder = os.path.dirname(files[0])
+    timestamps = [timestamp_of(file_path) for file_path in files]
+    cubes = []
+    for cube_class in cube_classes:
+        folder = os.path.join(version_folder, cube_class.folder_name)
+        cube = cube_class()
+        if published_folder(folder) is not None:
+            stored = cube_class.load(folder)
+            if stored.timestamps == timestamps[:len(stored.timestamps)]:
+                cube = stored
+        cubes.append(cube)
+
+    start = min(len(cube.timestamps) for cube in cubes)
+    # in order, so each delta file is applied to the snapshot read just before it
+    for t, data in enumerate(read_snapshot_files(files[start:]), start=start):
+        for cube in cubes:
+            if len(cube.timestamps) + len(cube._pending) == t:
+                cube.add_snapshot(timestamps[t], data)
+
+    for i, cube in enumerate(cubes):
+        if cube._pending:
+            cube.finish_update()
+            folder = os.path.join(version_folder, cube.folder_name)
+            # load the generation this process wrote, even if another one published after it
+            cubes[i] = type(cube).load(cube.save(folder))
+    return tuple(cubes)
+
+
+def update_node_cube(files):
+    return update_cubes(files, (NodeCube,))[0]
+
+
+def update_edge_cube(files):
+    return update_cubes(files, (EdgeCube,))[0]
+
+
+if __name__ == "__main__":
+    import time
+
+    from snapshot_store import list_snapshot_files
+
+    if len(sys.argv) < 2:
+        print("usage: python temporal_cube.py <version folder>")
+        sys.exit(1)
+
+    files = list_snapshot_files(sys.argv[1])
+
+    start = time.perf_counter()
+    node_cube, edge_cube = update_cubes(files)
+    print(f"cubes: {len(node_cube.timestamps)} timestamps, update {time.perf_counter() - start:.3f} s")
+    for node_type in node_cube.node_types:
+        print(f"  {node_type}: {node_cube.values(node_type).shape} {node_cube.attributes(node_type)}")
+    for link_type in edge_cube.link_types:
+        print(f"  {link_type}: {edge_cube.values(link_type).shape} {edge_cube.attributes(link_type)}")
+
+    start = time.perf_counter()
+    snapshots = list(read_snapshot_files(files))
+    print(f"reading every snapshot: {time.perf_counter() - start:.3f} s")
+
+    start = time.perf_counter()
+    demand = node_cube.values("PRODUCT_OFFERING", "demand")
+    top = np.argsort(np.where(np.isnan(demand), -np.inf, demand), axis=None)[-3:]
+    print(f"top demand from the node cube: {time.perf_counter() - start:.6f} s")
+
+    warehouse, _ = edge_cube.edges("WAREHOUSEToPARTS")[0]
+    start = time.perf_counter()
+    inventory = edge_cube.values("WAREHOUSEToPARTS", "inventory_level")[:, edge_cube.edge_positions("WAREHOUSEToPARTS", source=warehouse)]
+    print(f"inventory history of {warehouse} from the edge cube: {time.perf_counter() - start:.6f} s")
+
+    supplier, warehouse = edge_cube.edges("SUPPLIERSToWAREHOUSE")[0]
+    start = time.perf_counter()
+    lead_time = edge_cube.series("SUPPLIERSToWAREHOUSE", supplier, warehouse, "lead_time")
+    print(f"lead time history of {supplier} -> {warehouse} from the edge cube: {time.perf_counter() - start:.6f} s")
@@ -0,0 +1,80 @@
+"""
+Small hand-built snapshots for the tests, where every expected value can be
+worked out by hand.
+"""
+from temporal_cube import EdgeCube, NodeCube
+
+NODE_COLUMNS = {
+    "SUPPLIERS": ["node_type", "name", "id"],
+    "WAREHOUSE": ["node_type", "name", "id"],
+    "PARTS": ["node_type", "name", "type", "cost", "id"],
+    "FACILITY": ["node_type", "name", "type", "max_capacity", "operating_cost", "id"],
+    "PRODUCT_OFFERING": ["node_type", "name", "id"],
+}
+LINK_COLUMNS = {
+    "SUPPLIERSToWAREHOUSE": ["relationship_type", "transportation_cost", "lead_time", "source", "target"],
+    "WAREHOUSEToPARTS": ["relationship_type", "inventory_level", "storage_cost", "source", "target"],
+    "PARTSToFACILITY": ["relationship_type", "quantity", "distance", "transport_cost", "lead_time", "source", "target"],
+    "FACILITYToPRODUCT_OFFERING": ["relationship_type", "product_cost", "lead_time", "quantity", "source", "target"],
+    "WAREHOUSEToPRODUCT_OFFERING": ["relationship_type", "inventory_level", "storage_cost", "source", "target"],
+    "FACILITYToPARTS": ["relationship_type", "production_cost", "lead_time", "quantity", "source", "target"],
+}
+
+
+def snapshot(nodes, links):
+    """Snapshot payload from {node_type: [attribute rows without node_type]} and {link_type: [rows without relationship_type]}."""
+    return {
+        "directed": True,
+        "multigraph": False,
+        "graph": {},
+        "node_types": {node_type: NODE_COLUMNS[node_type] for node_type in nodes},
+        "relationship_types": {link_type: LINK_COLUMNS[link_type] for link_type in links},
+        "node_values": {node_type: [[node_type, *row] for row in rows] for node_type, rows in nodes.items()},
+        "link_values": {link_type: [[link_type, *row] for row in rows] for link_type, rows in links.items()},
+    }
+
+
+def supply_chain(**changes):
+    """
+    Two suppliers, two warehouses, two parts, two facilities and one product:
+
+        S_1 -> W_1 (cost 10, 5 days)    S_2 -> W_1 (cost 1, 9 days)    S_2 -> W_2 (cost 4, 2 days)
+        W_1 -> P_1 (50 in stock)        W_2 -> P_1 (30 in stock)       W_2 -> P_2 (20 in stock)
+        P_1 -> F_1 (2 a unit, 3 days)   P_2 -> F_1 (1 a unit, 7 days)  P_1 -> F_2 (1 a unit, 1 day)
+        F_1 -> PO_1 (cost 10, 4 days)   F_2 -> PO_1 (cost 50, 1 day)   W_1 -> PO_1 (5 in stock)
+    """
+    nodes = {
+        "SUPPLIERS": [["Supplier 1", "S_1"], ["Supplier 2", "S_2"]],
+        "WAREHOUSE": [["Warehouse 1", "W_1"], ["Warehouse 2", "W_2"]],
+        "PARTS": [["Part 1", "raw", 2.0, "P_1"], ["Part 2", "raw", 3.0, "P_2"]],
+        "FACILITY": [["Facility 1", "lam", 100, 50.0, "F_1"], ["Facility 2", "external", 10, 5.0, "F_2"]],
+        "PRODUCT_OFFERING": [["Product 1", "PO_1"]],
+    }
+    links = {
+        "SUPPLIERSToWAREHOUSE": [[10.0, 5, "S_1", "W_1"], [1.0, 9, "S_2", "W_1"], [4.0, 2, "S_2", "W_2"]],
+        "WAREHOUSEToPARTS": [[50, 1.0, "W_1", "P_1"], [30, 1.0, "W_2", "P_1"], [20, 2.0, "W_2", "P_2"]],
+        "PARTSToFACILITY": [[2, 10.0, 1.0, 3, "P_1", "F_1"], [1, 10.0, 1.0, 7, "P_2", "F_1"], [1, 10.0, 5.0, 1, "P_1", "F_2"]],
+        "FACILITYToPRODUCT_OFFERING": [[10.0, 4, 1, "F_1", "PO_1"], [50.0, 1, 1, "F_2", "PO_1"]],
+        "WAREHOUSEToPRODUCT_OFFERING": [[5, 1.0, "W_1", "PO_1"]],
+    }
+    nodes.update(changes.pop("nodes", {}))
+    links.update(changes.pop("links", {}))
+    return snapshot(nodes, links)
+
+
+def node_cube(*snapshots):
+    """NodeCube with one timestamp, "0", "1", ..., per snapshot."""
+    cube = NodeCube()
+    for timestamp, data in enumerate(snapshots):
+        cube.add_snapshot(str(timestamp), data)
+    cube.finish_update()
+    return cube
+
+
+def edge_cube(*snapshots):
+    """EdgeCube with one timestamp, "0", "1", ..., per snapshot."""
+    cube = EdgeCube()
+    for timestamp, data in enumerate(snapshots):
+        cube.add_snapshot(str(timestamp), data)
+    cube.finish_update()
+    return cube
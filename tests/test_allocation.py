@@ -0,0 +1,34 @@
+"""
+Allocation of order queues on hand-built snapshots.
+"""
+from allocation import STATUS_LABELS, AllocationLedger
+from query_engine import QueryEngine
+from snapshots import supply_chain
+
+
+def test_orders_draw_on_the_stock_the_previous_ones_left():
+    ledger = AllocationLedger(QueryEngine(supply_chain()))
+    state = ledger.start()
+    first = state.allocate("PO_1", 3)
+    assert first["Status"] == STATUS_LABELS[1] and first["Warehouse Units"] == 3
+
+    # 2 units left in W_1, the other 10 are made in F_1 from 20 P_1 and 10 P_2
+    second = state.allocate("PO_1", 12)
+    assert second["Status"] == STATUS_LABELS[2]
+    assert (second["Warehouse Units"], second["Facility"], second["Manufactured Units"]) == (2.0, "F_1", 10)
+    # P_1 is drawn from W_1 first, in file order of the WAREHOUSEToPARTS edges
+    assert state.part_stock.tolist() == [30.0, 30.0, 10.0]
+    assert state.capacity[ledger.facility_index["F_1"]] == 90
+
+
+def test_an_unfilled_order_gives_its_warehouse_units_back():
+    state = AllocationLedger(QueryEngine(supply_chain())).start()
+    # 5 from W_1, then 25 to make: F_1 lacks P_2, F_2 lacks capacity
+    unfilled = state.allocate("PO_1", 30)
+    assert unfilled["Status"] == STATUS_LABELS[3]
+    assert (unfilled["Warehouse Units"], unfilled["Unfilled Units"]) == (0.0, 30.0)
+    assert unfilled["Facility"] == "F_1" and unfilled["Short Parts"] == "P_2 (5)"
+    assert state.product_stock.tolist() == [5.0]
+
+    after = state.allocate("PO_1", 5)
+    assert after["Status"] == STATUS_LABELS[1] and after["Warehouse Units"] == 5
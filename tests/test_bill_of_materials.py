@@ -0,0 +1,79 @@
+"""
+Bill of materials of hand-built snapshots.
+"""
+import pytest
+
+from bill_of_materials import BillOfMaterials
+from feasibility import FeasibilityEvaluator
+from query_engine import QueryEngine
+from snapshots import supply_chain
+
+
+def with_subassemblies():
+    """
+    PO_1 is made in F_1 from 1 P_1, 2 P_3 and 1 P_5:
+
+        P_3 (F_2, 2 a run): 4 P_1 and 2 P_4 a run
+        P_4 (F_3, 1 a run): 5 P_7
+        P_5 (F_4, 1 a run): 1 P_6 and 3 P_2
+        P_6 (F_5, 1 a run): 1 P_5, so P_5 and P_6 need each other
+
+    F_4 also lists the raw P_7 as made, which gives it no recipe.
+    """
+    parts = [["Part %d" % i, "subassembly" if i in (3, 4, 5, 6) else "raw", float(i), "P_%d" % i] for i in range(1, 8)]
+    facilities = [["Facility %d" % i, "lam", 100, cost, "F_%d" % i] for i, cost in ((1, 50.0), (2, 5.0), (3, 1.0), (4, 2.0), (5, 4.0))]
+    return supply_chain(
+        nodes={"PARTS": parts, "FACILITY": facilities},
+        links={
+            "PARTSToFACILITY": [
+                [1, 10.0, 1.0, 3, "P_1", "F_1"], [2, 10.0, 1.0, 3, "P_3", "F_1"], [1, 10.0, 1.0, 3, "P_5", "F_1"],
+                [4, 10.0, 4.0, 3, "P_1", "F_2"], [2, 10.0, 2.0, 3, "P_4", "F_2"],
+                [5, 10.0, 3.0, 3, "P_7", "F_3"],
+                [1, 10.0, 1.0, 3, "P_6", "F_4"], [3, 10.0, 6.0, 3, "P_2", "F_4"],
+                [1, 10.0, 1.0, 3, "P_5", "F_5"],
+            ],
+            "FACILITYToPRODUCT_OFFERING": [[10.0, 4, 1, "F_1", "PO_1"]],
+            "FACILITYToPARTS": [
+                [1.0, 2, 2, "F_2", "P_3"], [1.0, 2, 1, "F_3", "P_4"], [1.0, 2, 1, "F_4", "P_5"],
+                [1.0, 2, 1, "F_5", "P_6"], [1.0, 2, 1, "F_4", "P_7"],
+            ],
+        },
+    )
+
+
+def test_bill_without_subassemblies_is_the_one_level_bill():
+    bom = BillOfMaterials(QueryEngine(supply_chain()))
+    assert not bom.has_recipes and bom.cycles == []
+    # F_1 and F_2 both make PO_1, a part of both keeps the values of the last facility
+    assert bom.flattened("PO_1").to_dict() == {"P_1": 1.0, "P_2": 1.0}
+    assert bom.built("PO_1").empty
+    assert bom.facilities("PO_1") == ["F_1", "F_2"]
+
+
+def test_bill_expands_subassemblies_through_their_makers():
+    bom = BillOfMaterials(QueryEngine(with_subassemblies()))
+    assert bom.has_recipes
+    # P_3 is 2 P_1 and 1 P_4 a unit, P_4 is 5 P_7, P_5 takes P_6, on its own cycle, from stock
+    assert bom.flattened("PO_1").to_dict() == {"P_1": 5.0, "P_2": 3.0, "P_6": 1.0, "P_7": 10.0}
+    assert bom.built("PO_1").to_dict() == {"P_3": 2.0, "P_4": 2.0, "P_5": 1.0}
+    assert bom.transport_costs("PO_1").to_dict() == {"P_1": 5.0, "P_2": 6.0, "P_3": 1.0, "P_4": 2.0, "P_5": 1.0, "P_6": 1.0, "P_7": 6.0}
+    assert bom.facilities("PO_1") == ["F_1", "F_2", "F_3", "F_4"]
+    assert [sorted(cycle) for cycle in bom.cycles] == [["P_5", "P_6"]]
+
+    assert bom.requirements("PO_1", 3).to_dict() == {"P_1": 15.0, "P_2": 9.0, "P_6": 3.0, "P_7": 30.0}
+    assert bom.cost("PO_1", 2) == pytest.approx(2 * (5 * 1.0 + 3 * 2.0 + 1 * 6.0 + 10 * 7.0))
+    shortfall = bom.shortfall("PO_1", 20).set_index("Part")
+    # 50 + 30 units of P_1 and 20 of P_2 are in stock, none of P_6 and P_7
+    assert shortfall["Short"].to_dict() == {"P_1": 20.0, "P_2": 40.0, "P_6": 20.0, "P_7": 200.0}
+    assert shortfall.loc["P_6", "Subassembly on a cycle"] and not shortfall.loc["P_7", "Subassembly on a cycle"]
+
+
+def test_batch_orders_use_the_flattened_bill():
+    engine = QueryEngine(with_subassemblies())
+    evaluator = FeasibilityEvaluator(engine, BillOfMaterials(engine))
+    result = evaluator.evaluate([("PO_1", 10)]).iloc[0]
+    # 5 from W_1, 5 made: 25 P_1 and 15 P_2 are in stock, 5 P_6 and 50 P_7 are not
+    assert result["Units to Manufacture"] == 5
+    assert (result["Short Parts"], result["Shortfall Units"]) == ("P_6, P_7", 55)
+    # transport 5 (P_3) + 25 + 5 + 10 + 30 + 5 + 30, and the operating cost of F_1 to F_4
+    assert result["Manufacturing Cost"] == 110 + 58
@@ -0,0 +1,47 @@
+"""Landed cost of the products of hand-built snapshots."""
+import numpy as np
+import pandas as pd
+
+from cost_rollup import CostRollup
+from snapshots import edge_cube, node_cube, supply_chain
+
+
+def rollup(*snapshots):
+    return CostRollup(node_cube(*snapshots), edge_cube(*snapshots))
+
+
+def test_cheapest_route_by_timestamp():
+    # F_1 is dropped at 1, nothing makes PO_1 at 2
+    snapshots = (
+        supply_chain(),
+        supply_chain(links={"FACILITYToPRODUCT_OFFERING": [[50.0, 1, 1, "F_2", "PO_1"]]}),
+        supply_chain(links={"FACILITYToPRODUCT_OFFERING": []}),
+    )
+    costs = rollup(*snapshots)
+
+    # F_1: 2 P_1 and 1 P_2 at 2 + 3, storage 2 * 1 + 2 (P_1 at 1 in both warehouses), transport 1 + 1, production 10
+    breakdown = costs.breakdown(0)
+    assert breakdown.loc["PO_1"].to_dict() == {
+        "Facility": "F_1", "Part Cost": 7.0, "Storage Cost": 4.0, "Transport Cost": 2.0,
+        "Production Cost": 10.0, "Operating Cost": 50.0, "Landed Cost": 23.0,
+    }
+    # F_2: 1 P_1 at 2, storage 1, transport 5, production 50
+    assert costs.table()["PO_1"].tolist()[:2] == [23.0, 58.0]
+    assert np.isnan(costs.table()["PO_1"].tolist()[2])
+    assert pd.isna(costs.breakdown(2).loc["PO_1", "Facility"])
+
+    routes = costs.routes(0)
+    assert routes[["Facility", "Landed Cost", "Cheapest"]].values.tolist() == [["F_1", 23.0, True], ["F_2", 58.0, False]]
+    assert costs.routes(1, "F_1").empty
+    # the operating cost is added once, not per unit
+    assert costs.cost("PO_1", 0, 10) == 23.0 * 10 + 50.0
+    assert costs.series("PO_9").isna().all().all()
+
+
+def test_tie_keeps_the_first_route():
+    # F_2 lands at 2 + 1 + 5 plus its production cost, F_1 at 23
+    cheaper = supply_chain(links={"FACILITYToPRODUCT_OFFERING": [[10.0, 4, 1, "F_1", "PO_1"], [14.0, 1, 1, "F_2", "PO_1"]]})
+    tie = supply_chain(links={"FACILITYToPRODUCT_OFFERING": [[10.0, 4, 1, "F_1", "PO_1"], [15.0, 1, 1, "F_2", "PO_1"]]})
+    costs = rollup(cheaper, tie)
+    assert costs.breakdown(0).loc["PO_1", "Facility"] == "F_2"
+    assert costs.breakdown(1).loc["PO_1", "Facility"] == "F_1"
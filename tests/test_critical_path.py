@@ -0,0 +1,26 @@
+"""
+Critical-path lead times of hand-built snapshots.
+"""
+import numpy as np
+
+from critical_path import LeadTimes
+from snapshots import edge_cube, supply_chain
+
+
+def test_critical_path_takes_the_fastest_alternative_and_the_slowest_required_part():
+    lead_times = LeadTimes(edge_cube(supply_chain()))
+    # W_2 2 days, P_1 and P_2 from W_2 at 2, F_1 waits for P_2 (9), F_2 for P_1 (3), PO_1 from F_2
+    assert lead_times.lead_time("PO_1", 0) == 4
+    assert lead_times.lead_time("PO_1", 0, ["F_1"]) == 13
+    assert lead_times.chain("PO_1", 0)["From"].tolist() == ["S_2", "W_2", "P_1", "F_2"]
+    chain = lead_times.chain("PO_1", 0, ["F_1"])
+    assert chain["From"].tolist() == ["S_2", "W_2", "P_2", "F_1"]
+    assert chain["Completes"].tolist() == [2, 2, 9, 13]
+
+
+def test_critical_path_skips_edges_missing_at_a_timestamp():
+    without_f2 = supply_chain(links={"FACILITYToPRODUCT_OFFERING": [[10.0, 4, 1, "F_1", "PO_1"]]})
+    without_makers = supply_chain(links={"FACILITYToPRODUCT_OFFERING": []})
+    lead_times = LeadTimes(edge_cube(supply_chain(), without_f2, without_makers))
+    assert lead_times.series("PO_1")[:2].tolist() == [4, 13]
+    assert np.isnan(lead_times.lead_time("PO_1", 2)) and lead_times.chain("PO_1", 2).empty
@@ -0,0 +1,107 @@
+"""
+Version sync against a local stand-in of the archive server.
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from downloader import read_manifest, sync_version
+from snapshot_store import list_snapshot_files, read_snapshot_file
+from snapshots import supply_chain
+
+TIMESTAMPS = ["0", "1", "2"]
+
+
+class ArchiveServer:
+    """Serves /timestamps and /data/<timestamp>; the timestamps in failing answer 500."""
+
+    def __init__(self):
+        self.failing = set()
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+                if self.path == "/timestamps":
+                    self.answer(200, TIMESTAMPS)
+                elif self.path.startswith("/data/") and self.path[len("/data/"):] in TIMESTAMPS:
+                    timestamp = self.path[len("/data/"):]
+                    if timestamp in server.failing:
+                        self.answer(500, {"error": "unavailable"})
+                    else:
+                        self.answer(200, supply_chain(nodes={"PRODUCT_OFFERING": [[f"Product {timestamp}", "PO_1"]]}))
+                else:
+                    self.answer(404, {})
+
+            def answer(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def snapshot_requests(self):
+        return sorted(path for path in self.requests if path.startswith("/data/"))
+
+
+@pytest.fixture
+def server():
+    archive = ArchiveServer()
+    thread = threading.Thread(target=archive.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield archive
+    archive.httpd.shutdown()
+    archive.httpd.server_close()
+
+
+def sync(server, target):
+    server.requests.clear()
+    return sync_version(f"{server.url}/timestamps", f"{server.url}/data", str(target), max_workers=2)
+
+
+def test_failed_and_interrupted_timestamps_are_fetched_by_the_next_sync(server, tmp_path):
+    # a download interrupted before the rename left only its temporary file
+    (tmp_path / "0.msgpack.part").write_bytes(b"\x92\x01")
+    server.failing.add("1")
+
+    first = sync(server, tmp_path)
+    assert sorted(first["downloaded"]) == ["0", "2"] and list(first["failed"]) == ["1"]
+    assert read_manifest(str(tmp_path)) == {"0", "2"}
+    assert read_snapshot_file(str(tmp_path / "0.msgpack"))["node_values"]["PRODUCT_OFFERING"] == [["PRODUCT_OFFERING", "Product 0", "PO_1"]]
+    assert not (tmp_path / "0.msgpack.part").exists()
+
+    server.failing.clear()
+    second = sync(server, tmp_path)
+    assert second["downloaded"] == ["1"] and second["failed"] == {}
+    assert server.snapshot_requests() == ["/data/1"]
+
+    third = sync(server, tmp_path)
+    assert third["downloaded"] == [] and server.snapshot_requests() == []
+    assert [os.path.basename(path) for path in list_snapshot_files(str(tmp_path))] == ["0.msgpack", "1.msgpack", "2.msgpack"]
+
+
+def test_a_recorded_snapshot_deleted_from_the_folder_is_fetched_again(server, tmp_path):
+    sync(server, tmp_path)
+    os.remove(tmp_path / "2.msgpack")
+    again = sync(server, tmp_path)
+    assert again["downloaded"] == ["2"] and server.snapshot_requests() == ["/data/2"]
+    assert read_manifest(str(tmp_path)) == {"0", "1", "2"}
+
+
+def test_files_from_before_the_manifest_are_adopted(server, tmp_path):
+    with open(tmp_path / "1.json", "w") as f:
+        json.dump(supply_chain(), f)
+    result = sync(server, tmp_path)
+    assert sorted(result["downloaded"]) == ["0", "2"]
+    assert server.snapshot_requests() == ["/data/0", "/data/2"]
@@ -0,0 +1,54 @@
+"""Bounded ego graphs and their cache."""
+from csr_graph import CSRGraph
+from ego_graph import EgoGraphService, bounded_ego_graph
+from mmap_store import SnapshotArrays
+from snapshots import supply_chain
+from TemporalGraphClass import json_to_graph
+
+
+def test_walk_ignores_direction_and_stops_at_the_budget():
+    graph = json_to_graph(supply_chain())
+
+    ego, truncated = bounded_ego_graph(graph, "P_1", 1)
+    assert not truncated and set(ego) == {"P_1", "W_1", "W_2", "F_1", "F_2"}
+    assert set(ego.edges) == {("W_1", "P_1"), ("W_2", "P_1"), ("P_1", "F_1"), ("P_1", "F_2")}
+    assert ego.nodes["P_1"]["cost"] == 2.0 and ego.edges["W_1", "P_1"]["inventory_level"] == 50
+
+    ego, truncated = bounded_ego_graph(graph, "P_1", 2)
+    assert not truncated and set(ego) == set(graph)
+
+    # nearest first: the budget fills up with neighbors before anything two hops away
+    ego, truncated = bounded_ego_graph(graph, "P_1", 3, node_budget=5)
+    assert truncated and set(ego) == {"P_1", "W_1", "W_2", "F_1", "F_2"}
+
+    assert bounded_ego_graph(graph, "P_9", 2)[0].number_of_nodes() == 0
+
+
+def test_csr_graph_gives_the_same_ego_graph():
+    data = supply_chain()
+    ego, _ = bounded_ego_graph(json_to_graph(data), "W_2", 2)
+    csr_ego, _ = bounded_ego_graph(CSRGraph(SnapshotArrays.from_data(data)), "W_2", 2)
+    assert set(csr_ego) == set(ego) and set(csr_ego.edges) == set(ego.edges)
+
+
+def test_service_caches_and_reuses_layouts():
+    graphs = [json_to_graph(supply_chain()), json_to_graph(supply_chain())]
+    loads = []
+
+    def load_graph(timestamp):
+        loads.append(timestamp)
+        return graphs[timestamp]
+
+    service = EgoGraphService(max_entries=2)
+    first = service.ego_graph(0, "P_1", 1, load_graph)
+    assert service.ego_graph(0, "P_1", 1, load_graph) is first and loads == [0]
+    assert set(first.pos) == set(first.graph)
+
+    # the same nodes and edges at the next timestamp keep their positions
+    second = service.ego_graph(1, "P_1", 1, load_graph)
+    assert second.pos is first.pos and loads == [0, 1]
+
+    # the least recently used entry goes first
+    service.ego_graph(0, "F_1", 1, load_graph)
+    service.ego_graph(0, "P_1", 1, load_graph)
+    assert loads == [0, 1, 0, 0]
@@ -0,0 +1,58 @@
+"""Batch feasibility of orders against one snapshot."""
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from bill_of_materials import BillOfMaterials
+from feasibility import FeasibilityEvaluator, read_orders
+from mmap_store import SnapshotArrays
+from query_engine import QueryEngine
+from snapshots import supply_chain
+from supplier_catalog import SupplierCatalog
+
+
+def evaluator(data, backend="rows"):
+    engine = QueryEngine(arrays=SnapshotArrays.from_data(data)) if backend == "arrays" else QueryEngine(data)
+    return FeasibilityEvaluator(engine, BillOfMaterials(engine))
+
+
+def test_every_status_of_a_batch():
+    # PO_1 takes 1 P_1 (transport 5) and 1 P_2 (transport 1); 5 units in stock, 80 P_1 and 20 P_2
+    catalog = SupplierCatalog({"S_1": ["P_1"], "S_2": ["P_2", "P_1"], "S_3": ["P_2"]})
+    result = evaluator(supply_chain()).evaluate(
+        [("PO_1", 3), ("PO_1", 10), ("PO_1", 30), ("PO_9", 5), ("PO_1", -1)],
+        catalog=catalog, lead_times=pd.Series({"PO_1": 7.0}),
+    )
+
+    assert result["Status"].tolist() == ["Warehouse stock", "Manufacture", "Parts short", "Invalid order", "Invalid order"]
+    assert result["Warehouse Units"].tolist() == [5, 5, 5, 0, 0]
+    assert result["Units to Manufacture"].tolist() == [0, 5, 25, 0, 0]
+    # transport of the parts, and the operating cost of F_1 and F_2 that both make PO_1
+    assert result["Manufacturing Cost"].tolist() == [0, 5 * 6 + 55, 25 * 6 + 55, 0, 0]
+    assert result["Manufacturing Time"].tolist() == [0, 7, 7, 0, 0]
+    assert result.loc[2, ["Short Parts", "Shortfall Units", "Supplier Options"]].tolist() == ["P_2", 5, "S_2, S_3"]
+    assert result.loc[1, ["Short Parts", "Supplier Options"]].tolist() == ["", ""]
+
+
+def test_time_without_a_lead_time_is_nan():
+    result = evaluator(supply_chain()).evaluate([("PO_1", 10)])
+    assert np.isnan(result.loc[0, "Manufacturing Time"])
+
+
+@pytest.mark.parametrize("backend", ["rows", "arrays"])
+def test_repeated_facility_keeps_its_last_row(backend):
+    facilities = [["Facility 1", "lam", 100, 50.0, "F_1"], ["Facility 2", "external", 10, 5.0, "F_2"], ["Facility 1", "lam", 100, 20.0, "F_1"]]
+    batch = evaluator(supply_chain(nodes={"FACILITY": facilities}), backend)
+
+    assert batch.facility_cost.to_dict() == {"PO_1": 25.0}
+    assert batch.evaluate([("PO_1", 10)]).loc[0, "Manufacturing Cost"] == 5 * 6 + 25
+
+
+def test_orders_from_csv():
+    orders = read_orders(io.StringIO("Product_ID, Units\n PO_1 ,10\nPO_2,many\n"))
+    assert orders["product_id"].tolist() == ["PO_1", "PO_2"]
+    assert orders["units"].tolist()[0] == 10 and np.isnan(orders["units"].tolist()[1])
+    with pytest.raises(ValueError):
+        read_orders(io.StringIO("product,units\nPO_1,10\n"))
@@ -0,0 +1,71 @@
+"""Plotly traces of graphs, bundled within the edge budget."""
+from collections import Counter
+
+import networkx as nx
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+from graph_render import GraphArrays, bundle_edges, edge_traces, node_trace, scatter_class
+from snapshots import supply_chain
+from TemporalGraphClass import json_to_graph
+
+KINDS = ["PARTSToFACILITY", "WAREHOUSEToPARTS", "SUPPLIERSToWAREHOUSE"]
+
+
+def random_graph(nodes, edges, seed=0):
+    rng = np.random.default_rng(seed)
+    graph = nx.DiGraph()
+    graph.add_nodes_from((f"N_{i}", {"node_type": "PARTS"}) for i in range(nodes))
+    for u, v in rng.integers(0, nodes, (edges, 2)).tolist():
+        graph.add_edge(f"N_{u}", f"N_{v}", relationship_type=KINDS[(u + v) % 3])
+    pos = {node: xy for node, xy in zip(graph.nodes, rng.uniform(-1, 1, (nodes, 2)))}
+    return GraphArrays(graph, pos)
+
+
+@pytest.mark.parametrize("edge_budget", [2000, 300, 20, 3])
+def test_bundles_fit_the_budget_and_keep_every_edge(edge_budget):
+    arrays = random_graph(1000, 5000)
+    start, end, kinds, count = bundle_edges(arrays, edge_budget)
+
+    # one bundle per relationship type at the least, however small the budget
+    assert len(count) <= max(edge_budget, len(KINDS))
+    assert count.sum() == len(arrays.src)
+    totals = Counter()
+    for kind, edges in zip(kinds.tolist(), count.tolist()):
+        totals[kind] += edges
+    assert totals == Counter(arrays.link_types.tolist())
+    assert np.allclose((start * count[:, None]).sum(axis=0), arrays.xy[arrays.src].sum(axis=0))
+    assert np.allclose((end * count[:, None]).sum(axis=0), arrays.xy[arrays.dst].sum(axis=0))
+
+
+def test_edges_within_the_budget_are_drawn_as_they_are():
+    arrays = random_graph(50, 100)
+    start, end, kinds, count = bundle_edges(arrays, edge_budget=len(arrays.src))
+    assert (count == 1).all() and np.array_equal(start, arrays.xy[arrays.src]) and np.array_equal(end, arrays.xy[arrays.dst])
+
+
+def test_render_modes():
+    small, large = random_graph(10, 10), random_graph(1000, 1000)
+    assert scatter_class(small) is go.Scatter and scatter_class(large) is go.Scattergl
+    assert scatter_class(small, "webgl") is go.Scattergl and scatter_class(large, "svg") is go.Scatter
+    with pytest.raises(ValueError):
+        scatter_class(small, "canvas")
+
+
+def test_hovers_carry_the_attributes():
+    graph = json_to_graph(supply_chain())
+    arrays = GraphArrays(graph, {node: (i, i) for i, node in enumerate(graph)})
+
+    traces = edge_traces(arrays, color={"WAREHOUSEToPARTS": "blue"})
+    hovers = {trace.hovertemplate.split("</b>")[0][3:]: trace for trace in traces if trace.mode == "markers"}
+    stock = hovers["WAREHOUSEToPARTS"]
+    assert [row[:3].tolist() for row in stock.customdata] == [["W_1", "P_1", 50], ["W_2", "P_1", 30], ["W_2", "P_2", 20]]
+    assert "inventory_level: %{customdata[2]}" in stock.hovertemplate
+    assert any(trace.line.color == "blue" for trace in traces if trace.mode == "lines")
+
+    rows = arrays.of_type("PARTS")
+    parts = node_trace(arrays, rows, title="Parts", degrees=True)
+    # id, connections, incoming, outgoing, then the attributes
+    assert parts.customdata[0][:4].tolist() == ["P_1", 4, 2, 2]
+    assert "cost: %{customdata[" in parts.hovertemplate and "node_type" not in parts.hovertemplate
@@ -0,0 +1,65 @@
+"""Force layouts and the global layout of a version."""
+import numpy as np
+
+from layout_engine import LAYOUT_FOLDER, GlobalLayout, force_layout, layout_graph, update_global_layout
+from snapshots import edge_cube, node_cube, supply_chain
+from temporal_cube import published_folder
+from TemporalGraphClass import json_to_graph
+
+
+def ring(n):
+    """A cycle of n nodes with a chord every tenth node."""
+    sources = np.concatenate([np.arange(n), np.arange(0, n, 10)])
+    targets = np.concatenate([(np.arange(n) + 1) % n, (np.arange(0, n, 10) + n // 2) % n])
+    return sources, targets
+
+
+def test_layout_is_bounded_deterministic_and_keeps_neighbors_close():
+    # past the exact repulsion size, so the coarsening and the quadtree both run
+    n = 2000
+    sources, targets = ring(n)
+    pos = force_layout(n, sources, targets)
+
+    assert pos.shape == (n, 2) and np.isfinite(pos).all() and np.abs(pos).max() <= 1
+    assert np.array_equal(pos, force_layout(n, sources, targets))
+    neighbors = np.linalg.norm(pos[sources] - pos[targets], axis=1).mean()
+    pairs = np.random.default_rng(1).integers(0, n, (2, 1000))
+    anyone = np.linalg.norm(pos[pairs[0]] - pos[pairs[1]], axis=1).mean()
+    assert neighbors < anyone / 4
+
+    assert force_layout(0, [], []).shape == (0, 2)
+
+
+def test_refining_places_the_new_nodes_and_keeps_the_others_near():
+    n = 100
+    sources, targets = ring(n)
+    pos = force_layout(n, sources, targets)
+    initial = pos.copy()
+    initial[:5] = np.nan
+
+    refined = force_layout(n, sources, targets, initial)
+    assert np.isfinite(refined).all()
+    assert np.linalg.norm(refined[5:] - pos[5:], axis=1).mean() < 0.25
+
+
+def test_layout_graph_names_the_positions():
+    graph = json_to_graph(supply_chain())
+    pos = layout_graph(graph)
+    assert set(pos) == set(graph) and all(len(xy) == 2 for xy in pos.values())
+
+
+def test_global_layout_is_persisted_and_refined_by_new_timestamps(tmp_path):
+    snapshots = [supply_chain(), supply_chain(nodes={"SUPPLIERS": [["Supplier 1", "S_1"], ["Supplier 2", "S_2"], ["Supplier 3", "S_3"]]})]
+    files = [str(tmp_path / f"{timestamp}.json") for timestamp in range(2)]
+
+    first = update_global_layout(files[:1], node_cube(*snapshots[:1]), edge_cube(*snapshots[:1]))
+    assert "S_3" not in first and set(first.positions(["P_1", "S_3"])) == {"P_1"}
+    saved = GlobalLayout.load(str(tmp_path / LAYOUT_FOLDER))
+    assert saved.node_ids == first.node_ids and np.array_equal(saved.pos, first.pos)
+
+    # the same timestamps are read back, a new one adds its nodes
+    assert np.array_equal(update_global_layout(files[:1], None, None).pos, first.pos)
+    second = update_global_layout(files, node_cube(*snapshots), edge_cube(*snapshots))
+    assert "S_3" in second and second.timestamps == ["0", "1"]
+    assert GlobalLayout.load(str(tmp_path / LAYOUT_FOLDER)).node_ids == second.node_ids
+    assert published_folder(str(tmp_path / LAYOUT_FOLDER)) is not None
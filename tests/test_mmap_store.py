@@ -0,0 +1,34 @@
+"""
+Memory-mapped snapshots of hand-built snapshots.
+"""
+from mmap_store import MmapSnapshot, write_mmap_snapshot
+from snapshots import supply_chain
+from TemporalGraphClass import TemporalSnapshot, TypedAdjacency
+
+
+def test_mmap_snapshot_reads_back_the_payload_and_its_adjacency(tmp_path):
+    data = supply_chain()
+    # a list column with the same value on every row must not be stored as one scalar
+    data["node_types"]["WAREHOUSE"] = ["node_type", "name", "zones", "id"]
+    data["node_values"]["WAREHOUSE"] = [["WAREHOUSE", "Warehouse 1", ["a", "b"], "W_1"], ["WAREHOUSE", "Warehouse 2", ["a", "b"], "W_2"]]
+    write_mmap_snapshot(data, str(tmp_path / "snapshot"))
+    arrays = MmapSnapshot(str(tmp_path / "snapshot"))
+    assert arrays.to_data() == data
+
+    mapped, reference = TemporalSnapshot(arrays=arrays), TypedAdjacency(data)
+    assert mapped.data["node_values"]["WAREHOUSE"] == data["node_values"]["WAREHOUSE"]
+    for link_type in data["link_values"]:
+        assert mapped.adjacency.edges(link_type, data=True) == reference.edges(link_type, data=True)
+        for node in ("W_1", "P_1", "F_1", "PO_1"):
+            assert mapped.adjacency.in_edges(link_type, node, data=True) == reference.in_edges(link_type, node, data=True)
+            assert mapped.adjacency.out_edges(link_type, node, data=True) == reference.out_edges(link_type, node, data=True)
+
+
+def test_a_published_mmap_folder_is_never_replaced(tmp_path):
+    folder = str(tmp_path / "snapshot")
+    write_mmap_snapshot(supply_chain(), folder)
+    changed = supply_chain(nodes={"PRODUCT_OFFERING": [["Product 1", "PO_1"], ["Product 2", "PO_2"]]})
+    write_mmap_snapshot(changed, folder)
+    # the first writer won, and no temporary folder is left behind
+    assert MmapSnapshot(folder).to_data() == supply_chain()
+    assert [path.name for path in tmp_path.iterdir()] == ["snapshot"]
@@ -0,0 +1,54 @@
+"""
+Path queries of hand-built snapshots.
+"""
+import pytest
+
+from mmap_store import SnapshotArrays
+from path_engine import PathEngine
+from snapshots import supply_chain
+
+
+def counting(function, calls):
+    """function, with every call appended to calls."""
+    def spy(*args):
+        calls.append(args)
+        return function(*args)
+    return spy
+
+
+@pytest.fixture
+def engine():
+    data = supply_chain()
+    data["node_values"]["SUPPLIERS"].append(["SUPPLIERS", "Supplier 3", "S_3"])
+    return PathEngine(SnapshotArrays.from_data(data))
+
+
+def test_path_engine_paths(engine):
+    # W_1 stocks PO_1 itself
+    assert engine.distance("S_1", "PO_1") == 2
+    assert engine.shortest_path("S_1", "S_2") == ["S_1", "W_1", "S_2"]
+    # 5 + 0 + 3 days through P_1, against 5 + 0 + 4 through PO_1
+    path, total = engine.weighted_path("S_1", "F_1", "lead_time")
+    assert path == ["S_1", "W_1", "P_1", "F_1"] and total == 8
+    assert [len(path) - 1 for path, _ in engine.k_shortest_paths("S_1", "PO_1", 2)] == [2, 4]
+    with pytest.raises(ValueError):
+        engine.distance("S_9", "PO_1")
+
+
+def test_unreachable_and_repeated_pairs_need_no_search(engine, monkeypatch):
+    searches = []
+    monkeypatch.setattr(engine, "_bidirectional_bfs", counting(engine._bidirectional_bfs, searches))
+    monkeypatch.setattr(engine, "_dijkstra", counting(engine._dijkstra, searches))
+
+    # S_3 has no edges: the landmarks answer without a search
+    assert engine.distance("S_3", "PO_1") is None
+    assert engine.shortest_path("S_3", "PO_1") is None
+    assert engine.weighted_path("S_3", "PO_1") == (None, None)
+    assert engine.k_shortest_paths("S_3", "PO_1") == []
+    assert searches == []
+
+    assert engine.shortest_path("S_1", "S_2") == ["S_1", "W_1", "S_2"]
+    assert len(searches) == 1
+    # the hop distance of the pair is remembered
+    assert engine.distance("S_2", "S_1") == 2
+    assert len(searches) == 1
@@ -0,0 +1,94 @@
+"""Predicate and interval queries of the QueryEngine."""
+import pytest
+
+from mmap_store import SnapshotArrays
+from query_engine import IntervalIndex, QueryEngine, col
+from snapshots import supply_chain
+
+
+@pytest.fixture(params=["rows", "arrays"])
+def engine(request):
+    data = supply_chain(nodes={
+        "SUPPLIERS": [["Supplier 1", "S_1"], ["Supplier 2", "S_2"], ["Supplier 3", "S_3"]],
+        "PARTS": [["Part 1", "raw", 2.0, "P_1"], ["Part 2", "raw", 3.0, "P_2"], ["Part 3", "sub", None, "P_3"]],
+    })
+    # a list column, as supplied_part_types
+    data["node_types"]["SUPPLIERS"] = ["node_type", "name", "supplied_part_types", "id"]
+    data["node_values"]["SUPPLIERS"] = [
+        ["SUPPLIERS", "Supplier 1", ["raw"], "S_1"],
+        ["SUPPLIERS", "Supplier 2", ["raw", "sub"], "S_2"],
+        ["SUPPLIERS", "Supplier 3", [], "S_3"],
+    ]
+    if request.param == "arrays":
+        return QueryEngine(arrays=SnapshotArrays.from_data(data))
+    return QueryEngine(data)
+
+
+def ids(frame):
+    return frame.index.tolist()
+
+
+def test_comparisons_and_combinations(engine):
+    assert ids(engine.select("PARTS", col("cost") <= 2.0)) == ["P_1"]
+    assert ids(engine.select("PARTS", col("cost") > 2.0)) == ["P_2"]
+    assert ids(engine.select("PARTS", col("cost").between(2.0, 3.0))) == ["P_1", "P_2"]
+    assert ids(engine.select("PARTS", col("type").isin(["sub"]))) == ["P_3"]
+    assert ids(engine.select("PARTS", (col("cost") < 3.0) | (col("type") == "sub"))) == ["P_1", "P_3"]
+    assert ids(engine.select("PARTS", (col("type") == "raw") & ~(col("cost") == 2.0))) == ["P_2"]
+
+
+def test_missing_values_and_columns_never_match(engine):
+    # P_3 has no cost: only != holds, as in pandas
+    assert ids(engine.select("PARTS", col("cost") >= 0)) == ["P_1", "P_2"]
+    assert ids(engine.select("PARTS", col("cost") != 2.0)) == ["P_2", "P_3"]
+    assert ids(engine.select("PARTS", col("reliability") >= 0)) == []
+    assert ids(engine.select("PARTS", col("reliability") != 0)) == []
+
+
+def test_list_columns(engine):
+    assert ids(engine.select("SUPPLIERS", col("supplied_part_types").contains("sub"))) == ["S_2"]
+    assert ids(engine.select("SUPPLIERS", col("supplied_part_types").contains("raw"))) == ["S_1", "S_2"]
+
+
+def test_sort_project_and_limit(engine):
+    frame = engine.select("PARTS", col("cost") > 0, sort_by="cost", ascending=False, columns=["name"], limit=1)
+    assert frame.to_dict("index") == {"P_2": {"name": "Part 2"}}
+
+
+def test_links_filtered_on_their_endpoints(engine):
+    frame = engine.select_links(
+        "PARTSToFACILITY", (col("target_operating_cost") < 10) | (col("source_cost") > 2.0),
+        target_columns=["operating_cost"], source_columns=["cost"],
+    )
+    assert list(zip(frame["source"], frame["target"])) == [("P_2", "F_1"), ("P_1", "F_2")]
+
+
+def test_interval_index_boundaries():
+    index = IntervalIndex(
+        ["a", "b", "c", "d", "e"],
+        ["2024-01-10", "2024-01-01", "2024-01-05", None, "2024-02-01"],
+        ["2024-01-20", "2024-01-10", "2024-01-05", "2024-01-05", "2024-03-01"],
+    )
+
+    assert index.unknown.tolist() == [3]
+    # both ends are inclusive, a one-day window on a shared end finds both intervals
+    assert index.overlapping("2024-01-10", "2024-01-10").tolist() == [0, 1]
+    assert index.overlapping("2024-01-05", "2024-01-05").tolist() == [1, 2]
+    assert index.overlapping("2024-01-21", "2024-01-31").tolist() == []
+    assert index.overlapping("2023-01-01", "2025-01-01").tolist() == [0, 1, 2, 4]
+    assert index.at_most(0).tolist() == [2]
+    assert index.at_most(9).tolist() == [1, 2]
+    assert index.at_most(10).tolist() == [0, 1, 2]
+
+
+def test_interval_index_of_unparseable_dates():
+    data = supply_chain()
+    data["node_types"]["PARTS"] = ["node_type", "name", "valid_from", "valid_till", "id"]
+    data["node_values"]["PARTS"] = [
+        ["PARTS", "Part 1", "2024-01-01", "2024-06-30", "P_1"],
+        ["PARTS", "Part 2", "someday", "2024-06-30", "P_2"],
+    ]
+    index = QueryEngine(data).interval_index("PARTS", "valid_from", "valid_till")
+
+    assert index.unknown.tolist() == [1]
+    assert index.ids[index.overlapping("2024-06-30", "2024-07-31")].tolist() == ["P_1"]
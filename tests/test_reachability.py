@@ -0,0 +1,32 @@
+"""Supplier to product offering reachability."""
+from mmap_store import SnapshotArrays
+from reachability import SupplierProductReachability
+from snapshots import supply_chain
+
+
+def test_products_of_and_suppliers_of():
+    data = supply_chain(
+        nodes={
+            "SUPPLIERS": [["Supplier 1", "S_1"], ["Supplier 2", "S_2"], ["Supplier 3", "S_3"]],
+            "PRODUCT_OFFERING": [["Product 1", "PO_1"], ["Product 2", "PO_2"]],
+        },
+        links={
+            # S_1 -> W_1 -> P_1 -> F_1 -> PO_1, S_2 also reaches P_2 -> F_2 -> PO_2 through W_2
+            "PARTSToFACILITY": [[2, 10.0, 1.0, 3, "P_1", "F_1"], [1, 10.0, 1.0, 7, "P_2", "F_1"], [1, 10.0, 5.0, 1, "P_2", "F_2"]],
+            "FACILITYToPRODUCT_OFFERING": [[10.0, 4, 1, "F_1", "PO_1"], [50.0, 1, 1, "F_2", "PO_2"]],
+        },
+    )
+    reachability = SupplierProductReachability(SnapshotArrays.from_data(data))
+
+    assert reachability.products_of("S_1") == ["PO_1"]
+    assert reachability.products_of("S_2") == ["PO_1", "PO_2"]
+    assert reachability.products_of("S_3") == []
+    # not a supplier, or not in the snapshot
+    assert reachability.products_of("W_1") == []
+    assert reachability.products_of("S_9") == []
+    assert reachability.suppliers_of("PO_1") == ["S_1", "S_2"]
+    assert reachability.suppliers_of("PO_2") == ["S_2"]
+    assert len(reachability) == 3
+    assert reachability.table.values.tolist() == [
+        ["Supplier 1", "PO_1"], ["Supplier 2", "PO_1, PO_2"], ["Supplier 3", "None"],
+    ]
@@ -0,0 +1,29 @@
+"""
+Cheapest and fastest supply routes of hand-built snapshots.
+"""
+from route_optimizer import ROUTE_NODES, RouteOptimizer
+from snapshots import edge_cube, supply_chain
+
+
+def test_route_optimizer_finds_the_cheapest_and_the_fastest_route():
+    routes = RouteOptimizer(edge_cube(supply_chain()))
+    cheapest = routes.best_routes(0, "cost").loc["PO_1"]
+    assert cheapest[ROUTE_NODES].tolist() == ["S_2", "W_1", "P_1", "F_1"]
+    assert (cheapest["Cost"], cheapest["Lead Time"]) == (13, 16)
+
+    fastest = routes.best_routes(0, "lead_time").loc["PO_1"]
+    assert fastest[ROUTE_NODES].tolist() == ["S_2", "W_2", "P_1", "F_2"]
+    assert (fastest["Cost"], fastest["Lead Time"]) == (60, 4)
+
+    route = routes.route("PO_1", 0, "cost")
+    assert route["Cost"].tolist() == [1, 1, 1, 10]
+    assert route["Cost"].sum() == routes.table("cost").loc["0", "PO_1"]
+
+
+def test_route_optimizer_breaks_cost_ties_by_lead_time():
+    # S_1 -> W_1 now costs as little as S_2 -> W_1 but takes 5 days instead of 9
+    tied = supply_chain(links={"SUPPLIERSToWAREHOUSE": [[1.0, 5, "S_1", "W_1"], [1.0, 9, "S_2", "W_1"], [4.0, 2, "S_2", "W_2"]]})
+    routes = RouteOptimizer(edge_cube(tied))
+    assert routes.best_routes(0, "cost").loc["PO_1", "Supplier"] == "S_1"
+    assert routes.best_routes(0, "cost_then_lead_time").loc["PO_1", "Supplier"] == "S_1"
+    assert routes.best_routes(0, "cost_then_lead_time").loc["PO_1", "Lead Time"] == 12
@@ -0,0 +1,49 @@
+"""Changes between two hand-built snapshots."""
+import numpy as np
+
+from mmap_store import SnapshotArrays
+from snapshot_diff import SnapshotDiff
+from snapshots import supply_chain
+
+FACILITIES = [["Facility 1", "lam", 100, 50.0, "F_1"], ["Facility 2", "external", 10, 0.0, "F_2"]]
+
+
+def diff():
+    before = supply_chain(nodes={"FACILITY": FACILITIES})
+    # S_1 and its link go, S_3 and a link to W_2 come, P_1 costs 20% more, P_2 1%,
+    # S_2 -> W_1 half as much, and F_2 starts operating at a cost
+    after = supply_chain(
+        nodes={
+            "SUPPLIERS": [["Supplier 2", "S_2"], ["Supplier 3", "S_3"]],
+            "PARTS": [["Part 1", "raw", 2.4, "P_1"], ["Part 2", "raw", 3.03, "P_2"]],
+            "FACILITY": [FACILITIES[0], ["Facility 2", "external", 10, 5.0, "F_2"]],
+        },
+        links={"SUPPLIERSToWAREHOUSE": [[0.5, 9, "S_2", "W_1"], [4.0, 2, "S_2", "W_2"], [3.0, 2, "S_3", "W_2"]]},
+    )
+    return SnapshotDiff(SnapshotArrays.from_data(before), SnapshotArrays.from_data(after))
+
+
+def test_added_and_removed():
+    changes = diff()
+    assert changes.nodes_added().values.tolist() == [["SUPPLIERS", "S_3"]]
+    assert changes.nodes_removed().values.tolist() == [["SUPPLIERS", "S_1"]]
+    assert changes.edges_added().values.tolist() == [["SUPPLIERSToWAREHOUSE", "S_3", "W_2"]]
+    assert changes.edges_removed().values.tolist() == [["SUPPLIERSToWAREHOUSE", "S_1", "W_1"]]
+
+
+def test_changes_above_a_threshold():
+    changes = diff()
+    moved = changes.node_changes(0.1)
+    assert moved[["Id", "Attribute", "Before", "After"]].values.tolist() == [
+        ["P_1", "cost", 2.0, 2.4], ["F_2", "operating_cost", 0.0, 5.0],
+    ]
+    assert np.allclose(moved["Change (%)"].iloc[0], 20) and np.isinf(moved["Change (%)"].iloc[1])
+    assert changes.node_changes(0.0, ["cost"])["Id"].tolist() == ["P_1", "P_2"]
+
+    edges = changes.edge_changes(0.1)
+    assert edges[["Source", "Target", "Attribute", "Change (%)"]].values.tolist() == [["S_2", "W_1", "transportation_cost", -50.0]]
+
+    summary = changes.summary(0.1).set_index(["Kind", "Type"])
+    assert summary.loc[("Node", "SUPPLIERS")].tolist() == [2, 2, 1, 1, 0]
+    assert summary.loc[("Node", "PARTS"), "Changed"] == 1
+    assert summary.loc[("Edge", "SUPPLIERSToWAREHOUSE")].tolist() == [3, 3, 1, 1, 1]
@@ -0,0 +1,88 @@
+"""Columnar snapshot files and deltas."""
+import json
+
+from snapshots import supply_chain
+from snapshot_store import (
+    apply_delta, convert_version_folder, delta_version_folder, list_snapshot_files, read_delta, read_snapshot,
+    read_snapshot_file, read_snapshot_files, write_delta, write_snapshot,
+)
+
+
+def test_round_trip_keeps_every_value_and_type(tmp_path):
+    data = supply_chain(nodes={
+        # a mixed column, a bool column, lists, an int too large for int64 and ragged rows
+        "PARTS": [["Part 1", "raw", 2.0, "P_1"], ["Part 2", "raw", 3, "P_2"]],
+        "WAREHOUSE": [["Warehouse 1", "W_1"], ["Warehouse 2", "W_2", "extra"]],
+        "SUPPLIERS": [[True, "S_1"], [False, "S_2"]],
+        "PRODUCT_OFFERING": [[["a", "b"], "PO_1"], [2 ** 63, "PO_2"]],
+    })
+    file_path = str(tmp_path / "0.msgpack")
+    write_snapshot(data, file_path)
+
+    loaded = read_snapshot(file_path)
+    assert loaded == data
+    assert [type(row[3]) for row in loaded["node_values"]["PARTS"]] == [float, int]
+    assert [type(row[1]) for row in loaded["node_values"]["SUPPLIERS"]] == [bool, bool]
+    assert type(loaded["link_values"]["WAREHOUSEToPARTS"][0][1]) is int
+
+
+def test_convert_version_folder(tmp_path):
+    first, second = supply_chain(), supply_chain(links={"WAREHOUSEToPRODUCT_OFFERING": []})
+    for timestamp, data in enumerate((first, second)):
+        (tmp_path / f"{timestamp}.json").write_text(json.dumps(data))
+    (tmp_path / "manifest.json").write_text("{}")
+
+    report = convert_version_folder(str(tmp_path), keep_json=True)
+
+    assert [row["timestamp"] for row in report] == [0, 1]
+    # the columnar file wins over the JSON one kept next to it
+    files = list_snapshot_files(str(tmp_path))
+    assert [path.rsplit("/", 1)[1] for path in files] == ["0.msgpack", "1.msgpack"]
+    assert [read_snapshot_file(path) for path in files] == [first, second]
+
+
+def drifted(step):
+    """supply_chain with the stock and the part costs of step, P_2 dropped from W_2 at odd steps."""
+    stock = [[50 - step, 1.0, "W_1", "P_1"], [30, 1.0, "W_2", "P_1"]] + ([] if step % 2 else [[20, 2.0, "W_2", "P_2"]])
+    return supply_chain(
+        nodes={"PARTS": [["Part 1", "raw", 2.0 + step, "P_1"], ["Part 2", "raw", 3.0, "P_2"]]},
+        links={"WAREHOUSEToPARTS": stock},
+    )
+
+
+def test_delta_round_trip(tmp_path):
+    base, data = drifted(0), drifted(1)
+    # an int that turns into a float is a change
+    data["link_values"]["WAREHOUSEToPARTS"][1][1] = 30.0
+    base_path, delta_path = str(tmp_path / "0.msgpack"), str(tmp_path / "1.delta")
+    write_snapshot(base, base_path)
+    write_delta(base, data, delta_path, base_path)
+
+    path, delta = read_delta(delta_path)
+    assert path == base_path
+    applied = apply_delta(base, delta)
+    assert applied == data
+    assert type(applied["link_values"]["WAREHOUSEToPARTS"][1][1]) is float
+    # types without changes share the rows of the base snapshot
+    assert applied["link_values"]["SUPPLIERSToWAREHOUSE"] is base["link_values"]["SUPPLIERSToWAREHOUSE"]
+    assert read_snapshot_file(delta_path) == data
+
+
+def test_keyframes_and_delta_chains(tmp_path):
+    snapshots = [drifted(step) for step in range(5)]
+    for timestamp, data in enumerate(snapshots):
+        (tmp_path / f"{timestamp}.json").write_text(json.dumps(data))
+
+    report = delta_version_folder(str(tmp_path), keyframe_interval=3)
+
+    assert [row["timestamp"] for row in report] == [1, 2, 4]
+    files = list_snapshot_files(str(tmp_path))
+    assert [path.rsplit("/", 1)[1] for path in files] == ["0.msgpack", "1.delta", "2.delta", "3.msgpack", "4.delta"]
+    # 2 is a delta on 1, which is a delta on the keyframe 0
+    assert read_delta(files[2])[0] == files[1] and read_delta(files[1])[0] == files[0]
+    assert [read_snapshot_file(path) for path in files] == snapshots
+    assert list(read_snapshot_files(files)) == snapshots
+
+    # a second run leaves the stored deltas as they are
+    assert delta_version_folder(str(tmp_path), keyframe_interval=3) == []
+    assert list(read_snapshot_files(list_snapshot_files(str(tmp_path)))) == snapshots
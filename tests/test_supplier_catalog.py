@@ -0,0 +1,107 @@
+"""
+Supplier catalog refresh, from a file and from a local stand-in of the
+supplier-data endpoint.
+"""
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import supplier_catalog
+from supplier_catalog import RemoteSupplierCatalog, SupplierCatalog, load_supplier_catalog
+
+SUPPLIER_PARTS = {"S_1": ["P_2", "P_1"], "S_2": ["P_1"], "S_3": []}
+
+
+class SupplierServer:
+    """Serves payload with etag; a matching If-None-Match answers 304, failing answers 500."""
+
+    def __init__(self):
+        self.payload = SUPPLIER_PARTS
+        self.etag = '"1"'
+        self.failing = False
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.headers.get("If-None-Match"))
+                if server.failing:
+                    self.send_response(500)
+                    self.end_headers()
+                    return
+                if self.headers.get("If-None-Match") == server.etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = json.dumps(server.payload).encode()
+                self.send_response(200)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/suppliers"
+
+
+@pytest.fixture
+def server():
+    endpoint = SupplierServer()
+    thread = threading.Thread(target=endpoint.httpd.serve_forever, daemon=True)
+    thread.start()
+    yield endpoint
+    endpoint.httpd.shutdown()
+    endpoint.httpd.server_close()
+
+
+def test_lookups_keep_the_file_order():
+    catalog = SupplierCatalog(SUPPLIER_PARTS)
+
+    assert len(catalog) == 3
+    assert catalog.parts_of("S_1") == {"P_1", "P_2"} and catalog.parts_of("S_9") == set()
+    assert catalog.suppliers_of("P_1") == ["S_1", "S_2"]
+    assert list(catalog.suppliers_for(["P_1", "P_9", "P_2"])) == ["P_2", "P_1"]
+
+
+def test_file_catalog_is_parsed_again_when_the_file_changes(tmp_path):
+    path = tmp_path / "suppliers.json"
+    path.write_text(json.dumps(SUPPLIER_PARTS))
+    os.utime(path, ns=(1, 1))
+
+    first = load_supplier_catalog(str(path))
+    assert load_supplier_catalog(str(path)) is first
+
+    # same size, only the modification time tells the edit apart
+    path.write_text(json.dumps({"S_1": ["P_3", "P_1"], "S_2": ["P_1"], "S_3": []}))
+    os.utime(path, ns=(2, 2))
+    second = load_supplier_catalog(str(path))
+    assert second is not first and second.suppliers_of("P_3") == ["S_1"]
+
+
+def test_remote_catalog_is_rebuilt_only_for_a_new_version(server, monkeypatch):
+    catalog = RemoteSupplierCatalog(server.url)
+    first = catalog.get()
+    assert first.suppliers_of("P_1") == ["S_1", "S_2"]
+
+    # checked at most every CHECK_INTERVAL seconds
+    assert catalog.get() is first and server.requests == [None]
+
+    monkeypatch.setattr(supplier_catalog, "CHECK_INTERVAL", 0)
+    assert catalog.get() is first and server.requests[-1] == '"1"'
+
+    # a new ETag with the same payload keeps the index
+    server.etag = '"2"'
+    assert catalog.get() is first
+
+    server.payload, server.etag = {"S_4": ["P_1"]}, '"3"'
+    assert catalog.get().suppliers_of("P_1") == ["S_4"]
+
+    # the last catalog answers while the endpoint fails
+    server.failing = True
+    assert catalog.get().suppliers_of("P_1") == ["S_4"]
@@ -0,0 +1,29 @@
+"""
+Time series cubes of hand-built snapshots.
+"""
+import os
+
+import numpy as np
+
+from temporal_cube import CUBE_POINTER_NAME, NodeCube, published_folder
+from snapshots import node_cube, supply_chain
+
+
+def test_node_cube_follows_an_attribute_and_a_missing_node():
+    cheaper = supply_chain(nodes={"PARTS": [["Part 1", "raw", 1.5, "P_1"]]})
+    cube = node_cube(supply_chain(), cheaper)
+    assert cube.timestamps == ["0", "1"]
+    assert cube.series("PARTS", "P_1", "cost").tolist() == [2.0, 1.5]
+    assert np.isnan(cube.series("PARTS", "P_2", "cost")[1])
+
+
+def test_saves_keep_the_published_and_the_previous_generation(tmp_path):
+    folder = str(tmp_path / "nodes")
+    os.makedirs(folder)
+    # a generation another process is still writing has no meta.json yet
+    os.makedirs(os.path.join(folder, "1.1"))
+
+    generations = [node_cube(supply_chain()).save(folder) for _ in range(4)]
+    assert published_folder(folder) == generations[-1]
+    assert sorted(os.listdir(folder)) == sorted(["1.1", CUBE_POINTER_NAME] + [os.path.basename(g) for g in generations[-2:]])
+    assert NodeCube.load(folder).timestamps == ["0"]
@@ -0,0 +1,78 @@
+"""TemporalSnapshot and what it builds, shared read-only by every session."""
+import networkx as nx
+import pytest
+
+from snapshot_store import apply_delta, diff_snapshots
+from snapshots import supply_chain
+from TemporalGraphClass import TemporalSnapshot, json_to_graph
+
+
+def test_shared_snapshot_is_read_only():
+    snapshot = TemporalSnapshot(supply_chain())
+
+    with pytest.raises(nx.NetworkXError):
+        snapshot.graph.add_edge("S_1", "W_2")
+    with pytest.raises(nx.NetworkXError):
+        snapshot.graph.remove_node("P_1")
+    with pytest.raises(ValueError):
+        snapshot.column_arrays.node_ids[0] = "X"
+
+    # a copy is the caller's own
+    graph = snapshot.graph.copy()
+    graph.remove_node("P_1")
+    assert "P_1" in snapshot.graph and "P_1" not in graph
+
+
+def test_facility_costs_under():
+    data = supply_chain(
+        nodes={"PRODUCT_OFFERING": [["Product 1", "PO_1"], ["Product 2", "PO_2"]]},
+        links={"FACILITYToPRODUCT_OFFERING": [
+            [10.0, 4, 1, "F_1", "PO_1"], [50.0, 1, 1, "F_2", "PO_1"], [1.0, 1, 1, "F_1", "PO_2"], [1.0, 1, 1, "F_9", "PO_2"],
+        ]},
+    )
+    data["node_types"]["FACILITY"] = ["node_type", "name", "location", "operating_cost", "id"]
+    data["node_values"]["FACILITY"] = [["FACILITY", "Facility 1", "Austin", 50.0, "F_1"], ["FACILITY", "Facility 2", "Boise", 5.0, "F_2"]]
+    costs = TemporalSnapshot(data).facility_costs
+
+    # the edge of the unknown facility F_9 is left out
+    assert len(costs) == 3
+    assert costs.highest_operating_cost == 50.0 and costs.highest_product_offering[-1] == "PO_1"
+    assert costs.under(4.9).empty
+    assert costs.under(5.0)["Facility Name"].tolist() == ["Facility 2"]
+    assert costs.under(49.9)["Product Name"].tolist() == ["Product 1"]
+    assert costs.under(50.0)["Operating Cost"].tolist() == [50.0, 50.0, 5.0]
+    assert costs.under(1e9)["Facility Location"].tolist() == ["Austin", "Austin", "Boise"]
+
+
+def edges(graph):
+    return {(source, target): attributes for source, target, attributes in graph.edges(data=True)}
+
+
+def patched(base, data):
+    """Snapshot of data read as a delta on base, after base has built its graph."""
+    delta = diff_snapshots(base, data)
+    base_snapshot = TemporalSnapshot(base)
+    base_snapshot.graph
+    return TemporalSnapshot(apply_delta(base, delta), base=base_snapshot, delta=delta)
+
+
+def test_patched_graph_matches_the_rebuilt_one():
+    data = supply_chain(
+        nodes={"PARTS": [["Part 1", "raw", 2.5, "P_1"], ["Part 2", "raw", 3.0, "P_2"], ["Part 3", "raw", 1.0, "P_3"]]},
+        links={"WAREHOUSEToPARTS": [[45, 1.0, "W_1", "P_1"], [20, 2.0, "W_2", "P_2"], [5, 1.0, "W_2", "P_3"]]},
+    )
+    snapshot = patched(supply_chain(), data)
+
+    assert edges(snapshot.graph) == edges(json_to_graph(data))
+    assert dict(snapshot.graph.nodes(data=True)) == dict(json_to_graph(data).nodes(data=True))
+
+
+def test_pair_removed_under_one_link_type_stays_under_another():
+    # undirected, F_1 making P_1 and P_1 going into F_1 are one edge
+    base = supply_chain(links={"FACILITYToPARTS": [[1.0, 2, 1, "F_1", "P_1"]]})
+    data = supply_chain(links={"FACILITYToPARTS": []})
+    base["directed"] = data["directed"] = False
+    snapshot = patched(base, data)
+
+    assert snapshot.graph.has_edge("F_1", "P_1")
+    assert edges(snapshot.graph) == edges(json_to_graph(data))
@@ -1,11 +1,14 @@
 import plotly.graph_objects as go
-import networkx as nx
+import numpy as np
 import time
 import tracemalloc
 import functools
 import streamlit as st
 from pyvis.network import Network
 import os
+from ego_graph import bounded_ego_graph
+from layout_engine import layout_graph
+from graph_render import EDGE_BUDGET, GraphArrays, edge_traces, node_trace
 
 def time_and_memory_streamlit(func):
     @functools.wraps(func)
@@ -32,71 +35,33 @@ def time_and_memory_streamlit(func):
     return wrapper
 
 
-def plotly_ego_graph(ego_graph):
+def plotly_ego_graph(ego_graph, pos=None, render="auto", edge_budget=EDGE_BUDGET):
     """
     Visualizes the ego graph using Plotly, displaying node IDs as labels and attributes on hover.
+    pos is a cached layout (see ego_graph.EgoGraphService), force_layout lays it out without one.
+    render and edge_budget pick WebGL and bundle the edges of large graphs, see graph_render.
     """
-    pos = nx.spring_layout(ego_graph)
-    
-    # Edges
-    edge_x = []
-    edge_y = []
-    edge_hover_text = []
-
-    for edge in ego_graph.edges(data=True):
-        x0, y0 = pos[edge[0]]
-        x1, y1 = pos[edge[1]]
-        edge_x.append(x0)
-        edge_y.append(y0)
-        edge_x.append(x1)
-        edge_y.append(y1)
-        edge_x.append(None)  # To separate edges visually
-        edge_y.append(None)
-
-        # Format hover text for edges
-        attributes = edge[2]
-        hover_details = [f"{key}: {value}" for key, value in attributes.items()]
-        edge_hover_text.append("<br>".join(hover_details))
-
-    edge_trace = go.Scatter(
-        x=edge_x,
-        y=edge_y,
-        line=dict(width=0.5, color="gray"),
-        hoverinfo="text",
-        hovertext=edge_hover_text,  # Show edge attributes on hover
-        mode="lines"
-    )
-
-    # Nodes
-    node_x = []
-    node_y = []
-    node_ids = []
-    node_hover_text = []
-
-    for node in ego_graph.nodes(data=True):
-        x, y = pos[node[0]]
-        node_x.append(x)
-        node_y.append(y)
-        node_ids.append(str(node[0]))  # Use node ID as label
-
-        # Format hover text for nodes
-        attributes = node[1]
-        hover_details = [f"{key}: {value}" for key, value in attributes.items()]
-        node_hover_text.append("<br>".join(hover_details))
-
-    node_trace = go.Scatter(
-        x=node_x,
-        y=node_y,
+    if pos is None:
+        pos = layout_graph(ego_graph)
+    arrays = GraphArrays(ego_graph, pos)
+
+    # Edges, attributes on hover
+    edges = edge_traces(arrays, render, edge_budget, color="gray", width=0.5)
+
+    # Nodes, IDs as labels and attributes on hover
+    node = node_trace(
+        arrays,
+        np.arange(len(arrays.ids)),
+        render,
         mode="markers+text",  # Display labels with text
-        text=node_ids,  # Node IDs as labels
+        text=arrays.ids.astype(str),
         textposition="top center",
-        hoverinfo="text",
-        hovertext=node_hover_text,  # Show attributes on hover
+        showlegend=False,
         marker=dict(
             showscale=False,
             colorscale="YlGnBu",
             size=20,
-            color=[1] * len(node_x),
+            color=np.ones(len(arrays.ids)),
         ),
     )
 
@@ -114,15 +79,15 @@ def plotly_ego_graph(ego_graph):
         margin=dict(l=80, r=40, t=80, b=50),  # Adjust margins
     )
 
-    fig = go.Figure(data=[edge_trace, node_trace], layout=layout)
+    fig = go.Figure(data=edges + [node], layout=layout)
     return fig
 
 
 def ego_graph_query(graph, node_id, radius):
     """
-    Returns the ego graph for a specific node within a given radius.
+    Returns the ego graph for a specific node within a given radius, at most EGO_NODE_BUDGET nodes.
     """
-    ego_graph = nx.ego_graph(graph, node_id, radius=radius,undirected=True)
+    ego_graph, _ = bounded_ego_graph(graph, node_id, radius)
     return ego_graph
 
 